@@ -0,0 +1,686 @@
+import asyncio
+import codecs
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+import functools
+import hashlib
+import io
+import threading
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Set, Tuple, cast
+
+from deployfish.core.models import Cluster, Instance, Service
+
+from deployfish_mysql.coalesce import InsertCoalescer
+from deployfish_mysql.checksums import READ_SIZE, TrailerReceiver
+from deployfish_mysql.models.mysql import MySQLDatabase, MySQLDatabaseManager
+from deployfish_mysql.sinks import DumpSink
+
+
+async def ssh_noninteractive(
+    cluster: Cluster,
+    command: str,
+    verbose: bool = False,
+    output: Any = None,
+    input_data: Any = None,
+    ssh_target: Instance = None,
+    timeout: float = None
+) -> Tuple[bool, str]:
+    """
+    Run ``command`` on ``ssh_target`` via ssh without blocking the event loop.
+    This works like ``Cluster.ssh_noninteractive``, except:
+
+    * ``input_data`` may be a string, bytes, a file object opened in either
+      mode, an iterable of bytes or an async iterable of bytes.  We read files
+      and iterables in a worker thread, so they may be slow, like pipes.
+    * If ``output`` is given, it may be any object with a ``write()`` method
+      that takes bytes, or a text file.  stderr goes there too, and we return
+      ``''`` as the output.
+    * ssh gets its stdin from a pipe or ``/dev/null``, never a terminal, so it
+      never allocates a pseudo-terminal.
+
+    If ``timeout`` passes, or the task running us is cancelled, we kill ssh.
+
+    Args:
+        cluster: the cluster whose ssh settings we use
+        command: the command to run on the remote host
+
+    Keyword Args:
+        verbose: If ``True``, use the verbose flags for ssh
+        output: where to write the output instead of returning it
+        input_data: what to send to the command's stdin
+        ssh_target: the instance to which to ssh.  If not supplied, we will
+            use ``cluster``'s default ssh instance.
+        timeout: give up after this many seconds
+
+    Raises:
+        cluster.OperationFailed: we timed out.
+
+    Returns:
+        A tuple of (success, output).
+    """
+    loop = asyncio.get_running_loop()
+    if ssh_target is None:
+        ssh_target = await loop.run_in_executor(None, lambda: cluster.ssh_target)
+    if not ssh_target:
+        raise cluster.NoSSHTargetAvailable('No ssh targets are available for {}'.format(cluster))
+    provider = cluster.providers[cluster.ssh_proxy_type](ssh_target, verbose=verbose)
+    if not command.startswith('ssh'):
+        command = provider.ssh_command(command)
+    process = await asyncio.create_subprocess_exec(
+        '/bin/bash', '-lc', command,
+        stdin=asyncio.subprocess.PIPE if input_data is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT
+    )
+    try:
+        return await asyncio.wait_for(_communicate(process, output, input_data), timeout)
+    except asyncio.TimeoutError:
+        raise cluster.OperationFailed('Timed out after {}s running a command on {}'.format(timeout, ssh_target.name))
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+async def _communicate(process: asyncio.subprocess.Process, output: Any, input_data: Any) -> Tuple[bool, str]:
+    loop = asyncio.get_running_loop()
+    feeder = asyncio.ensure_future(_feed(process, input_data)) if input_data is not None else None
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    text = isinstance(output, io.TextIOBase)
+    chunks: List[str] = []
+    try:
+        stdout = cast(asyncio.StreamReader, process.stdout)
+        while True:
+            block = await stdout.read(READ_SIZE)
+            if not block:
+                break
+            if output is None:
+                chunks.append(decoder.decode(block))
+            else:
+                await loop.run_in_executor(None, output.write, decoder.decode(block) if text else block)
+        if feeder is not None:
+            await feeder
+    finally:
+        if feeder is not None and not feeder.done():
+            feeder.cancel()
+    returncode = await process.wait()
+    if output is None:
+        chunks.append(decoder.decode(b'', final=True))
+    elif text:
+        output.write(decoder.decode(b'', final=True))
+    return returncode == 0, ''.join(chunks)
+
+
+async def _feed(process: asyncio.subprocess.Process, input_data: Any) -> None:
+    loop = asyncio.get_running_loop()
+    stdin = cast(asyncio.StreamWriter, process.stdin)
+    try:
+        if isinstance(input_data, str):
+            input_data = input_data.encode('utf-8')
+        if isinstance(input_data, bytes):
+            stdin.write(input_data)
+            await stdin.drain()
+        elif hasattr(input_data, '__aiter__'):
+            async for block in input_data:
+                stdin.write(block)
+                await stdin.drain()
+        else:
+            if hasattr(input_data, 'read'):
+                blocks: Iterable[Any] = iter(functools.partial(input_data.read, READ_SIZE), input_data.read(0))
+            else:
+                blocks = iter(input_data)
+            while True:
+                block = await loop.run_in_executor(None, next, blocks, None)
+                if not block:
+                    break
+                stdin.write(block.encode('utf-8') if isinstance(block, str) else block)
+                await stdin.drain()
+        stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        # The command exited early; its output will say why
+        pass
+
+
+class _ServiceProxy:
+    """
+    A ``Service`` whose ``cluster`` is a :py:class:`_LoopCluster`.
+    """
+
+    def __init__(self, service: Service, cluster: "_LoopCluster") -> None:
+        self.service = service
+        self.cluster = cluster
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.service, name)
+
+
+class _LoopCluster:
+    """
+    Stands in for the cluster of a ``MySQLDatabase`` while we run a
+    ``MySQLDatabaseManager`` method for it in a worker thread.  The method's
+    ssh commands run on the event loop with :py:func:`ssh_noninteractive`,
+    so :py:meth:`cancel` can kill them.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, timeout: float = None) -> None:
+        self.cluster: Optional[Cluster] = None
+        self.loop = loop
+        self.timeout = timeout
+        self.futures: Set[concurrent.futures.Future] = set()
+        self.lock = threading.Lock()
+        self.cancelled = False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.cluster, name)
+
+    def wrap(self, obj: MySQLDatabase) -> MySQLDatabase:
+        """
+        Return a copy of ``obj`` whose cluster is us.
+        """
+        self.cluster = obj.cluster
+        proxy = cast(MySQLDatabase, MySQLDatabase.new(deepcopy(obj.data), 'deployfish'))
+        proxy.cache.update(obj.cache)
+        proxy.service = _ServiceProxy(obj.service, self)  # type: ignore
+        return proxy
+
+    def ssh_noninteractive(
+        self,
+        command: str,
+        verbose: bool = False,
+        output: Any = None,
+        input_data: Any = None,
+        ssh_target: Instance = None
+    ) -> Tuple[bool, str]:
+        cluster = cast(Cluster, self.cluster)
+        with self.lock:
+            if self.cancelled:
+                raise cluster.OperationFailed('Cancelled')
+            future = asyncio.run_coroutine_threadsafe(
+                ssh_noninteractive(
+                    cluster,
+                    command,
+                    verbose=verbose,
+                    output=output,
+                    input_data=input_data,
+                    ssh_target=ssh_target,
+                    timeout=self.timeout
+                ),
+                self.loop
+            )
+            self.futures.add(future)
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise cluster.OperationFailed('Cancelled')
+        finally:
+            with self.lock:
+                self.futures.discard(future)
+
+    def cancel(self) -> None:
+        with self.lock:
+            self.cancelled = True
+            for future in self.futures:
+                future.cancel()
+
+
+class AsyncMySQLDatabaseManager:
+    """
+    An asyncio counterpart of :py:class:`MySQLDatabaseManager`: every manager
+    method, as a coroutine with the same arguments::
+
+        manager = AsyncMySQLDatabaseManager(timeout=3600)
+        rows = await manager.query(obj, 'SELECT 1;')
+        results = await manager.bulk('dump', MySQLDatabase.objects.list(), concurrency=10)
+
+    The commonly used methods are native coroutines that run ssh with
+    :py:func:`ssh_noninteractive`, and do nothing slow on the event loop.  We
+    run the rest in a worker thread, but their ssh commands still run on the
+    event loop, so cancelling one kills its remote commands and stops it
+    starting any more.  Commands run on other connections than ``obj``, like
+    the ``target`` of :py:meth:`MySQLDatabaseManager.verify`, and
+    :py:class:`deployfish_mysql.session.MySQLSession` sessions, are not
+    cancelled.
+
+    Cancel an operation, or time it out with ``asyncio.wait_for``, and we kill
+    its local ssh process.  The remote ``mysql`` command notices when it next
+    writes output.
+
+    Keyword Args:
+        timeout: give up on any single remote command after this many seconds
+        max_threads: run at most this many of the methods that need a worker
+            thread at once
+    """
+
+    def __init__(self, timeout: float = None, max_threads: int = 16) -> None:
+        self.manager = cast(MySQLDatabaseManager, MySQLDatabase.objects)
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_threads)
+
+    def __getattr__(self, name: str) -> Callable[..., Awaitable[Any]]:
+        if name.startswith('_') or not callable(getattr(self.manager, name)):
+            raise AttributeError(name)
+
+        async def method(obj: MySQLDatabase, *args, **kwargs) -> Any:
+            return await self._in_thread(name, obj, *args, **kwargs)
+
+        method.__name__ = name
+        method.__doc__ = 'Async version of :py:meth:`MySQLDatabaseManager.{}`.'.format(name)
+        return method
+
+    def close(self) -> None:
+        """
+        Shut down our worker threads.
+        """
+        self.executor.shutdown(wait=False)
+
+    async def bulk(
+        self,
+        method: str,
+        objs: Iterable[MySQLDatabase],
+        *args,
+        concurrency: int = 10,
+        timeout: float = None,
+        **kwargs
+    ) -> List[Any]:
+        """
+        Run the manager method ``method`` for each of ``objs``, at most
+        ``concurrency`` at a time.  Any further arguments are passed on to
+        ``method``.
+
+        Failures do not stop the others: like ``asyncio.gather(...,
+        return_exceptions=True)``, we return the exception in place of the
+        result.
+
+        Args:
+            method: the name of the method, e.g. ``dump``
+            objs: the ``MySQLDatabase`` objects to run it for
+
+        Keyword Args:
+            concurrency: run at most this many at once
+            timeout: cancel each run that takes longer than this many seconds,
+                giving ``asyncio.TimeoutError`` as its result
+
+        Returns:
+            The results, in the same order as ``objs``.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        coroutine = getattr(self, method)
+
+        async def run(obj: MySQLDatabase) -> Any:
+            async with semaphore:
+                return await asyncio.wait_for(coroutine(obj, *args, **kwargs), timeout)
+
+        return await asyncio.gather(*[run(obj) for obj in objs], return_exceptions=True)
+
+    async def _in_thread(self, name: str, obj: MySQLDatabase, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        cluster = _LoopCluster(loop, timeout=self.timeout)
+
+        def run() -> Any:
+            return getattr(self.manager, name)(cluster.wrap(obj), *args, **kwargs)
+
+        try:
+            return await loop.run_in_executor(self.executor, run)
+        except asyncio.CancelledError:
+            cluster.cancel()
+            raise
+
+    async def _prepare(self, obj: MySQLDatabase) -> None:
+        """
+        Look up anything about ``obj`` that might need AWS, like ``config.KEY``
+        values, in a worker thread, so rendering its commands does not block.
+        """
+        if not all(key in obj.cache for key in ('host', 'user', 'db', 'password', 'port', 'service')):
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                lambda: (obj.host, obj.user, obj.db, obj.password, obj.port, obj.cluster)
+            )
+
+    async def _ssh(
+        self,
+        obj: MySQLDatabase,
+        command: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        output: Any = None,
+        input_data: Any = None
+    ) -> Tuple[bool, str]:
+        return await ssh_noninteractive(
+            obj.cluster,
+            command,
+            verbose=verbose,
+            output=output,
+            input_data=input_data,
+            ssh_target=ssh_target,
+            timeout=self.timeout
+        )
+
+    async def create(
+        self,
+        obj: MySQLDatabase,
+        root_user: str,
+        root_password: str,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> str:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.create`.
+        """
+        version = await self.major_server_version(
+            obj,
+            user=root_user,
+            password=root_password,
+            verbose=verbose,
+            ssh_target=ssh_target
+        )
+        command = obj.render_for_create(root_user, root_password, version=version)
+        success, output = await self._ssh(obj, command, ssh_target=ssh_target, verbose=verbose)
+        return self.manager._finish_create(obj, success, output)
+
+    async def update(
+        self,
+        obj: MySQLDatabase,
+        root_user: str,
+        root_password: str,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> str:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.update`.
+        """
+        version = await self.major_server_version(
+            obj,
+            user=root_user,
+            password=root_password,
+            verbose=verbose,
+            ssh_target=ssh_target
+        )
+        command = obj.render_for_update(root_user, root_password, version=version)
+        success, output = await self._ssh(obj, command, ssh_target=ssh_target, verbose=verbose)
+        return self.manager._finish_update(obj, success, output)
+
+    async def validate(
+        self,
+        obj: MySQLDatabase,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        replica: bool = False
+    ) -> str:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.validate`.
+        """
+        if replica:
+            obj, _ = await self.read_target(obj, ssh_target=ssh_target, verbose=verbose)
+        await self._prepare(obj)
+        success, output = await self._ssh(obj, obj.render_for_validate(), ssh_target=ssh_target, verbose=verbose)
+        return self.manager._finish_validate(obj, success, output)
+
+    async def query(
+        self,
+        obj: MySQLDatabase,
+        sql: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None,
+        db: str = None,
+        replica: bool = False
+    ) -> List[List[Optional[str]]]:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.query`.
+        """
+        if replica:
+            obj, _ = await self.read_target(obj, ssh_target=ssh_target, verbose=verbose)
+        await self._prepare(obj)
+        command = obj.render_mysql_command(sql, user=user, password=password, db=db, batch=True)
+        success, output = await self._ssh(obj, command, ssh_target=ssh_target, verbose=verbose)
+        return self.manager._finish_query(obj, success, output)
+
+    async def execute_script(
+        self,
+        obj: MySQLDatabase,
+        sql: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None
+    ) -> List[List[Optional[str]]]:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.execute_script`.
+        """
+        await self._prepare(obj)
+        command = obj.render_for_script(user=user, password=password)
+        success, output = await self._ssh(obj, command, ssh_target=ssh_target, verbose=verbose, input_data=sql)
+        return self.manager._finish_script(obj, success, output)
+
+    async def stats(
+        self,
+        obj: MySQLDatabase,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        replica: bool = False
+    ) -> List[Any]:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.stats`.
+        """
+        await self._prepare(obj)
+        rows = await self.query(
+            obj,
+            obj.render_sql_for_stats(),
+            ssh_target=ssh_target,
+            verbose=verbose,
+            replica=replica
+        )
+        return self.manager._table_stats(rows)
+
+    async def threads_running(
+        self,
+        obj: MySQLDatabase,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> int:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.threads_running`.
+        """
+        await self._prepare(obj)
+        rows = await self.query(
+            obj,
+            obj.render_sql_for_threads_running(),
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        return self.manager._threads_running(rows)
+
+    async def insert_coalescer(
+        self,
+        obj: MySQLDatabase,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> InsertCoalescer:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.insert_coalescer`.
+        """
+        rows = await self.query(
+            obj,
+            obj.render_sql_for_max_allowed_packet(),
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        return self.manager._insert_coalescer(rows)
+
+    async def replica_lag(
+        self,
+        obj: MySQLDatabase,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Optional[int]:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.replica_lag`.
+        """
+        await self._prepare(obj)
+        version = obj.cache.get('server_version') or await self.server_version(
+            obj,
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        success, output = await self._ssh(
+            obj,
+            obj.render_for_replica_status(version),
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        return self.manager._finish_replica_lag(obj, success, output)
+
+    async def read_target(
+        self,
+        obj: MySQLDatabase,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Tuple[MySQLDatabase, Optional[int]]:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.read_target`.
+        """
+        await self._prepare(obj)
+        replicas = await asyncio.get_running_loop().run_in_executor(None, self.manager.read_replicas, obj)
+        if not replicas:
+            return obj, None
+
+        async def lag(replica: MySQLDatabase) -> Optional[int]:
+            try:
+                return await self.replica_lag(replica, ssh_target=ssh_target, verbose=verbose)
+            except replica.OperationFailed:
+                return None
+
+        lags = await asyncio.gather(*[lag(replica) for replica in replicas])
+        return self.manager._least_lagged(obj, replicas, lags)
+
+    async def server_version(
+        self,
+        obj: MySQLDatabase,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None
+    ) -> str:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.server_version`.
+        """
+        await self._prepare(obj)
+        command = obj.render_for_server_version(user=user, password=password)
+        success, output = await self._ssh(obj, command, ssh_target=ssh_target, verbose=verbose)
+        return self.manager._finish_server_version(obj, success, output)
+
+    async def major_server_version(
+        self,
+        obj: MySQLDatabase,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None
+    ) -> str:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.major_server_version`.
+        """
+        version = await self.server_version(obj, ssh_target=ssh_target, verbose=verbose, user=user, password=password)
+        return self.manager._major_version(version)
+
+    async def show_grants(
+        self,
+        obj: MySQLDatabase,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> str:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.show_grants`.
+        """
+        await self._prepare(obj)
+        success, output = await self._ssh(obj, obj.render_for_show_grants(), ssh_target=ssh_target, verbose=verbose)
+        return self.manager._finish_show_grants(obj, success, output)
+
+    async def dump(
+        self,
+        obj: MySQLDatabase,
+        filename: str = None,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        binlog_position: bool = False,
+        index: bool = True,
+        replica: bool = False,
+        sink: DumpSink = None
+    ) -> Tuple[str, str]:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.dump`.  We write the
+        dump as it arrives, and build its index in a worker thread.
+        """
+        if replica and not binlog_position:
+            obj, _ = await self.read_target(obj, ssh_target=ssh_target, verbose=verbose)
+        await self._prepare(obj)
+        loop = asyncio.get_running_loop()
+        sink = await loop.run_in_executor(None, functools.partial(
+            self.manager._dump_sink,
+            obj,
+            filename=filename,
+            sink=sink,
+            binlog_position=binlog_position
+        ))
+        command = obj.render_for_checksum(obj.render_for_dump(binlog_position=binlog_position))
+        try:
+            receiver = TrailerReceiver(sink)
+            success, output = await self._ssh(obj, command, ssh_target=ssh_target, verbose=verbose, output=receiver)
+            sha256, remote_sha256, size = await loop.run_in_executor(None, receiver.finish)
+        except BaseException:
+            sink.abort()
+            raise
+        return await loop.run_in_executor(None, functools.partial(
+            self.manager._finish_dump,
+            obj,
+            sink,
+            success,
+            output,
+            sha256,
+            remote_sha256,
+            size,
+            binlog_position=binlog_position,
+            index=index
+        ))
+
+    async def load(
+        self,
+        obj: MySQLDatabase,
+        filepath: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        sidecar: bool = True,
+        transform: Callable[[Iterable[bytes]], Iterable[bytes]] = None
+    ) -> str:
+        """
+        Async version of :py:meth:`MySQLDatabaseManager.load`.
+        """
+        await self._prepare(obj)
+        filename = self.manager._upload_filename(filepath)
+        digest = hashlib.sha256()
+        success, output = await self._ssh(
+            obj,
+            obj.render_for_upload(filename),
+            ssh_target=ssh_target,
+            verbose=verbose,
+            input_data=self.manager._upload_blocks(filepath, digest, transform=transform)
+        )
+        # _verify_upload writes the sidecar file, so keep it off the event loop
+        error = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+            self.manager._verify_upload,
+            obj,
+            filepath,
+            digest.hexdigest(),
+            success,
+            output,
+            sidecar=sidecar and transform is None,
+            ssh_target=ssh_target
+        ))
+        if error is not None:
+            await self._ssh(obj, 'rm -f {}'.format(filename), ssh_target=ssh_target, verbose=verbose)
+            raise obj.OperationFailed(error)
+        command = obj.render_for_load().format(filename=filename)
+        success, output = await self._ssh(obj, command, ssh_target=ssh_target, verbose=verbose)
+        return self.manager._finish_load(obj, filepath, success, output)
@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from deployfish_mysql.models.mysql import MySQLDatabase
+
+
+#: The first column of the rows that start each section of the audit query's output
+AUDIT_MARKER = 'deployfish-audit'
+#: The privileges ``GRANT ALL PRIVILEGES ON {db}.*`` gives, as listed in
+#: ``information_schema.SCHEMA_PRIVILEGES``
+SCHEMA_PRIVILEGES = frozenset([
+    'ALTER', 'ALTER ROUTINE', 'CREATE', 'CREATE ROUTINE', 'CREATE TEMPORARY TABLES', 'CREATE VIEW',
+    'DELETE', 'DROP', 'EVENT', 'EXECUTE', 'INDEX', 'INSERT', 'LOCK TABLES', 'REFERENCES', 'SELECT',
+    'SHOW VIEW', 'TRIGGER', 'UPDATE',
+])
+#: Character sets that MySQL 8.0 reports under another name
+CHARACTER_SET_ALIASES = {'utf8mb3': 'utf8'}
+#: The columns and source of each section of the snapshot.  The password hash is in
+#: ``Password`` before MySQL 5.7.6 and in ``authentication_string`` after, so we name
+#: it ``Password`` in a versioned comment.  The server sends only its SHA-256.
+AUDIT_SOURCES = [
+    ('users', "User, Host, plugin, IF(Password = '', NULL, SHA2(Password, 256))", (
+        'SELECT User, Host, plugin, /*!50706 authentication_string AS */ Password FROM mysql.user'
+    )),
+    ('global', 'GRANTEE, PRIVILEGE_TYPE, IS_GRANTABLE', (
+        'SELECT GRANTEE, PRIVILEGE_TYPE, IS_GRANTABLE FROM information_schema.USER_PRIVILEGES'
+    )),
+    ('schemas', 'GRANTEE, TABLE_SCHEMA, PRIVILEGE_TYPE, IS_GRANTABLE', (
+        'SELECT GRANTEE, TABLE_SCHEMA, PRIVILEGE_TYPE, IS_GRANTABLE FROM information_schema.SCHEMA_PRIVILEGES'
+    )),
+    ('tables', 'GRANTEE, TABLE_SCHEMA, TABLE_NAME, PRIVILEGE_TYPE, IS_GRANTABLE', (
+        'SELECT GRANTEE, TABLE_SCHEMA, TABLE_NAME, PRIVILEGE_TYPE, IS_GRANTABLE '
+        'FROM information_schema.TABLE_PRIVILEGES'
+    )),
+    ('databases', 'SCHEMA_NAME, DEFAULT_CHARACTER_SET_NAME, DEFAULT_COLLATION_NAME', (
+        'SELECT SCHEMA_NAME, DEFAULT_CHARACTER_SET_NAME, DEFAULT_COLLATION_NAME FROM information_schema.SCHEMATA'
+    )),
+]
+
+
+def native_password_hash(password: str) -> str:
+    """
+    Return the ``mysql_native_password`` hash of ``password``, as MySQL
+    stores it in ``mysql.user``.
+    """
+    return '*' + hashlib.sha1(hashlib.sha1(password.encode('utf-8')).digest()).hexdigest().upper()
+
+
+def password_digest(password: str) -> str:
+    """
+    Return the SHA-256 of the ``mysql_native_password`` hash of
+    ``password``, which is what the audit query reads from ``mysql.user``
+    instead of the hash itself.
+    """
+    return hashlib.sha256(native_password_hash(password).encode('utf-8')).hexdigest()
+
+
+def grantee(user: str, host: str) -> str:
+    """
+    Return the account ``user``@``host`` as ``information_schema`` writes it
+    in its ``GRANTEE`` columns.
+    """
+    return "'{}'@'{}'".format(user, host)
+
+
+def normalize_character_set(name: Optional[str]) -> Optional[str]:
+    """
+    Lower case the character set or collation ``name``, and call ``utf8mb3``
+    ``utf8``, as MySQL before 8.0 does.
+    """
+    if name is None:
+        return None
+    name = name.lower()
+    for alias, canonical in CHARACTER_SET_ALIASES.items():
+        if name.startswith(alias):
+            name = canonical + name[len(alias):]
+    return name
+
+
+def parse_audit_output(rows: List[List[Optional[str]]]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Turn the output of
+    :py:meth:`deployfish_mysql.models.mysql.MySQLDatabase.render_sql_for_audit`
+    into a normalized snapshot of the server's accounts and grants.
+
+    Returns:
+        A tuple of (the server's fingerprint of its grants, the snapshot).  The
+        snapshot is ``None`` if the server did not send it because the
+        fingerprint had not changed.  Otherwise it is a dict with keys
+        ``users`` (account to ``plugin`` and ``password``, the SHA-256 of the
+        password hash), ``global`` (account to its global privileges),
+        ``schemas`` (account to database to privileges), ``tables`` (account
+        to ``db.table`` to privileges) and ``databases`` (database to
+        ``character_set`` and ``collation``).
+    """
+    fingerprint = None
+    section = None
+    sections: Dict[str, List[List[Optional[str]]]] = {}
+    for row in rows:
+        if row and row[0] == AUDIT_MARKER:
+            section = row[1]
+            if section == 'fingerprint':
+                fingerprint = row[2]
+            else:
+                sections[str(section)] = []
+            continue
+        if section is not None and section != 'fingerprint':
+            sections[section].append(row)
+    if not sections.get('users'):
+        return fingerprint, None
+    snapshot: Dict[str, Any] = {'users': {}, 'global': {}, 'schemas': {}, 'tables': {}, 'databases': {}}
+    for user, host, plugin, digest in sections['users']:
+        snapshot['users'][grantee(str(user), str(host))] = {
+            'plugin': plugin or 'mysql_native_password',
+            'password': digest,
+        }
+    for account, privilege, grantable in sections.get('global', []):
+        if privilege != 'USAGE':
+            snapshot['global'].setdefault(account, []).append(privilege)
+        if grantable == 'YES':
+            snapshot['global'].setdefault(account, []).append('GRANT OPTION')
+    for account, db, privilege, grantable in sections.get('schemas', []):
+        # A grant on a database name with _ or % in it may have them escaped
+        db = str(db).replace('\\_', '_').replace('\\%', '%')
+        privileges = snapshot['schemas'].setdefault(account, {}).setdefault(db, [])
+        privileges.append(privilege)
+        if grantable == 'YES':
+            privileges.append('GRANT OPTION')
+    for account, db, table, privilege, _ in sections.get('tables', []):
+        snapshot['tables'].setdefault(account, {}).setdefault('{}.{}'.format(db, table), []).append(privilege)
+    for db, character_set, collation in sections.get('databases', []):
+        snapshot['databases'][db] = {
+            'character_set': normalize_character_set(character_set),
+            'collation': normalize_character_set(collation),
+        }
+    for key in ('global', 'schemas', 'tables'):
+        for account, value in snapshot[key].items():
+            if isinstance(value, list):
+                snapshot[key][account] = sorted(set(value))
+            else:
+                snapshot[key][account] = {name: sorted(set(privileges)) for name, privileges in value.items()}
+    return fingerprint, snapshot
+
+
+def audit_entries(snapshot: Dict[str, Any], objs: Sequence["MySQLDatabase"]) -> List[Dict[str, Any]]:
+    """
+    Compare the accounts and grants in ``snapshot`` (from
+    :py:func:`parse_audit_output`) with what
+    :py:meth:`deployfish_mysql.models.mysql.MySQLDatabase.render_for_create`
+    would have set up for each of ``objs``, all on the same server: the
+    database, with our character set and collation, and the account
+    ``'{user}'@'%'`` with our password, the ``mysql_native_password``
+    plugin, all privileges on the database and nothing else.
+
+    A user may have several ``mysql:`` entries on one server, so an account's
+    privileges on the databases of any of its entries are expected.
+
+    Returns:
+        A list of dicts with keys ``name``, ``user``, ``db`` and ``problem``,
+        one per difference.
+    """
+    databases: Dict[str, Set[str]] = {}
+    for obj in objs:
+        databases.setdefault(obj.user, set()).add(obj.db)
+    findings: List[Dict[str, Any]] = []
+    for obj in objs:
+        account = grantee(obj.user, '%')
+        findings.extend(
+            {'name': obj.name, 'user': account, 'db': obj.db, 'problem': problem}
+            for problem in _entry_problems(snapshot, obj, account, databases[obj.user])
+        )
+    return findings
+
+
+def _entry_problems(
+    snapshot: Dict[str, Any],
+    obj: "MySQLDatabase",
+    account: str,
+    databases: Set[str]
+) -> List[str]:
+    problems = []
+    database = snapshot['databases'].get(obj.db)
+    if database is None:
+        problems.append('database "{}" does not exist'.format(obj.db))
+    else:
+        if database['character_set'] != normalize_character_set(obj.character_set):
+            problems.append(
+                'database character set is {}, not {}'.format(database['character_set'], obj.character_set)
+            )
+        if database['collation'] != normalize_character_set(obj.collation):
+            problems.append('database collation is {}, not {}'.format(database['collation'], obj.collation))
+    others = sorted(
+        name for name in snapshot['users']
+        if name != account and name.startswith(grantee(obj.user, '')[:-1])
+    )
+    if others:
+        problems.append('the user also has the accounts {}, which may match first'.format(', '.join(others)))
+    user = snapshot['users'].get(account)
+    if user is None:
+        problems.append('account {} does not exist'.format(account))
+        return problems
+    if user['plugin'] != 'mysql_native_password':
+        problems.append('account uses {}, not mysql_native_password'.format(user['plugin']))
+    elif user['password'] != password_digest(obj.password):
+        problems.append('password does not match deployfish.yml')
+    schemas = snapshot['schemas'].get(account, {})
+    missing = SCHEMA_PRIVILEGES - set(schemas.get(obj.db, []))
+    if missing:
+        problems.append('missing privileges on {}: {}'.format(obj.db, ', '.join(sorted(missing))))
+    extra = sorted(set(schemas.get(obj.db, [])) - SCHEMA_PRIVILEGES)
+    if extra:
+        problems.append('extra privileges on {}: {}'.format(obj.db, ', '.join(extra)))
+    if snapshot['global'].get(account):
+        problems.append('global privileges: {}'.format(', '.join(snapshot['global'][account])))
+    others = sorted(set(schemas) - databases)
+    if others:
+        problems.append('privileges on other databases: {}'.format(', '.join(others)))
+    if snapshot['tables'].get(account):
+        problems.append('table privileges on {}'.format(', '.join(sorted(snapshot['tables'][account]))))
+    return problems
+
+
+def read_audit_cache(filename: str) -> Dict[str, Any]:
+    """
+    Load the audit cache written by :py:func:`write_audit_cache`, or return an
+    empty one if there is none or it is unreadable.
+
+    Returns:
+        A dict of ``host:port`` to a dict with keys ``fingerprint`` and
+        ``snapshot``.
+    """
+    if not os.path.exists(filename):
+        return {}
+    try:
+        with open(filename, encoding='utf-8') as fd:
+            cache = json.load(fd)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('kind') != 'audit':
+        return {}
+    return cache.get('servers', {})
+
+
+def write_audit_cache(filename: str, servers: Dict[str, Any]) -> None:
+    """
+    Save ``servers`` (as returned by :py:func:`read_audit_cache`) to
+    ``filename``, readable only by us, atomically.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, path = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(os.path.basename(filename)))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'kind': 'audit', 'servers': servers}, f, indent=2, sort_keys=True)
+    os.replace(path, filename)
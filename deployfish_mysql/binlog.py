@@ -0,0 +1,124 @@
+import datetime
+import gzip
+import re
+from typing import Any, BinaryIO, Dict, Optional
+
+
+#: The binlog coordinates comment ``mysqldump --master-data=2`` (or ``--source-data=2``) writes
+BINLOG_POSITION_RE = re.compile(
+    r"^-- CHANGE (?:MASTER|REPLICATION SOURCE) TO (?:MASTER|SOURCE)_LOG_FILE='(?P<file>[^']+)', "
+    r"(?:MASTER|SOURCE)_LOG_POS=(?P<position>\d+);",
+    re.MULTILINE
+)
+#: The GTID set ``mysqldump`` writes when the server has GTIDs enabled
+GTID_PURGED_RE = re.compile(r"GTID_PURGED=(?:/\*!80000 '\+'\*/ )?'(?P<gtid>[^']*)'")
+#: The header line ``mysqlbinlog`` writes before each event, e.g. ``#261019 12:00:01 server id 1 ...``
+EVENT_HEADER_RE = re.compile(rb'^#(?P<timestamp>\d{6}\s+\d{1,2}:\d{2}:\d{2}) server id ')
+#: ``mysqldump`` puts the coordinates in its header, so we only look this far into the dump
+HEADER_SIZE = 1024 * 1024
+
+
+def chain_filename(dump_filename: str) -> str:
+    """
+    Return the name of the backup chain file for the full dump ``dump_filename``.
+    """
+    base = dump_filename[:-4] if dump_filename.endswith('.sql') else dump_filename
+    return '{}.chain.json'.format(base)
+
+
+def segment_filename(chain_file: str, number: int) -> str:
+    """
+    Return the name of incremental segment ``number`` of the backup chain in
+    ``chain_file``.
+    """
+    base = chain_file[:-len('.chain.json')] if chain_file.endswith('.chain.json') else chain_file
+    return '{}.{:04d}.binlog.sql.gz'.format(base, number)
+
+
+def read_dump_position(filename: str) -> Optional[Dict[str, Any]]:
+    """
+    Find the binlog coordinates and GTID set that ``mysqldump`` recorded in the
+    header of the dump ``filename``.
+
+    Returns:
+        A dict with keys ``file``, ``position`` and ``gtid`` (``None`` if the
+        server does not use GTIDs), or ``None`` if the dump has no coordinates.
+    """
+    with open(filename, encoding='utf-8', errors='replace') as fd:
+        header = fd.read(HEADER_SIZE)
+    match = BINLOG_POSITION_RE.search(header)
+    if not match:
+        return None
+    gtid = GTID_PURGED_RE.search(header)
+    return {
+        'file': match.group('file'),
+        'position': int(match.group('position')),
+        'gtid': re.sub(r'\s+', '', gtid.group('gtid')) if gtid else None,
+    }
+
+
+def compress_segment(raw_filename: str, filename: str) -> int:
+    """
+    Gzip the ``mysqlbinlog`` output in ``raw_filename`` into ``filename``,
+    dropping the warnings ``mysqlbinlog`` printed on stderr, which
+    ``ssh_noninteractive`` mixes into the output.
+
+    We work in bytes: the events of statement based binlogs hold the SQL as
+    it was run, and text mode would turn any ``\\r`` in its strings into
+    ``\\n``.
+
+    Returns:
+        The number of events in the segment.
+    """
+    events = 0
+    with open(raw_filename, 'rb') as raw, gzip.open(filename, 'wb') as segment:
+        for line in raw:
+            if line.startswith(b'mysqlbinlog: [Warning]') or line.startswith(b'WARNING: '):
+                continue
+            if EVENT_HEADER_RE.match(line):
+                events += 1
+            segment.write(line)
+    return events
+
+
+def event_time(line: bytes) -> Optional[datetime.datetime]:
+    """
+    Return the time of the event whose ``mysqlbinlog`` header line is ``line``,
+    or ``None`` if ``line`` is not an event header.
+    """
+    match = EVENT_HEADER_RE.match(line)
+    if not match:
+        return None
+    return datetime.datetime.strptime(b' '.join(match.group('timestamp').split()).decode('ascii'), '%y%m%d %H:%M:%S')
+
+
+def copy_segment(filename: str, fd: BinaryIO, until: datetime.datetime = None) -> bool:
+    """
+    Decompress the segment ``filename`` to ``fd``, opened in binary mode,
+    stopping before the first event after ``until``.
+
+    ``mysqlbinlog`` prints event times in the local time of the host it ran
+    on, so ``until`` must be in that timezone too.
+
+    Returns:
+        ``True`` if we stopped early because we reached ``until``.
+    """
+    with gzip.open(filename, 'rb') as segment:
+        pending = b''
+        for line in segment:
+            if until is not None:
+                if line.startswith(b'# at '):
+                    # Hold the position line until we know when its event happened
+                    fd.write(pending)
+                    pending = line
+                    continue
+                when = event_time(line)
+                if when is not None and when > until:
+                    # Roll back any transaction we are in the middle of
+                    fd.write(b'ROLLBACK /*!*/;\nDELIMITER ;\n')
+                    return True
+                fd.write(pending)
+                pending = b''
+            fd.write(line)
+        fd.write(pending)
+    return False
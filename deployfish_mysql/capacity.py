@@ -0,0 +1,113 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+
+#: The connections each task of a service holds open to a ``mysql:`` connection's
+#: server, if its entry has no ``pool_size``
+POOL_SIZE = 10
+#: Warn when the peak connections reach this fraction of ``max_connections``
+WARNING_FRACTION = 0.8
+
+
+def service_demand(desired: int, max_tasks: int, maximum_percent: int, pool_size: int) -> Dict[str, int]:
+    """
+    Work out how many connections a service makes to its database, at most,
+    when it is steady and while it is being deployed.
+
+    During a rolling deploy ECS starts new tasks before it stops the old ones,
+    running up to ``maximum_percent`` percent of the service's task count (and
+    rounding down) until the deploy finishes.
+
+    Args:
+        desired: the service's desired task count
+        max_tasks: the most tasks the service scales out to; at least ``desired``
+        maximum_percent: the service's ``deploymentConfiguration.maximumPercent``
+        pool_size: the connections each task holds open
+
+    Returns:
+        A dict with keys ``desired``, ``max_tasks``, ``deploy_tasks`` (the most
+        tasks during a deploy), ``pool_size``, ``steady`` (connections with
+        ``max_tasks`` tasks), ``peak`` (connections with ``deploy_tasks``
+        tasks) and ``surge`` (the extra connections while a deploy runs at
+        ``desired`` tasks).
+    """
+    max_tasks = max(max_tasks, desired)
+    deploy_tasks = max(max_tasks * maximum_percent // 100, max_tasks)
+    return {
+        'desired': desired,
+        'max_tasks': max_tasks,
+        'deploy_tasks': deploy_tasks,
+        'pool_size': pool_size,
+        'steady': max_tasks * pool_size,
+        'peak': deploy_tasks * pool_size,
+        'surge': (max(desired * maximum_percent // 100, desired) - desired) * pool_size,
+    }
+
+
+def host_capacity(
+    entries: Sequence[Dict[str, Any]],
+    max_connections: Optional[int],
+    threads_connected: Optional[int]
+) -> Dict[str, Any]:
+    """
+    Add up the demand of the ``mysql:`` entries on one server (dicts from
+    :py:func:`service_demand`) and compare it with the server's limits.
+
+    We assume the worst: that every service on the server is at its most tasks
+    and is deployed at the same time.  ``live_peak`` is what the server would
+    see if every service was deployed now, at its desired task count: the
+    connections open now plus the extra tasks' connections.
+
+    Args:
+        entries: the demand of each ``mysql:`` entry on the server
+        max_connections: the server's ``max_connections``, or ``None`` if we
+            could not read it
+        threads_connected: the server's ``Threads_connected``, or ``None``
+
+    Returns:
+        A dict with keys ``entries``, ``steady``, ``peak``, ``live_peak``,
+        ``max_connections``, ``threads_connected``, ``headroom`` (connections
+        left at the worse of the two peaks) and ``verdict`` (``OK``, ``TIGHT``,
+        ``OVER`` or ``UNKNOWN``).
+    """
+    steady = sum(entry['steady'] for entry in entries)
+    peak = sum(entry['peak'] for entry in entries)
+    live_peak = None
+    if threads_connected is not None:
+        live_peak = threads_connected + sum(entry['surge'] for entry in entries)
+    headroom = None
+    if max_connections is None:
+        verdict = 'UNKNOWN'
+    else:
+        worst = max(peak, live_peak or 0)
+        headroom = max_connections - worst
+        if worst >= max_connections:
+            verdict = 'OVER'
+        elif worst >= max_connections * WARNING_FRACTION:
+            verdict = 'TIGHT'
+        else:
+            verdict = 'OK'
+    return {
+        'entries': list(entries),
+        'steady': steady,
+        'peak': peak,
+        'live_peak': live_peak,
+        'max_connections': max_connections,
+        'threads_connected': threads_connected,
+        'headroom': headroom,
+        'verdict': verdict,
+    }
+
+
+def parse_connection_limits(rows: List[List[Optional[str]]]) -> Dict[str, Optional[int]]:
+    """
+    Turn the output of
+    :py:meth:`deployfish_mysql.models.mysql.MySQLDatabase.render_sql_for_connection_limits`
+    into a dict with keys ``max_connections`` and ``threads_connected``.
+    """
+    limits: Dict[str, Optional[int]] = {'max_connections': None, 'threads_connected': None}
+    for row in rows:
+        if len(row) == 1 and row[0] is not None:
+            limits['max_connections'] = int(row[0])
+        elif len(row) == 2 and row[0] == 'Threads_connected' and row[1] is not None:
+            limits['threads_connected'] = int(row[1])
+    return limits
@@ -0,0 +1,152 @@
+import datetime
+import hashlib
+import os
+import re
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional, Tuple, TYPE_CHECKING
+
+from deployfish_mysql.snapshots import read_snapshot, write_snapshot
+
+if TYPE_CHECKING:
+    from deployfish_mysql.models.mysql import MySQLDatabase
+
+
+#: The line the remote side prints after the data with the SHA-256 of what it sent or received
+TRAILER_RE = re.compile(rb'\n?-- deployfish-sha256: (?P<sha256>[0-9a-f]{64})\n\Z')
+#: The trailer is ``\n``, the 23 byte prefix, 64 hex digits and ``\n``
+TRAILER_SIZE = 1 + 23 + 64 + 1
+#: How much we read from the remote side at a time
+READ_SIZE = 1024 * 1024
+
+
+def checksum_filename(filename: str) -> str:
+    """
+    Return the name of the sidecar file we record the checksums of transfers
+    of ``filename`` in.
+    """
+    return '{}.sha256.json'.format(filename)
+
+
+def hash_blocks(blocks: Iterable[bytes], digest: Any) -> Iterator[bytes]:
+    """
+    Pass ``blocks`` through unchanged, adding each to the hashlib object
+    ``digest`` on the way.
+    """
+    for block in blocks:
+        digest.update(block)
+        yield block
+
+
+def read_blocks(filename: str) -> Iterator[bytes]:
+    """
+    Yield the contents of ``filename`` a block at a time.
+    """
+    with open(filename, 'rb') as fd:
+        for block in iter(lambda: fd.read(READ_SIZE), b''):
+            yield block
+
+
+class TrailerReceiver:
+    """
+    A write-only file-like object that passes what is written to it on to
+    ``destination``, hashing it as it goes, except for the checksum trailer
+    that the remote side appends: see
+    :py:meth:`deployfish_mysql.models.mysql.MySQLDatabase.render_for_checksum`.
+
+    We hold back the last :py:data:`TRAILER_SIZE` bytes until
+    :py:meth:`finish`, so neither ``destination`` nor our hash ever includes
+    the trailer.
+    """
+
+    def __init__(self, destination: BinaryIO) -> None:
+        self.destination = destination
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.pending = b''
+
+    def write(self, data: bytes) -> int:
+        self.pending += data
+        if len(self.pending) > TRAILER_SIZE:
+            ready, self.pending = self.pending[:-TRAILER_SIZE], self.pending[-TRAILER_SIZE:]
+            self.digest.update(ready)
+            self.destination.write(ready)
+            self.size += len(ready)
+        return len(data)
+
+    def finish(self) -> Tuple[str, Optional[str], int]:
+        """
+        Write out what we held back, minus the trailer.
+
+        Returns:
+            A tuple of (our SHA-256, the remote SHA-256 or ``None`` if there was
+            no trailer, the number of bytes written).
+        """
+        remote = None
+        match = TRAILER_RE.search(self.pending)
+        if match:
+            remote = match.group('sha256').decode('ascii')
+            self.pending = self.pending[:match.start()]
+        self.digest.update(self.pending)
+        self.destination.write(self.pending)
+        self.size += len(self.pending)
+        self.pending = b''
+        return self.digest.hexdigest(), remote, self.size
+
+
+def receive_with_trailer(source: BinaryIO, destination: BinaryIO) -> Tuple[str, Optional[str], int]:
+    """
+    Copy ``source`` to ``destination`` through a :py:class:`TrailerReceiver`.
+
+    Returns:
+        A tuple of (our SHA-256, the remote SHA-256 or ``None`` if there was
+        no trailer, the number of bytes written).
+    """
+    receiver = TrailerReceiver(destination)
+    for block in iter(lambda: source.read(READ_SIZE), b''):
+        receiver.write(block)
+    return receiver.finish()
+
+
+def parse_trailer(output: str) -> Optional[str]:
+    """
+    Return the remote SHA-256 from the last checksum trailer in ``output``, or
+    ``None`` if there is none.
+    """
+    matches = re.findall(r'^-- deployfish-sha256: ([0-9a-f]{64})\s*$', output, re.MULTILINE)
+    return matches[-1] if matches else None
+
+
+def record_checksum(
+    filename: str,
+    obj: "MySQLDatabase",
+    operation: str,
+    sha256: str,
+    remote_sha256: Optional[str],
+    size: int
+) -> Dict[str, Any]:
+    """
+    Add a record of a transfer of ``filename`` to its checksum sidecar file.
+
+    Args:
+        filename: the local file we dumped to or loaded from
+        obj: the ``MySQLDatabase`` on the other end
+        operation: ``dump`` or ``load``
+        sha256: the SHA-256 we computed locally
+        remote_sha256: the SHA-256 the remote side computed
+        size: the number of bytes transferred
+
+    Returns:
+        The record we added.
+    """
+    sidecar = checksum_filename(filename)
+    rows = read_snapshot(sidecar, 'checksum')['rows'] if os.path.exists(sidecar) else []
+    record = {
+        'operation': operation,
+        'sha256': sha256,
+        'remote_sha256': remote_sha256,
+        'bytes': size,
+        'verified': sha256 == remote_sha256,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    rows.append(record)
+    write_snapshot(sidecar, 'checksum', obj, rows)
+    return record
@@ -0,0 +1,218 @@
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+#: The most we will make a coalesced ``INSERT``, whatever the server's ``max_allowed_packet``
+#: allows.  Past about this size, bigger statements stop being any faster.
+MAX_STATEMENT_SIZE = 1024 * 1024
+#: A quoted string
+STRING = rb"'[^'\\]*(?:(?:\\.|'')[^'\\]*)*'|\"[^\"\\]*(?:(?:\\.|\"\")[^\"\\]*)*\""
+#: A quoted string or identifier, inside which the delimiter does not count
+QUOTED_RE = re.compile(STRING + rb'|`[^`]*(?:``[^`]*)*`', re.DOTALL)
+#: A ``/* */`` comment, including the ``/*! */`` comments ``mysqldump`` writes
+BLOCK_COMMENT_RE = re.compile(rb'/\*.*?\*/', re.DOTALL)
+#: An identifier, optionally quoted
+IDENTIFIER = rb'(?:`(?:[^`]|``)+`|\w+)'
+#: One row of values, which may call functions but not nest them any deeper
+ROW = rb'\([^()\'"]*(?:(?:' + STRING + rb'|\([^()\'"]*(?:(?:' + STRING + rb')[^()\'"]*)*\))[^()\'"]*)*\)'
+#: An ``INSERT`` of a list of rows and nothing else, with any whitespace and comments
+#: (other than the ``/*! */`` comments that ``mysql`` runs) before it
+INSERT_RE = re.compile(
+    rb'(?P<leading>(?:\s|--[ \t\r][^\n]*\n|--\n|#[^\n]*\n|/\*(?!!).*?\*/)*)'
+    rb'(?P<prefix>(?:INSERT|REPLACE)\s+(?:(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|IGNORE)\s+)*(?:INTO\s+)?'
+    rb'' + IDENTIFIER + rb'(?:\s*\.\s*' + IDENTIFIER + rb')?\s*'
+    rb'(?:\((?:[^()`\'"]|`(?:[^`]|``)*`)*\)\s*)?VALUES?\s*)'
+    rb'(?P<rows>' + ROW + rb'(?:\s*,\s*' + ROW + rb')*)\s*;\s*\Z',
+    re.IGNORECASE | re.DOTALL
+)
+
+
+def _special_re(delimiter: bytes) -> "re.Pattern[bytes]":
+    return re.compile(b'[' + re.escape(b'\'"`#/-' + delimiter[:1]) + b']')
+
+
+def split_statements(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Split the SQL script in ``blocks`` into statements, the way the ``mysql``
+    client does: on the delimiter, except inside quotes and comments, and
+    following ``DELIMITER`` commands.
+
+    We only hold one statement (and one block) in memory at a time, so
+    scripts of any size are fine.
+
+    Yields:
+        Each statement, with the whitespace and comments before it and its
+        delimiter, then anything after the last statement.  Each
+        ``DELIMITER`` command comes as a statement of its own.  Joined
+        together, they are exactly ``blocks``.
+    """
+    iterator = iter(blocks)
+    buffer = bytearray()
+    start = 0
+    pos = 0
+    eof = False
+    delimiter = b';'
+    special = _special_re(delimiter)
+    while True:
+        more = False
+        if pos == start:
+            # The mysql client treats a line starting with DELIMITER as a command
+            window = bytes(buffer[start:start + 1024])
+            head = window.lstrip()
+            if len(head) < 10 and not eof and b'delimiter '.startswith(head[:10].lower()):
+                more = True
+            elif head[:10].lower() in (b'delimiter ', b'delimiter\t'):
+                newline = buffer.find(b'\n', start + len(window) - len(head))
+                if newline < 0 and not eof:
+                    more = True
+                else:
+                    end = newline + 1 if newline >= 0 else len(buffer)
+                    line = bytes(buffer[start:end])
+                    delimiter = line.split()[1]
+                    special = _special_re(delimiter)
+                    yield line
+                    start = pos = end
+                    continue
+        while not more:
+            match = special.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                more = True
+                break
+            i = match.start()
+            char = buffer[i:i + 1]
+            if buffer.startswith(delimiter, i):
+                end = i + len(delimiter)
+                yield bytes(buffer[start:end])
+                start = pos = end
+                break
+            if char in (b"'", b'"', b'`'):
+                quoted = QUOTED_RE.match(buffer, i)
+                # A match that ends at the end of the buffer might go on with a doubled quote
+                if quoted is None or (quoted.end() == len(buffer) and not eof):
+                    pos = i if not eof else len(buffer)
+                    more = True
+                else:
+                    pos = quoted.end()
+                continue
+            following = buffer[i + 1:i + 3]
+            if len(following) < 2 and not eof:
+                pos = i
+                more = True
+                continue
+            if char == b'#' or (char == b'-' and following[:1] == b'-' and (following[1:] or b'\n').isspace()):
+                newline = buffer.find(b'\n', i)
+                if newline < 0:
+                    pos = i if not eof else len(buffer)
+                    more = True
+                else:
+                    pos = newline + 1
+            elif char == b'/' and following[:1] == b'*':
+                comment = BLOCK_COMMENT_RE.match(buffer, i)
+                if comment is None:
+                    pos = i if not eof else len(buffer)
+                    more = True
+                else:
+                    pos = comment.end()
+            else:
+                pos = i + 1
+        if not more:
+            continue
+        if eof:
+            if start < len(buffer):
+                yield bytes(buffer[start:])
+            return
+        block = next(iterator, None)
+        if block is None:
+            eof = True
+        else:
+            del buffer[:start]
+            pos -= start
+            start = 0
+            buffer += block
+
+
+def parse_insert(statement: bytes) -> Optional[Tuple[bytes, bytes, bytes]]:
+    """
+    If ``statement`` is an ``INSERT`` (or ``REPLACE``) of a list of rows and
+    nothing else, split it up.
+
+    Returns:
+        A tuple of (the whitespace and comments before the statement, the
+        statement up to and including ``VALUES``, the rows), or ``None``.
+    """
+    match = INSERT_RE.match(statement)
+    if match is None:
+        return None
+    return match.group('leading'), match.group('prefix'), match.group('rows')
+
+
+class InsertCoalescer:
+    """
+    A streaming transform for :py:meth:`deployfish_mysql.models.mysql.MySQLDatabaseManager.load`
+    that merges runs of ``INSERT`` statements into the same table into
+    multi-row ``INSERT`` statements of up to ``max_statement_size`` bytes.
+
+    SQL written by ORMs and many other tools has one ``INSERT`` per row, and
+    the ``mysql`` client runs each in its own round trip to the server (and,
+    with autocommit, its own transaction); merged, they load many times
+    faster.  Anything else passes through untouched, and the runs are broken
+    by any other statement, so the order of everything is kept.
+
+    One difference: a merged statement that fails, e.g. on a duplicate key,
+    inserts none of its rows, where the separate statements would have
+    inserted the rows before the bad one.  Either way ``mysql`` stops there.
+
+    After it has run, :py:attr:`statements` is the number of statements we
+    read, :py:attr:`inserts` the number of those we merged and
+    :py:attr:`merged` the number of statements we merged them into.
+
+    Keyword Args:
+        max_statement_size: the most bytes to put in one statement.  Keep this
+            below the server's ``max_allowed_packet``.
+    """
+
+    def __init__(self, max_statement_size: int = MAX_STATEMENT_SIZE) -> None:
+        self.max_statement_size = max_statement_size
+        self.statements = 0
+        self.inserts = 0
+        self.merged = 0
+
+    def __call__(self, blocks: Iterable[bytes]) -> Iterator[bytes]:
+        run: List[bytes] = []
+        first = b''
+        head = b''
+        key = b''
+        size = 0
+        for statement in split_statements(blocks):
+            parsed = parse_insert(statement)
+            if statement.strip():
+                self.statements += 1
+            if parsed is not None:
+                leading, prefix, rows = parsed
+                if run and not leading.strip() and b' '.join(prefix.split()) == key \
+                        and size + len(rows) + 1 <= self.max_statement_size:
+                    run.append(rows)
+                    size += len(rows) + 1
+                    continue
+            if run:
+                yield self._flush(first, head, run)
+                run = []
+            if parsed is not None and len(statement) < self.max_statement_size:
+                leading, prefix, rows = parsed
+                first = statement
+                head = leading + prefix
+                key = b' '.join(prefix.split())
+                run = [rows]
+                size = len(leading) + len(prefix) + len(rows) + 1
+                continue
+            yield statement
+        if run:
+            yield self._flush(first, head, run)
+
+    def _flush(self, first: bytes, head: bytes, run: List[bytes]) -> bytes:
+        if len(run) == 1:
+            return first
+        self.inserts += len(run)
+        self.merged += 1
+        return head + b','.join(run) + b';'
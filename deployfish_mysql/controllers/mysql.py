@@ -1,4 +1,8 @@
-from typing import Type, Any, Dict
+import datetime
+import os
+import signal
+import time
+from typing import Type, Any, Callable, Dict, Optional, Tuple
 
 from cement import ex, shell
 import click
@@ -7,8 +11,14 @@ from deployfish.controllers.crud import ReadOnlyCrudBase
 from deployfish.controllers.network import get_ssh_target
 from deployfish.controllers.utils import handle_model_exceptions
 from deployfish.core.models import Model, RDSInstance
+from deployfish.renderers.table import TableRenderer
 
+from deployfish_mysql.binlog import chain_filename
 from deployfish_mysql.models.mysql import MySQLDatabase
+from deployfish_mysql.scheduler import BackupScheduler, serve_metrics
+from deployfish_mysql.sinks import sink_for
+from deployfish_mysql.snapshots import diff_counters, read_snapshot, snapshot_age, write_snapshot
+from deployfish_mysql.store import DumpStore
 
 
 class MysqlController(ReadOnlyCrudBase):
@@ -38,6 +48,216 @@ class MysqlController(ReadOnlyCrudBase):
         'Password': 'password',
     }
 
+    stats_result_columns: Dict[str, Any] = {
+        'Table': 'table',
+        'Engine': 'engine',
+        'Rows': 'rows',
+        'Data': {'key': 'data_length', 'datatype': 'bytes'},
+        'Index': {'key': 'index_length', 'datatype': 'bytes'},
+        'Free': {'key': 'data_free', 'datatype': 'bytes'},
+        'Total': {'key': 'total_length', 'datatype': 'bytes'},
+    }
+
+    index_report_result_columns: Dict[str, Any] = {
+        'Table': 'table',
+        'Index': 'index',
+        'Columns': 'columns',
+        'Size': {'key': 'size', 'datatype': 'bytes'},
+        'Table writes': 'writes',
+    }
+
+    verify_result_columns: Dict[str, Any] = {
+        'Table': 'table',
+        'Verdict': 'verdict',
+        'Rows': 'rows',
+        'Target rows': 'other_rows',
+        'Details': {'key': 'details', 'wrap': 60},
+    }
+
+    top_queries_result_columns: Dict[str, Any] = {
+        'Calls': 'calls',
+        'Latency (s)': 'latency',
+        'Avg (ms)': 'average',
+        'Rows examined': 'rows_examined',
+        'Rows sent': 'rows_sent',
+    }
+
+    watch_connections_result_columns: Dict[str, Any] = {
+        'User': 'user',
+        'Client host': 'host',
+        'Average': 'average',
+        'Max': 'max',
+    }
+
+    watch_blockers_result_columns: Dict[str, Any] = {
+        'Thread': 'id',
+        'User': 'user',
+        'Client host': 'host',
+        'Samples': 'samples',
+        'Max waiters': 'waiters',
+        'Max wait (s)': 'max_wait',
+        'Tables': 'tables',
+        'Query': {'key': 'info', 'wrap': 60},
+    }
+
+    watch_transactions_result_columns: Dict[str, Any] = {
+        'Thread': 'id',
+        'User': 'user',
+        'Client host': 'host',
+        'Age (s)': 'age',
+        'State': 'state',
+        'Rows locked': 'rows_locked',
+        'Rows modified': 'rows_modified',
+        'Query': {'key': 'query', 'wrap': 60},
+    }
+
+    tsv_dump_result_columns: Dict[str, Any] = {
+        'Table': 'table',
+        'File': 'file',
+        'Size': {'key': 'bytes', 'datatype': 'bytes'},
+    }
+
+    tsv_load_result_columns: Dict[str, Any] = {
+        'Table': 'table',
+        'Rows': 'rows',
+        'Seconds': 'seconds',
+    }
+
+    migrate_result_columns: Dict[str, Any] = {
+        'File': 'filename',
+        'Checksum': 'checksum',
+        'Status': 'status',
+        'Seconds': 'seconds',
+    }
+
+    audit_result_columns: Dict[str, Any] = {
+        'Connection': 'name',
+        'Account': 'user',
+        'DB': 'db',
+        'Problem': {'key': 'problem', 'wrap': 80},
+    }
+
+    capacity_result_columns: Dict[str, Any] = {
+        'Connection': 'name',
+        'Service': 'service',
+        'Desired': 'desired',
+        'Max tasks': 'max_tasks',
+        'Deploy tasks': 'deploy_tasks',
+        'Pool size': 'pool_size',
+        'Steady': 'steady',
+        'Peak': 'peak',
+    }
+
+    warm_result_columns: Dict[str, Any] = {
+        'Table': 'table',
+        'Index': 'index',
+        'Size': {'key': 'size', 'datatype': 'bytes'},
+        'Seconds': 'seconds',
+    }
+
+    def root_credentials(self, obj: MySQLDatabase) -> Tuple[Optional[str], Optional[str]]:
+        """
+        If the user asked for it with ``--root`` or ``--root-password``, return
+        the root user and password for ``obj``'s RDS instance, prompting for the
+        password if the RDS instance does not keep it in a secret.
+
+        Returns:
+            A (user, password) tuple, or ``(None, None)`` to use the user and
+            password from ``obj``.
+        """
+        if not (self.app.pargs.root or self.app.pargs.root_password):
+            return None, None
+        rds_instance = RDSInstance.objects.get(obj.host.split('.')[0])
+        password = self.app.pargs.root_password
+        if not password:
+            if rds_instance.secret_enabled:
+                password = rds_instance.root_password
+            else:
+                p = shell.Prompt('DB root password')
+                password = p.prompt()
+        return rds_instance.root_user, password
+
+    def print_warm(
+        self,
+        obj: MySQLDatabase,
+        target: Any,
+        snapshot_file: str = None,
+        concurrency: int = 4,
+        analyze: bool = True,
+        preload: bool = True,
+        max_threads_running: int = None,
+        sleep: float = 0.0
+    ) -> None:
+        """
+        Run :py:meth:`MySQLDatabase.warm` and print what it did.
+        """
+        result = obj.warm(
+            snapshot_file=snapshot_file,
+            concurrency=concurrency,
+            analyze=analyze,
+            preload=preload,
+            max_threads_running=max_threads_running,
+            sleep=sleep,
+            ssh_target=target,
+            verbose=self.app.pargs.verbose,
+            callback=lambda message: self.app.print(click.style(message, fg='yellow'))
+        )
+        renderer = TableRenderer(columns=self.warm_result_columns)
+        lines = []
+        if result['preloaded']:
+            lines.append(renderer.render([
+                dict(index, seconds=round(index['seconds'], 2)) for index in result['preloaded']
+            ]))
+        for error in result['analyze_errors']:
+            lines.append(click.style(
+                'ANALYZE TABLE failed for "{}": {}'.format(error['table'], error['error']),
+                fg='red'
+            ))
+        before = result['before']
+        after = result['after']
+        lines.append(click.style(
+            'Analyzed {} of {} tables in {:.1f}s, and preloaded {} indexes ({}) in {:.1f}s.  '
+            'The buffer pool of mysql server {}:{} is now {:.0%} full (was {:.0%}).'.format(
+                len(result['analyzed']),
+                result['tables'],
+                result['analyze_seconds'],
+                len(result['preloaded']),
+                renderer.human_bytes(sum(index['size'] for index in result['preloaded'])),
+                result['preload_seconds'],
+                obj.host,
+                obj.port,
+                after['pages_data'] / after['pages_total'] if after['pages_total'] else 0,
+                before['pages_data'] / before['pages_total'] if before['pages_total'] else 0
+            ),
+            fg='green'
+        ))
+        self.app.print('\n'.join(lines))
+
+    def read_target(self, obj: MySQLDatabase, target: Any, echo: Callable[[str], None] = None) -> MySQLDatabase:
+        """
+        Unless the user asked for ``--primary``, return the least lagged read
+        replica of ``obj`` that is within its ``replica_max_lag``, or ``obj``
+        itself if it has no replicas or none qualify.  We tell the user which
+        with ``echo``, or ``self.app.print`` by default.
+        """
+        if self.app.pargs.primary or not obj.replica_hosts:
+            return obj
+        echo = echo or self.app.print
+        replica, lag = obj.read_target(ssh_target=target, verbose=self.app.pargs.verbose)
+        if lag is None:
+            echo(click.style(
+                'No read replica is within {}s of mysql server {}:{}; using it instead.'.format(
+                    obj.replica_max_lag, obj.host, obj.port
+                ),
+                fg='yellow'
+            ))
+        else:
+            echo(click.style(
+                'Using read replica {}:{}, {}s behind.'.format(replica.host, replica.port, lag),
+                fg='cyan'
+            ))
+        return replica
+
     @ex(
         help="Create a MySQL database and user in the remote MySQL server.",
         arguments=[
@@ -187,6 +407,15 @@ and update the GRANTs for the user.
              "server and has the password we expect.",
         arguments=[
             (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (
+                ['--primary'],
+                {
+                    'help': 'Use the primary server even if the connection has read replicas.',
+                    'default': False,
+                    'dest': 'primary',
+                    'action': 'store_true'
+                }
+            ),
             (
                 ['-c', '--choose'],
                 {
@@ -216,6 +445,7 @@ MySQL server and has the password we expect.
         loader = self.loader(self)
         obj = loader.get_object_from_deployfish(self.app.pargs.pk)
         target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        obj = self.read_target(obj, target)
         obj.validate(ssh_target=target, verbose=self.app.pargs.verbose)
         lines = [
             click.style(
@@ -234,11 +464,92 @@ MySQL server and has the password we expect.
             (
                 ['--dumpfile'],
                 {
-                    'help': 'Write the SQL dump to this file.',
+                    'help': 'Write the SQL dump to this file, "-" for stdout, or s3://{bucket}/{key}.  '
+                            'With --format=tsv, the directory to write to.',
                     'default': None,
                     'dest': 'dumpfile',
                 }
             ),
+            (
+                ['--split-size'],
+                {
+                    'help': 'Split the SQL dump into parts of this many MB: "{dumpfile}.0000" and so on.',
+                    'default': None,
+                    'type': int,
+                    'dest': 'split_size',
+                }
+            ),
+            (
+                ['--format'],
+                {
+                    'help': 'Dump as a SQL file, or as a directory of per-table TSV files for fast loading.',
+                    'default': 'sql',
+                    'choices': ['sql', 'tsv'],
+                    'dest': 'format',
+                }
+            ),
+            (
+                ['--concurrency'],
+                {
+                    'help': 'With --format=tsv, dump this many tables at once.',
+                    'default': 4,
+                    'type': int,
+                    'dest': 'concurrency',
+                }
+            ),
+            (
+                ['--no-index'],
+                {
+                    'help': 'Do not write the table index file used by "load --table".',
+                    'default': True,
+                    'dest': 'index',
+                    'action': 'store_false'
+                }
+            ),
+            (
+                ['--binlog-position'],
+                {
+                    'help': 'Record the binlog coordinates of the dump and start a backup chain for incrementals.',
+                    'default': False,
+                    'dest': 'binlog_position',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['--store'],
+                {
+                    'help': 'Save the dump in this deduplicated dump store directory instead of a file.',
+                    'default': None,
+                    'dest': 'store',
+                }
+            ),
+            (
+                ['--keep-days'],
+                {
+                    'help': 'With --store, afterwards prune dumps of this connection older than this many days.',
+                    'default': None,
+                    'type': int,
+                    'dest': 'keep_days',
+                }
+            ),
+            (
+                ['--incremental'],
+                {
+                    'help': 'Instead of a full dump, add the binlog events since the end of this backup chain to it.',
+                    'default': None,
+                    'metavar': 'CHAIN_FILE',
+                    'dest': 'incremental',
+                }
+            ),
+            (
+                ['--primary'],
+                {
+                    'help': 'Use the primary server even if the connection has read replicas.',
+                    'default': False,
+                    'dest': 'primary',
+                    'action': 'store_true'
+                }
+            ),
             (
                 ['-c', '--choose'],
                 {
@@ -262,6 +573,41 @@ MySQL server and has the password we expect.
 Dump the contents of a MySQL database to a local file.  If "--dumpfile" is not supplied,
 the filename of the output file will be "{service-name}.sql". If that exists, then we will
 use "{service-name}-1.sql", and if that exists "{service-name}-2.sql" and so on.
+
+Alongside the dump we write "{dumpfile}.index.json", the byte offsets of each table's DDL
+and data in the dump, so that "deploy mysql load --table" can restore single tables
+without reading the whole dump.
+
+Incremental backups: "--binlog-position" dumps in a single transaction and records the
+binlog coordinates of the dump in a backup chain file, "{dumpfile}.chain.json".  Later,
+"--incremental {chain-file}" saves the binlog events for the database since the end of the
+chain as a new gzipped segment next to the chain file.  Restore the whole chain with
+"deploy mysql load --chain".  The server must have binary logging on, and keep its binlogs
+for longer than the time between incrementals.
+
+Deduplicated dumps: "--store {directory}" splits the dump into content defined chunks and
+saves only the chunks the store does not already have, plus a manifest listing the dump's
+chunks.  Consecutive dumps of a database share most of their chunks, so a month of nightly
+dumps takes little more space than one.  Use "--keep-days" to prune old dumps, and
+"deploy mysql restore" to load one.
+
+Destinations: the dump is written to its destination as it arrives, and never staged
+anywhere else first.  "--dumpfile -" writes it to stdout, so that it can be piped into
+another program; "--dumpfile s3://{bucket}/{key}" uploads it to S3 in parts; and
+"--split-size {MB}" writes it to "{dumpfile}.0000", "{dumpfile}.0001" and so on, each
+that many MB.  Only dumps to a single local file get an index.
+
+TSV dumps: "--format=tsv" dumps to a directory ("{service-name}.tsv" unless "--dumpfile"
+is given) holding the schema, the triggers and one gzipped tab separated file per table,
+streamed straight from SELECT on the server, several tables at a time.  "deploy mysql
+load" loads such a directory with LOAD DATA LOCAL INFILE.  Big tables dump and load
+several times faster than as SQL, but each table is read in its own transaction, so the
+tables are only consistent with each other if nothing writes to the database meanwhile.
+
+Read replicas: if the connection has "replica_host" in deployfish.yml, we dump from the
+least lagged replica that is at most "replica_max_lag" seconds behind, falling back to the
+primary.  Use "--primary" to always dump from the primary.  "--binlog-position" dumps
+always come from the primary.
 """
     )
     @handle_model_exceptions
@@ -269,10 +615,89 @@ use "{service-name}-1.sql", and if that exists "{service-name}-2.sql" and so on.
         loader = self.loader(self)
         obj = loader.get_object_from_deployfish(self.app.pargs.pk)
         target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        if self.app.pargs.incremental:
+            entry = obj.dump_incremental(
+                self.app.pargs.incremental,
+                ssh_target=target,
+                verbose=self.app.pargs.verbose
+            )
+            if entry is None:
+                message = 'No changes to database "{}" in mysql server {}:{} since the end of "{}".'.format(
+                    obj.db, obj.host, obj.port, self.app.pargs.incremental
+                )
+            else:
+                message = 'Saved {} binlog events for database "{}" in mysql server {}:{} to "{}".'.format(
+                    entry['events'], obj.db, obj.host, obj.port, entry['filename']
+                )
+            self.app.print(click.style(message, fg='green'))
+            return
+        to_stdout = self.app.pargs.dumpfile == '-'
+        # Keep stdout for the dump itself
+        echo = (lambda message: click.echo(message, err=True)) if to_stdout else self.app.print
+        if not self.app.pargs.binlog_position:
+            # Incrementals read our own server's binlogs, so their full dump must come from it too
+            obj = self.read_target(obj, target, echo=echo)
+        if self.app.pargs.format == 'tsv':
+            if self.app.pargs.store or self.app.pargs.binlog_position or self.app.pargs.split_size:
+                raise obj.OperationFailed('--format=tsv cannot be used with --store, --binlog-position or --split-size')
+            if to_stdout or (self.app.pargs.dumpfile or '').startswith('s3://'):
+                raise obj.OperationFailed('--format=tsv can only dump to a local directory')
+            rows, dirname = obj.dump_tsv(
+                dirname=self.app.pargs.dumpfile,
+                ssh_target=target,
+                verbose=self.app.pargs.verbose,
+                concurrency=self.app.pargs.concurrency
+            )
+            lines = [TableRenderer(columns=self.tsv_dump_result_columns).render(rows)]
+            lines.append(click.style(
+                '\nDumped database "{}" in mysql server {}:{} to "{}": {} tables.'.format(
+                    obj.db, obj.host, obj.port, dirname, len(rows)
+                ),
+                fg='green'
+            ))
+            self.app.print('\n'.join(lines))
+            return
+        if self.app.pargs.store:
+            result = obj.dump_to_store(self.app.pargs.store, ssh_target=target, verbose=self.app.pargs.verbose)
+            human_bytes = TableRenderer(columns={}).human_bytes
+            lines = [click.style(
+                'Dumped database "{}" in mysql server {}:{} to "{}": {} in {} chunks, {} new in {} chunks.'.format(
+                    obj.db,
+                    obj.host,
+                    obj.port,
+                    result['manifest'],
+                    human_bytes(result['size']),
+                    result['chunks'],
+                    human_bytes(result['new_size']),
+                    result['new_chunks']
+                ),
+                fg='green'
+            )]
+            if self.app.pargs.keep_days is not None:
+                pruned = DumpStore(self.app.pargs.store).prune(self.app.pargs.keep_days, name=obj.name)
+                lines.append(click.style(
+                    'Pruned {} old dumps, freeing {}.'.format(pruned['manifests'], human_bytes(pruned['bytes'])),
+                    fg='green'
+                ))
+            self.app.print('\n'.join(lines))
+            return
+        sink = None
+        if self.app.pargs.split_size and not self.app.pargs.dumpfile:
+            raise obj.OperationFailed('--split-size needs --dumpfile')
+        if self.app.pargs.dumpfile:
+            try:
+                sink = sink_for(
+                    self.app.pargs.dumpfile,
+                    part_size=self.app.pargs.split_size * 1024 * 1024 if self.app.pargs.split_size else None
+                )
+            except ValueError as e:
+                raise obj.OperationFailed(str(e))
         _, output_filename = obj.dump(
-            filename=self.app.pargs.dumpfile,
             ssh_target=target,
-            verbose=self.app.pargs.verbose
+            verbose=self.app.pargs.verbose,
+            binlog_position=self.app.pargs.binlog_position,
+            index=self.app.pargs.index,
+            sink=sink
         )
         lines = [
             click.style(
@@ -282,13 +707,82 @@ use "{service-name}-1.sql", and if that exists "{service-name}-2.sql" and so on.
                 fg='green'
             )
         ]
-        self.app.print('\n'.join(lines))
+        if self.app.pargs.binlog_position:
+            lines.append(click.style(
+                'Started backup chain "{}".'.format(chain_filename(output_filename)),
+                fg='green'
+            ))
+        echo('\n'.join(lines))
 
     @ex(
         help="Load the contents of a local SQL file into an existing MySQL database.",
         arguments=[
             (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
-            (['sqlfile'], {'help': 'the filename of the SQL file to load'}),
+            (
+                ['sqlfile'],
+                {'help': 'the SQL file to load, the backup chain with --chain, or a "dump --format=tsv" directory'}
+            ),
+            (
+                ['--table'],
+                {
+                    'help': 'Load only this table from the dump.  May be given more than once.',
+                    'default': [],
+                    'dest': 'tables',
+                    'action': 'append'
+                }
+            ),
+            (
+                ['--chain'],
+                {
+                    'help': 'Load a backup chain: its full dump, then its incremental segments.',
+                    'default': False,
+                    'dest': 'chain',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['--until'],
+                {
+                    'help': 'With --chain, stop replaying at this time, e.g. "2024-01-31 13:45:00".',
+                    'default': None,
+                    'dest': 'until',
+                }
+            ),
+            (
+                ['--concurrency'],
+                {
+                    'help': 'When loading a "dump --format=tsv" directory, load this many tables at once.',
+                    'default': 4,
+                    'type': int,
+                    'dest': 'concurrency',
+                }
+            ),
+            (
+                ['--coalesce-inserts'],
+                {
+                    'help': 'Merge runs of single-row INSERTs into multi-row INSERTs as we upload the file.',
+                    'default': False,
+                    'dest': 'coalesce',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['--warm'],
+                {
+                    'help': 'Afterwards, analyze every table and preload the buffer pool, as "deploy mysql warm".',
+                    'default': False,
+                    'dest': 'warm',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['--warm-snapshot'],
+                {
+                    'help': 'Like --warm, but preload the hottest tables in this "top-queries" or "stats" snapshot.',
+                    'default': None,
+                    'dest': 'warm_snapshot',
+                }
+            ),
             (
                 ['-c', '--choose'],
                 {
@@ -310,6 +804,27 @@ use "{service-name}-1.sql", and if that exists "{service-name}-2.sql" and so on.
         ],
         description="""
 Load the contents of a local SQL file into an existing MySQL database in the remote MySQL server.
+
+With "--table", load only the named tables from a mysqldump file, seeking straight to them
+with the index "deploy mysql dump" writes next to the dump.  Dumps without an index are
+scanned for tables, and the index saved, first.
+
+With "--chain", load a backup chain made by "deploy mysql dump --binlog-position" and
+"deploy mysql dump --incremental": the full dump, and then each incremental segment in order.
+Use "--until" to restore to a point in time.  Times are in the timezone of the machine that
+ran mysqlbinlog, which is usually UTC.
+
+If "sqlfile" is a directory written by "deploy mysql dump --format=tsv", create its tables,
+load their data with LOAD DATA LOCAL INFILE, several tables at a time, and then create its
+triggers.  The server must allow local_infile.
+
+With "--coalesce-inserts", rewrite the file on its way to the server so that each run of
+INSERTs into the same table becomes a few multi-row INSERTs, each within the server's
+max_allowed_packet.  Files with one INSERT per row, as many ORMs and tools write them, load
+many times faster this way.  The file itself is not changed.
+
+With "--warm" or "--warm-snapshot", get the database ready for traffic after loading it: see
+"deploy mysql warm".
 """
     )
     @handle_model_exceptions
@@ -317,20 +832,1641 @@ Load the contents of a local SQL file into an existing MySQL database in the rem
         loader = self.loader(self)
         obj = loader.get_object_from_deployfish(self.app.pargs.pk)
         target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
-        output = obj.load(self.app.pargs.sqlfile, ssh_target=target, verbose=self.app.pargs.verbose)
+        if self.app.pargs.chain:
+            until = None
+            if self.app.pargs.until:
+                try:
+                    until = datetime.datetime.fromisoformat(self.app.pargs.until)
+                except ValueError:
+                    raise obj.OperationFailed('"{}" is not a valid --until time'.format(self.app.pargs.until))
+            loaded = obj.load_chain(
+                self.app.pargs.sqlfile,
+                until=until,
+                ssh_target=target,
+                verbose=self.app.pargs.verbose,
+                callback=lambda message: self.app.print(click.style(message, fg='yellow'))
+            )
+            self.app.print(click.style(
+                'Loaded backup chain "{}" ({} files, up to {}) into database "{}" on mysql server {}:{}'.format(
+                    self.app.pargs.sqlfile,
+                    len(loaded),
+                    self.app.pargs.until or 'the end',
+                    obj.db,
+                    obj.host,
+                    obj.port
+                ),
+                fg='green'
+            ))
+        elif os.path.isdir(self.app.pargs.sqlfile):
+            results = obj.load_tsv(
+                self.app.pargs.sqlfile,
+                ssh_target=target,
+                verbose=self.app.pargs.verbose,
+                concurrency=self.app.pargs.concurrency
+            )
+            lines = [TableRenderer(columns=self.tsv_load_result_columns).render([
+                dict(result, seconds=round(result['seconds'], 2)) for result in results
+            ])]
+            lines.append(click.style(
+                '\nLoaded TSV dump "{}" ({} tables, {} rows) into database "{}" on mysql server {}:{}'.format(
+                    self.app.pargs.sqlfile,
+                    len(results),
+                    sum(result['rows'] for result in results),
+                    obj.db,
+                    obj.host,
+                    obj.port
+                ),
+                fg='green'
+            ))
+            self.app.print('\n'.join(lines))
+        elif self.app.pargs.tables:
+            output = obj.load_tables(
+                self.app.pargs.sqlfile,
+                self.app.pargs.tables,
+                ssh_target=target,
+                verbose=self.app.pargs.verbose
+            )
+            lines = [
+                click.style(
+                    'Loaded {} from file "{}" into database "{}" on mysql server {}:{}'.format(
+                        ', '.join('"{}"'.format(table) for table in self.app.pargs.tables),
+                        self.app.pargs.sqlfile,
+                        obj.db,
+                        obj.host,
+                        obj.port
+                    ),
+                    fg='green'
+                )
+            ]
+            if output.strip():
+                lines.append(click.style('Output from `mysql` command:\n{}'.format(output), fg='red'))
+            self.app.print('\n'.join(lines))
+        else:
+            coalescer = None
+            if self.app.pargs.coalesce:
+                coalescer = obj.insert_coalescer(ssh_target=target, verbose=self.app.pargs.verbose)
+            output = obj.load(
+                self.app.pargs.sqlfile,
+                ssh_target=target,
+                verbose=self.app.pargs.verbose,
+                transform=coalescer
+            )
+            lines = [
+                click.style(
+                    'Loaded file "{}" into database "{}" on mysql server {}:{}'.format(
+                        self.app.pargs.sqlfile, obj.db, obj.host, obj.port
+                    ),
+                    fg='green'
+                )
+            ]
+            if coalescer is not None:
+                lines.append(click.style(
+                    'Coalesced {:,} of {:,} statements into {:,} multi-row INSERTs of up to {:,} bytes'.format(
+                        coalescer.inserts,
+                        coalescer.statements,
+                        coalescer.merged,
+                        coalescer.max_statement_size
+                    ),
+                    fg='cyan'
+                ))
+            if output.strip():
+                # This is here just case `mysql` returns 0 but also prints something. Should probably never trigger.
+                lines.append(click.style('Output from `mysql` command:\n{}'.format(output), fg='red'))
+            self.app.print('\n'.join(lines))
+        if self.app.pargs.warm or self.app.pargs.warm_snapshot:
+            self.print_warm(obj, target, snapshot_file=self.app.pargs.warm_snapshot)
+
+    @ex(
+        help="Analyze every table in a remote MySQL database and preload its hottest tables into memory.",
+        arguments=[
+            (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (
+                ['--snapshot'],
+                {
+                    'help': 'Preload the hottest tables in this "top-queries --save" or "stats --cache" snapshot.',
+                    'default': None,
+                    'dest': 'snapshot',
+                }
+            ),
+            (
+                ['--concurrency'],
+                {
+                    'help': 'Run this many ANALYZE TABLE statements at once.',
+                    'default': 4,
+                    'type': int,
+                    'dest': 'concurrency',
+                }
+            ),
+            (
+                ['--max-threads-running'],
+                {
+                    'help': 'Before each preload scan, wait while the server\'s Threads_running is at least this.',
+                    'default': None,
+                    'type': int,
+                    'dest': 'max_threads_running',
+                }
+            ),
+            (
+                ['--sleep'],
+                {
+                    'help': 'Seconds to sleep between preload scans.',
+                    'default': 0.0,
+                    'type': float,
+                    'dest': 'sleep',
+                }
+            ),
+            (
+                ['--no-analyze'],
+                {
+                    'help': 'Do not run ANALYZE TABLE.',
+                    'default': True,
+                    'dest': 'analyze',
+                    'action': 'store_false'
+                }
+            ),
+            (
+                ['--no-preload'],
+                {
+                    'help': 'Do not preload the buffer pool.',
+                    'default': True,
+                    'dest': 'preload',
+                    'action': 'store_false'
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Get a freshly loaded database ready for production traffic.  A new server has no optimizer
+statistics worth the name and an empty InnoDB buffer pool, so the first hours of traffic
+are slow.
+
+First we run ANALYZE TABLE on every table, "--concurrency" at a time.  Then we read the
+hottest tables, and each of their indexes, in full to pull them into the buffer pool, one
+scan at a time, until the pool has no free pages left.  Use "--max-threads-running" and
+"--sleep" to keep the scans out of the way of live traffic.
+
+The hottest tables come from "--snapshot": save one on the old server with "deploy mysql
+top-queries --save" (tables ranked by rows examined) or "deploy mysql stats --cache"
+(biggest tables first).  Without one we preload the biggest tables first.
+"""
+    )
+    @handle_model_exceptions
+    def warm(self):
+        loader = self.loader(self)
+        obj = loader.get_object_from_deployfish(self.app.pargs.pk)
+        target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        self.print_warm(
+            obj,
+            target,
+            snapshot_file=self.app.pargs.snapshot,
+            concurrency=self.app.pargs.concurrency,
+            analyze=self.app.pargs.analyze,
+            preload=self.app.pargs.preload,
+            max_threads_running=self.app.pargs.max_threads_running,
+            sleep=self.app.pargs.sleep
+        )
+
+    @ex(
+        help="Load a dump from a deduplicated dump store into an existing MySQL database.",
+        arguments=[
+            (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (['manifest'], {'help': 'the manifest of the dump, in the "manifests" directory of the dump store'}),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Load a dump saved with "deploy mysql dump --store" into an existing MySQL database in the
+remote MySQL server.  The dump is reassembled from its chunks as it is streamed to the
+server, so it never needs to fit on local disk.
+"""
+    )
+    @handle_model_exceptions
+    def restore(self):
+        loader = self.loader(self)
+        obj = loader.get_object_from_deployfish(self.app.pargs.pk)
+        target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        output = obj.restore(self.app.pargs.manifest, ssh_target=target, verbose=self.app.pargs.verbose)
         lines = [
             click.style(
-                'Loaded file "{}" into database "{}" on mysql server {}:{}'.format(
-                    self.app.pargs.sqlfile, obj.db, obj.host, obj.port
+                'Restored "{}" into database "{}" on mysql server {}:{}'.format(
+                    self.app.pargs.manifest, obj.db, obj.host, obj.port
                 ),
                 fg='green'
             )
         ]
         if output.strip():
-            # This is here just case `mysql` returns 0 but also prints something. Should probably never trigger.
             lines.append(click.style('Output from `mysql` command:\n{}'.format(output), fg='red'))
         self.app.print('\n'.join(lines))
 
+    @ex(
+        help="Remove old dumps from a deduplicated dump store, and the chunks only they used.",
+        arguments=[
+            (['store'], {'help': 'the dump store directory'}),
+            (
+                ['--keep-days'],
+                {
+                    'help': 'Keep dumps this many days old or newer.',
+                    'default': 30,
+                    'type': int,
+                    'dest': 'keep_days',
+                }
+            ),
+            (
+                ['--name'],
+                {
+                    'help': 'Only prune dumps of this MySQL connection.',
+                    'default': None,
+                    'dest': 'name',
+                }
+            ),
+            (
+                ['--dry-run'],
+                {
+                    'help': 'Only report what would be removed.',
+                    'default': False,
+                    'dest': 'dry_run',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Remove the manifests of dumps older than "--keep-days" days from a dump store made by
+"deploy mysql dump --store", and then the chunks no remaining dump uses.  The newest dump of
+each MySQL connection is always kept, however old it is.
+"""
+    )
+    @handle_model_exceptions
+    def prune_dumps(self):
+        result = DumpStore(self.app.pargs.store).prune(
+            self.app.pargs.keep_days,
+            name=self.app.pargs.name,
+            dry_run=self.app.pargs.dry_run
+        )
+        self.app.print(click.style(
+            '{} {} dumps and {} chunks from "{}", freeing {}.'.format(
+                'Would remove' if self.app.pargs.dry_run else 'Removed',
+                result['manifests'],
+                result['chunks'],
+                self.app.pargs.store,
+                TableRenderer(columns={}).human_bytes(result['bytes'])
+            ),
+            fg='green'
+        ))
+
+    @ex(
+        help="Run the backups configured in the mysql: section on their schedules until stopped.",
+        arguments=[
+            (
+                ['names'],
+                {
+                    'help': 'the names of MySQL connections in deployfish.yml.  '
+                            'Default: all of them with a backup: section.',
+                    'nargs': '*',
+                }
+            ),
+            (
+                ['--max-jobs'],
+                {
+                    'help': 'Run at most this many backups at once.',
+                    'default': 2,
+                    'type': int,
+                    'dest': 'max_jobs',
+                }
+            ),
+            (
+                ['--max-per-host'],
+                {
+                    'help': 'Run at most this many backups at once on any one MySQL server.',
+                    'default': 1,
+                    'type': int,
+                    'dest': 'max_per_host',
+                }
+            ),
+            (
+                ['--max-per-bastion'],
+                {
+                    'help': 'Run at most this many backups at once through any one ssh instance.',
+                    'default': 2,
+                    'type': int,
+                    'dest': 'max_per_bastion',
+                }
+            ),
+            (
+                ['--metrics-file'],
+                {
+                    'help': 'Keep the backups\' metrics in this JSON file, and read their last runs back from it.',
+                    'default': None,
+                    'dest': 'metrics_file',
+                }
+            ),
+            (
+                ['--metrics-port'],
+                {
+                    'help': 'Serve the backups\' metrics over HTTP on this port on 127.0.0.1.',
+                    'default': None,
+                    'type': int,
+                    'dest': 'metrics_port',
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Run the backups configured in the "backup:" sections of the mysql: entries in
+deployfish.yml, each every "every", until stopped with Ctrl-C or SIGTERM.  Use this
+instead of one cron job per database.
+
+Due backups wait in a queue, highest "priority" and then most overdue first, and start as
+the budgets allow: "--max-jobs" backups at once overall, "--max-per-host" on any one MySQL
+server and "--max-per-bastion" through any one ssh instance.  So backups that are all due
+at once are spread out instead of all starting together.  A failed backup is retried up
+to "retries" times, waiting "retry_delay" seconds and then twice as long each time.
+
+Each backup's runs, failures, duration, size and next run are written to "--metrics-file"
+as they change, and served over HTTP with "--metrics-port": as JSON at / and for
+Prometheus at /metrics.  With "--metrics-file", a restarted daemon picks up each backup's
+schedule from its last success instead of running every backup at once.
+"""
+    )
+    @handle_model_exceptions
+    def backup_daemon(self):
+        loader = self.loader(self)
+        objs = None
+        if self.app.pargs.names:
+            objs = [loader.get_object_from_deployfish(name) for name in self.app.pargs.names]
+        jobs = MySQLDatabase.objects.backup_jobs(objs, verbose=self.app.pargs.verbose)
+        if not jobs:
+            raise MySQLDatabase.OperationFailed('No mysql: entry has a backup: section')
+
+        def echo(message: str) -> None:
+            self.app.print('{} {}'.format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), message))
+
+        scheduler = BackupScheduler(
+            jobs,
+            max_jobs=self.app.pargs.max_jobs,
+            max_per_host=self.app.pargs.max_per_host,
+            max_per_bastion=self.app.pargs.max_per_bastion,
+            metrics_file=self.app.pargs.metrics_file,
+            callback=echo
+        )
+        server = None
+        if self.app.pargs.metrics_port:
+            server = serve_metrics(scheduler, self.app.pargs.metrics_port)
+        signal.signal(signal.SIGTERM, lambda *_: scheduler.stop())
+        echo(click.style('Scheduled {} backups'.format(len(jobs)), fg='green'))
+        try:
+            scheduler.run()
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    @ex(
+        help="Apply the pending .sql migration files in a local directory to a remote MySQL database.",
+        arguments=[
+            (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (['dirname'], {'help': 'the directory of .sql migration files'}),
+            (
+                ['--dry-run'],
+                {
+                    'help': 'Only report which migrations are pending.',
+                    'default': False,
+                    'dest': 'dry_run',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Apply the .sql files in a local directory that have not been applied to the remote
+database yet, in filename order, with numbers compared as numbers (so 2_users.sql comes
+before 10_orders.sql).
+
+Each file applied is recorded, with its SHA-256, in the deployfish_migrations table in the
+database, and skipped on later runs.  A recorded file that has since changed is an error.
+The pending files are all streamed through a single ssh connection to a single mysql
+client, which stops at the first error: the migrations before it stay applied and recorded.
+"""
+    )
+    @handle_model_exceptions
+    def migrate(self):
+        loader = self.loader(self)
+        obj = loader.get_object_from_deployfish(self.app.pargs.pk)
+        target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        if not os.path.isdir(self.app.pargs.dirname):
+            raise MySQLDatabase.OperationFailed('"{}" is not a directory'.format(self.app.pargs.dirname))
+        results = obj.migrate(
+            self.app.pargs.dirname,
+            ssh_target=target,
+            verbose=self.app.pargs.verbose,
+            dry_run=self.app.pargs.dry_run
+        )
+        for result in results:
+            result['checksum'] = result['checksum'][:12]
+        lines = []
+        if results:
+            lines.append(TableRenderer(columns=self.migrate_result_columns).render(results))
+        status = 'pending' if self.app.pargs.dry_run else 'applied'
+        lines.append(click.style(
+            '\n{} migrations {} to database "{}" on mysql server {}:{}'.format(
+                sum(1 for result in results if result['status'] == status),
+                'pending' if self.app.pargs.dry_run else 'applied',
+                obj.db,
+                obj.host,
+                obj.port
+            ),
+            fg='green'
+        ))
+        self.app.print('\n'.join(lines))
+
+    @ex(
+        help="Stream a local CSV or TSV file into a table in an existing MySQL database.",
+        label='import',
+        arguments=[
+            (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (['table'], {'help': 'the name of the table to load the data into'}),
+            (['datafile'], {'help': 'the filename of the CSV or TSV file to load'}),
+            (
+                ['--columns'],
+                {
+                    'help': 'Comma separated list of table columns, in file order.  Use @dummy to skip a column.',
+                    'default': None,
+                    'dest': 'columns',
+                }
+            ),
+            (
+                ['--delimiter'],
+                {
+                    'help': 'The field delimiter.  Default: tab for .tsv files, comma otherwise.',
+                    'default': None,
+                    'dest': 'delimiter',
+                }
+            ),
+            (
+                ['--ignore-lines'],
+                {
+                    'help': 'Skip this many lines at the start of the file.',
+                    'default': 0,
+                    'type': int,
+                    'dest': 'ignore_lines',
+                }
+            ),
+            (
+                ['--batch-size'],
+                {
+                    'help': 'Load the file this many lines at a time.  Default: load it all at once.',
+                    'default': None,
+                    'type': int,
+                    'dest': 'batch_size',
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Stream a local CSV or TSV file into a table in an existing database in the remote MySQL
+server with "LOAD DATA LOCAL INFILE".  The file is piped through ssh directly into the
+remote "mysql" client, so it is never copied to the ssh target.  The MySQL server must
+have "local_infile" enabled.
+
+For bulk data this is much faster than loading a file of INSERT statements with "load".
+"""
+    )
+    @handle_model_exceptions
+    def import_file(self):
+        loader = self.loader(self)
+        obj = loader.get_object_from_deployfish(self.app.pargs.pk)
+        target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        columns = None
+        if self.app.pargs.columns:
+            columns = [column.strip() for column in self.app.pargs.columns.split(',')]
+        rows, output = obj.import_file(
+            self.app.pargs.table,
+            self.app.pargs.datafile,
+            columns=columns,
+            delimiter=self.app.pargs.delimiter,
+            ignore_lines=self.app.pargs.ignore_lines,
+            batch_size=self.app.pargs.batch_size,
+            ssh_target=target,
+            verbose=self.app.pargs.verbose
+        )
+        lines = [
+            click.style(
+                'Imported {} from "{}" into table "{}" of database "{}" on mysql server {}:{}'.format(
+                    '{} rows'.format(rows) if rows is not None else 'an unknown number of rows',
+                    self.app.pargs.datafile,
+                    self.app.pargs.table,
+                    obj.db,
+                    obj.host,
+                    obj.port
+                ),
+                fg='green'
+            )
+        ]
+        # Without a row count, the mysql output is all we have to go on
+        if (self.app.pargs.verbose or rows is None) and output.strip():
+            lines.append(click.style('\nMySQL output:\n', fg='yellow'))
+            lines.append(output)
+        self.app.print('\n'.join(lines))
+
+    @ex(
+        help="Show the size and approximate row count of each table in a remote MySQL database.",
+        arguments=[
+            (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (
+                ['--sort'],
+                {
+                    'help': 'Sort the report by this column.',
+                    'default': 'size',
+                    'choices': ['size', 'rows', 'free', 'name'],
+                    'dest': 'sort',
+                }
+            ),
+            (
+                ['--cache'],
+                {
+                    'help': 'Also save the report, with a timestamp, as JSON to this file.',
+                    'default': None,
+                    'dest': 'cache',
+                }
+            ),
+            (
+                ['--primary'],
+                {
+                    'help': 'Use the primary server even if the connection has read replicas.',
+                    'default': False,
+                    'dest': 'primary',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Show the engine, approximate row count, data size, index size and fragmentation
+(free space) of each table in a remote MySQL database.  All the numbers come from a
+single query against information_schema, so this is cheap to run even on big databases.
+"""
+    )
+    @handle_model_exceptions
+    def stats(self):
+        loader = self.loader(self)
+        obj = loader.get_object_from_deployfish(self.app.pargs.pk)
+        target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        obj = self.read_target(obj, target)
+        tables = obj.stats(ssh_target=target, verbose=self.app.pargs.verbose)
+        # Sort here rather than with TableRenderer's ordering, which would sort the
+        # human readable byte sizes as strings
+        sort_key = {
+            'size': lambda t: -t['total_length'],
+            'rows': lambda t: -t['rows'],
+            'free': lambda t: -t['data_free'],
+            'name': lambda t: t['table'],
+        }[self.app.pargs.sort]
+        renderer = TableRenderer(columns=self.stats_result_columns)
+        lines = [renderer.render(sorted(tables, key=sort_key))]
+        lines.append(click.style(
+            '\n{} tables, {} rows, {} total in database "{}" on mysql server {}:{}'.format(
+                len(tables),
+                sum(t['rows'] for t in tables),
+                renderer.human_bytes(sum(t['total_length'] for t in tables)),
+                obj.db,
+                obj.host,
+                obj.port
+            ),
+            fg='green'
+        ))
+        if self.app.pargs.cache:
+            write_snapshot(self.app.pargs.cache, 'stats', obj, tables)
+            lines.append(click.style('Saved report to "{}".'.format(self.app.pargs.cache), fg='green'))
+        self.app.print('\n'.join(lines))
+
+    @ex(
+        help="Show the most expensive queries run against a remote MySQL database.",
+        arguments=[
+            (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (
+                ['--sort'],
+                {
+                    'help': 'Rank queries by this.',
+                    'default': 'latency',
+                    'choices': ['latency', 'rows', 'calls'],
+                    'dest': 'sort',
+                }
+            ),
+            (
+                ['--limit'],
+                {
+                    'help': 'Show this many queries.',
+                    'default': 20,
+                    'type': int,
+                    'dest': 'limit',
+                }
+            ),
+            (
+                ['--save'],
+                {
+                    'help': 'Save the raw counters, with a timestamp, as JSON to this file.',
+                    'default': None,
+                    'dest': 'save',
+                }
+            ),
+            (
+                ['--since'],
+                {
+                    'help': 'Only report activity since the snapshot saved in this file with --save.',
+                    'default': None,
+                    'dest': 'since',
+                }
+            ),
+            (
+                ['--interval'],
+                {
+                    'help': 'Take two snapshots this many minutes apart, and report activity between them.',
+                    'default': None,
+                    'type': float,
+                    'dest': 'interval',
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Rank the statements run against a remote MySQL database by total latency, rows examined
+or number of calls, using performance_schema.events_statements_summary_by_digest.
+
+By default the numbers are cumulative since the server started.  Use "--interval" to
+measure a window of time, or "--save" now and "--since" later to compare against an
+earlier snapshot of the same database.  Interval reports include per second rates.
+"""
+    )
+    @handle_model_exceptions
+    def top_queries(self):
+        loader = self.loader(self)
+        obj = loader.get_object_from_deployfish(self.app.pargs.pk)
+        target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        before = None
+        elapsed = None
+        if self.app.pargs.since:
+            snapshot = read_snapshot(self.app.pargs.since, 'digests', obj=obj)
+            before = snapshot['rows']
+            elapsed = snapshot_age(snapshot).total_seconds()
+        elif self.app.pargs.interval:
+            before = obj.digests(ssh_target=target, verbose=self.app.pargs.verbose)
+            elapsed = self.app.pargs.interval * 60
+            self.app.print(click.style('Sampling for {} minutes ...'.format(self.app.pargs.interval), fg='yellow'))
+            time.sleep(elapsed)
+        digests = obj.digests(ssh_target=target, verbose=self.app.pargs.verbose)
+        if self.app.pargs.save:
+            write_snapshot(self.app.pargs.save, 'digests', obj, digests)
+        columns = dict(self.top_queries_result_columns)
+        if before is not None:
+            digests = diff_counters(
+                before,
+                digests,
+                'digest',
+                ['calls', 'latency', 'rows_examined', 'rows_sent']
+            )
+            for digest in digests:
+                digest['calls_per_second'] = digest['calls'] / elapsed if elapsed else 0.0
+            columns['Calls/s'] = 'calls_per_second'
+        for digest in digests:
+            digest['average'] = digest['latency'] * 1000 / digest['calls'] if digest['calls'] else 0.0
+        sort_key = {
+            'latency': lambda d: -d['latency'],
+            'rows': lambda d: -d['rows_examined'],
+            'calls': lambda d: -d['calls'],
+        }[self.app.pargs.sort]
+        digests = sorted(digests, key=sort_key)[:self.app.pargs.limit]
+        columns['Query'] = {'key': 'query', 'wrap': 80}
+        self.app.print(TableRenderer(columns=columns).render(digests))
+
+    @ex(
+        help="Report unused and redundant indexes and tables without primary keys in a remote MySQL database.",
+        arguments=[
+            (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (
+                ['--root'],
+                {
+                    'help': 'Connect as the root user of the RDS instance instead of our user.',
+                    'default': False,
+                    'dest': 'root',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['--root-password'],
+                {
+                    'help': 'the password of the root user for the MySQL server.  Implies --root.',
+                    'default': None,
+                    'dest': 'root_password'
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Report indexes in a remote MySQL database that slow down writes and restores without
+helping reads:
+
+  * secondary indexes that have not been read from since the server started
+  * secondary indexes whose columns are a leading prefix of another index on the same table
+  * tables with no primary key
+
+For each index we show its size and the number of row writes on its table since the
+server started, each of which also had to update the index.
+
+This needs SELECT on performance_schema and the mysql schema, which your database user
+may not have; use "--root" to connect as the RDS root user instead.
+"""
+    )
+    @handle_model_exceptions
+    def index_report(self):
+        loader = self.loader(self)
+        obj = loader.get_object_from_deployfish(self.app.pargs.pk)
+        user, password = self.root_credentials(obj)
+        target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        report = obj.index_report(ssh_target=target, verbose=self.app.pargs.verbose, user=user, password=password)
+        lines = [
+            click.style(
+                'Index usage counters cover the last {} (server uptime).'.format(
+                    datetime.timedelta(seconds=report['uptime'])
+                ),
+                fg='yellow'
+            )
+        ]
+        columns = dict(self.index_report_result_columns)
+        lines.append(click.style('\nUnused indexes:\n', fg='cyan'))
+        lines.append(TableRenderer(columns=columns).render(report['unused']) if report['unused'] else 'None')
+        columns['Covered by'] = 'covered_by'
+        lines.append(click.style('\nRedundant indexes:\n', fg='cyan'))
+        lines.append(TableRenderer(columns=columns).render(report['redundant']) if report['redundant'] else 'None')
+        lines.append(click.style('\nTables without a primary key:\n', fg='cyan'))
+        if report['no_primary_key']:
+            lines.append(TableRenderer(columns={'Table': 'table', 'Rows': 'rows'}).render(report['no_primary_key']))
+        else:
+            lines.append('None')
+        wasted = {(r['table'], r['index']): r['size'] for r in report['unused'] + report['redundant']}
+        lines.append(click.style(
+            '\n{} indexes using {} could be dropped.'.format(
+                len(wasted),
+                TableRenderer(columns={}).human_bytes(sum(wasted.values()))
+            ),
+            fg='green'
+        ))
+        self.app.print('\n'.join(lines))
+
+    @ex(
+        help="Show the DDL needed to make the schema of one MySQL database match another.",
+        arguments=[
+            (['source'], {'help': 'the name of the MySQL connection in deployfish.yml with the schema we want'}),
+            (['target'], {'help': 'the name of the MySQL connection in deployfish.yml to compare to it'}),
+            (
+                ['--output'],
+                {
+                    'help': 'Write the DDL to this file instead of printing it.',
+                    'default': None,
+                    'dest': 'output',
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Compare the schemas of two MySQL databases and print the CREATE, ALTER and DROP TABLE
+statements that would make TARGET match SOURCE.  Per-table hashes are fetched from both
+servers at the same time, and only tables whose hashes differ are compared in detail.
+
+Review the output before running it: DROP TABLE and DROP COLUMN statements lose data.
+"""
+    )
+    @handle_model_exceptions
+    def schema_diff(self):
+        loader = self.loader(self)
+        source = loader.get_object_from_deployfish(self.app.pargs.source)
+        target = loader.get_object_from_deployfish(self.app.pargs.target)
+        source_target = get_ssh_target(self.app, source, choose=self.app.pargs.choose)
+        target_target = get_ssh_target(self.app, target, choose=self.app.pargs.choose)
+        statements, identical = source.schema_diff(
+            target,
+            ssh_target=source_target,
+            other_ssh_target=target_target,
+            verbose=self.app.pargs.verbose
+        )
+        lines = []
+        if statements:
+            ddl = '\n\n'.join(statements) + '\n'
+            if self.app.pargs.output:
+                with open(self.app.pargs.output, 'w', encoding='utf-8') as fd:
+                    fd.write(ddl)
+            else:
+                lines.append(ddl)
+        lines.append(click.style(
+            '{} tables identical, {} statements needed to make "{}" match "{}".'.format(
+                len(identical), len(statements), self.app.pargs.target, self.app.pargs.source
+            ),
+            fg='green' if not statements else 'yellow'
+        ))
+        if statements and self.app.pargs.output:
+            lines.append(click.style('Wrote DDL to "{}".'.format(self.app.pargs.output), fg='green'))
+        self.app.print('\n'.join(lines))
+
+    @ex(
+        help="Check that the data in one MySQL database matches another, without copying it.",
+        arguments=[
+            (['source'], {'help': 'the name of the MySQL connection in deployfish.yml with the data we expect'}),
+            (['target'], {'help': 'the name of the MySQL connection in deployfish.yml to check'}),
+            (
+                ['--tables'],
+                {
+                    'help': 'Comma separated list of tables to check.  Default: all tables in SOURCE.',
+                    'default': None,
+                    'dest': 'tables',
+                }
+            ),
+            (
+                ['--chunk-size'],
+                {
+                    'help': 'Checksum this many primary key values per chunk.',
+                    'default': 100000,
+                    'type': int,
+                    'dest': 'chunk_size',
+                }
+            ),
+            (
+                ['--min-chunk-size'],
+                {
+                    'help': 'Stop narrowing down mismatched chunks at this many primary key values.',
+                    'default': 100,
+                    'type': int,
+                    'dest': 'min_chunk_size',
+                }
+            ),
+            (
+                ['--jobs'],
+                {
+                    'help': 'Check this many tables at once.',
+                    'default': 1,
+                    'type': int,
+                    'dest': 'jobs',
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Check that the data in TARGET matches the data in SOURCE, e.g. after a "load" or a copy.
+Each table is split into primary key ranges, and a checksum of each range is computed on
+both servers at the same time.  Only ranges that don't match are narrowed down further,
+so no rows ever leave either server.  Tables without a single integer primary key are
+checksummed as a whole.
+"""
+    )
+    @handle_model_exceptions
+    def verify(self):
+        loader = self.loader(self)
+        source = loader.get_object_from_deployfish(self.app.pargs.source)
+        target = loader.get_object_from_deployfish(self.app.pargs.target)
+        source_target = get_ssh_target(self.app, source, choose=self.app.pargs.choose)
+        target_target = get_ssh_target(self.app, target, choose=self.app.pargs.choose)
+        tables = None
+        if self.app.pargs.tables:
+            tables = [table.strip() for table in self.app.pargs.tables.split(',')]
+        results = source.verify(
+            target,
+            tables=tables,
+            chunk_size=self.app.pargs.chunk_size,
+            min_chunk_size=self.app.pargs.min_chunk_size,
+            jobs=self.app.pargs.jobs,
+            ssh_target=source_target,
+            other_ssh_target=target_target,
+            verbose=self.app.pargs.verbose
+        )
+        for result in results:
+            ranges = ', '.join('{}-{}'.format(start, end - 1) for start, end in result['ranges'])
+            result['details'] = '; '.join(item for item in (result['message'], ranges) if item)
+        lines = [TableRenderer(columns=self.verify_result_columns).render(results)]
+        bad = [result for result in results if result['verdict'] != 'match']
+        if bad:
+            lines.append(click.style(
+                '\n{} of {} tables in "{}" do not match "{}".'.format(
+                    len(bad), len(results), self.app.pargs.target, self.app.pargs.source
+                ),
+                fg='red'
+            ))
+        else:
+            lines.append(click.style(
+                '\nAll {} tables in "{}" match "{}".'.format(
+                    len(results), self.app.pargs.target, self.app.pargs.source
+                ),
+                fg='green'
+            ))
+        self.app.print('\n'.join(lines))
+
+    @ex(
+        help="Delete or archive old rows in small batches, as configured in the purge section.",
+        arguments=[
+            (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (
+                ['--table'],
+                {
+                    'help': 'Only run the purge for this table.',
+                    'default': None,
+                    'dest': 'table',
+                }
+            ),
+            (
+                ['--archive-dir'],
+                {
+                    'help': 'Save rows for purges with "archive: true" to gzipped TSV files in this directory.',
+                    'default': '.',
+                    'dest': 'archive_dir',
+                }
+            ),
+            (
+                ['--dry-run'],
+                {
+                    'help': 'Only count the rows that would be purged.',
+                    'default': False,
+                    'dest': 'dry_run',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Delete old rows from the tables listed in the "purge" section of a MySQL connection in
+deployfish.yml.  Rows are deleted in small batches in primary key order, sleeping between
+batches and waiting whenever the server has too many running threads or the configured
+replica is lagging, so that the purge never causes a lock storm.
+
+Purges with "archive: true" save each batch to a gzipped TSV file before deleting it.
+"""
+    )
+    @handle_model_exceptions
+    def purge(self):
+        loader = self.loader(self)
+        obj = loader.get_object_from_deployfish(self.app.pargs.pk)
+        target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        results = obj.purge(
+            table=self.app.pargs.table,
+            archive_dir=self.app.pargs.archive_dir,
+            dry_run=self.app.pargs.dry_run,
+            ssh_target=target,
+            verbose=self.app.pargs.verbose,
+            callback=lambda message: self.app.print(click.style(message, fg='yellow'))
+        )
+        lines = []
+        for result in results:
+            if self.app.pargs.dry_run:
+                message = 'Would purge {} rows from table "{}" of database "{}" on mysql server {}:{}'.format(
+                    result['rows'], result['table'], obj.db, obj.host, obj.port
+                )
+            else:
+                message = 'Purged {} rows from table "{}" of database "{}" on mysql server {}:{} in {:.1f}s.'.format(
+                    result['rows'], result['table'], obj.db, obj.host, obj.port, result['elapsed']
+                )
+                if result['archive']:
+                    message += ' Archived rows to "{}".'.format(result['archive'])
+            lines.append(click.style(message, fg='green'))
+        self.app.print('\n'.join(lines))
+
+    @ex(
+        help="Alter a table without locking it, by copying it to an altered shadow table and swapping them.",
+        arguments=[
+            (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (['table'], {'help': 'the name of the table to alter'}),
+            (
+                ['alter'],
+                {
+                    'help': 'the alter specification, e.g. "ADD COLUMN foo int".  Not needed with --resume or --abort.',
+                    'nargs': '?',
+                    'default': None,
+                }
+            ),
+            (
+                ['--chunk-size'],
+                {
+                    'help': 'Copy this many primary key values per chunk.',
+                    'default': 1000,
+                    'type': int,
+                    'dest': 'chunk_size',
+                }
+            ),
+            (
+                ['--sleep'],
+                {
+                    'help': 'Sleep this many seconds between chunks.',
+                    'default': 0.0,
+                    'type': float,
+                    'dest': 'sleep',
+                }
+            ),
+            (
+                ['--max-threads-running'],
+                {
+                    'help': 'Wait before each chunk while the server has this many threads running.',
+                    'default': 25,
+                    'type': int,
+                    'dest': 'max_threads_running',
+                }
+            ),
+            (
+                ['--state-file'],
+                {
+                    'help': 'Save progress to this file.  Default: "{db}.{table}.alter.json".',
+                    'default': None,
+                    'dest': 'state_file',
+                }
+            ),
+            (
+                ['--resume'],
+                {
+                    'help': 'Resume a paused alter from the state file.',
+                    'default': False,
+                    'dest': 'resume',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['--abort'],
+                {
+                    'help': 'Undo a paused alter: drop the triggers and the shadow table.',
+                    'default': False,
+                    'dest': 'abort',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['--keep-old'],
+                {
+                    'help': 'Keep the original table as "_{table}_old" after the swap.',
+                    'default': False,
+                    'dest': 'keep_old',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Alter a table in a remote MySQL database without blocking writes to it.  We create an
+altered, empty copy of the table, add triggers that keep the copy in sync with changes to
+the original, copy the existing rows over in throttled primary key chunks, and then swap
+the two tables with an atomic RENAME TABLE.  The table must have a single column integer
+primary key.
+
+Interrupt the command, or create the file "{state-file}.pause", to pause after the current
+chunk.  Continue later with "--resume", or undo everything with "--abort".
+"""
+    )
+    @handle_model_exceptions
+    def alter(self):
+        loader = self.loader(self)
+        obj = loader.get_object_from_deployfish(self.app.pargs.pk)
+        target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+        if self.app.pargs.abort:
+            obj.abort_online_alter(
+                self.app.pargs.table,
+                state_file=self.app.pargs.state_file,
+                ssh_target=target,
+                verbose=self.app.pargs.verbose
+            )
+            self.app.print(click.style(
+                'Aborted altering table "{}" of database "{}" on mysql server {}:{}.'.format(
+                    self.app.pargs.table, obj.db, obj.host, obj.port
+                ),
+                fg='green'
+            ))
+            return
+        result = obj.online_alter(
+            self.app.pargs.table,
+            alter=self.app.pargs.alter,
+            chunk_size=self.app.pargs.chunk_size,
+            sleep=self.app.pargs.sleep,
+            max_threads_running=self.app.pargs.max_threads_running,
+            state_file=self.app.pargs.state_file,
+            resume=self.app.pargs.resume,
+            keep_old=self.app.pargs.keep_old,
+            ssh_target=target,
+            verbose=self.app.pargs.verbose,
+            callback=lambda message: self.app.print(click.style(message, fg='yellow'))
+        )
+        self.app.print(click.style(
+            'Altered table "{}" of database "{}" on mysql server {}:{}: copied {} rows in {:.1f}s.'.format(
+                result['table'], obj.db, obj.host, obj.port, result['rows'], result['elapsed']
+            ),
+            fg='green'
+        ))
+
+    @ex(
+        help="Watch lock waits, long transactions and connections on a remote MySQL server.",
+        arguments=[
+            (['pk'], {'help': 'the name of the MySQL connection in deployfish.yml'}),
+            (
+                ['--interval'],
+                {
+                    'help': 'Seconds between samples.',
+                    'default': 2.0,
+                    'type': float,
+                    'dest': 'interval',
+                }
+            ),
+            (
+                ['--samples'],
+                {
+                    'help': 'Stop after this many samples.  Default: run until interrupted with Ctrl-C.',
+                    'default': None,
+                    'type': int,
+                    'dest': 'samples',
+                }
+            ),
+            (
+                ['--long-transaction'],
+                {
+                    'help': 'Report transactions that have been open at least this many seconds.',
+                    'default': 30,
+                    'type': int,
+                    'dest': 'long_transaction',
+                }
+            ),
+            (
+                ['--root'],
+                {
+                    'help': 'Connect as the root user of the RDS instance instead of our user.',
+                    'default': False,
+                    'dest': 'root',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['--root-password'],
+                {
+                    'help': 'the password of the root user for the MySQL server.  Implies --root.',
+                    'default': None,
+                    'dest': 'root_password'
+                }
+            ),
+            (
+                ['-c', '--choose'],
+                {
+                    'help': 'Choose from all available ssh targets instead of choosing one automatically.',
+                    'default': False,
+                    'dest': 'choose',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Sample the processlist, InnoDB lock waits and long running transactions on a remote MySQL
+server every few seconds over a single connection, printing a line per sample.  When the
+watch ends (after "--samples" samples, or when you press Ctrl-C) print a summary of the
+whole window:
+
+  * blocking chains, as "blocker <- waiter <- waiter", and how often we saw them
+  * the threads that blocked others, with what they were running
+  * transactions open longer than "--long-transaction" seconds
+  * average and peak connections per user and client host
+
+Seeing other users' threads needs the PROCESS privilege; use "--root" to connect as the
+RDS root user if your database user does not have it.
+"""
+    )
+    @handle_model_exceptions
+    def watch(self):
+        loader = self.loader(self)
+        obj = loader.get_object_from_deployfish(self.app.pargs.pk)
+        user, password = self.root_credentials(obj)
+        target = get_ssh_target(self.app, obj, choose=self.app.pargs.choose)
+
+        def show_sample(sample: Dict[str, Any]) -> None:
+            line = '[{}] {} connections, {} running, {} lock waits, {} long transactions'.format(
+                datetime.datetime.fromtimestamp(sample['timestamp']).strftime('%H:%M:%S'),
+                sample['connections'],
+                sample['running'],
+                sample['waits'],
+                sample['long_transactions'],
+            )
+            self.app.print(click.style(line, fg='red' if sample['waits'] else None))
+            for chain in sample['chains']:
+                self.app.print(click.style('    {}'.format(chain), fg='yellow'))
+
+        report = obj.watch(
+            interval=self.app.pargs.interval,
+            samples=self.app.pargs.samples,
+            long_transaction=self.app.pargs.long_transaction,
+            ssh_target=target,
+            verbose=self.app.pargs.verbose,
+            user=user,
+            password=password,
+            callback=show_sample
+        )
+        lines = []
+        lines.append(click.style('\nBlocking chains:\n', fg='cyan'))
+        if report['chains']:
+            lines.append(TableRenderer(columns={'Chain': 'chain', 'Samples': 'samples'}).render(report['chains']))
+        else:
+            lines.append('None')
+        lines.append(click.style('\nBlockers:\n', fg='cyan'))
+        if report['blockers']:
+            lines.append(TableRenderer(columns=self.watch_blockers_result_columns).render(report['blockers']))
+        else:
+            lines.append('None')
+        lines.append(click.style('\nLong transactions:\n', fg='cyan'))
+        if report['long_transactions']:
+            lines.append(
+                TableRenderer(columns=self.watch_transactions_result_columns).render(report['long_transactions'])
+            )
+        else:
+            lines.append('None')
+        lines.append(click.style('\nConnections:\n', fg='cyan'))
+        if report['connections']:
+            lines.append(TableRenderer(columns=self.watch_connections_result_columns).render(report['connections']))
+        else:
+            lines.append('None')
+        self.app.print('\n'.join(lines))
+
+    def audit_credentials(self, obj: MySQLDatabase) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Return the root user and password of the RDS instance ``obj`` is on,
+        prompting for the password if the RDS instance does not keep it in a
+        secret.
+        """
+        rds_instance = RDSInstance.objects.get(obj.host.split('.')[0])
+        if rds_instance.secret_enabled:
+            return rds_instance.root_user, rds_instance.root_password
+        p = shell.Prompt('DB root password for {}'.format(obj.host))
+        return rds_instance.root_user, p.prompt()
+
+    @ex(
+        help="Check the accounts, grants and databases on every MySQL server against deployfish.yml.",
+        arguments=[
+            (
+                ['names'],
+                {
+                    'help': 'the names of MySQL connections in deployfish.yml.  Default: all of them.',
+                    'nargs': '*',
+                }
+            ),
+            (
+                ['--cache'],
+                {
+                    'help': 'Keep the snapshots of the servers\' grants in this file.',
+                    'default': '~/.deployfish-mysql-audit.json',
+                    'dest': 'cache',
+                }
+            ),
+            (
+                ['--no-cache'],
+                {
+                    'help': 'Read every server in full, and do not save the snapshots.',
+                    'default': False,
+                    'dest': 'no_cache',
+                    'action': 'store_true'
+                }
+            ),
+            (
+                ['--concurrency'],
+                {
+                    'help': 'Read this many servers at once.',
+                    'default': 4,
+                    'type': int,
+                    'dest': 'concurrency',
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Find drift between the mysql: entries in deployfish.yml and the MySQL servers they point
+to.  For each entry we check what "deploy mysql create" would have set up: that the
+database exists with the configured character set and collation, and that the account
+'{user}'@'%' exists with the configured password and mysql_native_password, has all
+privileges on the database and no global, table or other database privileges beyond the
+databases of the user's other entries on that server.
+
+We read each server's accounts, grants and databases in one query, as the RDS root user,
+"--concurrency" servers at a time.  The snapshots are kept in "--cache": on later runs a
+server whose grants have not changed sends only a fingerprint of them, and we check its
+cached snapshot against deployfish.yml again.
+"""
+    )
+    @handle_model_exceptions
+    def audit(self):
+        loader = self.loader(self)
+        objs = None
+        if self.app.pargs.names:
+            objs = [loader.get_object_from_deployfish(name) for name in self.app.pargs.names]
+        servers = MySQLDatabase.objects.audit(
+            objs,
+            cache_file=None if self.app.pargs.no_cache else os.path.expanduser(self.app.pargs.cache),
+            credentials=self.audit_credentials,
+            verbose=self.app.pargs.verbose,
+            concurrency=self.app.pargs.concurrency
+        )
+        renderer = TableRenderer(columns=self.audit_result_columns)
+        lines = []
+        for server in servers:
+            title = '{}:{}'.format(server['host'], server['port'])
+            if server['cached']:
+                title += ' (grants unchanged since the last audit)'
+            lines.append(click.style(title, fg='cyan', bold=True))
+            if server['error']:
+                lines.append(click.style(server['error'], fg='red'))
+            elif server['findings']:
+                lines.append(renderer.render(server['findings']))
+            else:
+                lines.append(click.style('No drift in {}'.format(', '.join(server['names'])), fg='green'))
+            lines.append('')
+        lines.append(click.style(
+            '{} problems on {} of {} servers'.format(
+                sum(len(server['findings']) for server in servers),
+                sum(1 for server in servers if server['findings'] or server['error']),
+                len(servers)
+            ),
+            fg='green' if not any(server['findings'] or server['error'] for server in servers) else 'red'
+        ))
+        self.app.print('\n'.join(lines))
+
+    @ex(
+        help="Check whether each MySQL server can take the connections of its services during a deploy.",
+        arguments=[
+            (
+                ['names'],
+                {
+                    'help': 'the names of MySQL connections in deployfish.yml.  Default: all of them.',
+                    'nargs': '*',
+                }
+            ),
+            (
+                ['--concurrency'],
+                {
+                    'help': 'Check this many servers at once.',
+                    'default': 4,
+                    'type': int,
+                    'dest': 'concurrency',
+                }
+            ),
+            (
+                ['-v', '--verbose'],
+                {
+                    'help': 'Show all SSH output.',
+                    'default': False,
+                    'dest': 'verbose',
+                    'action': 'store_true'
+                }
+            ),
+        ],
+        description="""
+Find MySQL servers that will run out of connections during a deploy, before the deploy.
+
+We group the mysql: entries in deployfish.yml by server.  For each entry we take its
+service's task count, the most tasks its application autoscaling can scale it out to, and
+the "pool_size" of the entry (the connections each task holds open; default 10).  During a
+rolling deploy ECS runs up to "maximum_percent" percent of those tasks at once (default
+200%), so "Peak" is what the entry's service needs then.
+
+For each server we add up the peaks, as if every service on it was at its most tasks and
+deployed at once, and compare that with the server's live max_connections.  We also add the
+extra tasks' connections to its live Threads_connected, for a deploy right now.  A server
+whose worse peak reaches max_connections is OVER; one that reaches 80% of it is TIGHT.
+"""
+    )
+    @handle_model_exceptions
+    def capacity(self):
+        loader = self.loader(self)
+        objs = None
+        if self.app.pargs.names:
+            objs = [loader.get_object_from_deployfish(name) for name in self.app.pargs.names]
+        servers = MySQLDatabase.objects.capacity(
+            objs,
+            verbose=self.app.pargs.verbose,
+            concurrency=self.app.pargs.concurrency
+        )
+        colors = {'OK': 'green', 'TIGHT': 'yellow', 'OVER': 'red', 'UNKNOWN': 'red'}
+        renderer = TableRenderer(columns=self.capacity_result_columns)
+        lines = []
+        for server in servers:
+            lines.append(click.style('{}:{}'.format(server['host'], server['port']), fg='cyan', bold=True))
+            lines.append(renderer.render(server['entries']))
+            if server['error']:
+                lines.append(click.style('Could not read the server\'s limits: {}'.format(server['error']), fg='red'))
+            else:
+                lines.append(click.style(
+                    '{}: peak {} connections ({} with {} open now), max_connections {}, headroom {}'.format(
+                        server['verdict'],
+                        server['peak'],
+                        server['live_peak'],
+                        server['threads_connected'],
+                        server['max_connections'],
+                        server['headroom']
+                    ),
+                    fg=colors[server['verdict']]
+                ))
+            lines.append('')
+        self.app.print('\n'.join(lines).rstrip())
+
     @ex(
         help="Show the GRANTs for the our user in the remote MySQL server.",
         arguments=[
@@ -0,0 +1,92 @@
+import mmap
+import os
+import re
+from typing import Any, Dict, Iterator, List, Sequence
+
+
+#: The three line heading ``mysqldump`` starts each section with.  Starting the pattern with a
+#: literal lets ``re`` skip through the data sections quickly.
+SECTION_RE = re.compile(rb'\n--\n-- (?P<heading>[^\n]*)\n--\n')
+#: The heading of a table's DDL or data section
+TABLE_HEADING_RE = re.compile(rb'^(?P<kind>Table structure|Dumping data) for table `(?P<table>(?:[^`]|``)+)`$')
+#: The first statement of the footer that restores the session settings the header changed
+FOOTER_RE = re.compile(
+    rb'^/\*!40103 SET TIME_ZONE=@OLD_TIME_ZONE \*/;|^/\*!40101 SET SQL_MODE=@OLD_SQL_MODE \*/;',
+    re.MULTILINE
+)
+#: The footer is short, so we only look for it this far from the end of the dump
+FOOTER_SIZE = 64 * 1024
+#: How much of a section we read at a time
+READ_SIZE = 1024 * 1024
+
+
+def index_filename(dump_filename: str) -> str:
+    """
+    Return the name of the index file for the dump ``dump_filename``.
+    """
+    return '{}.index.json'.format(dump_filename)
+
+
+def build_dump_index(filename: str) -> List[Dict[str, Any]]:
+    """
+    Find the byte ranges of the sections of the ``mysqldump`` output in
+    ``filename``: the header, each table's DDL and data, and the footer.
+
+    We scan a memory map of the file for section headings, so even a very
+    big dump takes seconds rather than a full read through Python.
+
+    Returns:
+        A list of dicts with keys ``section`` (``header``, ``table`` or
+        ``footer``), ``start`` and ``end``.  ``table`` sections also have the
+        keys ``table`` and ``data_start``, where the table's data starts (or
+        ``None`` if the dump has no data for the table).
+    """
+    size = os.path.getsize(filename)
+    if size == 0:
+        return []
+    with open(filename, 'rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as dump:
+        header_start = 0
+        # ssh_noninteractive mixes mysqldump's stderr into the dump
+        while dump[header_start:header_start + 11] == b'mysqldump: ':
+            header_start = dump.find(b'\n', header_start) + 1
+        boundaries = [(match.start() + 1, match.group('heading')) for match in SECTION_RE.finditer(dump)]
+        footer_start = size
+        last = boundaries[-1][0] if boundaries else header_start
+        match = FOOTER_RE.search(dump, max(last, size - FOOTER_SIZE))
+        if match:
+            footer_start = match.start()
+    sections: List[Dict[str, Any]] = []
+    first = boundaries[0][0] if boundaries else footer_start
+    sections.append({'section': 'header', 'start': header_start, 'end': first})
+    current = None
+    for i, (start, heading) in enumerate(boundaries):
+        end = boundaries[i + 1][0] if i + 1 < len(boundaries) else footer_start
+        match = TABLE_HEADING_RE.match(heading)
+        table = match.group('table').decode('utf-8').replace('``', '`') if match else None
+        if match and match.group('kind') == b'Table structure':
+            current = {'section': 'table', 'table': table, 'start': start, 'data_start': None, 'end': end}
+            sections.append(current)
+        elif match and current is not None and current['table'] == table:
+            current['data_start'] = start
+            current['end'] = end
+        else:
+            current = None
+    sections.append({'section': 'footer', 'start': footer_start, 'end': size})
+    return sections
+
+
+def read_sections(filename: str, sections: Sequence[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Yield the bytes of ``sections`` of ``filename``, in order, seeking
+    straight to each one.
+    """
+    with open(filename, 'rb') as fd:
+        for section in sections:
+            fd.seek(section['start'])
+            remaining = section['end'] - section['start']
+            while remaining > 0:
+                data = fd.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
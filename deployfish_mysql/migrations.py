@@ -0,0 +1,70 @@
+import hashlib
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Union
+
+from deployfish_mysql.checksums import read_blocks
+from deployfish_mysql.coalesce import split_statements
+
+
+#: The table in our database in which we record the migrations we have applied
+MIGRATIONS_TABLE = 'deployfish_migrations'
+#: The first column of the row we select after each migration, so we can find those rows in the output
+MIGRATED_MARKER = 'deployfish-migrated'
+#: Nothing but whitespace and comments (other than the ``/*! */`` comments that ``mysql`` runs)
+BLANK_RE = re.compile(
+    rb'(?:\s|--(?:[ \t\r][^\n]*)?(?:\n|\Z)|#[^\n]*(?:\n|\Z)|/\*(?!!).*?\*/)*\Z',
+    re.DOTALL
+)
+
+
+def natural_key(filename: str) -> List[Union[int, str]]:
+    """
+    Sort ``filename`` with the numbers in it compared as numbers, so that
+    ``2_users.sql`` comes before ``10_orders.sql``.
+    """
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', filename)]
+
+
+def migration_files(dirname: str) -> List[Dict[str, Any]]:
+    """
+    List the ``.sql`` files in ``dirname``, in the order to apply them.
+
+    Returns:
+        A list of dicts with keys ``filename``, ``path``, ``checksum`` (the
+        SHA-256 of the file) and ``size``.
+    """
+    files = []
+    for filename in sorted(os.listdir(dirname), key=natural_key):
+        path = os.path.join(dirname, filename)
+        if not filename.lower().endswith('.sql') or not os.path.isfile(path):
+            continue
+        digest = hashlib.sha256()
+        size = 0
+        for block in read_blocks(path):
+            digest.update(block)
+            size += len(block)
+        files.append({'filename': filename, 'path': path, 'checksum': digest.hexdigest(), 'size': size})
+    return files
+
+
+def terminate(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Pass the SQL script in ``blocks`` through unchanged, except that we end
+    its last statement with the delimiter if it has none, and then set the
+    delimiter back to ``;``.  ``mysql`` runs an unterminated last statement
+    at the end of its input, but here more SQL follows it.
+    """
+    delimiter = b';'
+    last = b''
+    for statement in split_statements(blocks):
+        if last:
+            yield last
+        last = statement
+        if statement.lstrip()[:10].lower() in (b'delimiter ', b'delimiter\t'):
+            delimiter = statement.split()[1]
+    if not last.rstrip().endswith(delimiter) and not BLANK_RE.match(last):
+        last += b'\n' + delimiter
+    yield last + b'\n'
+    if delimiter != b';':
+        yield b'DELIMITER ;\n'
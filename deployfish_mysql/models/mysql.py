@@ -1,9 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+import datetime
+import gzip
+import hashlib
+import json
 import os
+import posixpath
+import re
 import tempfile
-from typing import Optional, Sequence, Tuple, List, cast
+import threading
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, Optional, Sequence, Set, Tuple, List, Union, cast
 
 from deployfish.config import get_config
-from deployfish.core.models import Manager, Model, Secret, Service, Instance, Cluster
+from deployfish.core.models import Manager, Model, Secret, Service, Instance, Cluster, RDSInstance
+
+from deployfish_mysql.audit import (
+    AUDIT_MARKER,
+    AUDIT_SOURCES,
+    audit_entries,
+    parse_audit_output,
+    read_audit_cache,
+    write_audit_cache,
+)
+from deployfish_mysql.binlog import (
+    chain_filename,
+    compress_segment,
+    copy_segment,
+    read_dump_position,
+    segment_filename,
+)
+from deployfish_mysql.checksums import (
+    READ_SIZE,
+    hash_blocks,
+    parse_trailer,
+    read_blocks,
+    receive_with_trailer,
+    record_checksum,
+)
+from deployfish_mysql.capacity import POOL_SIZE, host_capacity, parse_connection_limits, service_demand
+from deployfish_mysql.coalesce import MAX_STATEMENT_SIZE, InsertCoalescer
+from deployfish_mysql.dump_index import build_dump_index, index_filename, read_sections
+from deployfish_mysql.migrations import MIGRATED_MARKER, MIGRATIONS_TABLE, migration_files, terminate
+from deployfish_mysql.scheduler import BackupJob, parse_interval
+from deployfish_mysql.schema import analyze_indexes, build_columns, build_indexes, diff_table, table_hashes
+from deployfish_mysql.session import MySQLSession
+from deployfish_mysql.sinks import DumpSink, DumpStoreSink, FileSink, sink_for
+from deployfish_mysql.snapshots import SnapshotError, read_snapshot, write_snapshot
+from deployfish_mysql.sql import (
+    column_list,
+    escape_for_double_quotes,
+    escape_tsv,
+    parse_batch_output,
+    quote_identifier,
+    quote_string,
+    quote_value,
+    version_tuple,
+)
+from deployfish_mysql.store import DumpStore, store_for_manifest
+from deployfish_mysql.tsv import (
+    MANIFEST_FILENAME,
+    SCHEMA_FILENAME,
+    SESSION_SQL,
+    TRIGGERS_FILENAME,
+    build_tsv_columns,
+    load_columns,
+    render_tsv_select,
+    table_filename,
+)
+from deployfish_mysql.warm import balance, hot_tables
+from deployfish_mysql.watch import WatchSummary
+
+
+#: Defaults for the entries in the ``purge`` section of a ``mysql:`` entry
+PURGE_DEFAULTS: Dict[str, Any] = {
+    'batch_size': 1000,
+    'sleep': 0.5,
+    'max_threads_running': 25,
+    'replica': None,
+    'max_replica_lag': 10,
+    'max_wait': 600,
+    'archive': False,
+}
+
+#: Defaults for the ``backup`` section of a ``mysql:`` entry
+BACKUP_DEFAULTS: Dict[str, Any] = {
+    'every': '1d',
+    'destination': None,
+    'store': None,
+    'split_size': None,
+    'priority': 0,
+    'retries': 3,
+    'retry_delay': 60,
+    'replica': False,
+}
+
+#: MySQL data types that :py:meth:`MySQLDatabaseManager.verify` can split into key ranges
+INTEGER_TYPES = ('tinyint', 'smallint', 'mediumint', 'int', 'bigint')
+#: The first MySQL with ``SHOW REPLICA STATUS``; 8.4 drops ``SHOW SLAVE STATUS``
+REPLICA_STATUS_VERSION = (8, 0, 22)
+#: The first MySQL with ``SHOW BINARY LOG STATUS``; 8.4 drops ``SHOW MASTER STATUS``
+BINARY_LOG_STATUS_VERSION = (8, 2, 0)
 
 
 # ----------------------------------------
@@ -122,12 +219,15 @@ class MySQLDatabaseManager(Manager):
             ssh_target=ssh_target
         )
         command = obj.render_for_create(root_user, root_password, version=version)
-        status, output = obj.cluster.ssh_noninteractive(
+        success, output = obj.cluster.ssh_noninteractive(
             command,
             ssh_target=ssh_target,
             verbose=verbose
         )
-        if status:
+        return self._finish_create(obj, success, output)
+
+    def _finish_create(self, obj: "MySQLDatabase", success: bool, output: str) -> str:
+        if success:
             return output
         raise obj.OperationFailed(
             'Failed to create database "{}" and/or user "{}" on {}:{}: {}'.format(
@@ -181,6 +281,9 @@ class MySQLDatabaseManager(Manager):
             ssh_target=ssh_target,
             verbose=verbose
         )
+        return self._finish_update(obj, success, output)
+
+    def _finish_update(self, obj: "MySQLDatabase", success: bool, output: str) -> str:
         if success:
             return output
         raise obj.OperationFailed(
@@ -197,7 +300,8 @@ class MySQLDatabaseManager(Manager):
         self,
         obj: "MySQLDatabase",
         ssh_target: Instance = None,
-        verbose: bool = False
+        verbose: bool = False,
+        replica: bool = False
     ) -> str:
         """
         Validate that the database and user exist on the target MySQL server.
@@ -210,6 +314,8 @@ class MySQLDatabaseManager(Manager):
                 If not supplied, we will use the ``cluster``'s default ssh
                 instance.
             verbose: If ``True`` run ssh in verbose mode.
+            replica: If ``True``, validate against our least lagged read
+                replica instead; see :py:meth:`read_target`.
 
         Raises:
             obj.OperationFailed: The validation failed because of some
@@ -218,12 +324,17 @@ class MySQLDatabaseManager(Manager):
         Returns:
             The output of the validation commands.
         """
+        if replica:
+            obj, _ = self.read_target(obj, ssh_target=ssh_target, verbose=verbose)
         command = obj.render_for_validate()
         success, output = obj.cluster.ssh_noninteractive(
             command,
             ssh_target=ssh_target,
             verbose=verbose
         )
+        return self._finish_validate(obj, success, output)
+
+    def _finish_validate(self, obj: "MySQLDatabase", success: bool, output: str) -> str:
         if success:
             return output
         raise obj.OperationFailed(
@@ -240,15 +351,31 @@ class MySQLDatabaseManager(Manager):
         obj: "MySQLDatabase",
         filename: str = None,
         ssh_target: Instance = None,
-        verbose: bool = False
+        verbose: bool = False,
+        binlog_position: bool = False,
+        index: bool = True,
+        replica: bool = False,
+        sink: DumpSink = None
     ) -> Tuple[str, str]:
         """
-        Use ``mysqldump`` to dump the remote database as SQL to a local file.
+        Use ``mysqldump`` to dump the remote database as SQL to a local file,
+        or to ``sink``.
+
+        If neither ``filename`` nor ``sink`` is supplied, the filename of the
+        output file will be ``{service-name}.sql``. If that exists, then we
+        will use ``{service-name}-1.sql``, and if that exists
+        ``{service-name}-2.sql`` and so on.
+
+        The dump is written to its destination as it arrives, once: see
+        :py:mod:`deployfish_mysql.sinks` for the destinations other than a
+        local file.
 
-        If ``filename`` is not supplied, the filename of the output file will be
-        ``{service-name}.sql``. If that exists, then we will use
-        ``{service-name}-1.sql``, and if that exists ``{service-name}-2.sql``
-        and so on.
+        If ``binlog_position`` is ``True``, we dump in a single consistent
+        transaction, record the binlog coordinates (and GTID set) of that
+        snapshot in the dump, and start a new backup chain for the dump in
+        ``{filename}.chain.json``.  Use :py:meth:`dump_incremental` to add the
+        binlog events since then to the chain, and :py:meth:`load_chain` to
+        restore it.
 
         Args:
             obj: The ``MySQLDatabase`` object to us
@@ -260,52 +387,153 @@ class MySQLDatabaseManager(Manager):
                 If not supplied, we will use the ``cluster``'s default ssh
                 instance.
             verbose: If ``True`` run ssh in verbose mode.
+            binlog_position: If ``True``, record the binlog coordinates of the
+                dump and start a backup chain.
+            index: If ``True``, also write ``{filename}.index.json``, the byte
+                offsets of each table in the dump, which lets
+                :py:meth:`load_tables` restore single tables quickly.
+            replica: If ``True``, dump from our least lagged read replica
+                instead; see :py:meth:`read_target`.  Ignored with
+                ``binlog_position``, because incrementals read the binlogs of
+                our own server.
+            sink: write the dump here instead of to ``filename``.  Only dumps
+                to a local file (a :py:class:`deployfish_mysql.sinks.FileSink`)
+                get ``index`` and ``binlog_position`` files and a checksum
+                sidecar.
 
         Raises:
             obj.OperationFailed: The dump failed because of some
                 unexpected error.
 
         Returns:
-            The stderr output of dumping the database.
+            A tuple of (the stderr output of dumping the database, where the
+            dump is).
         """
-        if filename is None:
-            filename = "{}.sql".format(obj.service.name)
-            i = 1
-            while os.path.exists(filename):
-                filename = "{}-{}.sql".format(obj.service.name, i)
-                i += 1
-        command = obj.render_for_dump()
-        tmp_fd, file_path = tempfile.mkstemp()
-        with os.fdopen(tmp_fd, 'w') as fd:
-            success, output = obj.cluster.ssh_noninteractive(
+        if replica and not binlog_position:
+            obj, _ = self.read_target(obj, ssh_target=ssh_target, verbose=verbose)
+        sink = self._dump_sink(obj, filename=filename, sink=sink, binlog_position=binlog_position)
+        command = obj.render_for_checksum(obj.render_for_dump(binlog_position=binlog_position))
+        try:
+            success, output, sha256, remote_sha256, size = self._receive_from_remote(
+                obj,
                 command,
-                output=fd,
+                sink,
                 ssh_target=ssh_target,
                 verbose=verbose
             )
-            if success:
-                fd.close()
-                os.rename(file_path, filename)
-                return output, filename
-            fd.close()
-            os.rename(file_path, filename + ".errors")
-            raise obj.OperationFailed('Failed to dump our MySQL db "{}" in {}:{}: {}'.format(
-                obj.db,
-                obj.host,
-                obj.port,
-                output
-            ))
+        except BaseException:
+            sink.abort()
+            raise
+        return self._finish_dump(
+            obj,
+            sink,
+            success,
+            output,
+            sha256,
+            remote_sha256,
+            size,
+            binlog_position=binlog_position,
+            index=index
+        )
+
+    def _dump_sink(
+        self,
+        obj: "MySQLDatabase",
+        filename: str = None,
+        sink: DumpSink = None,
+        binlog_position: bool = False
+    ) -> DumpSink:
+        """
+        Return the sink for :py:meth:`dump` to write to: ``sink``, or else a
+        :py:class:`deployfish_mysql.sinks.FileSink` for ``filename``.
+
+        Raises:
+            obj.OperationFailed: ``binlog_position`` is set but the sink is not
+                a local file.
+        """
+        if sink is None:
+            sink = FileSink(self._dump_filename(obj, filename))
+        if binlog_position and sink.filename is None:
+            sink.abort()
+            raise obj.OperationFailed('A dump that starts a backup chain must be to a local file')
+        return sink
+
+    def _dump_filename(self, obj: "MySQLDatabase", filename: str = None, extension: str = 'sql') -> str:
+        if filename is None:
+            filename = "{}.{}".format(obj.service.name, extension)
+            i = 1
+            while os.path.exists(filename):
+                filename = "{}-{}.{}".format(obj.service.name, i, extension)
+                i += 1
+        return filename
+
+    def _finish_dump(
+        self,
+        obj: "MySQLDatabase",
+        sink: DumpSink,
+        success: bool,
+        output: str,
+        sha256: str,
+        remote_sha256: Optional[str],
+        size: int,
+        binlog_position: bool = False,
+        index: bool = True
+    ) -> Tuple[str, str]:
+        """
+        Commit the dump we wrote to ``sink`` and write its sidecar files, or
+        abort it if it failed.
+
+        Raises:
+            obj.OperationFailed: the dump failed, or was corrupted in transfer.
+
+        Returns:
+            A tuple of (output, where the dump is), as from :py:meth:`dump`.
+        """
+        if success and sha256 != remote_sha256:
+            success = False
+            output = 'The dump was corrupted or truncated in transfer: we got {} bytes with SHA-256 {}, ' \
+                'but the remote side sent SHA-256 {}'.format(size, sha256, remote_sha256)
+        if success:
+            location = sink.commit()
+            if sink.filename is not None:
+                record_checksum(sink.filename, obj, 'dump', sha256, remote_sha256, size)
+                if binlog_position:
+                    self._start_chain(obj, sink.filename)
+                if index:
+                    self.dump_index(obj, sink.filename)
+            return output, location
+        sink.abort()
+        if sha256 == remote_sha256:
+            # ssh wrote mysqldump's error messages into the dump, not to output
+            output = sink.error_output()
+        raise obj.OperationFailed('Failed to dump our MySQL db "{}" in {}:{}: {}'.format(
+            obj.db,
+            obj.host,
+            obj.port,
+            output
+        ))
 
     def load(
         self,
         obj: "MySQLDatabase",
         filepath: str,
         ssh_target: Instance = None,
-        verbose: bool = False
+        verbose: bool = False,
+        sidecar: bool = True,
+        transform: Callable[[Iterable[bytes]], Iterable[bytes]] = None
     ) -> str:
         """
         Load the local SQL file ``filepath`` into the remote database.
 
+        We hash the file as we upload it, and the remote side hashes it as it
+        receives it; we only load the file if the two hashes match.
+
+        If ``transform`` is given, we pass the file through it on its way up
+        and load what it gives us instead, e.g. an
+        :py:class:`deployfish_mysql.coalesce.InsertCoalescer` from
+        :py:meth:`insert_coalescer`.  The checksums are then of what we sent,
+        so we don't record them in the sidecar file.
+
         Args:
             obj: The ``MySQLDatabase`` object to us
             filepath: The name of the file to load
@@ -315,6 +543,10 @@ class MySQLDatabaseManager(Manager):
                 If not supplied, we will use the ``cluster``'s default ssh
                 instance.
             verbose: If ``True`` run ssh in verbose mode.
+            sidecar: If ``True``, record the checksums in
+                ``{filepath}.sha256.json``.
+            transform: a function that takes an iterable of blocks of bytes
+                from the file, and yields the blocks to load instead.
 
         Raises:
             obj.OperationFailed: The load failed because of some
@@ -323,18 +555,81 @@ class MySQLDatabaseManager(Manager):
         Returns:
             The output of loading the file.
         """
-        success, output, filename = obj.cluster.push_file(filepath, ssh_target=ssh_target)
-        if not success:
-            host = 'NO HOST'
-            if ssh_target:
-                host = f'{ssh_target.name} ({ssh_target.ip_address})'
-            raise obj.OperationFailed(
-                'Failed to upload {} to our cluster machine {}: {}'.format(
-                    filepath, host, output
-                )
-            )
+        filename = self._upload_filename(filepath)
+        digest = hashlib.sha256()
+        success, output = self._stream_to_remote(
+            obj,
+            obj.render_for_upload(filename),
+            self._upload_blocks(filepath, digest, transform=transform),
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        error = self._verify_upload(
+            obj,
+            filepath,
+            digest.hexdigest(),
+            success,
+            output,
+            sidecar=sidecar and transform is None,
+            ssh_target=ssh_target
+        )
+        if error is not None:
+            obj.cluster.ssh_noninteractive('rm -f {}'.format(filename), ssh_target=ssh_target, verbose=verbose)
+            raise obj.OperationFailed(error)
         command = obj.render_for_load().format(filename=filename)
         success, output = obj.cluster.ssh_noninteractive(command, ssh_target=ssh_target, verbose=verbose)
+        return self._finish_load(obj, filepath, success, output)
+
+    def _upload_blocks(
+        self,
+        filepath: str,
+        digest: Any,
+        transform: Callable[[Iterable[bytes]], Iterable[bytes]] = None
+    ) -> Iterator[bytes]:
+        """
+        Yield the blocks of ``filepath`` to upload for :py:meth:`load`, passed
+        through ``transform`` if given, adding them to the hashlib object
+        ``digest`` on the way.
+        """
+        blocks: Iterable[bytes] = read_blocks(filepath)
+        if transform is not None:
+            blocks = transform(blocks)
+        return hash_blocks(blocks, digest)
+
+    def _verify_upload(
+        self,
+        obj: "MySQLDatabase",
+        filepath: str,
+        sha256: str,
+        success: bool,
+        output: str,
+        sidecar: bool = True,
+        ssh_target: Instance = None
+    ) -> Optional[str]:
+        """
+        Check that the upload of ``filepath`` for :py:meth:`load`, which we
+        sent with SHA-256 ``sha256``, succeeded and arrived intact, and if
+        ``sidecar``, record both checksums in its sidecar file.
+
+        Returns:
+            ``None`` if the upload is good, or else why it failed.  The caller
+            should then remove the remote file.
+        """
+        remote_sha256 = parse_trailer(output)
+        if success and remote_sha256 != sha256:
+            success = False
+            output = 'The file was corrupted or truncated in transfer: we sent SHA-256 {}, ' \
+                'but the remote side got SHA-256 {}'.format(sha256, remote_sha256)
+        if sidecar:
+            record_checksum(filepath, obj, 'load', sha256, remote_sha256, os.path.getsize(filepath))
+        if success:
+            return None
+        host = 'NO HOST'
+        if ssh_target:
+            host = f'{ssh_target.name} ({ssh_target.ip_address})'
+        return 'Failed to upload {} to our cluster machine {}: {}'.format(filepath, host, output)
+
+    def _finish_load(self, obj: "MySQLDatabase", filepath: str, success: bool, output: str) -> str:
         if success:
             return output
         raise obj.OperationFailed(
@@ -347,95 +642,222 @@ class MySQLDatabaseManager(Manager):
             )
         )
 
-    def major_server_version(
+    def _upload_filename(self, filepath: str) -> str:
+        return posixpath.join(os.getenv('DEPLOYFISH_REMOTE_TMPDIR', '/tmp'), os.path.basename(filepath))
+
+    def _receive_from_remote(
         self,
         obj: "MySQLDatabase",
+        command: str,
+        fd: BinaryIO,
         ssh_target: Instance = None,
-        verbose: bool = False,
-        user: str = None,
-        password: str = None
-    ):
+        verbose: bool = False
+    ) -> Tuple[bool, str, str, Optional[str], int]:
         """
-        Return the major.minor version of the MySQL server.
+        Run ``command``, which must be wrapped with
+        :py:meth:`MySQLDatabase.render_for_checksum`, and write its output to
+        ``fd``, hashing it as it arrives.
 
-        Example:
-            If the server version is ``5.7.22``, then we will return ``5.7``.
+        ssh gets its stdin from ``/dev/null`` so that it does not allocate a
+        pseudo-terminal, which would turn every ``\\n`` into ``\\r\\n``.
+
+        Returns:
+            A tuple of (success, output, our SHA-256, the remote SHA-256, the
+            number of bytes written).
+        """
+        read_fd, write_fd = os.pipe()
+        results: List[Tuple[str, Optional[str], int]] = []
+        errors: List[Exception] = []
+
+        def drain() -> None:
+            with os.fdopen(read_fd, 'rb') as source:
+                try:
+                    results.append(receive_with_trailer(source, fd))
+                except Exception as e:  # pylint:disable=broad-except
+                    errors.append(e)
+                    # Keep reading so that ssh does not block writing to us
+                    for _ in iter(lambda: source.read(READ_SIZE), b''):
+                        pass
+
+        drainer = threading.Thread(target=drain, daemon=True)
+        drainer.start()
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe, open(os.devnull, 'rb') as devnull:
+                success, output = obj.cluster.ssh_noninteractive(
+                    command,
+                    output=pipe,
+                    input_data=devnull,
+                    ssh_target=ssh_target,
+                    verbose=verbose
+                )
+        finally:
+            # Closing our end of the pipe lets drain() finish
+            drainer.join()
+        if errors:
+            return False, 'Could not write the output: {}'.format(errors[0]), '', None, 0
+        sha256, remote_sha256, size = results[0]
+        return success, output, sha256, remote_sha256, size
+
+    def dump_index(self, obj: "MySQLDatabase", filename: str, rebuild: bool = False) -> List[Dict[str, Any]]:
+        """
+        Return the index of the sections of the dump ``filename``: see
+        :py:func:`deployfish_mysql.dump_index.build_dump_index`.
+
+        We read the index from ``{filename}.index.json`` if it is there and
+        still matches the dump; otherwise we scan the dump and save the index
+        there for next time.
 
         Args:
-            obj: The ``MySQLDatabase`` object to us
+            obj: The ``MySQLDatabase`` object to use
+            filename: the dump
+
+        Keyword Args:
+            rebuild: if ``True``, scan the dump even if it has an index
+
+        Returns:
+            A list of section dicts.
+        """
+        index_file = index_filename(filename)
+        if not rebuild and os.path.exists(index_file):
+            sections = read_snapshot(index_file, 'dump-index')['rows']
+            if sections and sections[-1]['end'] == os.path.getsize(filename):
+                return sections
+        sections = build_dump_index(filename)
+        try:
+            write_snapshot(index_file, 'dump-index', obj, sections)
+        except OSError:
+            # We can still use the index even if we cannot save it
+            pass
+        return sections
+
+    def load_tables(
+        self,
+        obj: "MySQLDatabase",
+        filepath: str,
+        tables: Sequence[str],
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> str:
+        """
+        Load just ``tables`` from the local ``mysqldump`` file ``filepath`` into
+        the remote database: we seek straight to each table's DDL and data
+        using the dump's index, and stream only those bytes (plus the dump's
+        header and footer, which set up and restore the session) to the server.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            filepath: The name of the file to load from
+            tables: the names of the tables to load
 
         Keyword Args:
             ssh_target: the ssh instance to use for running our mysql commands.
                 If not supplied, we will use the ``cluster``'s default ssh
                 instance.
             verbose: If ``True`` run ssh in verbose mode.
-            user: The user to use to bind to the database.
-            password: The password to use to bind to the database.
 
         Raises:
-            obj.OperationFailed: The command failed because of some
-                unexpected error.
+            obj.OperationFailed: a table is not in the dump, or the load
+                failed.
 
         Returns:
-            The major.minor version of the MySQL server.
+            The output of loading the tables.
         """
-        version = self.server_version(obj, ssh_target=ssh_target, verbose=verbose, user=user, password=password)
-        version = version.rsplit('.', 1)[0]
-        return version
+        sections = self.dump_index(obj, filepath)
+        by_table = {section['table']: section for section in sections if section['section'] == 'table'}
+        missing = [table for table in tables if table not in by_table]
+        if missing:
+            raise obj.OperationFailed('Table{} {} not found in "{}"'.format(
+                's' if len(missing) > 1 else '',
+                ', '.join('"{}"'.format(table) for table in missing),
+                filepath
+            ))
+        wanted = [sections[0]] + [by_table[table] for table in tables] + [sections[-1]]
+        success, output = self._stream_to_remote(
+            obj,
+            obj.render_for_script(),
+            read_sections(filepath, wanted),
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        if success:
+            return output
+        raise obj.OperationFailed(
+            'Failed to load {} from "{}" into database "{}" on {}:{}: {}'.format(
+                ', '.join('"{}"'.format(table) for table in tables),
+                filepath,
+                obj.db,
+                obj.host,
+                obj.port,
+                output
+            )
+        )
 
-    def server_version(
+    def _start_chain(self, obj: "MySQLDatabase", filename: str) -> str:
+        position = read_dump_position(filename)
+        if position is None:
+            raise obj.OperationFailed(
+                'Dumped our MySQL db "{}" in {}:{} to "{}", but the dump has no binlog coordinates. '
+                'Is binary logging enabled on the server?'.format(obj.db, obj.host, obj.port, filename)
+            )
+        chain_file = chain_filename(filename)
+        write_snapshot(chain_file, 'binlog-chain', obj, [{
+            'type': 'full',
+            'filename': os.path.basename(filename),
+            'end_file': position['file'],
+            'end_position': position['position'],
+            'gtid': position['gtid'],
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }])
+        return chain_file
+
+    def binlog_status(
         self,
         obj: "MySQLDatabase",
         ssh_target: Instance = None,
-        verbose: bool = False,
-        user: str = None,
-        password: str = None
-    ) -> str:
+        verbose: bool = False
+    ) -> Tuple[str, int]:
         """
-        Return the MySQL version of the MySQL server.
+        Return the current binlog coordinates of the MySQL server.
 
-        Example:
-            If the server version is ``5.7.22``, then we will return ``5.7.22``.
+        MySQL 8.4 replaced ``SHOW MASTER STATUS`` with ``SHOW BINARY LOG
+        STATUS``, so we ask the server its version first, if we have not yet.
 
         Args:
-            obj: The ``MySQLDatabase`` object to us
+            obj: The ``MySQLDatabase`` object to use
 
         Keyword Args:
             ssh_target: the ssh instance to use for running our mysql commands.
                 If not supplied, we will use the ``cluster``'s default ssh
                 instance.
             verbose: If ``True`` run ssh in verbose mode.
-            user: The user to use to bind to the database.
-            password: The password to use to bind to the database.
 
         Raises:
-            obj.OperationFailed: The command failed because of some
-                unexpected error.
+            obj.OperationFailed: the query failed, or binary logging is off.
 
         Returns:
-            The server version
+            A (binlog file, position) tuple.
         """
-        command = obj.render_for_server_version(user=user, password=password)
-        success, output = obj.cluster.ssh_noninteractive(command, ssh_target=ssh_target, verbose=verbose)
-        if success:
-            return output.split('\n')[3][2:-2].strip()
-        raise obj.OperationFailed('Failed to get MySQL version of remote server {}:{}: {}'.format(
-            obj.host,
-            obj.port,
-            output
-        ))
+        version = obj.cache.get('server_version') or self.server_version(obj, ssh_target=ssh_target, verbose=verbose)
+        rows = self.query(obj, obj.render_sql_for_binlog_status(version), ssh_target=ssh_target, verbose=verbose)
+        if not rows:
+            raise obj.OperationFailed('Binary logging is not enabled on remote server {}:{}'.format(
+                obj.host,
+                obj.port
+            ))
+        return cast(str, rows[0][0]), int(rows[0][1] or 0)
 
-    def show_grants(
+    def binary_logs(
         self,
         obj: "MySQLDatabase",
         ssh_target: Instance = None,
-        verbose: bool = False,
-    ) -> str:
+        verbose: bool = False
+    ) -> List[str]:
         """
-        Show the GRANTs for the database user on the remote database.
+        Return the names of the binlog files the MySQL server still has, oldest
+        first.
 
         Args:
-            obj: The ``MySQLDatabase`` object to us
+            obj: The ``MySQLDatabase`` object to use
 
         Keyword Args:
             ssh_target: the ssh instance to use for running our mysql commands.
@@ -444,76 +866,2884 @@ class MySQLDatabaseManager(Manager):
             verbose: If ``True`` run ssh in verbose mode.
 
         Raises:
-            obj.OperationFailed: The command failed because of some
-                unexpected error.
+            obj.OperationFailed: the query failed.
 
         Returns:
-            The output of the ``SHOW GRANTS` command.
+            A list of binlog file names.
         """
-        command = obj.render_for_show_grants()
-        success, output = obj.cluster.ssh_noninteractive(command, ssh_target=ssh_target, verbose=verbose)
-        if success:
-            return output
-        raise obj.OperationFailed('Failed to get grants for user "{}" on remote server {}:{}: {}'.format(
-            obj.user,
-            obj.host,
-            obj.port,
-            output
-        ))
+        rows = self.query(obj, 'SHOW BINARY LOGS;', ssh_target=ssh_target, verbose=verbose)
+        return [cast(str, row[0]) for row in rows]
 
+    def dump_incremental(
+        self,
+        obj: "MySQLDatabase",
+        chain_file: str,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Add the binlog events for our database since the end of the backup chain
+        in ``chain_file`` to the chain, as a new gzipped segment of SQL.
 
-# ----------------------------------------
-# Models
-# ----------------------------------------
+        We read the binlogs with ``mysqlbinlog --read-from-remote-server``,
+        which needs the ``REPLICATION SLAVE`` privilege, and the server must
+        still have every binlog since the end of the chain: take incrementals
+        more often than binlogs are purged (``binlog retention hours`` on RDS).
 
-class MySQLDatabase(Model):
-    """
-    self.data here has the following structure:
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            chain_file: the backup chain, as written by :py:meth:`dump`
 
-        {
-            'name': 'string',
-            'service': 'string',
-            'character_set': 'string',                   [optional, default='utf8']
-            'collation': 'string',                       [optional, default='utf8_unicode_ci']
-            'host': 'string',
-            'db': 'string' ,
-            'user': 'string',
-            'pass': 'string',
-            'port': 'string'                             [optional, default=3306]
-        }
-    """
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
 
-    objects = MySQLDatabaseManager()
-    config_section: str = 'mysql'
+        Raises:
+            obj.OperationFailed: the binlogs we need are gone, or
+                ``mysqlbinlog`` failed.
 
-    @property
-    def pk(self) -> str:
-        return self.data['name']
+        Returns:
+            The chain entry for the new segment, or ``None`` if there have been
+            no new events since the end of the chain.
+        """
+        chain = read_snapshot(chain_file, 'binlog-chain')
+        last = chain['rows'][-1]
+        end_file, end_position = self.binlog_status(obj, ssh_target=ssh_target, verbose=verbose)
+        if (end_file, end_position) == (last['end_file'], last['end_position']):
+            return None
+        logs = self.binary_logs(obj, ssh_target=ssh_target, verbose=verbose)
+        if last['end_file'] not in logs or end_file not in logs:
+            raise obj.OperationFailed(
+                'Binlog "{}" is no longer on remote server {}:{}, so the backup chain "{}" cannot be continued. '
+                'Take a new full dump.'.format(last['end_file'], obj.host, obj.port, chain_file)
+            )
+        files = logs[logs.index(last['end_file']):logs.index(end_file) + 1]
+        command = obj.render_for_binlog_dump(files, last['end_position'], end_position)
+        entry = {
+            'type': 'incremental',
+            'filename': os.path.basename(segment_filename(chain_file, len(chain['rows']))),
+            'start_file': last['end_file'],
+            'start_position': last['end_position'],
+            'end_file': end_file,
+            'end_position': end_position,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        tmp_fd, file_path = tempfile.mkstemp()
+        try:
+            with os.fdopen(tmp_fd, 'wb') as fd:
+                success, output = obj.cluster.ssh_noninteractive(
+                    command,
+                    output=fd,
+                    ssh_target=ssh_target,
+                    verbose=verbose
+                )
+            if not success:
+                with open(file_path, encoding='utf-8', errors='replace') as fd:
+                    output += fd.read()[-2000:]
+                raise obj.OperationFailed('Failed to read binlogs for our MySQL db "{}" in {}:{}: {}'.format(
+                    obj.db,
+                    obj.host,
+                    obj.port,
+                    output
+                ))
+            entry['events'] = compress_segment(
+                file_path,
+                os.path.join(os.path.dirname(chain_file), entry['filename'])
+            )
+        finally:
+            os.remove(file_path)
+        chain['rows'].append(entry)
+        write_snapshot(chain_file, 'binlog-chain', obj, chain['rows'])
+        return entry
 
-    @property
-    def name(self) -> str:
-        return self.data['name']
+    def load_chain(
+        self,
+        obj: "MySQLDatabase",
+        chain_file: str,
+        until: datetime.datetime = None,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        callback: Callable[[str], None] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Restore the backup chain in ``chain_file``: load its full dump, then
+        replay its incremental segments in order, optionally stopping at a
+        point in time.
 
-    def secret(self, name: str) -> Secret:
-        if 'secrets' not in self.cache:
-            self.cache['secrets'] = {}
-        if name not in self.cache['secrets']:
-            if "." not in name:
-                full_name = '{}{}'.format(self.service.secrets_prefix, name)
-            else:
-                full_name = name
-            self.cache['secrets'][name] = Secret.objects.get(full_name)
-        return self.cache['secrets'][name]
+        Replaying binlog events needs the privileges for ``BINLOG`` statements
+        (``SUPER``, or ``REPLICATION_APPLIER`` on MySQL 8.0), and the events
+        name the database they were captured from, so restore into a server
+        with a database of the same name.
 
-    def parse(self, key: str) -> str:
-        """
-        deployfish supports putting 'config.KEY' as the value for the host and port keys in self.data
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            chain_file: the backup chain, as written by :py:meth:`dump`
 
-        Parse the value and dereference it from the live secrets for the service if necessary.
+        Keyword Args:
+            until: stop replaying before the first event after this time, in
+                the timezone of the host that ran ``mysqlbinlog`` (usually UTC)
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            callback: if supplied, call this with a message before each step
+
+        Raises:
+            obj.OperationFailed: a file is missing or a load failed.
+
+        Returns:
+            The chain entries we loaded.
+        """
+        chain = read_snapshot(chain_file, 'binlog-chain')
+        directory = os.path.dirname(chain_file)
+        for entry in chain['rows']:
+            path = os.path.join(directory, entry['filename'])
+            if not os.path.exists(path):
+                raise obj.OperationFailed('Backup chain "{}" is missing "{}"'.format(chain_file, path))
+        loaded = []
+        for entry in chain['rows']:
+            path = os.path.join(directory, entry['filename'])
+            if callback:
+                callback('Loading {} "{}" ...'.format('full dump' if entry['type'] == 'full' else 'segment', path))
+            if entry['type'] == 'full':
+                self.load(obj, path, ssh_target=ssh_target, verbose=verbose)
+                loaded.append(entry)
+                continue
+            tmp_fd, file_path = tempfile.mkstemp(suffix='.sql')
+            try:
+                with os.fdopen(tmp_fd, 'wb') as fd:
+                    stopped = copy_segment(path, fd, until=until)
+                self.load(obj, file_path, ssh_target=ssh_target, verbose=verbose, sidecar=False)
+            finally:
+                os.remove(file_path)
+            loaded.append(entry)
+            if stopped:
+                break
+        return loaded
+
+    def dump_to_store(
+        self,
+        obj: "MySQLDatabase",
+        store_path: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        replica: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Dump the remote database into the deduplicated dump store at
+        ``store_path``: only the parts of the dump that are not already in the
+        store take up more space.  The dump is split into chunks as it
+        arrives, so it is never written out in full.  See
+        :py:class:`deployfish_mysql.store.DumpStore`.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            store_path: the directory of the dump store.  It will be created if
+                it does not exist.
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            replica: If ``True``, dump from our least lagged read replica
+                instead; see :py:meth:`read_target`.
+
+        Raises:
+            obj.OperationFailed: The dump failed because of some
+                unexpected error.
+
+        Returns:
+            The output of :py:meth:`deployfish_mysql.store.DumpStore.add`.
+        """
+        sink = DumpStoreSink(DumpStore(store_path), obj)
+        self.dump(obj, ssh_target=ssh_target, verbose=verbose, replica=replica, sink=sink)
+        return sink.result
+
+    def backup(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Dump the remote database as configured in the ``backup`` section of our
+        ``mysql:`` entry: into the dump store at ``store``, or to
+        ``destination``, any of the destinations :py:func:`deployfish_mysql.sinks.sink_for`
+        understands except stdout.
+
+        ``{name}``, ``{db}`` and ``{timestamp}`` in ``destination`` are
+        replaced with our connection name, our database name and the UTC time
+        the backup started, so each backup gets a new file.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: we have no ``backup`` section, or the dump
+                failed because of some unexpected error.
+
+        Returns:
+            A dict with keys ``bytes`` (the size of the dump) and ``location``
+            (where it is).
+        """
+        config = obj.backup_config
+        if config is None or bool(config['store']) == bool(config['destination']):
+            raise obj.OperationFailed(
+                'MySQLDatabase(pk="{}"): backup needs either "store" or "destination"'.format(obj.name)
+            )
+        if config['store']:
+            result = self.dump_to_store(obj, config['store'], ssh_target=ssh_target, verbose=verbose,
+                                        replica=config['replica'])
+            return {'bytes': result['size'], 'location': result['manifest']}
+        destination = config['destination'].format(
+            name=obj.name,
+            db=obj.db,
+            timestamp=datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        )
+        if destination == '-':
+            raise obj.OperationFailed('MySQLDatabase(pk="{}"): backup cannot go to stdout'.format(obj.name))
+        if '://' not in destination and os.path.dirname(destination):
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+        split_size = config['split_size'] * 1024 * 1024 if config['split_size'] else None
+        sink = sink_for(destination, part_size=split_size)
+        _, location = self.dump(obj, ssh_target=ssh_target, verbose=verbose, replica=config['replica'], sink=sink)
+        return {'bytes': sink.size, 'location': location}
+
+    def backup_jobs(
+        self,
+        objs: Sequence["MySQLDatabase"] = None,
+        verbose: bool = False
+    ) -> List[BackupJob]:
+        """
+        Return a :py:class:`deployfish_mysql.scheduler.BackupJob` that runs
+        :py:meth:`backup` for each of ``objs`` that has a ``backup`` section.
+
+        Each job's host is its server, and its bastion the ssh instance its
+        backups go through, so that
+        :py:class:`deployfish_mysql.scheduler.BackupScheduler` can keep to its
+        per-host and per-bastion budgets.  We choose that instance once, now,
+        and every run of the job uses it.
+
+        Keyword Args:
+            objs: the ``MySQLDatabase`` objects to back up.  If not supplied,
+                we use every ``mysql:`` entry in ``deployfish.yml``.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            MySQLDatabase.OperationFailed: a ``backup`` section is invalid.
+
+        Returns:
+            A list of ``BackupJob`` objects.
+        """
+        if objs is None:
+            objs = cast(Sequence["MySQLDatabase"], self.list())
+        jobs = []
+        for obj in objs:
+            config = obj.backup_config
+            if config is None:
+                continue
+            if bool(config['store']) == bool(config['destination']):
+                raise obj.OperationFailed(
+                    'MySQLDatabase(pk="{}"): backup needs either "store" or "destination"'.format(obj.name)
+                )
+            try:
+                every = parse_interval(config['every'])
+                retry_delay = parse_interval(config['retry_delay'])
+            except ValueError as e:
+                raise obj.OperationFailed('MySQLDatabase(pk="{}"): backup: {}'.format(obj.name, e))
+            target = obj.ssh_target
+            jobs.append(BackupJob(
+                obj.name,
+                lambda obj=obj, target=target: self.backup(obj, ssh_target=target, verbose=verbose),
+                every,
+                priority=int(config['priority']),
+                retries=int(config['retries']),
+                retry_delay=retry_delay,
+                host='{}:{}'.format(obj.host, obj.port),
+                bastion=target.pk if target is not None else obj.cluster.name
+            ))
+        return jobs
+
+    def dump_tsv(
+        self,
+        obj: "MySQLDatabase",
+        dirname: str = None,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        concurrency: int = 4,
+        replica: bool = False
+    ) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Dump the remote database to a local directory as its DDL plus one
+        gzipped file of tab separated values per table, which
+        :py:meth:`load_tsv` loads with ``LOAD DATA``.  Both ends are several
+        times faster than :py:meth:`dump` and :py:meth:`load` for big tables:
+        the server streams plain rows instead of ``mysqldump`` rendering
+        ``INSERT`` statements, and ``LOAD DATA`` skips the SQL parser.
+
+        If ``dirname`` is not supplied, the directory will be
+        ``{service-name}.tsv``, or ``{service-name}-1.tsv`` if that exists, and
+        so on.
+
+        The directory holds ``schema.sql``, ``triggers.sql``, a
+        ``{table}.tsv.gz`` for each table and ``manifest.json``, which lists
+        the tables, their columns, files and checksums.
+
+        We dump ``concurrency`` tables at a time, each in its own connection,
+        so unlike :py:meth:`dump` the tables are not a consistent snapshot of
+        each other if the database is being written to.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            dirname: The directory to dump the database to.  It must not exist.
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            concurrency: dump this many tables at once.
+            replica: If ``True``, dump from our least lagged read replica
+                instead; see :py:meth:`read_target`.
+
+        Raises:
+            obj.OperationFailed: The dump failed because of some
+                unexpected error.
+
+        Returns:
+            A tuple of (the manifest rows, one per table, with keys ``table``,
+            ``file``, ``columns``, ``sha256`` and ``bytes``; the directory).
+        """
+        if replica:
+            obj, _ = self.read_target(obj, ssh_target=ssh_target, verbose=verbose)
+        dirname = self._dump_filename(obj, dirname, extension='tsv')
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            raise obj.OperationFailed('Cannot dump to "{}": {}'.format(dirname, e))
+        tables = build_tsv_columns(
+            self.query(obj, obj.render_sql_for_tsv_columns(), ssh_target=ssh_target, verbose=verbose)
+        )
+        for filename, triggers in ((SCHEMA_FILENAME, False), (TRIGGERS_FILENAME, True)):
+            self._dump_tsv_file(
+                obj,
+                os.path.join(dirname, filename),
+                obj.render_for_schema_dump(triggers=triggers),
+                ssh_target=ssh_target,
+                verbose=verbose
+            )
+        taken: Set[str] = set()
+        rows = [
+            {'table': table, 'file': table_filename(table, taken), 'columns': columns}
+            for table, columns in sorted(tables.items())
+        ]
+
+        def dump_table(row: Dict[str, Any]) -> None:
+            row['sha256'], row['bytes'] = self._dump_tsv_file(
+                obj,
+                os.path.join(dirname, row['file']),
+                obj.render_for_tsv_dump(row['table'], row['columns']),
+                ssh_target=ssh_target,
+                verbose=verbose
+            )
+
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            # list() to raise the first failure here
+            list(executor.map(dump_table, rows))
+        write_snapshot(os.path.join(dirname, MANIFEST_FILENAME), 'tsv-dump', obj, rows)
+        return rows, dirname
+
+    def _dump_tsv_file(
+        self,
+        obj: "MySQLDatabase",
+        filename: str,
+        command: str,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Tuple[str, int]:
+        """
+        Save the output of the remote ``command`` to ``filename``, checking
+        that it arrived intact.
+
+        Raises:
+            obj.OperationFailed: the command failed, or its output was
+                corrupted in transfer.
+
+        Returns:
+            A tuple of (the SHA-256 of the file, its size).
+        """
+        with open(filename, 'wb') as fd:
+            success, output, sha256, remote_sha256, size = self._receive_from_remote(
+                obj,
+                obj.render_for_checksum(command),
+                fd,
+                ssh_target=ssh_target,
+                verbose=verbose
+            )
+        if success and sha256 == remote_sha256:
+            return sha256, size
+        if success:
+            output = 'The file was corrupted or truncated in transfer: we got {} bytes with SHA-256 {}, ' \
+                'but the remote side sent SHA-256 {}'.format(size, sha256, remote_sha256)
+        else:
+            # ssh wrote the error messages into the file, not to output
+            with open(filename, 'rb') as fd:
+                fd.seek(max(size - 2000, 0))
+                output = fd.read().decode('utf-8', errors='replace')
+        raise obj.OperationFailed('Failed to dump "{}" from our MySQL db "{}" in {}:{}: {}'.format(
+            os.path.basename(filename),
+            obj.db,
+            obj.host,
+            obj.port,
+            output
+        ))
+
+    def load_tsv(
+        self,
+        obj: "MySQLDatabase",
+        dirname: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        concurrency: int = 4
+    ) -> List[Dict[str, Any]]:
+        """
+        Load a dump written by :py:meth:`dump_tsv` into the remote database:
+        create the tables, load ``concurrency`` tables at a time with ``LOAD
+        DATA LOCAL INFILE``, then create the triggers.
+
+        The data files are streamed up still compressed and unpacked on the
+        remote side, so gzip's own checksum catches any corruption in
+        transfer.  The server must allow ``local_infile``.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            dirname: the directory of the dump
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            concurrency: load this many tables at once.
+
+        Raises:
+            obj.OperationFailed: The load failed because of some
+                unexpected error.
+
+        Returns:
+            A list of dicts with keys ``table``, ``rows`` and ``seconds``, one
+            per table.
+        """
+        manifest_file = os.path.join(dirname, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_file):
+            raise obj.OperationFailed('"{}" is not a TSV dump: it has no {}'.format(dirname, MANIFEST_FILENAME))
+        manifest = read_snapshot(manifest_file, 'tsv-dump')
+        for row in manifest['rows']:
+            if not os.path.exists(os.path.join(dirname, row['file'])):
+                raise obj.OperationFailed('TSV dump "{}" is missing "{}"'.format(dirname, row['file']))
+        self.load(obj, os.path.join(dirname, SCHEMA_FILENAME), ssh_target=ssh_target, verbose=verbose, sidecar=False)
+
+        def load_table(row: Dict[str, Any]) -> Dict[str, Any]:
+            start = time.monotonic()
+            success, output = self._stream_to_remote(
+                obj,
+                obj.render_for_tsv_load(row['table'], row['columns']),
+                read_blocks(os.path.join(dirname, row['file'])),
+                ssh_target=ssh_target,
+                verbose=verbose
+            )
+            rows = parse_batch_output(output)
+            if not success or not rows or not (rows[-1][0] or '').isdigit():
+                raise obj.OperationFailed('Failed to load table "{}" into database "{}" on {}:{}: {}'.format(
+                    row['table'],
+                    obj.db,
+                    obj.host,
+                    obj.port,
+                    output
+                ))
+            return {'table': row['table'], 'rows': int(rows[-1][0]), 'seconds': time.monotonic() - start}
+
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            results = list(executor.map(load_table, manifest['rows']))
+        self.load(obj, os.path.join(dirname, TRIGGERS_FILENAME), ssh_target=ssh_target, verbose=verbose, sidecar=False)
+        return results
+
+    def _stream_to_remote(
+        self,
+        obj: "MySQLDatabase",
+        command: str,
+        data: Iterable[bytes],
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Tuple[bool, str]:
+        """
+        Pipe ``data`` into the stdin of the remote ``command`` as it is
+        produced, so that it never has to be written out in full locally.
+
+        Returns:
+            A (success, output) tuple, as from ``ssh_noninteractive``.
+        """
+        read_fd, write_fd = os.pipe()
+        errors: List[Exception] = []
+
+        def feed() -> None:
+            with os.fdopen(write_fd, 'wb') as fd:
+                try:
+                    for block in data:
+                        fd.write(block)
+                except BrokenPipeError:
+                    # mysql exited early; its output will say why
+                    pass
+                except Exception as e:  # pylint:disable=broad-except
+                    errors.append(e)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        with os.fdopen(read_fd, 'rb') as fd:
+            success, output = obj.cluster.ssh_noninteractive(
+                command,
+                input_data=fd,
+                ssh_target=ssh_target,
+                verbose=verbose
+            )
+        feeder.join()
+        if errors:
+            return False, '{}\n{}'.format(errors[0], output)
+        return success, output
+
+    def migrate(
+        self,
+        obj: "MySQLDatabase",
+        dirname: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        dry_run: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Apply the ``.sql`` migration files in the local directory ``dirname``
+        that have not been applied yet, in order (with numbers in their names
+        compared as numbers).
+
+        We record each migration we apply, with its SHA-256, in the
+        ``deployfish_migrations`` table in our database, and skip the files
+        recorded there.  All the pending files are streamed, one after the
+        other, to a single ``mysql`` on the remote side, so applying dozens of
+        small migrations costs one ssh connection rather than dozens of uploads
+        and loads.  ``mysql`` stops at the first error, so every migration
+        before the failed one stays applied and recorded, and none after it
+        is run.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            dirname: the directory of migration files
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            dry_run: If ``True``, only report which files are pending.
+
+        Raises:
+            obj.OperationFailed: an applied file has changed since we applied
+                it, or a migration failed.
+
+        Returns:
+            A list of dicts with keys ``filename``, ``checksum``, ``status``
+            (``applied``, ``skipped`` or, with ``dry_run``, ``pending``) and
+            ``seconds``, the time the server took to apply the file, in file
+            order.
+        """
+        files = migration_files(dirname)
+        if not files:
+            return []
+        if dry_run:
+            # Don't create the tracking table on a dry run
+            rows = self.query(obj, obj.render_sql_for_migrations_table_exists(), ssh_target=ssh_target, verbose=verbose)
+            sql = obj.render_sql_for_applied_migrations() if int(rows[0][0]) else None
+        else:
+            sql = obj.render_sql_for_migrations_table() + obj.render_sql_for_applied_migrations()
+        applied = dict(self.query(obj, sql, ssh_target=ssh_target, verbose=verbose)) if sql else {}
+        changed = [
+            row['filename'] for row in files
+            if row['filename'] in applied and applied[row['filename']] != row['checksum']
+        ]
+        if changed:
+            raise obj.OperationFailed(
+                'These migrations in "{}" have changed since they were applied to database "{}" on {}:{}: {}'.format(
+                    dirname, obj.db, obj.host, obj.port, ', '.join(changed)
+                )
+            )
+        results = []
+        pending = []
+        for row in files:
+            result = {'filename': row['filename'], 'checksum': row['checksum'], 'status': 'skipped', 'seconds': None}
+            if row['filename'] not in applied:
+                result['status'] = 'pending'
+                pending.append(row)
+            results.append(result)
+        if dry_run or not pending:
+            return results
+        success, output = self._stream_to_remote(
+            obj,
+            obj.render_for_script(),
+            self._migration_script(obj, pending),
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        timings = {
+            row[1]: float(row[2] or 0) for row in parse_batch_output(output)
+            if len(row) == 3 and row[0] == MIGRATED_MARKER
+        }
+        for result in results:
+            if result['filename'] in timings:
+                result['status'] = 'applied'
+                result['seconds'] = timings[result['filename']]
+        if not success:
+            failed = next((row['filename'] for row in pending if row['filename'] not in timings), None)
+            if failed is None:
+                # Every migration was recorded, so it was ssh or mysql that failed afterwards
+                raise obj.OperationFailed(
+                    'Applied all {} migrations to database "{}" on {}:{}, but the mysql session then failed: '
+                    '{}'.format(len(pending), obj.db, obj.host, obj.port, output)
+                )
+            raise obj.OperationFailed(
+                'Migration "{}" failed in database "{}" on {}:{} after applying {} of {} migrations: {}'.format(
+                    failed,
+                    obj.db,
+                    obj.host,
+                    obj.port,
+                    len(timings),
+                    len(pending),
+                    output
+                )
+            )
+        return results
+
+    def _migration_script(self, obj: "MySQLDatabase", files: Sequence[Dict[str, Any]]) -> Iterator[bytes]:
+        for row in files:
+            yield obj.render_sql_for_migration_start().encode('utf-8')
+            yield from terminate(read_blocks(row['path']))
+            yield obj.render_sql_for_record_migration(row['filename'], row['checksum']).encode('utf-8')
+
+    def restore(
+        self,
+        obj: "MySQLDatabase",
+        manifest_file: str,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> str:
+        """
+        Load a dump from a dump store into the remote database, streaming it
+        chunk by chunk straight into the remote ``mysql`` client, so the dump is
+        never reassembled on disk.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            manifest_file: the manifest of the dump, in the ``manifests``
+                directory of its store
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: a chunk is missing, or the load failed.
+
+        Returns:
+            The output of loading the dump.
+        """
+        store = store_for_manifest(manifest_file)
+        if store is None:
+            raise obj.OperationFailed('"{}" is not in the "manifests" directory of a dump store'.format(manifest_file))
+        manifest = read_snapshot(manifest_file, 'dump-manifest')
+        for row in manifest['rows']:
+            if not os.path.exists(store.chunk_path(row['hash'])):
+                raise obj.OperationFailed('Dump store "{}" is missing chunk {} of "{}"'.format(
+                    store.path, row['hash'], manifest_file
+                ))
+        success, output = self._stream_to_remote(
+            obj,
+            obj.render_for_script(),
+            store.stream(manifest),
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        if success:
+            return output
+        raise obj.OperationFailed(
+            'Failed to restore "{}" into database "{}" on {}:{}: {}'.format(
+                manifest_file,
+                obj.db,
+                obj.host,
+                obj.port,
+                output
+            )
+        )
+
+    def import_file(
+        self,
+        obj: "MySQLDatabase",
+        table: str,
+        filepath: str,
+        columns: Sequence[str] = None,
+        delimiter: str = None,
+        enclosure: str = '"',
+        ignore_lines: int = 0,
+        batch_size: int = None,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Tuple[Optional[int], str]:
+        """
+        Stream the local CSV or TSV file ``filepath`` into ``table`` in the
+        remote database with ``LOAD DATA LOCAL INFILE``.
+
+        Unlike :py:meth:`load`, we don't upload the file first: the file is
+        piped through ssh straight into the stdin of the remote ``mysql``
+        client.  The MySQL server must have ``local_infile`` enabled.
+
+        If ``batch_size`` is given, we load the file ``batch_size`` lines at a
+        time, each batch in its own ``LOAD DATA`` statement.  This keeps each
+        transaction small on big files, at the cost of one ssh session per
+        batch.  Batches are split on newlines, so don't use ``batch_size`` with
+        files that have newlines inside quoted fields.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            table: The name of the table to load the data into
+            filepath: The name of the file to load
+
+        Keyword Args:
+            columns: the table columns, in the order they appear in the file.
+                Use ``@dummy`` to skip a column in the file.  If not supplied,
+                the file must have a value for every column in the table.
+            delimiter: the field delimiter.  If not supplied, use a tab if
+                ``filepath`` ends with ``.tsv`` and a comma otherwise.
+            enclosure: the character that optionally encloses fields.
+            ignore_lines: skip this many lines at the start of the file (e.g. a
+                header line).
+            batch_size: load this many lines per ``LOAD DATA`` statement.
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The import failed because of some
+                unexpected error.
+
+        Returns:
+            A tuple of (number of rows loaded, output of the ``mysql`` commands).
+            The number of rows is ``None`` if ``mysql`` did not report it.
+        """
+        if delimiter is None:
+            delimiter = '\t' if filepath.endswith('.tsv') else ','
+        rows: Optional[int] = 0
+        outputs = []
+        if batch_size:
+            command = obj.render_for_import(table, columns=columns, delimiter=delimiter, enclosure=enclosure)
+            with open(filepath, encoding='utf-8') as fd:
+                for _ in range(ignore_lines):
+                    fd.readline()
+                while True:
+                    chunk = ''.join(line for _, line in zip(range(batch_size), fd))
+                    if not chunk:
+                        break
+                    count, output = self._run_import(obj, command, chunk, filepath, ssh_target, verbose)
+                    rows = rows + count if rows is not None and count is not None else None
+                    outputs.append(output)
+        else:
+            command = obj.render_for_import(
+                table,
+                columns=columns,
+                delimiter=delimiter,
+                enclosure=enclosure,
+                ignore_lines=ignore_lines
+            )
+            with open(filepath, 'rb') as fd:
+                rows, output = self._run_import(obj, command, fd, filepath, ssh_target, verbose)
+            outputs.append(output)
+        return rows, '\n'.join(output for output in outputs if output.strip())
+
+    def _run_import(
+        self,
+        obj: "MySQLDatabase",
+        command: str,
+        input_data: Any,
+        filepath: str,
+        ssh_target: Optional[Instance],
+        verbose: bool
+    ) -> Tuple[Optional[int], str]:
+        success, output = obj.cluster.ssh_noninteractive(
+            command,
+            input_data=input_data,
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        if not success:
+            raise obj.OperationFailed(
+                'Failed to import "{}" into database "{}" on {}:{}: {}'.format(
+                    filepath,
+                    obj.db,
+                    obj.host,
+                    obj.port,
+                    output
+                )
+            )
+        rows = parse_batch_output(output)
+        try:
+            return int(rows[-1][0]), output  # type: ignore
+        except (IndexError, TypeError, ValueError):
+            # The import worked, but we can't tell how many rows it loaded
+            return None, output
+
+    def query(
+        self,
+        obj: "MySQLDatabase",
+        sql: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None,
+        db: str = None,
+        replica: bool = False
+    ) -> List[List[Optional[str]]]:
+        """
+        Run ``sql`` on the remote MySQL server and return the result rows.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            sql: The SQL to run
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            user: The user to use to bind to the database.
+            password: The password to use to bind to the database.
+            db: The default database for ``sql``.
+            replica: If ``True``, run ``sql``, which must only read, on our
+                least lagged read replica instead; see :py:meth:`read_target`.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A list of rows, each of which is a list of column values.  ``NULL``
+            values are returned as ``None``.
+        """
+        if replica:
+            obj, _ = self.read_target(obj, ssh_target=ssh_target, verbose=verbose)
+        command = obj.render_mysql_command(sql, user=user, password=password, db=db, batch=True)
+        success, output = obj.cluster.ssh_noninteractive(command, ssh_target=ssh_target, verbose=verbose)
+        return self._finish_query(obj, success, output)
+
+    def _finish_query(self, obj: "MySQLDatabase", success: bool, output: str) -> List[List[Optional[str]]]:
+        if success:
+            return parse_batch_output(output)
+        raise obj.OperationFailed('Failed to run query on remote server {}:{}: {}'.format(
+            obj.host,
+            obj.port,
+            output
+        ))
+
+    def execute_script(
+        self,
+        obj: "MySQLDatabase",
+        sql: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None
+    ) -> List[List[Optional[str]]]:
+        """
+        Run the SQL script ``sql`` in our database by piping it to the remote
+        ``mysql`` client's stdin.  Unlike :py:meth:`query`, the SQL is not put on
+        the command line, so it may be any size and may use client commands
+        like ``DELIMITER``.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            sql: The SQL to run
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            user: The user to use to bind to the database.
+            password: The password to use to bind to the database.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A list of rows, each of which is a list of column values.
+        """
+        command = obj.render_for_script(user=user, password=password)
+        success, output = obj.cluster.ssh_noninteractive(
+            command,
+            input_data=sql,
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        return self._finish_script(obj, success, output)
+
+    def _finish_script(self, obj: "MySQLDatabase", success: bool, output: str) -> List[List[Optional[str]]]:
+        if success:
+            return parse_batch_output(output)
+        raise obj.OperationFailed('Failed to run SQL script in database "{}" on remote server {}:{}: {}'.format(
+            obj.db,
+            obj.host,
+            obj.port,
+            output
+        ))
+
+    def stats(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        replica: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the size of every table in our database, using a single query
+        against ``information_schema.tables``.
+
+        Row counts for InnoDB tables are the estimates that MySQL keeps in
+        ``information_schema``, not exact counts.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            replica: If ``True``, read the sizes from our least lagged read
+                replica instead; see :py:meth:`read_target`.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A list of dicts, one per table, with keys ``table``, ``engine``,
+            ``rows``, ``data_length``, ``index_length``, ``data_free`` and
+            ``total_length``, largest table first.
+        """
+        rows = self.query(obj, obj.render_sql_for_stats(), ssh_target=ssh_target, verbose=verbose, replica=replica)
+        return self._table_stats(rows)
+
+    def _table_stats(self, rows: List[List[Optional[str]]]) -> List[Dict[str, Any]]:
+        tables = []
+        for row in rows:
+            table = {
+                'table': row[0],
+                'engine': row[1] or '',
+                'rows': int(row[2] or 0),
+                'data_length': int(row[3] or 0),
+                'index_length': int(row[4] or 0),
+                'data_free': int(row[5] or 0),
+            }
+            table['total_length'] = table['data_length'] + table['index_length']
+            tables.append(table)
+        return sorted(tables, key=lambda t: (-t['total_length'], t['table']))
+
+    def digests(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the cumulative statement statistics for our database from
+        ``performance_schema.events_statements_summary_by_digest``.  The
+        counters are cumulative since the server started (or the table was
+        truncated), so compare two of these with
+        :py:func:`deployfish_mysql.snapshots.diff_counters` to get the numbers
+        for an interval.
+
+        ``performance_schema`` must be enabled on the server, and our user
+        needs ``SELECT`` on it.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A list of dicts, one per digest, with keys ``digest``, ``query``,
+            ``calls``, ``latency`` (seconds), ``rows_examined`` and
+            ``rows_sent``.
+        """
+        digests = []
+        for row in self.query(obj, obj.render_sql_for_digests(), ssh_target=ssh_target, verbose=verbose):
+            digests.append({
+                'digest': row[0] or '',
+                'query': row[1] or '(other)',
+                'calls': int(row[2] or 0),
+                # performance_schema timers are in picoseconds
+                'latency': int(row[3] or 0) / 1e12,
+                'rows_examined': int(row[4] or 0),
+                'rows_sent': int(row[5] or 0),
+            })
+        return digests
+
+    def index_report(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None
+    ) -> Dict[str, Any]:
+        """
+        Find unused and redundant indexes, and tables without a primary key, in
+        our database.
+
+        We get everything we need in one ``mysql`` session:  table and index
+        definitions from ``information_schema``, index usage from
+        ``performance_schema.table_io_waits_summary_by_index_usage`` and index
+        sizes from ``mysql.innodb_index_stats``.  The user needs ``SELECT`` on
+        ``performance_schema`` and ``mysql``, so you may need to pass the root
+        user and password.
+
+        Usage counters reset when the server restarts, so an index that looks
+        unused on a server that was recently restarted may just not have been
+        needed yet.  We return the server uptime so you can judge that.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            user: The user to use to bind to the database.
+            password: The password to use to bind to the database.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A dict with keys ``uptime`` (seconds), ``unused``, ``redundant``
+            and ``no_primary_key``.  See
+            :py:func:`deployfish_mysql.schema.analyze_indexes`.
+        """
+        rows = self.query(
+            obj,
+            obj.render_sql_for_index_report(),
+            ssh_target=ssh_target,
+            verbose=verbose,
+            user=user,
+            password=password
+        )
+        tables: Dict[str, int] = {}
+        statistics = []
+        reads: Dict[Tuple[str, str], int] = {}
+        writes: Dict[str, int] = {}
+        sizes: Dict[Tuple[str, str], int] = {}
+        uptime = 0
+        for row in rows:
+            kind, values = row[0], row[1:]
+            if kind == 'T':
+                tables[values[0]] = int(values[1] or 0)  # type: ignore
+            elif kind == 'S':
+                statistics.append(values)
+            elif kind == 'U':
+                table = cast(str, values[0])
+                if values[1]:
+                    reads[(table, values[1])] = int(values[2] or 0)
+                writes[table] = writes.get(table, 0) + int(values[3] or 0)
+            elif kind == 'Z':
+                sizes[(values[0], values[1])] = int(values[2] or 0)  # type: ignore
+            elif kind == 'V':
+                uptime = int(values[0] or 0)
+        indexes = build_indexes(statistics)
+        for table_indexes in indexes.values():
+            for index in table_indexes.values():
+                index.reads = reads.get((index.table, index.name), 0)
+                index.size = sizes.get((index.table, index.name), 0)
+        report: Dict[str, Any] = analyze_indexes(tables, indexes, writes)
+        report['uptime'] = uptime
+        return report
+
+    def schema_hashes(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Dict[str, str]:
+        """
+        Return a hash of the definition (columns, indexes, engine and collation)
+        of each table in our database.  The hashes are built from compact
+        per-table digests computed on the server, so this is one small query no
+        matter how big the schema is.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A dict of table name to hash.
+        """
+        rows = self.query(obj, obj.render_sql_for_schema_hashes(), ssh_target=ssh_target, verbose=verbose)
+        return table_hashes(rows)
+
+    def schema_details(
+        self,
+        obj: "MySQLDatabase",
+        tables: Sequence[str],
+        create_tables: Sequence[str] = None,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Return the full column and index definitions of ``tables`` in our
+        database, and the ``CREATE TABLE`` statements for ``create_tables``.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            tables: the tables to describe
+
+        Keyword Args:
+            create_tables: the tables for which to get ``CREATE TABLE`` statements
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A dict of table name to a dict with keys ``columns``, ``indexes``,
+            ``engine``, ``collation`` and (for ``create_tables``) ``create``.
+        """
+        details: Dict[str, Any] = {}
+        if not tables and not create_tables:
+            return details
+        rows = self.query(
+            obj,
+            obj.render_sql_for_schema_details(tables, create_tables=create_tables),
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        # SHOW CREATE TABLE rows are untagged (table name, CREATE TABLE statement)
+        # pairs; all our own rows have more columns than that
+        tagged = [row for row in rows if len(row) > 2]
+        columns = build_columns([row[1:] for row in tagged if row[0] == 'C'])
+        indexes = build_indexes([row[1:] for row in tagged if row[0] == 'I'])
+        for row in tagged:
+            if row[0] == 'T':
+                details[row[1]] = {
+                    'columns': columns.get(row[1], []),  # type: ignore
+                    'indexes': indexes.get(row[1], {}),  # type: ignore
+                    'engine': row[2],
+                    'collation': row[3],
+                }
+        for row in rows:
+            if len(row) == 2:
+                details.setdefault(row[0], {})['create'] = row[1]
+        return details
+
+    def schema_diff(
+        self,
+        obj: "MySQLDatabase",
+        other: "MySQLDatabase",
+        ssh_target: Instance = None,
+        other_ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Return the DDL that would make the schema of ``other`` match the schema
+        of ``obj``.
+
+        We first fetch per-table hashes from both servers concurrently, and
+        then fetch full definitions, again concurrently, only for the tables
+        whose hashes differ.
+
+        Args:
+            obj: The ``MySQLDatabase`` with the schema we want
+            other: The ``MySQLDatabase`` to compare it to
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running mysql commands for
+                ``obj``.  If not supplied, we will use the ``cluster``'s default
+                ssh instance.
+            other_ssh_target: the ssh instance to use for running mysql
+                commands for ``other``.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A tuple of (list of SQL statements, list of names of tables that
+            are identical).
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            source_future = executor.submit(self.schema_hashes, obj, ssh_target=ssh_target, verbose=verbose)
+            target_future = executor.submit(self.schema_hashes, other, ssh_target=other_ssh_target, verbose=verbose)
+            source, target = source_future.result(), target_future.result()
+        identical = sorted(table for table in source if target.get(table) == source[table])
+        changed = sorted(table for table in source if table in target and target[table] != source[table])
+        added = sorted(table for table in source if table not in target)
+        dropped = sorted(table for table in target if table not in source)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            source_future = executor.submit(
+                self.schema_details,
+                obj,
+                changed,
+                create_tables=added,
+                ssh_target=ssh_target,
+                verbose=verbose
+            )
+            target_future = executor.submit(
+                self.schema_details,
+                other,
+                changed,
+                ssh_target=other_ssh_target,
+                verbose=verbose
+            )
+            source_details, target_details = source_future.result(), target_future.result()
+        statements = []
+        for table in added:
+            statements.append('{};'.format(source_details[table]['create']))
+        for table in changed:
+            statements.extend(diff_table(table, source_details[table], target_details[table]))
+        for table in dropped:
+            statements.append('DROP TABLE {};'.format(quote_identifier(table)))
+        return statements, identical
+
+    def checksum_metadata(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Return what :py:meth:`verify` needs to know about each table in our
+        database: its columns and its primary key.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Returns:
+            A dict of table name to a dict with keys ``columns`` (list of column
+            names), ``key`` (the primary key column, if the primary key is a
+            single integer column, else ``None``) and ``has_primary_key``.
+        """
+        rows = self.query(obj, obj.render_sql_for_checksum_metadata(), ssh_target=ssh_target, verbose=verbose)
+        tables: Dict[str, Dict[str, Any]] = {}
+        types: Dict[Tuple[str, str], str] = {}
+        for row in sorted((r for r in rows if r[0] == 'C'), key=lambda r: (r[1], int(r[3] or 0))):
+            tables.setdefault(row[1], {'columns': [], 'key': None, 'has_primary_key': False})['columns'].append(row[2])
+            types[(row[1], row[2])] = cast(str, row[4])
+        primary: Dict[str, List[str]] = {}
+        for row in sorted((r for r in rows if r[0] == 'K'), key=lambda r: (r[1], int(r[3] or 0))):
+            primary.setdefault(cast(str, row[1]), []).append(cast(str, row[2]))
+        for table, columns in primary.items():
+            if table not in tables:
+                continue
+            tables[table]['has_primary_key'] = True
+            if len(columns) == 1 and types[(table, columns[0])] in INTEGER_TYPES:
+                tables[table]['key'] = columns[0]
+        return tables
+
+    def checksum_chunks(
+        self,
+        obj: "MySQLDatabase",
+        table: str,
+        columns: Sequence[str],
+        key: str = None,
+        chunk_size: int = None,
+        ranges: Sequence[Tuple[int, int]] = None,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Dict[int, Tuple[int, int]]:
+        """
+        Checksum the rows of ``table`` in chunks of ``chunk_size`` values of the
+        integer primary key ``key``.  Each chunk's checksum is the sum of the
+        ``CRC32`` of every row in it, so it does not depend on row order.  All
+        chunks are computed in one query.
+
+        If ``key`` is not supplied, checksum the whole table as chunk ``0``.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            table: the table to checksum
+            columns: the columns to include in the checksum
+
+        Keyword Args:
+            key: the integer primary key column
+            chunk_size: the number of key values per chunk
+            ranges: if supplied, only checksum rows with keys in these
+                half-open ``(start, end)`` ranges
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A dict of chunk number (``key // chunk_size``) to a tuple of (row
+            count, checksum).
+        """
+        sql = obj.render_sql_for_checksum(table, columns, key=key, chunk_size=chunk_size, ranges=ranges)
+        chunks = {}
+        for row in self.query(obj, sql, ssh_target=ssh_target, verbose=verbose):
+            chunks[int(row[0] or 0)] = (int(row[1] or 0), int(row[2] or 0))
+        return chunks
+
+    def verify(
+        self,
+        obj: "MySQLDatabase",
+        other: "MySQLDatabase",
+        tables: Sequence[str] = None,
+        chunk_size: int = 100000,
+        min_chunk_size: int = 100,
+        jobs: int = 1,
+        ssh_target: Instance = None,
+        other_ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Check that the data in ``other`` matches the data in ``obj`` without
+        copying any rows off either server.
+
+        Each table is split into ranges of ``chunk_size`` primary key values
+        and a checksum is computed for each range on both servers at the same
+        time.  Ranges whose checksums differ are split again into ranges ten
+        times smaller, and so on down to ``min_chunk_size``, so that we can
+        say roughly which rows differ.  Tables without a single integer primary
+        key are checksummed as a whole.
+
+        Args:
+            obj: The ``MySQLDatabase`` with the data we expect
+            other: The ``MySQLDatabase`` to check
+
+        Keyword Args:
+            tables: only check these tables.  Default: all tables in ``obj``.
+            chunk_size: the number of primary key values per chunk
+            min_chunk_size: stop splitting mismatched chunks at this size
+            jobs: check this many tables at once
+            ssh_target: the ssh instance to use for running mysql commands for
+                ``obj``.  If not supplied, we will use the ``cluster``'s default
+                ssh instance.
+            other_ssh_target: the ssh instance to use for running mysql
+                commands for ``other``.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A list of dicts, one per table, with keys ``table``, ``verdict``
+            (``match``, ``differs``, ``missing`` or ``error``), ``rows``, ``other_rows``,
+            ``ranges`` (the mismatched half-open key ranges) and ``message``.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            source_future = executor.submit(self.checksum_metadata, obj, ssh_target=ssh_target, verbose=verbose)
+            target_future = executor.submit(
+                self.checksum_metadata, other, ssh_target=other_ssh_target, verbose=verbose
+            )
+            source, target = source_future.result(), target_future.result()
+        if tables is None:
+            tables = sorted(source)
+
+        def verify_table(table: str) -> Dict[str, Any]:
+            result: Dict[str, Any] = {
+                'table': table, 'verdict': 'match', 'rows': 0, 'other_rows': 0, 'ranges': [], 'message': ''
+            }
+            if table not in source or table not in target:
+                result['verdict'] = 'missing'
+                result['message'] = 'not in {}'.format(obj.name if table not in source else other.name)
+                return result
+            if source[table]['columns'] != target[table]['columns']:
+                result['verdict'] = 'error'
+                result['message'] = 'columns differ'
+                return result
+            columns = source[table]['columns']
+            key = source[table]['key'] if source[table]['key'] == target[table]['key'] else None
+            size = chunk_size if key else None
+            ranges: Optional[List[Tuple[int, int]]] = None
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                while True:
+                    futures = [
+                        executor.submit(
+                            self.checksum_chunks, db, table, columns, key=key, chunk_size=size, ranges=ranges,
+                            ssh_target=target_, verbose=verbose
+                        )
+                        for db, target_ in ((obj, ssh_target), (other, other_ssh_target))
+                    ]
+                    expected, actual = futures[0].result(), futures[1].result()
+                    if ranges is None:
+                        result['rows'] = sum(count for count, _ in expected.values())
+                        result['other_rows'] = sum(count for count, _ in actual.values())
+                    bad = sorted(
+                        chunk for chunk in set(expected) | set(actual) if expected.get(chunk) != actual.get(chunk)
+                    )
+                    if not bad:
+                        return result
+                    result['verdict'] = 'differs'
+                    if not size:
+                        return result
+                    ranges = [(chunk * size, (chunk + 1) * size) for chunk in bad]
+                    if size <= min_chunk_size:
+                        result['ranges'] = ranges
+                        return result
+                    size = max(size // 10, min_chunk_size)
+
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            return list(executor.map(verify_table, tables))
+
+    def threads_running(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> int:
+        """
+        Return the number of threads currently running queries on the MySQL
+        server.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            The value of the ``Threads_running`` status variable.
+        """
+        rows = self.query(obj, obj.render_sql_for_threads_running(), ssh_target=ssh_target, verbose=verbose)
+        return self._threads_running(rows)
+
+    def _threads_running(self, rows: List[List[Optional[str]]]) -> int:
+        return int(rows[0][1] or 0) if rows else 0
+
+    def audit(
+        self,
+        objs: Sequence["MySQLDatabase"] = None,
+        cache_file: str = None,
+        credentials: Callable[["MySQLDatabase"], Tuple[Optional[str], Optional[str]]] = None,
+        verbose: bool = False,
+        concurrency: int = 4
+    ) -> List[Dict[str, Any]]:
+        """
+        Check that the accounts, grants and databases on each MySQL server in
+        ``deployfish.yml`` are what :py:meth:`MySQLDatabase.render_for_create`
+        would have made them for its ``mysql:`` entries.  See
+        :py:func:`deployfish_mysql.audit.audit_entries`.
+
+        We group the entries by server and read each server's accounts, grants
+        and databases in one query, ``concurrency`` servers at a time.  With
+        ``cache_file``, we keep the snapshot of each server there, and a server
+        whose fingerprint of its grants has not changed since sends only the
+        fingerprint; we check the cached snapshot against the entries again.
+
+        Reading ``mysql.user`` takes a privileged user, so ``credentials`` is
+        called, once per server and one server at a time, with the first entry
+        on it, and returns the (user, password) to read it with.
+
+        Keyword Args:
+            objs: the ``MySQLDatabase`` objects to check.  If not supplied, we
+                check every ``mysql:`` entry in ``deployfish.yml``.
+            cache_file: the file to keep our snapshots in
+            credentials: returns the user and password to read a server with.
+                If not supplied, we use each entry's own.
+            verbose: If ``True`` run ssh in verbose mode.
+            concurrency: how many servers to read at once
+
+        Returns:
+            A list of dicts, one per server, with keys ``host``, ``port``,
+            ``names`` (the entries on it), ``fingerprint``, ``cached``
+            (``True`` if the server's grants had not changed), ``findings``
+            (from :py:func:`deployfish_mysql.audit.audit_entries`) and
+            ``error``, if we could not read it.
+        """
+        if objs is None:
+            objs = cast(Sequence["MySQLDatabase"], self.list())
+        servers: Dict[Tuple[str, int], List["MySQLDatabase"]] = {}
+        for obj in objs:
+            servers.setdefault((obj.host, int(obj.port)), []).append(obj)
+        logins = {
+            server: credentials(entries[0]) if credentials else (None, None)
+            for server, entries in sorted(servers.items())
+        }
+        cache = read_audit_cache(cache_file) if cache_file else {}
+
+        def check(server: Tuple[str, int]) -> Dict[str, Any]:
+            entries = servers[server]
+            key = '{}:{}'.format(*server)
+            cached = cache.get(key)
+            result: Dict[str, Any] = {
+                'host': server[0],
+                'port': server[1],
+                'names': [obj.name for obj in entries],
+                'fingerprint': None,
+                'cached': False,
+                'findings': [],
+                'error': None,
+            }
+            user, password = logins[server]
+            try:
+                rows = self.query(
+                    entries[0],
+                    entries[0].render_sql_for_audit(cached['fingerprint'] if cached else None),
+                    verbose=verbose,
+                    user=user,
+                    password=password
+                )
+            except entries[0].OperationFailed as e:
+                result['error'] = str(e)
+                return result
+            fingerprint, snapshot = parse_audit_output(rows)
+            if snapshot is None and cached and fingerprint == cached['fingerprint']:
+                snapshot = cached['snapshot']
+                result['cached'] = True
+            if snapshot is None:
+                result['error'] = 'The server sent no accounts: does {} have SELECT on mysql.user?'.format(
+                    user or entries[0].user
+                )
+                return result
+            cache[key] = {'fingerprint': fingerprint, 'snapshot': snapshot}
+            result['fingerprint'] = fingerprint
+            result['findings'] = audit_entries(snapshot, entries)
+            return result
+
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            results = list(executor.map(check, sorted(servers)))
+        if cache_file:
+            write_audit_cache(cache_file, cache)
+        return results
+
+    def connection_limits(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Dict[str, Optional[int]]:
+        """
+        Return the MySQL server's connection limit and how many connections it
+        has open now.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A dict with keys ``max_connections`` and ``threads_connected``.
+        """
+        rows = self.query(obj, obj.render_sql_for_connection_limits(), ssh_target=ssh_target, verbose=verbose)
+        return parse_connection_limits(rows)
+
+    def connection_demand(self, obj: "MySQLDatabase") -> Dict[str, Any]:
+        """
+        Work out how many connections the tasks of ``obj``'s service make to
+        its MySQL server, from the service's task count in ``deployfish.yml``,
+        the most tasks its application autoscaling lets it scale out to, its
+        ``maximum_percent`` and our ``pool_size``.  See
+        :py:func:`deployfish_mysql.capacity.service_demand`.
+
+        A daemon service runs one task on each container instance in its
+        cluster, so for those we count the container instances.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Returns:
+            A dict as from :py:func:`deployfish_mysql.capacity.service_demand`,
+            plus the keys ``name`` and ``service``.
+        """
+        service = obj.service
+        desired = service.data.get('desiredCount', 0)
+        if not isinstance(desired, int):
+            desired = len(obj.cluster.container_instances)
+        max_tasks = desired
+        if service.appscaling is not None:
+            max_tasks = int(service.appscaling.data.get('MaxCapacity', desired))
+        maximum_percent = int(service.data.get('deploymentConfiguration', {}).get('maximumPercent', 200))
+        demand = service_demand(desired, max_tasks, maximum_percent, obj.pool_size)
+        demand['name'] = obj.name
+        demand['service'] = obj.data['service']
+        return demand
+
+    def capacity(
+        self,
+        objs: Sequence["MySQLDatabase"] = None,
+        verbose: bool = False,
+        concurrency: int = 4
+    ) -> List[Dict[str, Any]]:
+        """
+        Compare the connections the services in ``deployfish.yml`` would make
+        to each MySQL server, at their most tasks and during a rolling deploy,
+        with the server's ``max_connections`` and ``Threads_connected``.  See
+        :py:func:`deployfish_mysql.capacity.host_capacity`.
+
+        We group the ``mysql:`` entries by server and read each server's limits
+        once, ``concurrency`` servers at a time, through the default ssh
+        instance of the first entry's cluster.  A server we cannot read gets
+        the verdict ``UNKNOWN`` and the error in ``error``.
+
+        Keyword Args:
+            objs: the ``MySQLDatabase`` objects to check.  If not supplied, we
+                check every ``mysql:`` entry in ``deployfish.yml``.
+            verbose: If ``True`` run ssh in verbose mode.
+            concurrency: how many servers to read at once
+
+        Returns:
+            A list of dicts, one per server, as from
+            :py:func:`deployfish_mysql.capacity.host_capacity`, plus the keys
+            ``host`` and ``port``.
+        """
+        if objs is None:
+            objs = cast(Sequence["MySQLDatabase"], self.list())
+        servers: Dict[Tuple[str, int], List["MySQLDatabase"]] = {}
+        for obj in objs:
+            servers.setdefault((obj.host, int(obj.port)), []).append(obj)
+
+        def check(server: Tuple[str, int]) -> Dict[str, Any]:
+            entries = servers[server]
+            error = None
+            try:
+                limits = self.connection_limits(entries[0], verbose=verbose)
+            except entries[0].OperationFailed as e:
+                limits = {'max_connections': None, 'threads_connected': None}
+                error = str(e)
+            result = host_capacity(
+                [self.connection_demand(obj) for obj in entries],
+                limits['max_connections'],
+                limits['threads_connected']
+            )
+            result.update({'host': server[0], 'port': server[1], 'error': error})
+            return result
+
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            return list(executor.map(check, sorted(servers)))
+
+    def insert_coalescer(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> InsertCoalescer:
+        """
+        Return an :py:class:`deployfish_mysql.coalesce.InsertCoalescer` to pass
+        as ``transform`` to :py:meth:`load`, sized to fit the MySQL server's
+        ``max_allowed_packet``.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            An ``InsertCoalescer``.
+        """
+        rows = self.query(obj, obj.render_sql_for_max_allowed_packet(), ssh_target=ssh_target, verbose=verbose)
+        return self._insert_coalescer(rows)
+
+    def _insert_coalescer(self, rows: List[List[str]]) -> InsertCoalescer:
+        # Leave room for the packet header and the rest of the protocol
+        max_allowed_packet = int(rows[0][0]) if rows and rows[0][0] else MAX_STATEMENT_SIZE
+        return InsertCoalescer(max(min(MAX_STATEMENT_SIZE, max_allowed_packet - 1024), 1024))
+
+    def replica_lag(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Optional[int]:
+        """
+        Return how many seconds the MySQL server for ``obj``, which should be a
+        replica, is behind its source.
+
+        MySQL 8.4 only has ``SHOW REPLICA STATUS``, and MySQL before 8.0.22
+        only ``SHOW SLAVE STATUS``, so the first time we ask a server we also
+        ask its version.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            The replica lag in seconds, or ``None`` if the server is not a
+            replica or replication is not running.
+        """
+        version = obj.cache.get('server_version') or self.server_version(obj, ssh_target=ssh_target, verbose=verbose)
+        success, output = obj.cluster.ssh_noninteractive(
+            obj.render_for_replica_status(version),
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+        return self._finish_replica_lag(obj, success, output)
+
+    def _finish_replica_lag(self, obj: "MySQLDatabase", success: bool, output: str) -> Optional[int]:
+        if not success:
+            raise obj.OperationFailed('Failed to get replica status of remote server {}:{}: {}'.format(
+                obj.host,
+                obj.port,
+                output
+            ))
+        rows = parse_batch_output(output)
+        if len(rows) < 2:
+            return None
+        status = dict(zip(rows[0], rows[1]))
+        # MySQL 8.0.22 renamed Seconds_Behind_Master in SHOW REPLICA STATUS
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        return int(lag) if lag is not None else None
+
+    def read_replicas(self, obj: "MySQLDatabase") -> List["MySQLDatabase"]:
+        """
+        Return a ``MySQLDatabase`` for each read replica of ``obj``'s server,
+        from the ``replica_host`` setting in our ``mysql:`` entry.
+
+        If ``replica_host`` is ``auto``, we ask RDS for the replicas of the RDS
+        instance ``obj.host`` belongs to, and use the ones that are available.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Returns:
+            A list of ``MySQLDatabase`` objects, empty if we have no replicas.
+        """
+        hosts = obj.replica_hosts
+        if hosts == ['auto']:
+            hosts = []
+            try:
+                instance = RDSInstance.objects.get(obj.host.split('.')[0])
+            except RDSInstance.DoesNotExist:
+                return []
+            for pk in instance.data.get('ReadReplicaDBInstanceIdentifiers', []):
+                try:
+                    replica = RDSInstance.objects.get(pk)
+                except RDSInstance.DoesNotExist:
+                    continue
+                if replica.status == 'available':
+                    hosts.append(replica.hostname)
+        return [obj.for_host(host) for host in hosts]
+
+    def read_target(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Tuple["MySQLDatabase", Optional[int]]:
+        """
+        Choose the server to send read-only work for ``obj`` to: the least
+        lagged of our read replicas whose lag is at most ``replica_max_lag``
+        seconds, or our own server if no replica qualifies.
+
+        We check the replicas' lag in parallel.  A replica whose lag we cannot
+        read, because it is down, replication is stopped or our user lacks the
+        ``REPLICATION CLIENT`` privilege, does not qualify.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Returns:
+            A (``MySQLDatabase``, replica lag in seconds) tuple.  The lag is
+            ``None`` if we chose ``obj`` itself.
+        """
+        replicas = self.read_replicas(obj)
+        if not replicas:
+            return obj, None
+
+        def lag(replica: "MySQLDatabase") -> Optional[int]:
+            try:
+                return self.replica_lag(replica, ssh_target=ssh_target, verbose=verbose)
+            except replica.OperationFailed:
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(replicas)) as executor:
+            lags = list(executor.map(lag, replicas))
+        return self._least_lagged(obj, replicas, lags)
+
+    def _least_lagged(
+        self,
+        obj: "MySQLDatabase",
+        replicas: Sequence["MySQLDatabase"],
+        lags: Sequence[Optional[int]]
+    ) -> Tuple["MySQLDatabase", Optional[int]]:
+        candidates = [
+            (seconds, i) for i, seconds in enumerate(lags)
+            if seconds is not None and seconds <= obj.replica_max_lag
+        ]
+        if not candidates:
+            return obj, None
+        seconds, i = min(candidates)
+        return replicas[i], seconds
+
+    def wait_for_capacity(
+        self,
+        obj: "MySQLDatabase",
+        max_threads_running: int = None,
+        replica: "MySQLDatabase" = None,
+        max_replica_lag: int = None,
+        max_wait: float = None,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        pause: float = 5.0,
+        callback: Callable[[str], None] = None
+    ) -> float:
+        """
+        Block until the server for ``obj`` has fewer than
+        ``max_threads_running`` running threads and ``replica`` is less than
+        ``max_replica_lag`` seconds behind.  Use this between batches of bulk
+        work to back off when the server is busy.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            max_threads_running: wait while ``Threads_running`` is at or above this
+            replica: a ``MySQLDatabase`` on a replica of ``obj``'s server
+            max_replica_lag: wait while ``replica`` is this many seconds behind
+            max_wait: give up after waiting this many seconds.  If not
+                supplied, wait for as long as it takes.
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            pause: how long to sleep between checks, in seconds
+            callback: if supplied, call this with a message each time we wait
+
+        Raises:
+            obj.OperationFailed: ``replica`` is not replicating, so we cannot
+                tell how far behind it is, or we waited ``max_wait`` seconds.
+
+        Returns:
+            The number of seconds we waited.
+        """
+        waited = 0.0
+        while True:
+            reasons = []
+            if max_threads_running:
+                running = self.threads_running(obj, ssh_target=ssh_target, verbose=verbose)
+                if running >= max_threads_running:
+                    reasons.append('Threads_running={}'.format(running))
+            if replica is not None and max_replica_lag is not None:
+                lag = self.replica_lag(replica, verbose=verbose)
+                if lag is None:
+                    raise obj.OperationFailed(
+                        'Replica {}:{} is not replicating, so we cannot tell how far behind it is'.format(
+                            replica.host,
+                            replica.port
+                        )
+                    )
+                if lag >= max_replica_lag:
+                    reasons.append('replica lag={}'.format(lag))
+            if not reasons:
+                return waited
+            if max_wait is not None and waited >= max_wait:
+                raise obj.OperationFailed('Gave up after waiting {:.0f}s for {}:{} to be less busy: {}'.format(
+                    waited,
+                    obj.host,
+                    obj.port,
+                    ', '.join(reasons)
+                ))
+            if callback:
+                callback('Waiting {}s: {}'.format(pause, ', '.join(reasons)))
+            time.sleep(pause)
+            waited += pause
+
+    def purge(
+        self,
+        obj: "MySQLDatabase",
+        table: str,
+        where: str,
+        batch_size: int = 1000,
+        sleep: float = 0.5,
+        max_threads_running: int = 25,
+        replica: "MySQLDatabase" = None,
+        max_replica_lag: int = 10,
+        max_wait: float = 600,
+        archive_dir: str = None,
+        dry_run: bool = False,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        callback: Callable[[str], None] = None
+    ) -> Dict[str, Any]:
+        """
+        Delete the rows of ``table`` that match ``where`` in small batches, in
+        primary key order, so that no single statement holds locks for long.
+
+        Each batch finds the primary key of the last of the next
+        ``batch_size`` matching rows and deletes the matching rows up to and
+        including it.  Between batches we sleep for ``sleep`` seconds and wait
+        for the server (and ``replica``, if given) to be less busy; see
+        :py:meth:`wait_for_capacity`.
+
+        If ``archive_dir`` is given, each batch of rows is first selected and
+        appended to a gzipped tab separated file in ``archive_dir``, and only
+        the primary keys that were archived are deleted.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            table: the table to purge
+            where: a SQL condition that matches the rows to purge
+
+        Keyword Args:
+            batch_size: delete at most this many rows per batch
+            sleep: sleep this many seconds between batches
+            max_threads_running: wait before each batch while the server has
+                this many threads running
+            replica: a ``MySQLDatabase`` on a replica of ``obj``'s server
+            max_replica_lag: wait before each batch while ``replica`` is this
+                many seconds behind
+            max_wait: give up if we have waited this many seconds before a
+                batch
+            archive_dir: save the purged rows in this directory first
+            dry_run: only count the rows that would be purged
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            callback: if supplied, call this with a progress message after each
+                batch
+
+        Raises:
+            obj.OperationFailed: The table does not have a single column
+                primary key, ``replica`` is not replicating, we waited
+                ``max_wait`` seconds for the server to be less busy, or a
+                command failed.
+
+        Returns:
+            A dict with keys ``table``, ``rows`` (rows purged, or that would be
+            purged for ``dry_run``), ``batches``, ``archive`` (the archive
+            filename, if any) and ``elapsed`` (seconds).
+        """
+        start = time.time()
+        result: Dict[str, Any] = {'table': table, 'rows': 0, 'batches': 0, 'archive': None, 'elapsed': 0.0}
+        if dry_run:
+            rows = self.query(obj, obj.render_sql_for_purge_count(table, where), ssh_target=ssh_target, verbose=verbose)
+            result['rows'] = int(rows[0][0] or 0) if rows else 0
+            result['elapsed'] = time.time() - start
+            return result
+        metadata = self.query(obj, obj.render_sql_for_key_metadata(table), ssh_target=ssh_target, verbose=verbose)
+        key_columns = [cast(str, row[1]) for row in metadata if row[0] == 'K']
+        columns = [cast(str, row[1]) for row in metadata if row[0] == 'C']
+        types = {row[1]: row[2] for row in metadata if row[0] == 'C'}
+        if len(key_columns) != 1:
+            raise obj.OperationFailed(
+                'Cannot purge {}.{}: it needs a single column primary key, but has {}'.format(
+                    obj.db, table, ', '.join(key_columns) or 'none'
+                )
+            )
+        key = key_columns[0]
+        # Compare an integer key with integers, not strings, or MySQL compares them as doubles
+        to_key: Callable[[Any], Union[int, str]] = int if types.get(key) in INTEGER_TYPES else str
+        last: Optional[Union[int, str]] = None
+        archive = None
+        if archive_dir:
+            result['archive'] = os.path.join(
+                archive_dir,
+                '{}.{}-{}.tsv.gz'.format(obj.db, table, time.strftime('%Y%m%d%H%M%S'))
+            )
+            archive = gzip.open(result['archive'], 'wt', encoding='utf-8')
+            archive.write('\t'.join(columns) + '\n')
+        try:
+            while True:
+                self.wait_for_capacity(
+                    obj,
+                    max_threads_running=max_threads_running,
+                    replica=replica,
+                    max_replica_lag=max_replica_lag,
+                    max_wait=max_wait,
+                    ssh_target=ssh_target,
+                    verbose=verbose,
+                    callback=callback
+                )
+                if archive is not None:
+                    rows = self.query(
+                        obj,
+                        obj.render_sql_for_purge_select(table, where, key, last, batch_size),
+                        ssh_target=ssh_target,
+                        verbose=verbose
+                    )
+                    if not rows:
+                        break
+                    for row in rows:
+                        archive.write('\t'.join('\\N' if value is None else escape_tsv(value) for value in row[1:]))
+                        archive.write('\n')
+                    archive.flush()
+                    keys = [to_key(row[0]) for row in rows]
+                    sql = obj.render_sql_for_purge_delete_keys(table, key, keys)
+                    last = keys[-1]
+                else:
+                    sql = obj.render_sql_for_purge_batch(table, where, key, last, batch_size)
+                rows = self.query(obj, sql, ssh_target=ssh_target, verbose=verbose)
+                if archive is None:
+                    if not rows or rows[0][0] is None:
+                        break
+                    last = to_key(rows[0][0])
+                deleted = int(rows[-1][-1] or 0) if rows else 0
+                result['rows'] += deleted
+                result['batches'] += 1
+                if callback:
+                    callback('{}: batch {}: purged {} rows ({} total), last {} = {}'.format(
+                        table, result['batches'], deleted, result['rows'], key, last
+                    ))
+                if sleep:
+                    time.sleep(sleep)
+        finally:
+            if archive is not None:
+                archive.close()
+        result['elapsed'] = time.time() - start
+        return result
+
+    def online_alter(
+        self,
+        obj: "MySQLDatabase",
+        table: str,
+        alter: str = None,
+        chunk_size: int = 1000,
+        sleep: float = 0.0,
+        max_threads_running: int = 25,
+        state_file: str = None,
+        resume: bool = False,
+        keep_old: bool = False,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        callback: Callable[[str], None] = None
+    ) -> Dict[str, Any]:
+        """
+        Apply ``alter`` to ``table`` without locking it for the duration of the
+        change, by copy-and-swap:
+
+        1. Create an empty shadow table ``_{table}_new`` like ``table`` and
+           apply ``alter`` to it.
+        2. Add triggers to ``table`` that copy every insert, update and delete
+           to the shadow table.
+        3. Copy the existing rows to the shadow table in chunks of
+           ``chunk_size`` primary key values, sleeping ``sleep`` seconds between
+           chunks and waiting while the server is busy.
+        4. Atomically rename ``table`` to ``_{table}_old`` and the shadow table
+           to ``table``, then drop the triggers and (unless ``keep_old``) the
+           old table.
+
+        Our progress is saved to ``state_file`` after every chunk.  To pause,
+        interrupt us or create ``{state_file}.pause``; the triggers stay in
+        place, and we can pick up where we left off with ``resume=True``.  Use
+        :py:meth:`abort_online_alter` to give up instead.
+
+        The table must have a single column integer primary key, and no
+        triggers or foreign keys (of its own, or in other tables referencing
+        it): the shadow table would not have them, so the swap would lose them.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            table: the table to alter
+
+        Keyword Args:
+            alter: the alter specification, e.g. ``ADD COLUMN foo int``.  A
+                leading ``ALTER TABLE name`` is ignored.  Not needed with
+                ``resume``.
+            chunk_size: copy this many primary key values per chunk
+            sleep: sleep this many seconds between chunks
+            max_threads_running: wait before each chunk while the server has
+                this many threads running
+            state_file: where to save our progress.  Default:
+                ``{db}.{table}.alter.json``.
+            resume: continue the copy saved in ``state_file``
+            keep_old: don't drop the original table after the swap
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            callback: if supplied, call this with a progress message after each
+                chunk
+
+        Raises:
+            obj.OperationFailed: The table can't be altered online (it has no
+                single column integer primary key, or has triggers or foreign
+                keys), the alter was paused, ``resume`` was given but ``state_file`` is missing
+                or unreadable, or a command failed.
+
+        Returns:
+            A dict with keys ``table``, ``rows`` (rows copied), ``chunks`` and
+            ``elapsed`` (seconds).
+        """
+        start = time.time()
+        if not state_file:
+            state_file = '{}.{}.alter.json'.format(obj.db, table)
+        if resume:
+            if not os.path.exists(state_file):
+                raise obj.OperationFailed(
+                    'Cannot resume altering table "{}": there is no state file "{}".  Pass the --state-file of '
+                    'the alter you want to resume.'.format(table, state_file)
+                )
+            try:
+                with open(state_file, encoding='utf-8') as fd:
+                    state = json.load(fd)
+            except (OSError, ValueError) as e:
+                raise obj.OperationFailed(
+                    'Cannot resume altering table "{}": cannot read state file "{}": {}'.format(table, state_file, e)
+                )
+        else:
+            if not alter:
+                raise obj.OperationFailed('No ALTER specification given for table "{}"'.format(table))
+            state = self._start_online_alter(obj, table, alter, ssh_target=ssh_target, verbose=verbose)
+        kwargs = {'ssh_target': ssh_target, 'verbose': verbose}
+        try:
+            while state['next'] is not None and state['next'] <= state['max']:
+                if os.path.exists(state_file + '.pause'):
+                    raise KeyboardInterrupt
+                self.wait_for_capacity(obj, max_threads_running=max_threads_running, callback=callback, **kwargs)
+                end = state['next'] + chunk_size
+                rows = self.query(obj, obj.render_sql_for_alter_copy(state, state['next'], end), **kwargs)
+                state['copied'] += int(rows[-1][-1] or 0) if rows else 0
+                state['chunks'] += 1
+                state['next'] = end
+                with open(state_file, 'w', encoding='utf-8') as fd:
+                    json.dump(state, fd)
+                if callback:
+                    span = max(state['max'] - state['min'] + 1, 1)
+                    callback('{}: copied {} rows ({:.1f}%)'.format(
+                        table, state['copied'], min(100.0, 100.0 * (end - state['min']) / span)
+                    ))
+                if sleep:
+                    time.sleep(sleep)
+        except KeyboardInterrupt:
+            with open(state_file, 'w', encoding='utf-8') as fd:
+                json.dump(state, fd)
+            raise obj.OperationFailed(
+                'Paused altering table "{}" after copying {} rows.  Resume with --resume, or undo with --abort.  '
+                'Progress is in "{}".'.format(table, state['copied'], state_file)
+            )
+        self.execute_script(obj, obj.render_sql_for_alter_swap(state, keep_old=keep_old), **kwargs)
+        os.remove(state_file)
+        if os.path.exists(state_file + '.pause'):
+            os.remove(state_file + '.pause')
+        return {'table': table, 'rows': state['copied'], 'chunks': state['chunks'], 'elapsed': time.time() - start}
+
+    def _start_online_alter(
+        self,
+        obj: "MySQLDatabase",
+        table: str,
+        alter: str,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Dict[str, Any]:
+        kwargs = {'ssh_target': ssh_target, 'verbose': verbose}
+        alter = re.sub(r'^\s*ALTER\s+TABLE\s+\S+\s+', '', alter, flags=re.IGNORECASE).strip().rstrip(';')
+        shadow = '_{}_new'.format(table)
+        metadata = self.query(
+            obj,
+            obj.render_sql_for_key_metadata(table) + obj.render_sql_for_alter_dependents(table),
+            **kwargs
+        )
+        keys = [cast(str, row[1]) for row in metadata if row[0] == 'K']
+        if len(keys) != 1:
+            raise obj.OperationFailed(
+                'Cannot alter {}.{} online: it needs a single column primary key, but has {}'.format(
+                    obj.db, table, ', '.join(keys) or 'none'
+                )
+            )
+        # CREATE TABLE ... LIKE copies neither foreign keys nor triggers, and foreign keys that
+        # reference the table follow it when it is renamed away, so the swap would lose them all
+        dependents = {
+            'F': 'foreign keys',
+            'R': 'foreign keys in other tables that reference it',
+            'T': 'triggers',
+        }
+        problems = [
+            '{} ({})'.format(description, ', '.join(cast(str, row[2]) for row in metadata if row[0] == kind))
+            for kind, description in dependents.items()
+            if any(row[0] == kind for row in metadata)
+        ]
+        if problems:
+            raise obj.OperationFailed(
+                'Cannot alter {}.{} online: it has {}, which the swap would lose.  Use ALTER TABLE '
+                'instead.'.format(obj.db, table, '; '.join(problems))
+            )
+        self.execute_script(obj, obj.render_sql_for_alter_shadow(table, shadow, alter), **kwargs)
+        shadow_metadata = self.query(obj, obj.render_sql_for_key_metadata(shadow), **kwargs)
+        shadow_columns = [row[1] for row in shadow_metadata if row[0] == 'C']
+        state: Dict[str, Any] = {
+            'table': table,
+            'alter': alter,
+            'shadow': shadow,
+            'key': keys[0],
+            # Only copy the columns that survive the alter
+            'columns': [row[1] for row in metadata if row[0] == 'C' and row[1] in shadow_columns],
+            'copied': 0,
+            'chunks': 0,
+        }
+        self.execute_script(obj, obj.render_sql_for_alter_triggers(state), **kwargs)
+        rows = self.query(obj, obj.render_sql_for_key_range(table, keys[0]), **kwargs)
+        try:
+            state['min'], state['max'] = int(rows[0][0]), int(rows[0][1])  # type: ignore
+        except (IndexError, TypeError, ValueError):
+            # Empty table, or a non-integer key
+            if rows and rows[0][0] is not None:
+                self.abort_online_alter(obj, table, **kwargs)
+                raise obj.OperationFailed(
+                    'Cannot alter {}.{} online: its primary key is not an integer'.format(obj.db, table)
+                )
+            state['min'] = state['max'] = 0
+            state['next'] = None
+        else:
+            state['next'] = state['min']
+        return state
+
+    def abort_online_alter(
+        self,
+        obj: "MySQLDatabase",
+        table: str,
+        state_file: str = None,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> None:
+        """
+        Undo a paused or failed :py:meth:`online_alter` of ``table``: drop the
+        triggers and the shadow table, and remove the state file.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+            table: the table that was being altered
+
+        Keyword Args:
+            state_file: the state file.  Default: ``{db}.{table}.alter.json``.
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: a command failed.
+        """
+        self.execute_script(obj, obj.render_sql_for_alter_abort(table), ssh_target=ssh_target, verbose=verbose)
+        if not state_file:
+            state_file = '{}.{}.alter.json'.format(obj.db, table)
+        for filename in (state_file, state_file + '.pause'):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def watch(
+        self,
+        obj: "MySQLDatabase",
+        interval: float = 2.0,
+        samples: int = None,
+        long_transaction: int = 30,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None,
+        callback: Callable[[Dict[str, Any]], None] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Sample the processlist, the InnoDB lock waits and the long running
+        transactions on the MySQL server every ``interval`` seconds, and
+        summarize what we saw over the whole window: who is blocking whom,
+        which transactions stay open too long, and how many connections each
+        user and client host holds.
+
+        All samples are taken over a single :py:class:`MySQLSession`, so
+        sampling every second or two is cheap.  Stop early with Ctrl-C; we
+        return the summary of the samples taken so far.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            interval: seconds between samples
+            samples: stop after this many samples.  If not supplied, run until
+                interrupted.
+            long_transaction: report transactions open at least this many seconds
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            user: The user to use to bind to the database.  We need the
+                ``PROCESS`` privilege to see other users' threads.
+            password: The password to use to bind to the database.
+            callback: if supplied, call this with the dict returned by
+                :py:meth:`deployfish_mysql.watch.WatchSummary.add` after each
+                sample, with a ``timestamp`` key added
+
+        Raises:
+            obj.OperationFailed: a query failed.
+
+        Returns:
+            The output of :py:meth:`deployfish_mysql.watch.WatchSummary.report`.
+        """
+        summary = WatchSummary()
+        with MySQLSession(obj, ssh_target=ssh_target, verbose=verbose, user=user, password=password) as session:
+            rows = session.query('SELECT @@version;')
+            version = rows[0][0] if rows and rows[0][0] else ''
+            sql = obj.render_sql_for_watch(long_transaction, legacy_locks=version.startswith('5.'))
+            try:
+                while samples is None or summary.samples < samples:
+                    started = time.time()
+                    sample = summary.add(session.query(sql))
+                    if callback:
+                        sample['timestamp'] = started
+                        callback(sample)
+                    if samples is None or summary.samples < samples:
+                        time.sleep(max(interval - (time.time() - started), 0))
+            except KeyboardInterrupt:
+                pass
+        return summary.report()
+
+    def buffer_pool_status(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Dict[str, int]:
+        """
+        Return how full the InnoDB buffer pool of the MySQL server is.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            A dict with keys ``pages_total``, ``pages_data``, ``pages_free``,
+            ``page_size``, ``bytes_total``, ``bytes_data`` and ``bytes_free``.
+        """
+        rows = self.query(obj, obj.render_sql_for_buffer_pool(), ssh_target=ssh_target, verbose=verbose)
+        status = {cast(str, row[0]).lower(): int(row[1] or 0) for row in rows}
+        page_size = status.get('innodb_page_size', 16384)
+        pages = {
+            'pages_total': status.get('innodb_buffer_pool_pages_total', 0),
+            'pages_data': status.get('innodb_buffer_pool_pages_data', 0),
+            'pages_free': status.get('innodb_buffer_pool_pages_free', 0),
+        }
+        return dict(
+            pages,
+            page_size=page_size,
+            bytes_total=pages['pages_total'] * page_size,
+            bytes_data=pages['pages_data'] * page_size,
+            bytes_free=pages['pages_free'] * page_size
+        )
+
+    def warm(
+        self,
+        obj: "MySQLDatabase",
+        snapshot_file: str = None,
+        concurrency: int = 4,
+        analyze: bool = True,
+        preload: bool = True,
+        max_threads_running: int = None,
+        sleep: float = 0.0,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        callback: Callable[[str], None] = None
+    ) -> Dict[str, Any]:
+        """
+        Get a freshly loaded MySQL server ready for production traffic.
+
+        First we run ``ANALYZE TABLE`` on every table in our database, over
+        ``concurrency`` :py:class:`MySQLSession` sessions at once, so the
+        optimizer has fresh statistics.  Then we scan the hottest tables and
+        their indexes, one at a time, to pull them into the InnoDB buffer pool,
+        until the pool has no free pages left for them.
+
+        The hottest tables come from ``snapshot_file``, a ``digests`` snapshot
+        (``deploy mysql top-queries --save``) or ``stats`` snapshot (``deploy
+        mysql stats --cache``) taken on the old server: see
+        :py:func:`deployfish_mysql.warm.hot_tables`.  Without one we preload
+        the biggest tables first.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to use
+
+        Keyword Args:
+            snapshot_file: rank tables by this saved ``digests`` or ``stats``
+                snapshot
+            concurrency: run this many ``ANALYZE TABLE`` statements at once
+            analyze: if ``False``, skip ``ANALYZE TABLE``
+            preload: if ``False``, skip preloading the buffer pool
+            max_threads_running: before each preload scan, wait while the
+                server's ``Threads_running`` is at least this
+            sleep: seconds to sleep between preload scans
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            callback: if supplied, call this with a message before each step
+
+        Raises:
+            obj.OperationFailed: a query failed.
+            SnapshotError: ``snapshot_file`` is not a ``digests`` or ``stats``
+                snapshot.
+
+        Returns:
+            A dict with keys ``tables`` (how many tables there are), ``analyzed``
+            (the tables we analyzed), ``analyze_errors`` (dicts with keys
+            ``table`` and ``error``), ``preloaded`` (dicts with keys ``table``,
+            ``index``, ``size`` and ``seconds``), ``before`` and ``after`` (the
+            :py:meth:`buffer_pool_status` before and after), and
+            ``analyze_seconds``, ``preload_seconds`` and ``seconds``.
+        """
+        ranking = None
+        if snapshot_file:
+            try:
+                ranking = hot_tables(read_snapshot(snapshot_file, 'digests'))
+            except SnapshotError:
+                try:
+                    ranking = hot_tables(read_snapshot(snapshot_file, 'stats'))
+                except SnapshotError:
+                    raise SnapshotError('"{}" is not a "digests" or "stats" snapshot'.format(snapshot_file))
+        started = time.time()
+        result: Dict[str, Any] = {
+            'before': self.buffer_pool_status(obj, ssh_target=ssh_target, verbose=verbose),
+            'analyzed': [],
+            'analyze_errors': [],
+            'preloaded': [],
+        }
+        tables = self.stats(obj, ssh_target=ssh_target, verbose=verbose)
+        result['tables'] = len(tables)
+        if analyze and tables:
+            result['analyzed'], result['analyze_errors'] = self._analyze_tables(
+                obj,
+                tables,
+                concurrency,
+                ssh_target=ssh_target,
+                verbose=verbose,
+                callback=callback
+            )
+        result['analyze_seconds'] = time.time() - started
+        if preload and tables:
+            result['preloaded'] = self._preload(
+                obj,
+                tables,
+                ranking if ranking is not None else [table['table'] for table in tables],
+                max_threads_running=max_threads_running,
+                sleep=sleep,
+                ssh_target=ssh_target,
+                verbose=verbose,
+                callback=callback
+            )
+        result['preload_seconds'] = time.time() - started - result['analyze_seconds']
+        result['after'] = self.buffer_pool_status(obj, ssh_target=ssh_target, verbose=verbose)
+        result['seconds'] = time.time() - started
+        return result
+
+    def _analyze_tables(
+        self,
+        obj: "MySQLDatabase",
+        tables: List[Dict[str, Any]],
+        concurrency: int,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        callback: Callable[[str], None] = None
+    ) -> Tuple[List[str], List[Dict[str, str]]]:
+        analyzed: List[str] = []
+        errors: List[Dict[str, str]] = []
+        lock = threading.Lock()
+
+        def analyze(names: List[str]) -> None:
+            with MySQLSession(obj, ssh_target=ssh_target, verbose=verbose) as session:
+                for name in names:
+                    if callback:
+                        callback('Analyzing table "{}" ...'.format(name))
+                    try:
+                        rows = session.query(obj.render_sql_for_analyze(name))
+                    except obj.OperationFailed as e:
+                        failures = [str(e)]
+                    else:
+                        failures = [cast(str, row[3]) for row in rows if (row[2] or '').lower() == 'error']
+                    with lock:
+                        if failures:
+                            errors.append({'table': name, 'error': '; '.join(failures)})
+                        else:
+                            analyzed.append(name)
+
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            list(executor.map(analyze, balance(tables, concurrency)))
+        return analyzed, errors
+
+    def _preload(
+        self,
+        obj: "MySQLDatabase",
+        tables: List[Dict[str, Any]],
+        ranking: Sequence[str],
+        max_threads_running: int = None,
+        sleep: float = 0.0,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        callback: Callable[[str], None] = None
+    ) -> List[Dict[str, Any]]:
+        sizes = self._index_sizes(
+            tables,
+            self.query(obj, obj.render_sql_for_index_columns(), ssh_target=ssh_target, verbose=verbose)
+        )
+        budget = self.buffer_pool_status(obj, ssh_target=ssh_target, verbose=verbose)['bytes_free']
+        preloaded = []
+        with MySQLSession(obj, ssh_target=ssh_target, verbose=verbose) as session:
+            for table in ranking:
+                if table not in sizes:
+                    continue
+                indexes = sorted(sizes[table], key=lambda index: (index not in ('PRIMARY', 'GEN_CLUST_INDEX'), index))
+                for index in indexes:
+                    size = sizes[table][index]
+                    if size > budget:
+                        continue
+                    while max_threads_running:
+                        running = self._threads_running(session.query(obj.render_sql_for_threads_running()))
+                        if running < max_threads_running:
+                            break
+                        if callback:
+                            callback('Waiting: Threads_running={}'.format(running))
+                        time.sleep(max(sleep, 1.0))
+                    if callback:
+                        callback('Preloading index "{}" of table "{}" ...'.format(index, table))
+                    started = time.time()
+                    session.query(obj.render_sql_for_preload(table, index))
+                    preloaded.append({
+                        'table': table,
+                        'index': index,
+                        'size': size,
+                        'seconds': time.time() - started,
+                    })
+                    budget -= size
+                    if sleep:
+                        time.sleep(sleep)
+        return preloaded
+
+    def _index_sizes(
+        self,
+        tables: List[Dict[str, Any]],
+        rows: List[List[Optional[str]]]
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        Estimate the size of each index of each of ``tables`` (from
+        :py:meth:`stats`), given the output of
+        :py:meth:`MySQLDatabase.render_sql_for_index_columns`.
+
+        Exact index sizes are only in ``mysql.innodb_index_stats``, which our
+        user cannot read, so we take the clustered index to be the table's
+        ``data_length``, and share its ``index_length`` between its secondary
+        indexes by how many columns each has.  A table with no primary key is
+        clustered on ``GEN_CLUST_INDEX``.
+
+        Returns:
+            A dict of table name to a dict of index name to bytes.
+        """
+        columns: Dict[str, Dict[str, int]] = {}
+        for table, index, count in rows:
+            columns.setdefault(cast(str, table), {})[cast(str, index)] = int(count or 1)
+        sizes: Dict[str, Dict[str, int]] = {}
+        for table in tables:
+            indexes = columns.get(table['table'], {})
+            secondary = {index: count for index, count in indexes.items() if index != 'PRIMARY'}
+            total = sum(secondary.values())
+            sizes[table['table']] = {
+                index: table['index_length'] * count // total for index, count in secondary.items()
+            }
+            sizes[table['table']]['PRIMARY' if 'PRIMARY' in indexes else 'GEN_CLUST_INDEX'] = table['data_length']
+        return sizes
+
+    def major_server_version(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None
+    ):
+        """
+        Return the major.minor version of the MySQL server.
+
+        Example:
+            If the server version is ``5.7.22``, then we will return ``5.7``.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to us
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            user: The user to use to bind to the database.
+            password: The password to use to bind to the database.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            The major.minor version of the MySQL server.
+        """
+        version = self.server_version(obj, ssh_target=ssh_target, verbose=verbose, user=user, password=password)
+        return self._major_version(version)
+
+    def _major_version(self, version: str) -> str:
+        return version.rsplit('.', 1)[0]
+
+    def server_version(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None
+    ) -> str:
+        """
+        Return the MySQL version of the MySQL server.
+
+        Example:
+            If the server version is ``5.7.22``, then we will return ``5.7.22``.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to us
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+            user: The user to use to bind to the database.
+            password: The password to use to bind to the database.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            The server version
+        """
+        command = obj.render_for_server_version(user=user, password=password)
+        success, output = obj.cluster.ssh_noninteractive(command, ssh_target=ssh_target, verbose=verbose)
+        return self._finish_server_version(obj, success, output)
+
+    def _finish_server_version(self, obj: "MySQLDatabase", success: bool, output: str) -> str:
+        if success:
+            # Remembered for choosing between statements that later versions renamed
+            obj.cache['server_version'] = output.split('\n')[3][2:-2].strip()
+            return obj.cache['server_version']
+        raise obj.OperationFailed('Failed to get MySQL version of remote server {}:{}: {}'.format(
+            obj.host,
+            obj.port,
+            output
+        ))
+
+    def show_grants(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: Instance = None,
+        verbose: bool = False,
+    ) -> str:
+        """
+        Show the GRANTs for the database user on the remote database.
+
+        Args:
+            obj: The ``MySQLDatabase`` object to us
+
+        Keyword Args:
+            ssh_target: the ssh instance to use for running our mysql commands.
+                If not supplied, we will use the ``cluster``'s default ssh
+                instance.
+            verbose: If ``True`` run ssh in verbose mode.
+
+        Raises:
+            obj.OperationFailed: The command failed because of some
+                unexpected error.
+
+        Returns:
+            The output of the ``SHOW GRANTS` command.
+        """
+        command = obj.render_for_show_grants()
+        success, output = obj.cluster.ssh_noninteractive(command, ssh_target=ssh_target, verbose=verbose)
+        return self._finish_show_grants(obj, success, output)
+
+    def _finish_show_grants(self, obj: "MySQLDatabase", success: bool, output: str) -> str:
+        if success:
+            return output
+        raise obj.OperationFailed('Failed to get grants for user "{}" on remote server {}:{}: {}'.format(
+            obj.user,
+            obj.host,
+            obj.port,
+            output
+        ))
+
+
+# ----------------------------------------
+# Models
+# ----------------------------------------
+
+class MySQLDatabase(Model):
+    """
+    self.data here has the following structure:
+
+        {
+            'name': 'string',
+            'service': 'string',
+            'character_set': 'string',                   [optional, default='utf8']
+            'collation': 'string',                       [optional, default='utf8_unicode_ci']
+            'host': 'string',
+            'db': 'string' ,
+            'user': 'string',
+            'pass': 'string',
+            'port': 'string',                            [optional, default=3306]
+            'replica_host': 'string' or ['string'],      [optional; 'auto' to ask RDS]
+            'replica_max_lag': int,                      [optional, default=30]
+            'pool_size': int,                            [optional, default=10]
+            'backup': {                                  [optional]
+                'every': 'string' or int,                [optional, default='1d']
+                'destination': 'string',                 [either this or store]
+                'store': 'string',                       [either this or destination]
+                'split_size': int,                       [optional; MB]
+                'priority': int,                         [optional, default=0]
+                'retries': int,                          [optional, default=3]
+                'retry_delay': int,                      [optional, default=60]
+                'replica': bool                          [optional, default=False]
+            },
+            'purge': [                                   [optional]
+                {
+                    'table': 'string',
+                    'where': 'string',
+                    'batch_size': int,                   [optional, default=1000]
+                    'sleep': float,                      [optional, default=0.5]
+                    'max_threads_running': int,          [optional, default=25]
+                    'replica': 'string',                 [optional]
+                    'max_replica_lag': int,              [optional, default=10]
+                    'max_wait': int,                     [optional, default=600]
+                    'archive': bool                      [optional, default=False]
+                }
+            ]
+        }
+    """
+
+    objects = MySQLDatabaseManager()
+    config_section: str = 'mysql'
+
+    @property
+    def pk(self) -> str:
+        return self.data['name']
+
+    @property
+    def name(self) -> str:
+        return self.data['name']
+
+    def secret(self, name: str) -> Secret:
+        if 'secrets' not in self.cache:
+            self.cache['secrets'] = {}
+        if name not in self.cache['secrets']:
+            if "." not in name:
+                full_name = '{}{}'.format(self.service.secrets_prefix, name)
+            else:
+                full_name = name
+            self.cache['secrets'][name] = Secret.objects.get(full_name)
+        return self.cache['secrets'][name]
+
+    def parse(self, key: str) -> str:
+        """
+        deployfish supports putting 'config.KEY' as the value for the host and port keys in self.data
+
+        Parse the value and dereference it from the live secrets for the service if necessary.
         """
-        if isinstance(self.data[key], str):
-            if self.data[key].startswith('config.'):
-                _, key = self.data[key].split('.')
+        return self.parse_value(self.data[key])
+
+    def parse_value(self, value: Any) -> Any:
+        """
+        Dereference ``value`` from the live secrets for the service if it is a
+        'config.KEY' reference, as for :py:meth:`parse`.
+        """
+        if isinstance(value, str):
+            if value.startswith('config.'):
+                _, key = value.split('.')
                 try:
                     value = self.secret(key).value
                 except Secret.DoesNotExist:
@@ -524,8 +3754,7 @@ class MySQLDatabase(Model):
                             key
                         )
                     )
-                return value
-        return self.data[key]
+        return value
 
     @property
     def host(self) -> str:
@@ -588,63 +3817,504 @@ class MySQLDatabase(Model):
     def ssh_targets(self) -> Sequence[Instance]:
         return self.service.cluster.ssh_targets
 
-    @property
-    def service(self) -> Service:
-        if 'service' not in self.cache:
-            config = get_config()
-            data = config.get_section_item('services', self.data['service'])
-            # We don't need the live service; we just need the service's cluster to exist
-            self.cache['service'] = Service.new(data, 'deployfish')
-        return self.cache['service']
+    @property
+    def service(self) -> Service:
+        if 'service' not in self.cache:
+            config = get_config()
+            data = config.get_section_item('services', self.data['service'])
+            # We don't need the live service; we just need the service's cluster to exist
+            self.cache['service'] = Service.new(data, 'deployfish')
+        return self.cache['service']
+
+    @service.setter
+    def service(self, value: str) -> None:
+        self.cache['service'] = value
+
+    @property
+    def cluster(self) -> Cluster:
+        return self.service.cluster
+
+    @property
+    def replica_hosts(self) -> List[str]:
+        """
+        The hostnames from our ``replica_host`` setting, or ``['auto']`` to
+        discover our RDS instance's read replicas.
+        """
+        if 'replica_hosts' not in self.cache:
+            hosts = self.data.get('replica_host', [])
+            if isinstance(hosts, str):
+                hosts = [hosts]
+            self.cache['replica_hosts'] = [self.parse_value(host) for host in hosts]
+        return self.cache['replica_hosts']
+
+    @property
+    def replica_max_lag(self) -> int:
+        return int(self.data.get('replica_max_lag', 30))
+
+    @property
+    def pool_size(self) -> int:
+        """
+        The number of connections each task of our service holds open to our
+        server.
+        """
+        return int(self.data.get('pool_size', POOL_SIZE))
+
+    def for_host(self, host: str) -> "MySQLDatabase":
+        """
+        Return a copy of this ``MySQLDatabase`` that connects to ``host``, e.g.
+        one of our read replicas, with the same database, user and password.
+        """
+        data = deepcopy(self.data)
+        data['host'] = host
+        data.pop('replica_host', None)
+        obj = cast("MySQLDatabase", MySQLDatabase.new(data, 'deployfish'))
+        obj.cache.update({key: value for key, value in self.cache.items() if key != 'replica_hosts'})
+        obj.cache['host'] = host
+        return obj
+
+    @property
+    def purge_configs(self) -> List[Dict[str, Any]]:
+        """
+        The entries from our ``purge`` section, with defaults filled in.
+        """
+        configs = []
+        for data in self.data.get('purge', []):
+            config = deepcopy(PURGE_DEFAULTS)
+            config.update(data)
+            configs.append(config)
+        return configs
+
+    @property
+    def backup_config(self) -> Optional[Dict[str, Any]]:
+        """
+        Our ``backup`` section, with defaults filled in, or ``None`` if we have
+        none.
+        """
+        if 'backup' not in self.data:
+            return None
+        config = deepcopy(BACKUP_DEFAULTS)
+        config.update(self.data['backup'])
+        return config
+
+    def create(
+        self,
+        root_user: str,
+        root_password: str,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> str:
+        return self.objects.create(self, root_user, root_password, ssh_target=ssh_target, verbose=verbose)
+
+    def update(
+        self,
+        root_user: str,
+        root_password: str,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> str:
+        return self.objects.update(self, root_user, root_password, ssh_target=ssh_target, verbose=verbose)
+
+    def validate(
+        self,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        replica: bool = False
+    ) -> str:
+        return self.objects.validate(self, ssh_target=ssh_target, verbose=verbose, replica=replica)
+
+    def read_target(
+        self,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Tuple["MySQLDatabase", Optional[int]]:
+        return self.objects.read_target(self, ssh_target=ssh_target, verbose=verbose)
+
+    def dump(
+        self,
+        filename: str = None,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        binlog_position: bool = False,
+        index: bool = True,
+        replica: bool = False,
+        sink: DumpSink = None
+    ) -> Tuple[str, str]:
+        return self.objects.dump(
+            self,
+            filename=filename,
+            ssh_target=ssh_target,
+            verbose=verbose,
+            binlog_position=binlog_position,
+            index=index,
+            replica=replica,
+            sink=sink
+        )
+
+    def dump_incremental(
+        self,
+        chain_file: str,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        return self.objects.dump_incremental(self, chain_file, ssh_target=ssh_target, verbose=verbose)
+
+    def dump_to_store(
+        self,
+        store_path: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        replica: bool = False
+    ) -> Dict[str, Any]:
+        return self.objects.dump_to_store(self, store_path, ssh_target=ssh_target, verbose=verbose, replica=replica)
+
+    def backup(self, ssh_target: Instance = None, verbose: bool = False) -> Dict[str, Any]:
+        return self.objects.backup(self, ssh_target=ssh_target, verbose=verbose)
+
+    def migrate(
+        self,
+        dirname: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        dry_run: bool = False
+    ) -> List[Dict[str, Any]]:
+        return self.objects.migrate(self, dirname, ssh_target=ssh_target, verbose=verbose, dry_run=dry_run)
+
+    def dump_tsv(
+        self,
+        dirname: str = None,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        concurrency: int = 4,
+        replica: bool = False
+    ) -> Tuple[List[Dict[str, Any]], str]:
+        return self.objects.dump_tsv(
+            self,
+            dirname=dirname,
+            ssh_target=ssh_target,
+            verbose=verbose,
+            concurrency=concurrency,
+            replica=replica
+        )
+
+    def load(
+        self,
+        filename: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        transform: Callable[[Iterable[bytes]], Iterable[bytes]] = None
+    ) -> str:
+        return self.objects.load(self, filename, ssh_target=ssh_target, verbose=verbose, transform=transform)
+
+    def insert_coalescer(self, ssh_target: Instance = None, verbose: bool = False) -> InsertCoalescer:
+        return self.objects.insert_coalescer(self, ssh_target=ssh_target, verbose=verbose)
+
+    def load_tsv(
+        self,
+        dirname: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        concurrency: int = 4
+    ) -> List[Dict[str, Any]]:
+        return self.objects.load_tsv(self, dirname, ssh_target=ssh_target, verbose=verbose, concurrency=concurrency)
+
+    def load_tables(
+        self,
+        filename: str,
+        tables: Sequence[str],
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> str:
+        return self.objects.load_tables(self, filename, tables, ssh_target=ssh_target, verbose=verbose)
+
+    def restore(
+        self,
+        manifest_file: str,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> str:
+        return self.objects.restore(self, manifest_file, ssh_target=ssh_target, verbose=verbose)
+
+    def load_chain(
+        self,
+        chain_file: str,
+        until: datetime.datetime = None,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        callback: Callable[[str], None] = None
+    ) -> List[Dict[str, Any]]:
+        return self.objects.load_chain(
+            self,
+            chain_file,
+            until=until,
+            ssh_target=ssh_target,
+            verbose=verbose,
+            callback=callback
+        )
+
+    def import_file(
+        self,
+        table: str,
+        filename: str,
+        columns: Sequence[str] = None,
+        delimiter: str = None,
+        enclosure: str = '"',
+        ignore_lines: int = 0,
+        batch_size: int = None,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> Tuple[Optional[int], str]:
+        return self.objects.import_file(
+            self,
+            table,
+            filename,
+            columns=columns,
+            delimiter=delimiter,
+            enclosure=enclosure,
+            ignore_lines=ignore_lines,
+            batch_size=batch_size,
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
+
+    def query(
+        self,
+        sql: str,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None,
+        db: str = None,
+        replica: bool = False
+    ) -> List[List[Optional[str]]]:
+        return self.objects.query(
+            self,
+            sql,
+            ssh_target=ssh_target,
+            verbose=verbose,
+            user=user,
+            password=password,
+            db=db,
+            replica=replica
+        )
+
+    def stats(
+        self,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        replica: bool = False
+    ) -> List[Dict[str, Any]]:
+        return self.objects.stats(self, ssh_target=ssh_target, verbose=verbose, replica=replica)
 
-    @service.setter
-    def service(self, value: str) -> None:
-        self.cache['service'] = value
+    def digests(
+        self,
+        ssh_target: Instance = None,
+        verbose: bool = False
+    ) -> List[Dict[str, Any]]:
+        return self.objects.digests(self, ssh_target=ssh_target, verbose=verbose)
 
-    @property
-    def cluster(self) -> Cluster:
-        return self.service.cluster
+    def index_report(
+        self,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None
+    ) -> Dict[str, Any]:
+        return self.objects.index_report(
+            self,
+            ssh_target=ssh_target,
+            verbose=verbose,
+            user=user,
+            password=password
+        )
 
-    def create(
+    def schema_diff(
         self,
-        root_user: str,
-        root_password: str,
+        other: "MySQLDatabase",
         ssh_target: Instance = None,
+        other_ssh_target: Instance = None,
         verbose: bool = False
-    ) -> str:
-        return self.objects.create(self, root_user, root_password, ssh_target=ssh_target, verbose=verbose)
+    ) -> Tuple[List[str], List[str]]:
+        return self.objects.schema_diff(
+            self,
+            other,
+            ssh_target=ssh_target,
+            other_ssh_target=other_ssh_target,
+            verbose=verbose
+        )
 
-    def update(
+    def verify(
         self,
-        root_user: str,
-        root_password: str,
+        other: "MySQLDatabase",
+        tables: Sequence[str] = None,
+        chunk_size: int = 100000,
+        min_chunk_size: int = 100,
+        jobs: int = 1,
         ssh_target: Instance = None,
+        other_ssh_target: Instance = None,
         verbose: bool = False
-    ) -> str:
-        return self.objects.update(self, root_user, root_password, ssh_target=ssh_target, verbose=verbose)
+    ) -> List[Dict[str, Any]]:
+        return self.objects.verify(
+            self,
+            other,
+            tables=tables,
+            chunk_size=chunk_size,
+            min_chunk_size=min_chunk_size,
+            jobs=jobs,
+            ssh_target=ssh_target,
+            other_ssh_target=other_ssh_target,
+            verbose=verbose
+        )
 
-    def validate(
+    def purge(
+        self,
+        table: str = None,
+        archive_dir: str = None,
+        dry_run: bool = False,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        callback: Callable[[str], None] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Run the purges configured in our ``purge`` section, or just the one for
+        ``table``.  See :py:meth:`MySQLDatabaseManager.purge`.
+        """
+        configs = [config for config in self.purge_configs if table is None or config['table'] == table]
+        if not configs:
+            raise self.OperationFailed('MySQLDatabase(pk="{}") has no purge configured{}'.format(
+                self.name,
+                ' for table "{}"'.format(table) if table else ''
+            ))
+        results = []
+        for config in configs:
+            replica = None
+            if config.get('replica'):
+                replica = self.objects.get(config['replica'])
+            results.append(self.objects.purge(
+                self,
+                config['table'],
+                config['where'],
+                batch_size=config['batch_size'],
+                sleep=config['sleep'],
+                max_threads_running=config['max_threads_running'],
+                replica=replica,
+                max_replica_lag=config['max_replica_lag'],
+                max_wait=config['max_wait'],
+                archive_dir=archive_dir if config['archive'] else None,
+                dry_run=dry_run,
+                ssh_target=ssh_target,
+                verbose=verbose,
+                callback=callback
+            ))
+        return results
+
+    def online_alter(
+        self,
+        table: str,
+        alter: str = None,
+        chunk_size: int = 1000,
+        sleep: float = 0.0,
+        max_threads_running: int = 25,
+        state_file: str = None,
+        resume: bool = False,
+        keep_old: bool = False,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        callback: Callable[[str], None] = None
+    ) -> Dict[str, Any]:
+        return self.objects.online_alter(
+            self,
+            table,
+            alter=alter,
+            chunk_size=chunk_size,
+            sleep=sleep,
+            max_threads_running=max_threads_running,
+            state_file=state_file,
+            resume=resume,
+            keep_old=keep_old,
+            ssh_target=ssh_target,
+            verbose=verbose,
+            callback=callback
+        )
+
+    def abort_online_alter(
         self,
+        table: str,
+        state_file: str = None,
         ssh_target: Instance = None,
         verbose: bool = False
-    ) -> str:
-        return self.objects.validate(self, ssh_target=ssh_target, verbose=verbose)
+    ) -> None:
+        return self.objects.abort_online_alter(
+            self,
+            table,
+            state_file=state_file,
+            ssh_target=ssh_target,
+            verbose=verbose
+        )
 
-    def dump(
+    def watch(
+        self,
+        interval: float = 2.0,
+        samples: int = None,
+        long_transaction: int = 30,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None,
+        callback: Callable[[Dict[str, Any]], None] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        return self.objects.watch(
+            self,
+            interval=interval,
+            samples=samples,
+            long_transaction=long_transaction,
+            ssh_target=ssh_target,
+            verbose=verbose,
+            user=user,
+            password=password,
+            callback=callback
+        )
+
+    def buffer_pool_status(
         self,
-        filename: str = None,
         ssh_target: Instance = None,
         verbose: bool = False
-    ) -> Tuple[str, str]:
-        return self.objects.dump(self, filename=filename, ssh_target=ssh_target, verbose=verbose)
+    ) -> Dict[str, int]:
+        return self.objects.buffer_pool_status(self, ssh_target=ssh_target, verbose=verbose)
 
-    def load(
+    def connection_limits(
         self,
-        filename: str,
         ssh_target: Instance = None,
         verbose: bool = False
-    ) -> str:
-        return self.objects.load(self, filename, ssh_target=ssh_target, verbose=verbose)
+    ) -> Dict[str, Optional[int]]:
+        return self.objects.connection_limits(self, ssh_target=ssh_target, verbose=verbose)
+
+    def connection_demand(self) -> Dict[str, Any]:
+        return self.objects.connection_demand(self)
+
+    def warm(
+        self,
+        snapshot_file: str = None,
+        concurrency: int = 4,
+        analyze: bool = True,
+        preload: bool = True,
+        max_threads_running: int = None,
+        sleep: float = 0.0,
+        ssh_target: Instance = None,
+        verbose: bool = False,
+        callback: Callable[[str], None] = None
+    ) -> Dict[str, Any]:
+        return self.objects.warm(
+            self,
+            snapshot_file=snapshot_file,
+            concurrency=concurrency,
+            analyze=analyze,
+            preload=preload,
+            max_threads_running=max_threads_running,
+            sleep=sleep,
+            ssh_target=ssh_target,
+            verbose=verbose,
+            callback=callback
+        )
 
     def server_version(
         self,
@@ -668,13 +4338,44 @@ class MySQLDatabase(Model):
     ) -> str:
         return self.objects.show_grants(self, ssh_target=ssh_target, verbose=verbose)
 
-    def render_mysql_command(self, sql: str, user: str = None, password: str = None) -> str:
-        return '/usr/bin/mysql --host={host} --user={user} --password=\'{password}\' --port={port} --execute="{sql}"'.format(  # noqa:E501  # pylint:disable=line-too-long
+    def render_mysql_command(
+        self,
+        sql: str,
+        user: str = None,
+        password: str = None,
+        db: str = None,
+        batch: bool = False,
+        options: Sequence[str] = None
+    ) -> str:
+        """
+        Render a ``mysql`` command line that runs ``sql`` on our server.
+
+        Args:
+            sql: the SQL to execute
+
+        Keyword Args:
+            user: bind as this user instead of :py:attr:`user`
+            password: bind with this password instead of :py:attr:`password`
+            db: make this the default database for ``sql``
+            batch: if ``True``, print results as tab separated values without
+                column names, suitable for :py:func:`deployfish_mysql.sql.parse_batch_output`
+            options: any extra command line options for ``mysql``
+
+        Returns:
+            The ``mysql`` command.
+        """
+        extra = list(options) if options else []
+        if batch:
+            extra.extend(['--batch', '--skip-column-names'])
+        if db:
+            extra.append('--database={}'.format(db))
+        return '/usr/bin/mysql --host={host} --user={user} --password=\'{password}\' --port={port} {extra}--execute="{sql}"'.format(  # noqa:E501  # pylint:disable=line-too-long
             host=self.host,
             port=self.port,
-            sql=sql,
+            sql=escape_for_double_quotes(sql),
             user=user if user else self.user,
-            password=password if password else self.password
+            password=password if password else self.password,
+            extra=''.join('{} '.format(option) for option in extra)
         )
 
     def render_for_create(    # type: ignore  # pylint:disable=arguments-differ
@@ -719,16 +4420,64 @@ class MySQLDatabase(Model):
         sql += "flush privileges;"
         return self.render_mysql_command(sql, user=root_user, password=root_password)
 
-    def render_for_dump(self) -> str:
-        cmd = "/usr/bin/mysqldump --no-tablespaces --host={host} --user={user} --password='{password}' --port={port} --opt {db}".format(  # noqa:E501  # pylint:disable=line-too-long
+    def render_for_dump(self, binlog_position: bool = False) -> str:
+        options = ''
+        if binlog_position:
+            # mysqldump 8.0.26 renamed --master-data to --source-data, and later releases drop the old name
+            options = (
+                '--single-transaction $(/usr/bin/mysqldump --help | grep -q -- --source-data '
+                '&& echo --source-data=2 || echo --master-data=2) '
+            )
+        cmd = "/usr/bin/mysqldump --no-tablespaces --host={host} --user={user} --password='{password}' --port={port} --opt {options}{db}".format(  # noqa:E501  # pylint:disable=line-too-long
             host=self.host,
             user=self.user,
             password=self.password,
             port=self.port,
+            options=options,
             db=self.db
         )
         return cmd
 
+    def render_for_checksum(self, command: str) -> str:
+        """
+        Wrap the remote ``command`` so that it also computes the SHA-256 of its
+        output (stdout and stderr) as it produces it, and prints that after the
+        output as a ``-- deployfish-sha256: {sha256}`` trailer.  See
+        :py:func:`deployfish_mysql.checksums.receive_with_trailer`.
+        """
+        return (
+            'D=$(mktemp -d) || exit 1; mkfifo $D/p; sha256sum < $D/p > $D/s & P=$!; set -o pipefail; '
+            '({command}) 2>&1 | tee $D/p; S=$?; wait $P; '
+            'echo; echo "-- deployfish-sha256: $(cut -c1-64 $D/s)"; rm -rf $D; exit $S'
+        ).format(command=command)
+
+    def render_for_upload(self, filename: str) -> str:
+        """
+        Render a command that saves its stdin to the remote file ``filename``,
+        and prints the SHA-256 of what it received as a
+        ``-- deployfish-sha256: {sha256}`` trailer.
+        """
+        return "set -o pipefail; tee {filename} | sha256sum | cut -c1-64 | sed 's/^/-- deployfish-sha256: /'".format(
+            filename=filename
+        )
+
+    def render_for_binlog_dump(self, files: Sequence[str], start_position: int, stop_position: int) -> str:
+        """
+        Render a ``mysqlbinlog`` command that prints the events for our
+        database from ``start_position`` in the first of ``files`` up to
+        ``stop_position`` in the last of them as SQL.
+        """
+        return "/usr/bin/mysqlbinlog --read-from-remote-server --host={host} --user={user} --password='{password}' --port={port} --database={db} --start-position={start} --stop-position={stop} {files}".format(  # noqa:E501  # pylint:disable=line-too-long
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            port=self.port,
+            db=self.db,
+            start=start_position,
+            stop=stop_position,
+            files=' '.join(files)
+        )
+
     def render_for_load(self) -> str:
         cmd = "/usr/bin/mysql --host={} --user={} --password='{}' --port={} {} < {{filename}} && rm {{filename}}".format(  # noqa:E501  # pylint:disable=line-too-long
             self.host,
@@ -739,6 +4488,548 @@ class MySQLDatabase(Model):
         )
         return cmd
 
+    def render_for_schema_dump(self, triggers: bool = False) -> str:
+        """
+        Render a ``mysqldump`` command that dumps the DDL for our tables and
+        views without their triggers, or with ``triggers``, only the triggers.
+        """
+        options = '--no-create-info --triggers' if triggers else '--skip-triggers'
+        return "/usr/bin/mysqldump --no-tablespaces --host={host} --user={user} --password='{password}' --port={port} --opt --no-data {options} {db}".format(  # noqa:E501  # pylint:disable=line-too-long
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            port=self.port,
+            options=options,
+            db=self.db
+        )
+
+    def render_for_tsv_dump(self, table: str, columns: Sequence[Dict[str, Any]]) -> str:
+        """
+        Render a command that prints every row of ``table`` as gzipped tab
+        separated values that ``LOAD DATA`` can read.  ``--quick`` makes
+        ``mysql`` print rows as the server sends them instead of holding the
+        whole table in memory first.
+
+        :py:meth:`render_for_checksum` sends stderr down the same stream as the
+        data, so we keep ``mysql``'s stderr (including its warning about the
+        password on the command line) out of the gzip stream, and print it only
+        if the command fails.
+        """
+        return (
+            'E=$(mktemp) || exit 1; set -o pipefail; {command} 2>"$E" | gzip -1; S=$?; '
+            '[ $S -eq 0 ] || cat "$E" >&2; rm -f "$E"; exit $S'
+        ).format(command=self.render_mysql_command(
+            render_tsv_select(table, columns),
+            db=self.db,
+            batch=True,
+            options=['--raw', '--quick', '--default-character-set={}'.format(self.character_set)]
+        ))
+
+    def render_for_tsv_load(self, table: str, columns: Sequence[Dict[str, Any]]) -> str:
+        """
+        Render a command that loads gzipped tab separated values written by
+        :py:meth:`render_for_tsv_dump` from its stdin into ``table`` with
+        ``LOAD DATA LOCAL INFILE``.  The last line of output will be the number
+        of rows loaded.
+        """
+        sql = SESSION_SQL + "SET SESSION unique_checks=0;SET SESSION foreign_key_checks=0;"
+        sql += "LOAD DATA LOCAL INFILE '/dev/stdin' INTO TABLE {} CHARACTER SET {}".format(
+            quote_identifier(table),
+            self.character_set
+        )
+        sql += " FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n'"
+        sql += load_columns(columns)
+        sql += ";SELECT ROW_COUNT();"
+        return 'set -o pipefail; gzip -dc | ' + self.render_mysql_command(
+            sql,
+            db=self.db,
+            batch=True,
+            options=['--local-infile=1', '--default-character-set={}'.format(self.character_set)]
+        )
+
+    def render_for_script(self, user: str = None, password: str = None) -> str:
+        """
+        Render a ``mysql`` command that runs the SQL script on its stdin in our
+        database, printing results as tab separated values without column
+        names.
+        """
+        return "/usr/bin/mysql --host={} --user={} --password='{}' --port={} --batch --skip-column-names {}".format(
+            self.host,
+            user if user else self.user,
+            password if password else self.password,
+            self.port,
+            self.db
+        )
+
+    def render_for_import(
+        self,
+        table: str,
+        columns: Sequence[str] = None,
+        delimiter: str = ',',
+        enclosure: str = '"',
+        ignore_lines: int = 0
+    ) -> str:
+        """
+        Render a ``mysql`` command that reads delimited data from its stdin
+        with ``LOAD DATA LOCAL INFILE`` and loads it into ``table``.
+
+        We turn off unique and foreign key checks for the session, which is
+        what makes ``LOAD DATA`` so much faster than replaying ``INSERT``
+        statements.  The last line of output will be the number of rows loaded.
+        """
+        sql = "SET SESSION unique_checks=0;SET SESSION foreign_key_checks=0;"
+        sql += "LOAD DATA LOCAL INFILE '/dev/stdin' INTO TABLE {} CHARACTER SET {}".format(
+            quote_identifier(table),
+            self.character_set
+        )
+        sql += " FIELDS TERMINATED BY {}".format(quote_string(delimiter))
+        if enclosure:
+            sql += " OPTIONALLY ENCLOSED BY {}".format(quote_string(enclosure))
+        sql += " LINES TERMINATED BY '\\n'"
+        if ignore_lines:
+            sql += " IGNORE {} LINES".format(int(ignore_lines))
+        sql += column_list(columns)
+        sql += ";SELECT ROW_COUNT();"
+        return self.render_mysql_command(sql, db=self.db, batch=True, options=['--local-infile=1'])
+
+    def render_sql_for_stats(self) -> str:
+        return (
+            "SELECT table_name, engine, table_rows, data_length, index_length, data_free "
+            "FROM information_schema.tables WHERE table_schema = {} AND table_type = 'BASE TABLE';"
+        ).format(quote_string(self.db))
+
+    def render_sql_for_digests(self) -> str:
+        return (
+            "SELECT digest, LEFT(digest_text, 1024), count_star, sum_timer_wait, sum_rows_examined, sum_rows_sent "
+            "FROM performance_schema.events_statements_summary_by_digest WHERE schema_name = {};"
+        ).format(quote_string(self.db))
+
+    def render_sql_for_index_report(self) -> str:
+        db = quote_string(self.db)
+        sql = (
+            "SELECT 'T', table_name, table_rows FROM information_schema.tables "
+            "WHERE table_schema = {db} AND table_type = 'BASE TABLE';"
+        )
+        sql += (
+            "SELECT 'S', table_name, index_name, seq_in_index, column_name, sub_part, non_unique "
+            "FROM information_schema.statistics WHERE table_schema = {db};"
+        )
+        sql += (
+            "SELECT 'U', object_name, index_name, count_read, count_write "
+            "FROM performance_schema.table_io_waits_summary_by_index_usage WHERE object_schema = {db};"
+        )
+        sql += (
+            "SELECT 'Z', table_name, index_name, stat_value * @@innodb_page_size "
+            "FROM mysql.innodb_index_stats WHERE database_name = {db} AND stat_name = 'size';"
+        )
+        sql += "SELECT 'V', variable_value FROM performance_schema.global_status WHERE variable_name = 'Uptime';"
+        return sql.format(db=db)
+
+    def render_sql_for_schema_hashes(self) -> str:
+        db = quote_string(self.db)
+        sql = "SET SESSION group_concat_max_len = 4194304;"
+        sql += (
+            "SELECT 'T', table_name, engine, table_collation FROM information_schema.tables "
+            "WHERE table_schema = {db} AND table_type = 'BASE TABLE';"
+        )
+        sql += (
+            "SELECT 'C', table_name, MD5(GROUP_CONCAT(CONCAT_WS(':', column_name, column_type, is_nullable, "
+            "IFNULL(column_default, 'NULL'), extra, IFNULL(collation_name, ''), column_comment) "
+            "ORDER BY ordinal_position SEPARATOR '|')) "
+            "FROM information_schema.columns WHERE table_schema = {db} GROUP BY table_name;"
+        )
+        sql += (
+            "SELECT 'I', table_name, MD5(GROUP_CONCAT(CONCAT_WS(':', index_name, seq_in_index, column_name, "
+            "IFNULL(sub_part, ''), non_unique, index_type) ORDER BY index_name, seq_in_index SEPARATOR '|')) "
+            "FROM information_schema.statistics WHERE table_schema = {db} GROUP BY table_name;"
+        )
+        return sql.format(db=db)
+
+    def render_sql_for_schema_details(self, tables: Sequence[str], create_tables: Sequence[str] = None) -> str:
+        sql = ''
+        if tables:
+            db = quote_string(self.db)
+            names = ','.join(quote_string(table) for table in tables)
+            sql += (
+                "SELECT 'T', table_name, engine, table_collation FROM information_schema.tables "
+                "WHERE table_schema = {db} AND table_name IN ({names});"
+            )
+            sql += (
+                "SELECT 'C', table_name, column_name, ordinal_position, column_type, is_nullable, column_default, "
+                "extra, collation_name, column_comment, generation_expression FROM information_schema.columns "
+                "WHERE table_schema = {db} AND table_name IN ({names});"
+            )
+            sql += (
+                "SELECT 'I', table_name, index_name, seq_in_index, column_name, sub_part, non_unique, index_type "
+                "FROM information_schema.statistics WHERE table_schema = {db} AND table_name IN ({names});"
+            )
+            sql = sql.format(db=db, names=names)
+        for table in create_tables or []:
+            sql += "SHOW CREATE TABLE {}.{};".format(quote_identifier(self.db), quote_identifier(table))
+        return sql
+
+    def render_sql_for_checksum_metadata(self) -> str:
+        db = quote_string(self.db)
+        sql = (
+            "SELECT 'C', c.table_name, c.column_name, c.ordinal_position, c.data_type "
+            "FROM information_schema.columns c JOIN information_schema.tables t "
+            "ON t.table_schema = c.table_schema AND t.table_name = c.table_name "
+            "WHERE c.table_schema = {db} AND t.table_type = 'BASE TABLE';"
+        )
+        sql += (
+            "SELECT 'K', table_name, column_name, seq_in_index FROM information_schema.statistics "
+            "WHERE table_schema = {db} AND index_name = 'PRIMARY';"
+        )
+        return sql.format(db=db)
+
+    def render_sql_for_checksum(
+        self,
+        table: str,
+        columns: Sequence[str],
+        key: str = None,
+        chunk_size: int = None,
+        ranges: Sequence[Tuple[int, int]] = None
+    ) -> str:
+        quoted = [quote_identifier(column) for column in columns]
+        # CONCAT_WS skips NULLs, so add a NULL map to tell NULL from missing
+        row = "CONCAT_WS('#', {}, CONCAT({}))".format(
+            ', '.join(quoted),
+            ', '.join('ISNULL({})'.format(column) for column in quoted)
+        )
+        chunk = '0'
+        where = ''
+        if key and chunk_size:
+            chunk = 'FLOOR({} / {})'.format(quote_identifier(key), int(chunk_size))
+            if ranges:
+                where = ' WHERE ' + ' OR '.join(
+                    '({key} >= {start} AND {key} < {end})'.format(key=quote_identifier(key), start=start, end=end)
+                    for start, end in ranges
+                )
+        return "SELECT {chunk} AS chunk, COUNT(*), SUM(CRC32({row})) FROM {db}.{table}{where} GROUP BY chunk;".format(
+            chunk=chunk,
+            row=row,
+            db=quote_identifier(self.db),
+            table=quote_identifier(table),
+            where=where
+        )
+
+    def render_sql_for_purge_count(self, table: str, where: str) -> str:
+        return "SELECT COUNT(*) FROM {}.{} WHERE ({});".format(
+            quote_identifier(self.db),
+            quote_identifier(table),
+            where
+        )
+
+    def render_sql_for_key_metadata(self, table: str) -> str:
+        sql = (
+            "SELECT 'K', column_name FROM information_schema.statistics "
+            "WHERE table_schema = {db} AND table_name = {table} AND index_name = 'PRIMARY' ORDER BY seq_in_index;"
+        )
+        sql += (
+            "SELECT 'C', column_name, data_type FROM information_schema.columns "
+            "WHERE table_schema = {db} AND table_name = {table} ORDER BY ordinal_position;"
+        )
+        return sql.format(db=quote_string(self.db), table=quote_string(table))
+
+    def render_sql_for_alter_dependents(self, table: str) -> str:
+        """
+        Render the SQL that lists what the copy-and-swap of
+        :py:meth:`deployfish_mysql.models.mysql.MySQLDatabaseManager.online_alter`
+        can't carry over to the new ``table``: its foreign keys (``F``), foreign
+        keys in other tables that reference it (``R``) and its triggers
+        (``T``).
+        """
+        sql = (
+            "SELECT 'F', constraint_name, CONCAT(constraint_name, ' -> ', referenced_table_name) "
+            "FROM information_schema.referential_constraints "
+            "WHERE constraint_schema = {db} AND table_name = {table};"
+        )
+        sql += (
+            "SELECT 'R', constraint_name, CONCAT(constraint_schema, '.', table_name, '.', constraint_name) "
+            "FROM information_schema.referential_constraints "
+            "WHERE unique_constraint_schema = {db} AND referenced_table_name = {table};"
+        )
+        sql += (
+            "SELECT 'T', trigger_name, trigger_name FROM information_schema.triggers "
+            "WHERE event_object_schema = {db} AND event_object_table = {table};"
+        )
+        return sql.format(db=quote_string(self.db), table=quote_string(table))
+
+    def _purge_condition(self, where: str, key: str, last: Optional[Union[int, str]]) -> str:
+        if last is None:
+            return '({})'.format(where)
+        return '{} > {} AND ({})'.format(quote_identifier(key), quote_value(last), where)
+
+    def render_sql_for_purge_batch(
+        self,
+        table: str,
+        where: str,
+        key: str,
+        last: Optional[Union[int, str]],
+        batch_size: int
+    ) -> str:
+        name = '{}.{}'.format(quote_identifier(self.db), quote_identifier(table))
+        condition = self._purge_condition(where, key, last)
+        sql = "SET @upper := (SELECT MAX({key}) FROM (SELECT {key} FROM {name} WHERE {condition} ORDER BY {key} LIMIT {limit}) AS batch);"  # noqa:E501  # pylint:disable=line-too-long
+        sql += "DELETE FROM {name} WHERE {condition} AND {key} <= @upper;"
+        sql += "SELECT @upper, ROW_COUNT();"
+        return sql.format(key=quote_identifier(key), name=name, condition=condition, limit=int(batch_size))
+
+    def render_sql_for_purge_select(
+        self,
+        table: str,
+        where: str,
+        key: str,
+        last: Optional[Union[int, str]],
+        batch_size: int
+    ) -> str:
+        return "SELECT {key}, t.* FROM {db}.{table} t WHERE {condition} ORDER BY {key} LIMIT {limit};".format(
+            key=quote_identifier(key),
+            db=quote_identifier(self.db),
+            table=quote_identifier(table),
+            condition=self._purge_condition(where, key, last),
+            limit=int(batch_size)
+        )
+
+    def render_sql_for_purge_delete_keys(self, table: str, key: str, keys: Sequence[Union[int, str]]) -> str:
+        return "DELETE FROM {}.{} WHERE {} IN ({});SELECT ROW_COUNT();".format(
+            quote_identifier(self.db),
+            quote_identifier(table),
+            quote_identifier(key),
+            ','.join(quote_value(value) for value in keys)
+        )
+
+    def render_sql_for_key_range(self, table: str, key: str) -> str:
+        return "SELECT MIN({key}), MAX({key}) FROM {db}.{table};".format(
+            key=quote_identifier(key),
+            db=quote_identifier(self.db),
+            table=quote_identifier(table)
+        )
+
+    def render_sql_for_alter_shadow(self, table: str, shadow: str, alter: str) -> str:
+        sql = "CREATE TABLE {shadow} LIKE {table};\n"
+        sql += "ALTER TABLE {shadow} {alter};\n"
+        return sql.format(shadow=quote_identifier(shadow), table=quote_identifier(table), alter=alter)
+
+    def _alter_trigger_names(self, table: str) -> List[str]:
+        return [quote_identifier('{}_osc_{}'.format(table, kind)) for kind in ('ins', 'upd', 'del')]
+
+    def render_sql_for_alter_triggers(self, state: Dict[str, Any]) -> str:
+        insert, update, delete = self._alter_trigger_names(state['table'])
+        columns = ', '.join(quote_identifier(column) for column in state['columns'])
+        new_values = ', '.join('NEW.{}'.format(quote_identifier(column)) for column in state['columns'])
+        replace = 'REPLACE INTO {} ({}) VALUES ({})'.format(quote_identifier(state['shadow']), columns, new_values)
+        delete_old = 'DELETE IGNORE FROM {shadow} WHERE {key} = OLD.{key}'.format(
+            shadow=quote_identifier(state['shadow']),
+            key=quote_identifier(state['key'])
+        )
+        table = quote_identifier(state['table'])
+        sql = "DELIMITER ;;\n"
+        sql += "CREATE TRIGGER {} AFTER INSERT ON {} FOR EACH ROW {};;\n".format(insert, table, replace)
+        sql += "CREATE TRIGGER {} AFTER UPDATE ON {} FOR EACH ROW BEGIN {}; {}; END;;\n".format(
+            update, table, delete_old, replace
+        )
+        sql += "CREATE TRIGGER {} AFTER DELETE ON {} FOR EACH ROW {};;\n".format(delete, table, delete_old)
+        sql += "DELIMITER ;\n"
+        return sql
+
+    def render_sql_for_alter_copy(self, state: Dict[str, Any], start: int, end: int) -> str:
+        columns = ', '.join(quote_identifier(column) for column in state['columns'])
+        sql = (
+            "INSERT LOW_PRIORITY IGNORE INTO {db}.{shadow} ({columns}) SELECT {columns} FROM {db}.{table} "
+            "FORCE INDEX (PRIMARY) WHERE {key} >= {start} AND {key} < {end} LOCK IN SHARE MODE;"
+        )
+        sql += "SELECT ROW_COUNT();"
+        return sql.format(
+            db=quote_identifier(self.db),
+            shadow=quote_identifier(state['shadow']),
+            table=quote_identifier(state['table']),
+            columns=columns,
+            key=quote_identifier(state['key']),
+            start=int(start),
+            end=int(end)
+        )
+
+    def render_sql_for_alter_swap(self, state: Dict[str, Any], keep_old: bool = False) -> str:
+        old = quote_identifier('_{}_old'.format(state['table']))
+        sql = "RENAME TABLE {table} TO {old}, {shadow} TO {table};\n".format(
+            table=quote_identifier(state['table']),
+            old=old,
+            shadow=quote_identifier(state['shadow'])
+        )
+        for trigger in self._alter_trigger_names(state['table']):
+            sql += "DROP TRIGGER IF EXISTS {};\n".format(trigger)
+        if not keep_old:
+            sql += "DROP TABLE {};\n".format(old)
+        return sql
+
+    def render_sql_for_alter_abort(self, table: str) -> str:
+        sql = ''
+        for trigger in self._alter_trigger_names(table):
+            sql += "DROP TRIGGER IF EXISTS {};\n".format(trigger)
+        sql += "DROP TABLE IF EXISTS {};\n".format(quote_identifier('_{}_new'.format(table)))
+        return sql
+
+    def render_sql_for_watch(self, long_transaction: int, legacy_locks: bool = False) -> str:
+        sql = (
+            "SELECT 'P', id, user, SUBSTRING_INDEX(host, ':', 1), db, command, time, state, LEFT(info, 200) "
+            "FROM information_schema.processlist WHERE id <> CONNECTION_ID();"
+        )
+        if legacy_locks:
+            # MySQL 5.7 only has the information_schema lock tables
+            sql += (
+                "SELECT 'L', r.trx_mysql_thread_id, b.trx_mysql_thread_id, l.lock_table, "
+                "TIMESTAMPDIFF(SECOND, r.trx_wait_started, NOW()) "
+                "FROM information_schema.innodb_lock_waits w "
+                "JOIN information_schema.innodb_trx r ON r.trx_id = w.requesting_trx_id "
+                "JOIN information_schema.innodb_trx b ON b.trx_id = w.blocking_trx_id "
+                "LEFT JOIN information_schema.innodb_locks l ON l.lock_id = w.requested_lock_id;"
+            )
+        else:
+            sql += (
+                "SELECT 'L', r.processlist_id, b.processlist_id, CONCAT(l.object_schema, '.', l.object_name), "
+                "TIMESTAMPDIFF(SECOND, t.trx_wait_started, NOW()) "
+                "FROM performance_schema.data_lock_waits w "
+                "JOIN performance_schema.threads r ON r.thread_id = w.requesting_thread_id "
+                "JOIN performance_schema.threads b ON b.thread_id = w.blocking_thread_id "
+                "LEFT JOIN performance_schema.data_locks l ON l.engine_lock_id = w.requesting_engine_lock_id "
+                "LEFT JOIN information_schema.innodb_trx t ON t.trx_id = w.requesting_engine_transaction_id;"
+            )
+        sql += (
+            "SELECT 'X', trx_mysql_thread_id, TIMESTAMPDIFF(SECOND, trx_started, NOW()), trx_state, "
+            "trx_rows_locked, trx_rows_modified, LEFT(trx_query, 200) "
+            "FROM information_schema.innodb_trx WHERE trx_started <= NOW() - INTERVAL {:d} SECOND;"
+        ).format(int(long_transaction))
+        return sql
+
+    def render_sql_for_buffer_pool(self) -> str:
+        return (
+            "SELECT variable_name, variable_value FROM performance_schema.global_status "
+            "WHERE variable_name IN ('Innodb_buffer_pool_pages_total', 'Innodb_buffer_pool_pages_data', "
+            "'Innodb_buffer_pool_pages_free', 'Innodb_page_size');"
+        )
+
+    def render_sql_for_analyze(self, table: str) -> str:
+        return 'ANALYZE TABLE {};'.format(quote_identifier(table))
+
+    def render_sql_for_index_columns(self) -> str:
+        return (
+            "SELECT table_name, index_name, COUNT(*) FROM information_schema.statistics "
+            "WHERE table_schema = {} AND index_type = 'BTREE' GROUP BY table_name, index_name;"
+        ).format(quote_string(self.db))
+
+    def render_sql_for_preload(self, table: str, index: str) -> str:
+        """
+        Render a query that reads every page of ``index`` of ``table``, and
+        so pulls it into the buffer pool.
+        """
+        if index == 'GEN_CLUST_INDEX':
+            # The hidden clustered index of a table without a primary key cannot be named
+            return 'SELECT COUNT(*) FROM {};'.format(quote_identifier(table))
+        return 'SELECT COUNT(*) FROM {} FORCE INDEX ({});'.format(
+            quote_identifier(table),
+            'PRIMARY' if index == 'PRIMARY' else quote_identifier(index)
+        )
+
+    def render_sql_for_tsv_columns(self) -> str:
+        return (
+            "SELECT c.table_name, c.column_name, c.data_type, c.is_nullable, c.extra "
+            "FROM information_schema.columns c JOIN information_schema.tables t "
+            "ON t.table_schema = c.table_schema AND t.table_name = c.table_name "
+            "WHERE c.table_schema = {} AND t.table_type = 'BASE TABLE' "
+            "ORDER BY c.table_name, c.ordinal_position;"
+        ).format(quote_string(self.db))
+
+    def render_sql_for_max_allowed_packet(self) -> str:
+        return 'SELECT @@max_allowed_packet;'
+
+    def render_sql_for_migrations_table(self) -> str:
+        return (
+            'CREATE TABLE IF NOT EXISTS {}.{} ('
+            'filename VARCHAR(255) NOT NULL PRIMARY KEY, '
+            'checksum CHAR(64) NOT NULL, '
+            'applied_at DATETIME(6) NOT NULL, '
+            'seconds DECIMAL(12,3) NOT NULL'
+            ');'
+        ).format(quote_identifier(self.db), quote_identifier(MIGRATIONS_TABLE))
+
+    def render_sql_for_migrations_table_exists(self) -> str:
+        return 'SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = {} AND TABLE_NAME = {};'.format(
+            quote_string(self.db),
+            quote_string(MIGRATIONS_TABLE)
+        )
+
+    def render_sql_for_applied_migrations(self) -> str:
+        return 'SELECT filename, checksum FROM {}.{};'.format(
+            quote_identifier(self.db),
+            quote_identifier(MIGRATIONS_TABLE)
+        )
+
+    def render_sql_for_migration_start(self) -> str:
+        return 'SET @deployfish_migration_start = NOW(6);\n'
+
+    def render_sql_for_record_migration(self, filename: str, checksum: str) -> str:
+        """
+        Render the SQL that records that we applied the migration ``filename``
+        and then selects a row with :py:data:`deployfish_mysql.migrations.MIGRATED_MARKER`,
+        the filename and the seconds it took, for
+        :py:meth:`MySQLDatabaseManager.migrate` to find in the output.
+        """
+        seconds = 'TIMESTAMPDIFF(MICROSECOND, @deployfish_migration_start, NOW(6)) / 1000000'
+        return (
+            'INSERT INTO {}.{} (filename, checksum, applied_at, seconds) VALUES ({}, {}, NOW(6), {});\n'
+            'SELECT {}, {}, {};\n'
+        ).format(
+            quote_identifier(self.db),
+            quote_identifier(MIGRATIONS_TABLE),
+            quote_string(filename),
+            quote_string(checksum),
+            seconds,
+            quote_string(MIGRATED_MARKER),
+            quote_string(filename),
+            seconds
+        )
+
+    def render_sql_for_audit(self, fingerprint: str = None) -> str:
+        """
+        Render the SQL that reads the accounts, grants and databases on our
+        server for :py:func:`deployfish_mysql.audit.parse_audit_output`.
+
+        The server first works out a fingerprint of all of it: the count and
+        XOR of the hashes of the rows of each section.  If that is
+        ``fingerprint``, it sends only the fingerprint.
+        """
+        parts = []
+        for _, columns, sql in AUDIT_SOURCES:
+            parts.append(
+                "(SELECT CONCAT(COUNT(*), '-', IFNULL(BIT_XOR(CAST(CONV("
+                "LEFT(SHA2(CONCAT_WS(0x1f, {}), 256), 16), 16, 10) AS UNSIGNED)), 0)) "
+                "FROM ({}) AS s)".format(columns, sql)
+            )
+        sql = "SET @deployfish_audit = CONCAT_WS(':', {});".format(', '.join(parts))
+        sql += 'SELECT {}, {}, @deployfish_audit;'.format(quote_string(AUDIT_MARKER), quote_string('fingerprint'))
+        condition = ' WHERE @deployfish_audit <> {}'.format(quote_string(fingerprint)) if fingerprint else ''
+        for section, columns, source in AUDIT_SOURCES:
+            sql += 'SELECT {}, {};'.format(quote_string(AUDIT_MARKER), quote_string(section))
+            sql += 'SELECT {} FROM ({}) AS s{};'.format(columns, source, condition)
+        return sql
+
+    def render_sql_for_threads_running(self) -> str:
+        return "SHOW GLOBAL STATUS LIKE 'Threads_running';"
+
+    def render_sql_for_binlog_status(self, version: str) -> str:
+        if version_tuple(version) >= BINARY_LOG_STATUS_VERSION:
+            return 'SHOW BINARY LOG STATUS;'
+        return 'SHOW MASTER STATUS;'
+
+    def render_for_replica_status(self, version: str) -> str:
+        if version_tuple(version) >= REPLICA_STATUS_VERSION:
+            return self.render_mysql_command('SHOW REPLICA STATUS;', options=['--batch'])
+        return self.render_mysql_command('SHOW SLAVE STATUS;', options=['--batch'])
+
+    def render_sql_for_connection_limits(self) -> str:
+        return "SELECT @@max_connections;SHOW GLOBAL STATUS LIKE 'Threads_connected';"
+
     def render_for_validate(self) -> str:
         return self.render_mysql_command("select version(), current_date;")
 
@@ -0,0 +1,418 @@
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+#: A number of seconds, optionally with a unit
+INTERVAL_RE = re.compile(r'^\s*(?P<number>\d+(?:\.\d+)?)\s*(?P<unit>[smhdw]?)\s*$')
+#: The seconds in each unit :py:func:`parse_interval` understands
+INTERVAL_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_interval(value: Any) -> float:
+    """
+    Turn ``value``, a number of seconds or a string like ``90``, ``30m``,
+    ``6h``, ``1d`` or ``1w``, into seconds.
+
+    Raises:
+        ValueError: ``value`` is not an interval.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = float(value)
+    else:
+        match = INTERVAL_RE.match(str(value))
+        if match is None:
+            raise ValueError('"{}" is not an interval like 90, 30m, 6h or 1d'.format(value))
+        seconds = float(match.group('number')) * INTERVAL_UNITS[match.group('unit')]
+    if seconds <= 0:
+        raise ValueError('"{}" is not a positive interval'.format(value))
+    return seconds
+
+
+class BackupJob:
+    """
+    A backup for :py:class:`BackupScheduler` to run every ``every`` seconds.
+
+    Args:
+        name: the name of the job, unique within its scheduler
+        run: the function that does the backup.  It returns a dict with the
+            keys ``bytes`` and ``location``, and raises an exception if the
+            backup fails.
+        every: seconds from the start of one backup to the start of the next
+
+    Keyword Args:
+        priority: when several jobs are due at once, start those with the
+            highest priority first
+        retries: retry a failed backup this many times before waiting for its
+            next scheduled run
+        retry_delay: seconds to wait before the first retry; each later retry
+            waits twice as long as the one before
+        host: the server the job backs up, for the per-host budget
+        bastion: the ssh instance the job goes through, for the per-bastion
+            budget
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[], Dict[str, Any]],
+        every: float,
+        priority: int = 0,
+        retries: int = 3,
+        retry_delay: float = 60.0,
+        host: str = None,
+        bastion: str = None
+    ) -> None:
+        self.name = name
+        self.run = run
+        self.every = every
+        self.priority = priority
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.host = host
+        self.bastion = bastion
+        #: The failures since the last success, for the retry backoff
+        self.attempt = 0
+        self.due = 0.0
+        self.metrics: Dict[str, Any] = {
+            'name': name,
+            'host': host,
+            'bastion': bastion,
+            'status': 'scheduled',
+            'runs': 0,
+            'failures': 0,
+            'total_bytes': 0,
+            'last_started': None,
+            'last_duration': None,
+            'last_bytes': None,
+            'last_location': None,
+            'last_error': None,
+            'last_success': None,
+            'next_due': None,
+        }
+
+
+class BackupScheduler:
+    """
+    Run :py:class:`BackupJob` objects on their schedules from a priority queue
+    ordered by due time, within three concurrency budgets: ``max_jobs``
+    backups at once overall, ``max_per_host`` on any one server and
+    ``max_per_bastion`` through any one ssh instance.  Of the jobs that are
+    due, we start those with the highest priority, then the most overdue,
+    first.  A due job that would go over a budget waits for a running job to
+    finish, so backups that are all due at once are spread out rather than
+    started together.
+
+    We keep each job's metrics (see :py:attr:`BackupJob.metrics`) and, if
+    ``metrics_file`` is supplied, write them there as JSON whenever a job
+    starts or finishes.  When we start, we read the last successful run of
+    each job back from ``metrics_file``, so a restart does not run every
+    backup again at once: a job is due ``every`` seconds after it last
+    succeeded, or now if it never has.
+
+    Args:
+        jobs: the jobs to run
+
+    Keyword Args:
+        max_jobs: the most backups to run at once
+        max_per_host: the most backups to run at once on any one server
+        max_per_bastion: the most backups to run at once through any one ssh
+            instance
+        metrics_file: write our metrics to this file
+        callback: if supplied, call this with a message each time a job
+            starts, finishes or fails
+        clock: the function that tells us the time, as ``time.time`` does
+    """
+
+    def __init__(
+        self,
+        jobs: Sequence[BackupJob],
+        max_jobs: int = 2,
+        max_per_host: int = 1,
+        max_per_bastion: int = 2,
+        metrics_file: str = None,
+        callback: Callable[[str], None] = None,
+        clock: Callable[[], float] = time.time
+    ) -> None:
+        self.jobs = list(jobs)
+        self.max_jobs = max(max_jobs, 1)
+        self.max_per_host = max(max_per_host, 1)
+        self.max_per_bastion = max(max_per_bastion, 1)
+        self.metrics_file = metrics_file
+        self.callback = callback
+        self.clock = clock
+        self.started = clock()
+        self.queue: List[Tuple[float, int, int, BackupJob]] = []
+        self.running: List[BackupJob] = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.sequence = 0
+        history = self._read_history()
+        for job in self.jobs:
+            last_success = history.get(job.name)
+            job.metrics['last_success'] = last_success
+            self._schedule(job, last_success + job.every if last_success else self.started)
+
+    def _read_history(self) -> Dict[str, float]:
+        if not self.metrics_file or not os.path.exists(self.metrics_file):
+            return {}
+        try:
+            with open(self.metrics_file, encoding='utf-8') as fd:
+                data = json.load(fd)
+        except (OSError, ValueError):
+            return {}
+        return {
+            job['name']: job['last_success'] for job in data.get('jobs', [])
+            if job.get('last_success') is not None
+        }
+
+    def _schedule(self, job: BackupJob, due: float) -> None:
+        job.due = due
+        job.metrics['next_due'] = due
+        self.sequence += 1
+        heapq.heappush(self.queue, (due, -job.priority, self.sequence, job))
+
+    def _fits(self, job: BackupJob) -> bool:
+        if len(self.running) >= self.max_jobs:
+            return False
+        if job.host is not None and \
+                sum(1 for other in self.running if other.host == job.host) >= self.max_per_host:
+            return False
+        if job.bastion is not None and \
+                sum(1 for other in self.running if other.bastion == job.bastion) >= self.max_per_bastion:
+            return False
+        return True
+
+    def _startable(self, now: float) -> List[BackupJob]:
+        """
+        Take the due jobs that fit our budgets off the queue, highest priority
+        and then most overdue first, and mark them running.
+        """
+        due = []
+        while self.queue and self.queue[0][0] <= now:
+            due.append(heapq.heappop(self.queue))
+        jobs = []
+        for entry in sorted(due, key=lambda entry: (entry[1], entry[0], entry[2])):
+            job = entry[3]
+            if self._fits(job):
+                self.running.append(job)
+                job.metrics['status'] = 'running'
+                job.metrics['last_started'] = now
+                job.metrics['next_due'] = None
+                jobs.append(job)
+            else:
+                heapq.heappush(self.queue, entry)
+        return jobs
+
+    def _run(self, job: BackupJob) -> None:
+        started = self.clock()
+        try:
+            result = job.run()
+        except Exception as e:  # pylint:disable=broad-except
+            self._finish(job, started, error=str(e) or e.__class__.__name__)
+        else:
+            self._finish(job, started, result=result)
+
+    def _finish(
+        self,
+        job: BackupJob,
+        started: float,
+        result: Dict[str, Any] = None,
+        error: str = None
+    ) -> None:
+        now = self.clock()
+        with self.lock:
+            self.running.remove(job)
+            metrics = job.metrics
+            metrics['runs'] += 1
+            metrics['last_duration'] = now - started
+            if error is None:
+                result = result or {}
+                job.attempt = 0
+                metrics.update({
+                    'status': 'ok',
+                    'last_bytes': result.get('bytes'),
+                    'last_location': result.get('location'),
+                    'last_error': None,
+                    'last_success': started,
+                })
+                metrics['total_bytes'] += result.get('bytes') or 0
+                self._schedule(job, max(started + job.every, now))
+                message = 'Backup "{}" finished in {:.1f}s: {}'.format(
+                    job.name,
+                    now - started,
+                    metrics['last_location']
+                )
+            else:
+                job.attempt += 1
+                metrics['failures'] += 1
+                metrics['last_error'] = error
+                if job.attempt <= job.retries:
+                    delay = job.retry_delay * 2 ** (job.attempt - 1)
+                    metrics['status'] = 'retrying'
+                    self._schedule(job, now + delay)
+                    message = 'Backup "{}" failed, retrying in {:.0f}s: {}'.format(job.name, delay, error)
+                else:
+                    job.attempt = 0
+                    metrics['status'] = 'failed'
+                    self._schedule(job, max(started + job.every, now))
+                    message = 'Backup "{}" failed {} times, giving up until its next run: {}'.format(
+                        job.name,
+                        job.retries + 1,
+                        error
+                    )
+            self.write_metrics()
+        if self.callback:
+            self.callback(message)
+        self.wake.set()
+
+    def run_pending(self, executor: ThreadPoolExecutor) -> Optional[float]:
+        """
+        Start every due job that fits our budgets on ``executor``.
+
+        Returns:
+            The number of seconds until the next job is due, or ``None`` if no
+            job is waiting.
+        """
+        now = self.clock()
+        with self.lock:
+            jobs = self._startable(now)
+            if jobs:
+                self.write_metrics()
+            wait = self.queue[0][0] - now if self.queue else None
+        for job in jobs:
+            if self.callback:
+                self.callback('Starting backup "{}"'.format(job.name))
+            executor.submit(self._run, job)
+        return wait
+
+    def run(self) -> None:
+        """
+        Run our jobs until :py:meth:`stop` is called or we are interrupted,
+        then wait for the running backups to finish.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_jobs) as executor:
+            try:
+                while not self.stopping.is_set():
+                    wait = self.run_pending(executor)
+                    # A job that is due but over budget waits for a running job to wake us
+                    self.wake.wait(None if wait is None else min(max(wait, 0.0), 60.0) or 60.0)
+                    self.wake.clear()
+            except KeyboardInterrupt:
+                self.stop()
+            if self.running and self.callback:
+                self.callback('Stopping: waiting for {} running backups to finish'.format(len(self.running)))
+
+    def stop(self) -> None:
+        """
+        Start no more jobs, and make :py:meth:`run` return once the running
+        backups finish.
+        """
+        self.stopping.set()
+        self.wake.set()
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Return the metrics of our jobs.
+
+        Returns:
+            A dict with keys ``started``, ``running`` (the names of the running
+            jobs) and ``jobs`` (a list of the metrics of each job).
+        """
+        return {
+            'started': self.started,
+            'running': [job.name for job in self.running],
+            'jobs': [dict(job.metrics) for job in self.jobs],
+        }
+
+    def write_metrics(self) -> None:
+        """
+        Write our metrics to ``metrics_file``, atomically, if we have one.
+        """
+        if not self.metrics_file:
+            return
+        directory = os.path.dirname(os.path.abspath(self.metrics_file))
+        fd, path = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(os.path.basename(self.metrics_file)))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.metrics(), f, indent=2)
+        os.replace(path, self.metrics_file)
+
+
+def render_prometheus(metrics: Dict[str, Any]) -> str:
+    """
+    Render the output of :py:meth:`BackupScheduler.metrics` in the Prometheus
+    text exposition format.
+    """
+    gauges = [
+        ('runs_total', 'counter', 'Backups run', 'runs'),
+        ('failures_total', 'counter', 'Backups that failed', 'failures'),
+        ('bytes_total', 'counter', 'Bytes backed up', 'total_bytes'),
+        ('last_duration_seconds', 'gauge', 'Duration of the last backup', 'last_duration'),
+        ('last_bytes', 'gauge', 'Size of the last successful backup', 'last_bytes'),
+        ('last_success_timestamp_seconds', 'gauge', 'Start time of the last successful backup', 'last_success'),
+        ('next_due_timestamp_seconds', 'gauge', 'When the backup is next due', 'next_due'),
+    ]
+    lines = []
+    for suffix, kind, description, key in gauges:
+        name = 'deployfish_mysql_backup_{}'.format(suffix)
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for job in metrics['jobs']:
+            if job[key] is not None:
+                lines.append('{}{{job="{}",host="{}"}} {}'.format(
+                    name,
+                    job['name'].replace('\\', '\\\\').replace('"', '\\"'),
+                    (job['host'] or '').replace('\\', '\\\\').replace('"', '\\"'),
+                    job[key]
+                ))
+    lines.append('# HELP deployfish_mysql_backup_running Backups running now')
+    lines.append('# TYPE deployfish_mysql_backup_running gauge')
+    lines.append('deployfish_mysql_backup_running {}'.format(len(metrics['running'])))
+    return '\n'.join(lines) + '\n'
+
+
+def serve_metrics(scheduler: BackupScheduler, port: int, address: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """
+    Serve the metrics of ``scheduler`` over HTTP on ``address``:``port`` from a
+    background thread: as JSON at ``/`` and in the Prometheus text format at
+    ``/metrics``.
+
+    Returns:
+        The server.  Call its ``shutdown()`` method to stop it.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self) -> None:  # noqa: N802
+            with scheduler.lock:
+                metrics = scheduler.metrics()
+            if self.path.split('?')[0] == '/metrics':
+                body = render_prometheus(metrics).encode('utf-8')
+                content_type = 'text/plain; version=0.0.4'
+            elif self.path.split('?')[0] == '/':
+                body = json.dumps(metrics, indent=2).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
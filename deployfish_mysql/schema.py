@@ -0,0 +1,307 @@
+from collections import OrderedDict
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from deployfish_mysql.sql import quote_identifier, quote_string
+
+
+#: ``CURRENT_TIMESTAMP`` and its synonyms, with an optional fractional seconds
+#: precision, which MySQL accepts as a default without parentheses
+CURRENT_TIMESTAMP_RE = re.compile(
+    r'^(CURRENT_TIMESTAMP|NOW|LOCALTIME|LOCALTIMESTAMP)(\(\d*\))?$', re.IGNORECASE
+)
+#: How ``information_schema.columns`` shows the default of a ``BIT`` column
+BIT_LITERAL_RE = re.compile(r"^b'[01]*'$", re.IGNORECASE)
+
+
+# ----------------------------------------
+# Index analysis
+# ----------------------------------------
+
+class Index:
+    """
+    One index on a table, built from the rows of ``information_schema.statistics``.
+    """
+
+    def __init__(self, table: str, name: str, unique: bool, index_type: str = 'BTREE') -> None:
+        self.table = table
+        self.name = name
+        self.unique = unique
+        self.index_type = index_type
+        #: (column name, prefix length) tuples, in index order
+        self.columns: List[Tuple[str, Optional[int]]] = []
+        #: reads done through this index since the server started
+        self.reads: int = 0
+        #: bytes used by the index
+        self.size: int = 0
+
+    @property
+    def is_primary(self) -> bool:
+        return self.name == 'PRIMARY'
+
+    @property
+    def column_names(self) -> str:
+        return ','.join(
+            '{}({})'.format(column, length) if length else column for column, length in self.columns
+        )
+
+    @property
+    def definition(self) -> str:
+        """
+        The index as it would appear in a ``CREATE TABLE`` or ``ALTER TABLE``
+        statement.
+        """
+        columns = ','.join(
+            '{}({})'.format(quote_identifier(column), length) if length else quote_identifier(column)
+            for column, length in self.columns
+        )
+        if self.is_primary:
+            return 'PRIMARY KEY ({})'.format(columns)
+        if self.unique:
+            kind = 'UNIQUE KEY'
+        elif self.index_type in ('FULLTEXT', 'SPATIAL'):
+            kind = '{} KEY'.format(self.index_type)
+        else:
+            kind = 'KEY'
+        return '{} {} ({})'.format(kind, quote_identifier(self.name), columns)
+
+    def is_prefix_of(self, other: "Index") -> bool:
+        """
+        Return ``True`` if our columns are a leading prefix of (or the same as)
+        the columns of ``other``, meaning ``other`` can serve every lookup we
+        can.
+        """
+        return len(self.columns) <= len(other.columns) and other.columns[:len(self.columns)] == self.columns
+
+
+def build_indexes(statistics: Sequence[Sequence[Optional[str]]]) -> Dict[str, Dict[str, Index]]:
+    """
+    Group rows of ``(table_name, index_name, seq_in_index, column_name,
+    sub_part, non_unique[, index_type])`` from ``information_schema.statistics``
+    into :py:class:`Index` objects.
+
+    Returns:
+        A dict of table name to a dict of index name to :py:class:`Index`.
+    """
+    tables: Dict[str, Dict[str, Index]] = OrderedDict()
+    for row in sorted(statistics, key=lambda r: (r[0], r[1], int(r[2] or 0))):
+        table, name, _, column, sub_part, non_unique = row[:6]
+        indexes = tables.setdefault(table, OrderedDict())  # type: ignore
+        if name not in indexes:
+            index_type = row[6] if len(row) > 6 and row[6] else 'BTREE'
+            indexes[name] = Index(table, name, non_unique == '0', index_type=index_type)  # type: ignore
+        indexes[name].columns.append((column, int(sub_part) if sub_part else None))  # type: ignore
+    return tables
+
+
+def analyze_indexes(
+    tables: Dict[str, int],
+    indexes: Dict[str, Dict[str, Index]],
+    writes: Dict[str, int]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Find indexes that cost us writes and space without earning their keep.
+
+    * ``unused``: non-unique secondary indexes that have never been read from.
+      Unique indexes are never reported here because they enforce a
+      constraint even if nobody reads through them.
+    * ``redundant``: non-unique secondary indexes whose columns are a leading
+      prefix of another index on the same table.
+    * ``no_primary_key``: tables without a primary key.
+
+    The write cost of an index is the number of row writes on its table since
+    the server started: each of those had to update the index too.
+
+    Args:
+        tables: table name to approximate row count
+        indexes: the output of :py:func:`build_indexes`, with ``reads`` and
+            ``size`` filled in
+        writes: table name to the number of row writes since server start
+
+    Returns:
+        A dict with keys ``unused``, ``redundant`` and ``no_primary_key``, each
+        a list of dicts suitable for a table renderer.
+    """
+    report: Dict[str, List[Dict[str, Any]]] = {'unused': [], 'redundant': [], 'no_primary_key': []}
+    for table, rows in tables.items():
+        table_indexes = indexes.get(table, {})
+        if 'PRIMARY' not in table_indexes:
+            report['no_primary_key'].append({'table': table, 'rows': rows})
+        secondary = [index for index in table_indexes.values() if not index.is_primary]
+        for index in secondary:
+            if index.unique:
+                continue
+            entry = {
+                'table': table,
+                'index': index.name,
+                'columns': index.column_names,
+                'size': index.size,
+                'writes': writes.get(table, 0),
+            }
+            if index.reads == 0:
+                report['unused'].append(dict(entry))
+            for other in table_indexes.values():
+                if other is index or not index.is_prefix_of(other):
+                    continue
+                if other.columns == index.columns and not other.unique and other.name > index.name:
+                    # Exact duplicates: only report one of the pair
+                    continue
+                entry['covered_by'] = '{} ({})'.format(other.name, other.column_names)
+                report['redundant'].append(entry)
+                break
+    for rows in report.values():
+        rows.sort(key=lambda r: (-r.get('size', 0), r['table']))
+    return report
+
+
+# ----------------------------------------
+# Schema comparison
+# ----------------------------------------
+
+def table_hashes(rows: Sequence[Sequence[Optional[str]]]) -> Dict[str, str]:
+    """
+    Combine the tagged rows from
+    :py:meth:`deployfish_mysql.models.mysql.MySQLDatabase.render_sql_for_schema_hashes`
+    into a single hash per table.
+
+    Returns:
+        A dict of table name to hash.  Only base tables are included.
+    """
+    parts: Dict[str, Dict[str, str]] = {}
+    for kind, table, *values in rows:
+        parts.setdefault(table, {})[kind] = '|'.join(value or '' for value in values)  # type: ignore
+    hashes = {}
+    for table, kinds in parts.items():
+        if 'T' not in kinds:
+            # a view
+            continue
+        data = '\n'.join(kinds.get(kind, '') for kind in ('T', 'C', 'I'))
+        hashes[table] = hashlib.md5(data.encode('utf-8')).hexdigest()
+    return hashes
+
+
+def build_columns(rows: Sequence[Sequence[Optional[str]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Group rows of ``(table_name, column_name, ordinal_position, column_type,
+    is_nullable, column_default, extra, collation_name, column_comment,
+    generation_expression)`` from ``information_schema.columns`` by table.
+
+    Returns:
+        A dict of table name to a list of column dicts, in column order.
+    """
+    tables: Dict[str, List[Dict[str, Any]]] = OrderedDict()
+    for row in sorted(rows, key=lambda r: (r[0], int(r[2] or 0))):
+        tables.setdefault(row[0], []).append({  # type: ignore
+            'name': row[1],
+            'type': row[3],
+            'nullable': row[4] == 'YES',
+            'default': row[5],
+            'extra': row[6] or '',
+            'collation': row[7],
+            'comment': row[8] or '',
+            'expression': row[9] if len(row) > 9 else None,
+        })
+    return tables
+
+
+def default_value(column: Dict[str, Any]) -> str:
+    """
+    Render the default of ``column``, as returned by :py:func:`build_columns`,
+    as it goes after ``DEFAULT``.
+
+    ``information_schema.columns`` gives every default as a string, so we
+    only quote the ones that are string literals: ``CURRENT_TIMESTAMP``,
+    bit literals like ``b'0'`` and expression defaults (MySQL 8.0 marks those
+    ``DEFAULT_GENERATED``, and they need parentheses) are left unquoted.
+    """
+    default = column['default']
+    if CURRENT_TIMESTAMP_RE.match(default):
+        return default
+    if 'DEFAULT_GENERATED' in column['extra']:
+        return '({})'.format(default)
+    if column['type'].lower().startswith('bit') and BIT_LITERAL_RE.match(default):
+        return default
+    return quote_string(default)
+
+
+def column_definition(column: Dict[str, Any]) -> str:
+    """
+    Render ``column``, as returned by :py:func:`build_columns`, as it would
+    appear in a ``CREATE TABLE`` or ``ALTER TABLE`` statement.
+    """
+    parts = [quote_identifier(column['name']), column['type']]
+    if column['collation']:
+        parts.append('COLLATE {}'.format(column['collation']))
+    extra = column['extra'].replace('DEFAULT_GENERATED', '').strip()
+    if column['expression'] and 'GENERATED' in extra:
+        parts.append('GENERATED ALWAYS AS ({}) {}'.format(
+            column['expression'],
+            'STORED' if 'STORED' in extra else 'VIRTUAL'
+        ))
+        extra = ''
+    parts.append('NULL' if column['nullable'] else 'NOT NULL')
+    if column['default'] is not None:
+        parts.append('DEFAULT {}'.format(default_value(column)))
+    if extra:
+        parts.append(extra)
+    if column['comment']:
+        parts.append('COMMENT {}'.format(quote_string(column['comment'])))
+    return ' '.join(parts)
+
+
+def diff_table(
+    table: str,
+    source: Dict[str, Any],
+    target: Dict[str, Any]
+) -> List[str]:
+    """
+    Return the ``ALTER TABLE`` statement that makes ``table`` in the target
+    database look like ``table`` in the source database.
+
+    Column order is only honored for new columns: if the only difference is
+    the order of existing columns we return a comment saying so instead.
+
+    Args:
+        table: the table name
+        source: a dict with keys ``columns`` (a list from
+            :py:func:`build_columns`), ``indexes`` (a dict from
+            :py:func:`build_indexes`), ``engine`` and ``collation`` describing
+            the table in the source database
+        target: the same, for the target database
+
+    Returns:
+        A list of SQL statements or comments.  Empty if the tables are the same.
+    """
+    clauses = []
+    source_indexes = {name: index.definition for name, index in source['indexes'].items()}
+    target_indexes = {name: index.definition for name, index in target['indexes'].items()}
+    for name, definition in target_indexes.items():
+        if source_indexes.get(name) != definition:
+            clauses.append('DROP PRIMARY KEY' if name == 'PRIMARY' else 'DROP INDEX {}'.format(quote_identifier(name)))
+    source_columns = OrderedDict((column['name'], column) for column in source['columns'])
+    target_columns = OrderedDict((column['name'], column) for column in target['columns'])
+    for name in target_columns:
+        if name not in source_columns:
+            clauses.append('DROP COLUMN {}'.format(quote_identifier(name)))
+    previous = None
+    for name, column in source_columns.items():
+        definition = column_definition(column)
+        if name not in target_columns:
+            position = 'AFTER {}'.format(quote_identifier(previous)) if previous else 'FIRST'
+            clauses.append('ADD COLUMN {} {}'.format(definition, position))
+        elif column_definition(target_columns[name]) != definition:
+            clauses.append('MODIFY COLUMN {}'.format(definition))
+        previous = name
+    for name, definition in source_indexes.items():
+        if target_indexes.get(name) != definition:
+            clauses.append('ADD {}'.format(definition))
+    if source['engine'] != target['engine']:
+        clauses.append('ENGINE={}'.format(source['engine']))
+    if source['collation'] != target['collation']:
+        clauses.append('COLLATE={}'.format(source['collation']))
+    if not clauses:
+        if list(source_columns) != list(target_columns):
+            return ['-- {}: column order differs; not changed'.format(quote_identifier(table))]
+        return []
+    return ['ALTER TABLE {}\n  {};'.format(quote_identifier(table), ',\n  '.join(clauses))]
@@ -0,0 +1,122 @@
+import subprocess
+import uuid
+from typing import List, Optional, TYPE_CHECKING, cast
+
+from deployfish_mysql.sql import parse_batch_output
+
+if TYPE_CHECKING:
+    from deployfish.core.models import Instance
+    from deployfish_mysql.models.mysql import MySQLDatabase
+
+
+class MySQLSession:
+    """
+    A single long-lived ``mysql`` client on the remote side of one ssh
+    connection, which we can send any number of queries to.
+
+    ``ssh_noninteractive`` opens a new ssh connection and starts a new
+    ``mysql`` for every command, which is fine for one-off commands but far
+    too slow for anything that polls the server.  Use this instead::
+
+        with MySQLSession(obj, ssh_target=target) as session:
+            rows = session.query('SELECT 1;')
+
+    The client runs with ``--force``, so a failed query raises
+    ``obj.OperationFailed`` but leaves the session usable.
+    """
+
+    def __init__(
+        self,
+        obj: "MySQLDatabase",
+        ssh_target: "Instance" = None,
+        verbose: bool = False,
+        user: str = None,
+        password: str = None
+    ) -> None:
+        self.obj = obj
+        self.ssh_target = ssh_target
+        self.verbose = verbose
+        self.user = user
+        self.password = password
+        self.process: Optional[subprocess.Popen] = None
+        #: the row we ask for after every query, so we know when its output has ended
+        self.sentinel = 'end-{}'.format(uuid.uuid4().hex)
+
+    def open(self) -> None:
+        cluster = self.obj.cluster
+        ssh_target = self.ssh_target if self.ssh_target else cluster.ssh_target
+        if not ssh_target:
+            raise cluster.NoSSHTargetAvailable('No ssh targets are available for {}'.format(cluster))
+        provider = cluster.providers[cluster.ssh_proxy_type](ssh_target, verbose=self.verbose)
+        command = provider.ssh_command(
+            self.obj.render_for_script(user=self.user, password=self.password) + ' --force --unbuffered'
+        )
+        self.process = subprocess.Popen(
+            ['/bin/bash', '-c', command],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            bufsize=1
+        )
+
+    def close(self) -> None:
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()  # type: ignore
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        self.process = None
+
+    def __enter__(self) -> "MySQLSession":
+        self.open()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def query(self, sql: str) -> List[List[Optional[str]]]:
+        """
+        Run ``sql`` in the session.
+
+        Args:
+            sql: one or more SQL statements
+
+        Raises:
+            self.obj.OperationFailed: the query failed, or the session died.
+
+        Returns:
+            A list of rows, each of which is a list of column values.
+        """
+        if self.process is None:
+            self.open()
+        process = cast(subprocess.Popen, self.process)
+        try:
+            process.stdin.write("{}\nSELECT '{}';\n".format(sql.rstrip().rstrip(';') + ';', self.sentinel))
+            process.stdin.flush()
+        except OSError as e:
+            raise self.obj.OperationFailed('Lost our MySQL session to {}:{}: {}'.format(
+                self.obj.host, self.obj.port, e
+            ))
+        lines = []
+        errors = []
+        while True:
+            line = process.stdout.readline()
+            if not line:
+                self.close()
+                raise self.obj.OperationFailed('Lost our MySQL session to {}:{}: {}'.format(
+                    self.obj.host, self.obj.port, ''.join(lines)
+                ))
+            if line.rstrip('\r\n') == self.sentinel:
+                break
+            if line.startswith('ERROR '):
+                errors.append(line.strip())
+            else:
+                lines.append(line)
+        if errors:
+            raise self.obj.OperationFailed('Query failed on remote server {}:{}: {}'.format(
+                self.obj.host, self.obj.port, '\n'.join(errors)
+            ))
+        return parse_batch_output(''.join(lines))
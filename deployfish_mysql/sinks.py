@@ -0,0 +1,382 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+from typing import Any, BinaryIO, Dict, List, Optional, TYPE_CHECKING, cast
+
+from deployfish_mysql.checksums import READ_SIZE
+
+if TYPE_CHECKING:
+    from deployfish_mysql.models.mysql import MySQLDatabase
+    from deployfish_mysql.store import DumpStore
+
+
+#: How much of the end of a dump we keep, to show the errors ``mysqldump`` wrote into it
+TAIL_SIZE = 2000
+#: The default size of each part an :py:class:`ObjectStoreSink` uploads.  S3 needs at least 5MB.
+PART_SIZE = 8 * 1024 * 1024
+
+
+class DumpSink:
+    """
+    Where :py:meth:`deployfish_mysql.models.mysql.MySQLDatabaseManager.dump`
+    writes a dump as it arrives from the remote side: a write-only, binary
+    file-like object.
+
+    We write each block straight through, with no decoding and no staging
+    copy, and call :py:meth:`commit` once the dump has arrived intact, or
+    :py:meth:`abort` if it failed.  Subclasses implement :py:meth:`_write`,
+    :py:meth:`commit` and :py:meth:`abort`.
+    """
+
+    #: The local file the finished dump will be in, if there is one.  Only then do we write
+    #: the checksum sidecar, the table index and the backup chain next to it.
+    filename: Optional[str] = None
+
+    def __init__(self) -> None:
+        self.size = 0
+        self.tail = b''
+
+    def write(self, data: bytes) -> int:
+        self._write(data)
+        self.size += len(data)
+        self.tail = (self.tail + data[-TAIL_SIZE:])[-TAIL_SIZE:]
+        return len(data)
+
+    def _write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    def commit(self) -> str:
+        """
+        Finish the dump.
+
+        Returns:
+            A description of where the dump is, for the user.
+        """
+        raise NotImplementedError
+
+    def abort(self) -> Optional[str]:
+        """
+        Throw away the failed dump.
+
+        Returns:
+            Where we kept what we got, if anywhere.
+        """
+        raise NotImplementedError
+
+    def error_output(self) -> str:
+        """
+        Return the end of what we got, which is where ``mysqldump`` writes its
+        error messages.
+        """
+        return self.tail.decode('utf-8', errors='replace')
+
+
+class FileSink(DumpSink):
+    """
+    Write the dump to the local file ``filename``.  We write to a temporary
+    file in the same directory and rename it into place when the dump is
+    complete, so ``filename`` never holds a partial dump; a failed dump is
+    renamed to ``{filename}.errors`` instead.
+    """
+
+    def __init__(self, filename: str) -> None:
+        super().__init__()
+        self.filename = filename
+        directory = os.path.dirname(os.path.abspath(filename))
+        tmp_fd, self.tmp_path = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(os.path.basename(filename)))
+        self.fd = os.fdopen(tmp_fd, 'wb', buffering=READ_SIZE)
+
+    def _write(self, data: bytes) -> None:
+        self.fd.write(data)
+
+    def commit(self) -> str:
+        self.fd.close()
+        os.replace(self.tmp_path, cast(str, self.filename))
+        return cast(str, self.filename)
+
+    def abort(self) -> Optional[str]:
+        self.fd.close()
+        errors = '{}.errors'.format(self.filename)
+        os.replace(self.tmp_path, errors)
+        return errors
+
+
+class StreamSink(DumpSink):
+    """
+    Write the dump to the binary stream ``stream`` as it arrives, so that it
+    can be piped into another program: by default, our stdout.  A failed dump
+    cannot be taken back, so the program reading it must check our exit
+    status.
+    """
+
+    def __init__(self, stream: BinaryIO = None) -> None:
+        super().__init__()
+        self.stream = stream if stream is not None else sys.stdout.buffer
+
+    def _write(self, data: bytes) -> None:
+        self.stream.write(data)
+
+    def commit(self) -> str:
+        self.stream.flush()
+        return getattr(self.stream, 'name', 'stdout')
+
+    def abort(self) -> Optional[str]:
+        try:
+            self.stream.flush()
+        except OSError:
+            pass
+        return None
+
+
+class SplitSink(DumpSink):
+    """
+    Write the dump to the local files ``{filename}.0000``, ``{filename}.0001``
+    and so on, each ``part_size`` bytes but the last, e.g. to fit a file size
+    limit.  ``cat {filename}.*`` puts the dump back together.
+
+    Like :py:class:`FileSink`, each part has a temporary name until the dump
+    is complete; a failed dump leaves no parts behind.
+    """
+
+    def __init__(self, filename: str, part_size: int) -> None:
+        super().__init__()
+        self.base = filename
+        self.part_size = part_size
+        self.parts: List[str] = []
+        self.fd: Optional[BinaryIO] = None
+        self.written = 0
+
+    def _write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            if self.fd is None or self.written == self.part_size:
+                self._next_part()
+            count = min(len(view), self.part_size - self.written)
+            cast(BinaryIO, self.fd).write(view[:count])
+            self.written += count
+            view = view[count:]
+
+    def _next_part(self) -> None:
+        if self.fd is not None:
+            self.fd.close()
+        self.parts.append('{}.{:04d}'.format(self.base, len(self.parts)))
+        self.fd = open(self.parts[-1] + '.tmp', 'wb', buffering=READ_SIZE)
+        self.written = 0
+
+    def commit(self) -> str:
+        if self.fd is None:
+            self._next_part()
+        cast(BinaryIO, self.fd).close()
+        for part in self.parts:
+            os.replace(part + '.tmp', part)
+        return '{}.* ({} parts)'.format(self.base, len(self.parts))
+
+    def abort(self) -> Optional[str]:
+        if self.fd is not None:
+            self.fd.close()
+        for part in self.parts:
+            os.remove(part + '.tmp')
+        return None
+
+
+class LocalObjectStore:
+    """
+    An object store in the local directory ``path``, with the multipart
+    upload interface of S3: a stand-in for :py:class:`S3ObjectStore` for
+    testing, or for network filesystems.  Parts are kept under
+    ``{path}/.uploads/`` until the upload is completed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def url(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def create_upload(self, key: str) -> str:
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.path, '.uploads', upload_id))
+        return upload_id
+
+    def upload_part(self, key: str, upload_id: str, number: int, data: bytes) -> Any:
+        path = os.path.join(self.path, '.uploads', upload_id, '{:05d}'.format(number))
+        with open(path, 'wb') as fd:
+            fd.write(data)
+        return path
+
+    def complete_upload(self, key: str, upload_id: str, parts: List[Any]) -> None:
+        # Assembling the parts is the store's job, as it is for S3
+        destination = self.url(key)
+        os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(destination, upload_id)
+        with open(tmp_path, 'wb') as out:
+            for part in parts:
+                with open(part, 'rb') as fd:
+                    shutil.copyfileobj(fd, out, READ_SIZE)
+        os.replace(tmp_path, destination)
+        self.abort_upload(key, upload_id)
+
+    def abort_upload(self, key: str, upload_id: str) -> None:
+        shutil.rmtree(os.path.join(self.path, '.uploads', upload_id), ignore_errors=True)
+
+
+class S3ObjectStore:
+    """
+    The S3 bucket ``bucket``, using the AWS credentials deployfish is
+    configured with.
+    """
+
+    def __init__(self, bucket: str) -> None:
+        from deployfish.core.aws import get_boto3_session
+        self.bucket = bucket
+        self.client = get_boto3_session().client('s3')
+
+    def url(self, key: str) -> str:
+        return 's3://{}/{}'.format(self.bucket, key)
+
+    def create_upload(self, key: str) -> str:
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+
+    def upload_part(self, key: str, upload_id: str, number: int, data: bytes) -> Any:
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=number,
+            Body=data
+        )
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+    def complete_upload(self, key: str, upload_id: str, parts: List[Any]) -> None:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+
+    def abort_upload(self, key: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+
+class ObjectStoreSink(DumpSink):
+    """
+    Upload the dump to ``key`` in the object store ``store`` (an
+    :py:class:`S3ObjectStore` or :py:class:`LocalObjectStore`) as a multipart
+    upload, a ``part_size`` part at a time, as it arrives.  Only one part is
+    ever held in memory, and nothing touches the local disk.  The object only
+    appears in the store once the dump is complete.
+    """
+
+    def __init__(self, store: Any, key: str, part_size: int = PART_SIZE) -> None:
+        super().__init__()
+        self.store = store
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts: List[Any] = []
+        self.upload_id = store.create_upload(key)
+
+    def _write(self, data: bytes) -> None:
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self._upload(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+
+    def _upload(self, data: bytes) -> None:
+        self.parts.append(self.store.upload_part(self.key, self.upload_id, len(self.parts) + 1, data))
+
+    def commit(self) -> str:
+        if self.buffer or not self.parts:
+            self._upload(bytes(self.buffer))
+            self.buffer = bytearray()
+        self.store.complete_upload(self.key, self.upload_id, self.parts)
+        return self.store.url(self.key)
+
+    def abort(self) -> Optional[str]:
+        self.store.abort_upload(self.key, self.upload_id)
+        return None
+
+
+class DumpStoreSink(DumpSink):
+    """
+    Add the dump to the deduplicated dump store ``store`` as it arrives: a
+    worker thread splits it into chunks and saves the new ones, and
+    :py:meth:`commit` writes its manifest.  See
+    :py:class:`deployfish_mysql.store.DumpStore`.  We hold a shared lock on
+    the store until the manifest is written, so a prune cannot remove our
+    chunks in the meantime.  A failed dump leaves no manifest behind; any
+    chunks it saved go at the next prune.
+
+    After :py:meth:`commit`, :py:attr:`result` is the output of
+    :py:meth:`deployfish_mysql.store.DumpStore.write_manifest`.
+    """
+
+    def __init__(self, store: "DumpStore", obj: "MySQLDatabase") -> None:
+        super().__init__()
+        self.store = store
+        self.obj = obj
+        self.rows: List[Dict[str, Any]] = []
+        self.errors: List[Exception] = []
+        self.result: Dict[str, Any] = {}
+        self.lock = store.lock()
+        read_fd, write_fd = os.pipe()
+        self.pipe = os.fdopen(write_fd, 'wb', buffering=READ_SIZE)
+        self.worker = threading.Thread(target=self._save, args=(read_fd,), daemon=True)
+        self.worker.start()
+
+    def _save(self, read_fd: int) -> None:
+        with os.fdopen(read_fd, 'rb') as fd:
+            try:
+                self.rows = self.store.save_chunks(fd)
+            except Exception as e:  # pylint:disable=broad-except
+                self.errors.append(e)
+                # Keep reading so that the writer does not block
+                for _ in iter(lambda: fd.read(READ_SIZE), b''):
+                    pass
+
+    def _write(self, data: bytes) -> None:
+        self.pipe.write(data)
+
+    def _finish(self) -> None:
+        self.pipe.close()
+        self.worker.join()
+
+    def commit(self) -> str:
+        try:
+            self._finish()
+            if self.errors:
+                raise self.errors[0]
+            self.result = self.store.write_manifest(self.obj, self.rows)
+        finally:
+            self.lock.close()
+        return self.result['manifest']
+
+    def abort(self) -> Optional[str]:
+        self._finish()
+        self.lock.close()
+        return None
+
+
+def sink_for(destination: str, part_size: int = None) -> DumpSink:
+    """
+    Return the sink for the ``dump --dumpfile`` destination ``destination``:
+    ``-`` for stdout, ``s3://{bucket}/{key}`` for S3, or else a local file,
+    split into ``part_size`` byte parts if ``part_size`` is given.
+
+    Raises:
+        ValueError: ``destination`` is an S3 URL with no key.
+    """
+    if destination == '-':
+        return StreamSink()
+    if destination.startswith('s3://'):
+        bucket, _, key = destination[len('s3://'):].partition('/')
+        if not bucket or not key:
+            raise ValueError('"{}" is not an S3 URL of the form s3://{{bucket}}/{{key}}'.format(destination))
+        return ObjectStoreSink(S3ObjectStore(bucket), key)
+    if part_size:
+        return SplitSink(destination, part_size)
+    return FileSink(destination)
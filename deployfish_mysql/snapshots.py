@@ -0,0 +1,126 @@
+import datetime
+import json
+from typing import Any, Dict, List, TYPE_CHECKING
+
+from deployfish.core.models import Model
+
+if TYPE_CHECKING:
+    from deployfish_mysql.models.mysql import MySQLDatabase
+
+
+class SnapshotError(Model.OperationFailed):
+    pass
+
+
+def write_snapshot(filename: str, kind: str, obj: "MySQLDatabase", rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Save ``rows`` to ``filename`` as JSON, along with a timestamp and enough
+    information about ``obj`` to tell later where the snapshot came from.
+
+    Args:
+        filename: the file to write
+        kind: what sort of snapshot this is (e.g. ``stats``)
+        obj: the ``MySQLDatabase`` the rows came from
+        rows: the data to save
+
+    Returns:
+        The snapshot we wrote.
+    """
+    snapshot = {
+        'kind': kind,
+        'name': obj.name,
+        'host': obj.host,
+        'port': obj.port,
+        'db': obj.db,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'rows': rows,
+    }
+    with open(filename, 'w', encoding='utf-8') as fd:
+        json.dump(snapshot, fd, indent=2)
+    return snapshot
+
+
+def read_snapshot(filename: str, kind: str, obj: "MySQLDatabase" = None) -> Dict[str, Any]:
+    """
+    Load a snapshot written by :py:func:`write_snapshot`.
+
+    Args:
+        filename: the file to read
+        kind: the sort of snapshot we expect
+
+    Keyword Args:
+        obj: if supplied, the snapshot must be of this ``MySQLDatabase``'s
+            database on the same server
+
+    Raises:
+        SnapshotError: the file is not a snapshot of type ``kind``, or not of
+            ``obj``.
+
+    Returns:
+        The snapshot.
+    """
+    with open(filename, encoding='utf-8') as fd:
+        try:
+            snapshot = json.load(fd)
+        except ValueError as e:
+            raise SnapshotError('"{}" is not a valid snapshot file: {}'.format(filename, e))
+    if not isinstance(snapshot, dict) or snapshot.get('kind') != kind:
+        raise SnapshotError('"{}" is not a "{}" snapshot'.format(filename, kind))
+    if obj is not None and (snapshot.get('host'), snapshot.get('port'), snapshot.get('db')) != \
+            (obj.host, obj.port, obj.db):
+        raise SnapshotError('"{}" is a snapshot of database "{}" on {}:{}, not of "{}" on {}:{}'.format(
+            filename,
+            snapshot.get('db'),
+            snapshot.get('host'),
+            snapshot.get('port'),
+            obj.db,
+            obj.host,
+            obj.port
+        ))
+    return snapshot
+
+
+def snapshot_age(snapshot: Dict[str, Any]) -> datetime.timedelta:
+    """
+    Return how long ago ``snapshot`` was taken.
+    """
+    taken = datetime.datetime.fromisoformat(snapshot['timestamp'])
+    return datetime.datetime.now(datetime.timezone.utc) - taken
+
+
+def diff_counters(
+    before: List[Dict[str, Any]],
+    after: List[Dict[str, Any]],
+    key: str,
+    counters: List[str]
+) -> List[Dict[str, Any]]:
+    """
+    Subtract the cumulative ``counters`` in ``before`` from those in
+    ``after``, matching rows on ``key``.
+
+    Rows only in ``after`` are new since ``before`` and are kept as is.  If a
+    counter went backwards the server's counters were reset in between, so we
+    use the ``after`` value as the delta.  Rows whose counters did not change
+    are dropped.
+
+    Args:
+        before: the earlier rows
+        after: the later rows
+        key: the name of the column that identifies a row
+        counters: the names of the cumulative columns to subtract
+
+    Returns:
+        The rows from ``after`` with ``counters`` replaced by their deltas.
+    """
+    previous = {row[key]: row for row in before}
+    deltas = []
+    for row in after:
+        delta = dict(row)
+        old = previous.get(row[key])
+        if old is not None:
+            for counter in counters:
+                value = row[counter] - old[counter]
+                delta[counter] = value if value >= 0 else row[counter]
+        if any(delta[counter] for counter in counters):
+            deltas.append(delta)
+    return deltas
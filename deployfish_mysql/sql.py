@@ -0,0 +1,183 @@
+import re
+from typing import List, Optional, Sequence, Tuple, Union
+
+
+# ----------------------------------------
+# Quoting
+# ----------------------------------------
+
+def quote_identifier(name: str) -> str:
+    """
+    Quote ``name`` as a MySQL identifier (database, table or column name).
+
+    Args:
+        name: the identifier to quote
+
+    Returns:
+        ``name`` wrapped in backticks, with any embedded backticks doubled.
+    """
+    return '`{}`'.format(name.replace('`', '``'))
+
+
+def quote_string(value: str) -> str:
+    """
+    Quote ``value`` as a MySQL string literal.
+
+    Args:
+        value: the string to quote
+
+    Returns:
+        ``value`` wrapped in single quotes, with backslashes and single quotes
+        escaped.
+    """
+    return "'{}'".format(value.replace('\\', '\\\\').replace("'", "\\'"))
+
+
+def quote_value(value: Union[int, str]) -> str:
+    """
+    Quote ``value`` as a MySQL literal: an integer as a number, so that MySQL
+    compares it with an integer column exactly, and anything else as a
+    string.
+
+    Args:
+        value: the value to quote
+
+    Returns:
+        The literal.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return quote_string(value)
+
+
+def escape_for_double_quotes(value: str) -> str:
+    """
+    Escape ``value`` so that it survives being put inside a double quoted
+    string in ``bash`` unchanged.  We use this on the SQL we pass to
+    ``mysql --execute="..."`` on the remote side.
+
+    Args:
+        value: the string to escape
+
+    Returns:
+        The escaped string.
+    """
+    for char in ('\\', '"', '$', '`'):
+        value = value.replace(char, '\\' + char)
+    return value
+
+
+# ----------------------------------------
+# Output parsing
+# ----------------------------------------
+
+BATCH_ESCAPES = {
+    '\\t': '\t',
+    '\\n': '\n',
+    '\\0': '\0',
+    '\\\\': '\\',
+}
+
+
+def unescape_batch_value(value: str) -> Optional[str]:
+    """
+    Undo the escaping that ``mysql --batch`` does to column values.
+
+    Args:
+        value: a single raw column value
+
+    Returns:
+        The unescaped value, or ``None`` if the value was ``NULL``.
+    """
+    if value == 'NULL':
+        return None
+    if '\\' not in value:
+        return value
+    out = []
+    i = 0
+    while i < len(value):
+        pair = value[i:i + 2]
+        if pair in BATCH_ESCAPES:
+            out.append(BATCH_ESCAPES[pair])
+            i += 2
+        else:
+            out.append(value[i])
+            i += 1
+    return ''.join(out)
+
+
+def parse_batch_output(output: str) -> List[List[Optional[str]]]:
+    """
+    Parse the output of ``mysql --batch --skip-column-names`` into a list of
+    rows.
+
+    ``ssh_noninteractive`` gives us stdout and stderr together, so we drop
+    blank lines and the warnings that ``mysql`` prints on stderr.
+
+    Args:
+        output: the output of the ``mysql`` command
+
+    Returns:
+        A list of rows, each of which is a list of column values.
+    """
+    rows: List[List[Optional[str]]] = []
+    for line in output.splitlines():
+        line = line.rstrip('\r')
+        if not line.strip() or line.startswith('mysql: [Warning]') or line.startswith('mysqldump: [Warning]'):
+            continue
+        rows.append([unescape_batch_value(value) for value in line.split('\t')])
+    return rows
+
+
+def escape_tsv(value: str) -> str:
+    """
+    Escape ``value`` for a tab separated file that ``LOAD DATA`` can read with
+    its default field escaping.
+
+    Args:
+        value: an unescaped column value
+
+    Returns:
+        The escaped value.
+    """
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\0', '\\0')
+
+
+def column_list(columns: Optional[Sequence[str]]) -> str:
+    """
+    Render ``columns`` as a parenthesized, quoted column list for use in
+    ``INSERT`` or ``LOAD DATA`` statements.
+
+    Args:
+        columns: the column names.  Names that start with ``@`` are user
+            variables and are not quoted.
+
+    Returns:
+        The column list, or the empty string if ``columns`` is empty.
+    """
+    if not columns:
+        return ''
+    return ' ({})'.format(
+        ','.join(column if column.startswith('@') else quote_identifier(column) for column in columns)
+    )
+
+
+# ----------------------------------------
+# Server versions
+# ----------------------------------------
+
+def version_tuple(version: str) -> Tuple[int, ...]:
+    """
+    Turn a MySQL server version like ``8.0.35`` or ``5.7.44-log`` into a tuple
+    of integers we can compare, like ``(8, 0, 35)``.
+
+    Args:
+        version: the version, as from ``SELECT VERSION()``
+
+    Returns:
+        The numeric parts of ``version``, or ``()`` if it has none.
+    """
+    match = re.match(r'\s*(\d+(?:\.\d+)*)', version)
+    if match is None:
+        return ()
+    return tuple(int(part) for part in match.group(1).split('.'))
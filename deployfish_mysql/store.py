@@ -0,0 +1,320 @@
+import datetime
+import fcntl
+import hashlib
+import os
+import re
+import tempfile
+import zlib
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, TYPE_CHECKING
+
+from deployfish_mysql.snapshots import SnapshotError, read_snapshot, write_snapshot
+
+if TYPE_CHECKING:
+    from deployfish_mysql.models.mysql import MySQLDatabase
+
+
+#: Where we may end a chunk: at the end of a line, or between two rows of an extended ``INSERT``
+CHUNK_SEPARATOR_RE = re.compile(rb'\n|\),\(')
+#: How many bytes before a separator we hash to decide whether to end a chunk there
+CHUNK_WINDOW = 64
+#: About how far apart separators are in a typical dump: roughly one row
+SEPARATOR_SPACING = 256
+#: How much of a dump we read at a time
+READ_SIZE = 1024 * 1024
+#: The file in a store that writers hold a shared lock on, and :py:meth:`DumpStore.prune` an exclusive one
+LOCK_FILENAME = 'lock'
+#: The prefix of the temporary files :py:meth:`DumpStore.put_chunk` writes chunks to before renaming them
+TEMP_PREFIX = '.tmp-'
+
+
+def chunk_stream(
+    fd: BinaryIO,
+    min_size: int = 16 * 1024,
+    average_size: int = 64 * 1024,
+    max_size: int = 1024 * 1024
+) -> Iterator[bytes]:
+    """
+    Split the data in ``fd`` into content defined chunks.
+
+    We only end a chunk at a line end or between two rows of an extended
+    ``INSERT``, and only where the hash of the bytes just before that
+    separator says to.  Because where we cut depends only on the nearby
+    content, a change to a few rows in a dump changes only the chunks that
+    contain them, and the rest of the chunks are the same as last time.
+
+    Chunks are kept much smaller than the ~1MB lines ``mysqldump`` writes:
+    inserting a row moves where every later ``INSERT`` statement in the table
+    starts, which changes every chunk that holds the start of one.
+
+    Args:
+        fd: the data to split, opened in binary mode
+
+    Keyword Args:
+        min_size: never end a chunk before it is this big
+        average_size: aim for chunks about this much bigger than ``min_size``
+        max_size: always end a chunk when it gets this big
+
+    Yields:
+        The chunks, which together are the whole of ``fd``.
+    """
+    # End a chunk at about 1 in (average_size / SEPARATOR_SPACING) separators
+    mask = (1 << max((average_size // SEPARATOR_SPACING).bit_length() - 1, 0)) - 1
+    pending = bytearray()
+    scanned = 0
+    for block in iter(lambda: fd.read(READ_SIZE), b''):
+        pending += block
+        while len(pending) >= min_size:
+            cut = None
+            for match in CHUNK_SEPARATOR_RE.finditer(pending, max(scanned, min_size), min(len(pending), max_size)):
+                end = match.end()
+                if zlib.crc32(pending[end - CHUNK_WINDOW:end]) & mask == 0:
+                    cut = end
+                    break
+            if cut is None and len(pending) >= max_size:
+                cut = max_size
+            if cut is None:
+                # Leave room for a separator that straddles the next block
+                scanned = max(len(pending) - 3, 0)
+                break
+            yield bytes(pending[:cut])
+            del pending[:cut]
+            scanned = 0
+    if pending:
+        yield bytes(pending)
+
+
+class DumpStore:
+    """
+    A directory of deduplicated SQL dumps.
+
+    Each dump is split into content defined chunks by :py:func:`chunk_stream`,
+    and each chunk is saved compressed under the SHA-256 of its contents, so a
+    chunk that appears in many dumps is only stored once.  A manifest per dump
+    lists its chunks in order::
+
+        {path}/chunks/ab/abcdef0123...
+        {path}/manifests/{name}-{YYYYmmddTHHMMSSZ}.json
+
+    Manifests are snapshots (see :py:mod:`deployfish_mysql.snapshots`) of kind
+    ``dump-manifest``, with one row per chunk.
+
+    Anything that saves chunks holds a shared lock on ``{path}/lock`` (see
+    :py:meth:`lock`) from the first chunk until its manifest is written, and
+    :py:meth:`prune` holds an exclusive one, so a prune never removes the
+    chunks of a dump that is still being added.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.chunks_path = os.path.join(path, 'chunks')
+        self.manifests_path = os.path.join(path, 'manifests')
+
+    def chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunks_path, digest[:2], digest)
+
+    def lock(self, exclusive: bool = False) -> BinaryIO:
+        """
+        Wait for and take a lock on the store: a shared one, or an exclusive
+        one if ``exclusive``.
+
+        Returns:
+            The open lock file.  Closing it releases the lock, so this can be
+            used as ``with store.lock():``.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        fd = open(os.path.join(self.path, LOCK_FILENAME), 'ab')  # pylint:disable=consider-using-with
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        except BaseException:
+            fd.close()
+            raise
+        return fd
+
+    def put_chunk(self, data: bytes) -> Dict[str, Any]:
+        """
+        Save ``data`` as a chunk, unless we already have it.
+
+        Returns:
+            A dict with keys ``hash``, ``size`` and ``new``, which is ``True``
+            if we did not have the chunk already.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        new = not os.path.exists(path)
+        if new:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=TEMP_PREFIX)
+            with os.fdopen(tmp_fd, 'wb') as fd:
+                fd.write(zlib.compress(data, 6))
+            os.rename(tmp_path, path)
+        return {'hash': digest, 'size': len(data), 'new': new}
+
+    def get_chunk(self, digest: str) -> bytes:
+        """
+        Return the contents of the chunk ``digest``.
+
+        Raises:
+            SnapshotError: the chunk is missing or corrupt.
+        """
+        try:
+            with open(self.chunk_path(digest), 'rb') as fd:
+                data = zlib.decompress(fd.read())
+        except (OSError, zlib.error) as e:
+            raise SnapshotError('Chunk {} in dump store "{}" is missing or corrupt: {}'.format(digest, self.path, e))
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise SnapshotError('Chunk {} in dump store "{}" is corrupt'.format(digest, self.path))
+        return data
+
+    def add(self, fd: BinaryIO, obj: "MySQLDatabase") -> Dict[str, Any]:
+        """
+        Split the dump in ``fd`` into chunks, save the ones we do not have
+        yet, and write a manifest for it.
+
+        Args:
+            fd: the dump, opened in binary mode
+            obj: the ``MySQLDatabase`` the dump is of
+
+        Returns:
+            The output of :py:meth:`write_manifest`.
+        """
+        with self.lock():
+            return self.write_manifest(obj, self.save_chunks(fd))
+
+    def save_chunks(self, fd: BinaryIO) -> List[Dict[str, Any]]:
+        """
+        Split the dump in ``fd`` into chunks and save the ones we do not have
+        yet.  The caller must hold a shared :py:meth:`lock` until it has
+        written the manifest for them.
+
+        Returns:
+            A list of the dicts from :py:meth:`put_chunk`, one per chunk.
+        """
+        return [self.put_chunk(data) for data in chunk_stream(fd)]
+
+    def write_manifest(self, obj: "MySQLDatabase", chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Write a manifest for the dump of ``obj`` made of ``chunks``, as from
+        :py:meth:`save_chunks`.
+
+        Returns:
+            A dict with keys ``manifest`` (the manifest filename), ``chunks``,
+            ``size``, ``new_chunks`` and ``new_size``.
+        """
+        rows: List[Dict[str, Any]] = []
+        new_chunks = 0
+        new_size = 0
+        for chunk in chunks:
+            chunk = dict(chunk)
+            if chunk.pop('new'):
+                new_chunks += 1
+                new_size += chunk['size']
+            rows.append(chunk)
+        os.makedirs(self.manifests_path, exist_ok=True)
+        base = os.path.join(self.manifests_path, '{}-{}'.format(
+            obj.name,
+            datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        ))
+        manifest = '{}.json'.format(base)
+        i = 1
+        while os.path.exists(manifest):
+            manifest = '{}-{}.json'.format(base, i)
+            i += 1
+        write_snapshot(manifest, 'dump-manifest', obj, rows)
+        return {
+            'manifest': manifest,
+            'chunks': len(rows),
+            'size': sum(row['size'] for row in rows),
+            'new_chunks': new_chunks,
+            'new_size': new_size,
+        }
+
+    def manifests(self) -> List[Dict[str, Any]]:
+        """
+        Return all the manifests in the store, oldest first, each with a
+        ``filename`` key added.
+        """
+        manifests = []
+        if not os.path.isdir(self.manifests_path):
+            return manifests
+        for filename in os.listdir(self.manifests_path):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.manifests_path, filename)
+            manifest = read_snapshot(path, 'dump-manifest')
+            manifest['filename'] = path
+            manifests.append(manifest)
+        manifests.sort(key=lambda manifest: manifest['timestamp'])
+        return manifests
+
+    def stream(self, manifest: Dict[str, Any]) -> Iterator[bytes]:
+        """
+        Yield the contents of the dump described by ``manifest``, one chunk at
+        a time, holding a shared :py:meth:`lock` so that a prune waits for us.
+        """
+        with self.lock():
+            for row in manifest['rows']:
+                yield self.get_chunk(row['hash'])
+
+    def prune(self, keep_days: int, name: str = None, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Remove manifests older than ``keep_days`` days, and then any chunks
+        that no remaining manifest uses.  We always keep the newest manifest
+        for each connection, however old it is.
+
+        We hold an exclusive :py:meth:`lock` throughout, so we wait for any
+        dumps being added to finish first.
+
+        Args:
+            keep_days: keep manifests this many days old or newer
+
+        Keyword Args:
+            name: only prune manifests for this connection name
+            dry_run: only report what we would remove
+
+        Returns:
+            A dict with keys ``manifests``, ``chunks`` and ``bytes``: what we
+            removed.
+        """
+        with self.lock(exclusive=True):
+            return self._prune(keep_days, name=name, dry_run=dry_run)
+
+    def _prune(self, keep_days: int, name: str = None, dry_run: bool = False) -> Dict[str, int]:
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=keep_days)
+        manifests = self.manifests()
+        newest: Dict[str, str] = {}
+        for manifest in manifests:
+            newest[manifest['name']] = manifest['filename']
+        removed = 0
+        keep: Set[str] = set()
+        for manifest in manifests:
+            old = datetime.datetime.fromisoformat(manifest['timestamp']) < cutoff
+            if old and (name is None or manifest['name'] == name) and newest[manifest['name']] != manifest['filename']:
+                removed += 1
+                if not dry_run:
+                    os.remove(manifest['filename'])
+            else:
+                keep.update(row['hash'] for row in manifest['rows'])
+        chunks = 0
+        freed = 0
+        if os.path.isdir(self.chunks_path):
+            for directory in os.listdir(self.chunks_path):
+                for digest in os.listdir(os.path.join(self.chunks_path, directory)):
+                    if digest in keep or digest.startswith(TEMP_PREFIX):
+                        continue
+                    path = os.path.join(self.chunks_path, directory, digest)
+                    chunks += 1
+                    freed += os.path.getsize(path)
+                    if not dry_run:
+                        os.remove(path)
+        return {'manifests': removed, 'chunks': chunks, 'bytes': freed}
+
+
+def store_for_manifest(manifest_file: str) -> Optional[DumpStore]:
+    """
+    Return the :py:class:`DumpStore` that ``manifest_file`` lives in, or
+    ``None`` if it is not in a store's ``manifests`` directory.
+    """
+    directory = os.path.dirname(os.path.abspath(manifest_file))
+    if os.path.basename(directory) != 'manifests':
+        return None
+    return DumpStore(os.path.dirname(directory))
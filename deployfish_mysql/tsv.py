@@ -0,0 +1,135 @@
+import re
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from deployfish_mysql.sql import column_list, quote_identifier
+
+
+#: The name of the manifest in a TSV dump directory
+MANIFEST_FILENAME = 'manifest.json'
+#: The DDL for the tables and views, without triggers
+SCHEMA_FILENAME = 'schema.sql'
+#: The triggers, which we create after the data is loaded so they do not fire on it
+TRIGGERS_FILENAME = 'triggers.sql'
+#: Types whose values ``mysql --raw`` prints without tabs, newlines or backslashes, and
+#: never as ``NULL`` unless they are ``NULL``
+PLAIN_TYPES = {
+    'tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint', 'decimal', 'numeric',
+    'float', 'double', 'real', 'date', 'datetime', 'timestamp', 'time', 'year',
+}
+#: The session settings for both ends: times in UTC, and a 0 in an ``AUTO_INCREMENT``
+#: column stays 0, as in ``mysqldump`` output
+SESSION_SQL = "SET SESSION time_zone='+00:00';SET SESSION sql_mode='NO_AUTO_VALUE_ON_ZERO';"
+
+
+def column_kind(data_type: str) -> str:
+    """
+    Decide how to dump a column of type ``data_type``, as from
+    ``information_schema.COLUMNS.DATA_TYPE``.
+
+    Returns:
+        ``plain`` for numbers and times, which we dump as they are; ``bit`` for
+        ``BIT`` columns, which we dump as numbers; or ``text`` for everything
+        else, which we escape for ``LOAD DATA``.
+    """
+    data_type = data_type.lower()
+    if data_type == 'bit':
+        return 'bit'
+    if data_type in PLAIN_TYPES:
+        return 'plain'
+    return 'text'
+
+
+def build_tsv_columns(rows: Sequence[Sequence[Optional[str]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Turn the output of
+    :py:meth:`deployfish_mysql.models.mysql.MySQLDatabase.render_sql_for_tsv_columns`
+    into the columns to dump for each table.  Generated columns are left out,
+    since the server computes them.
+
+    Returns:
+        A dict of table name to a list of dicts with keys ``name``, ``kind``
+        (see :py:func:`column_kind`) and ``nullable``, in column order.
+    """
+    tables: Dict[str, List[Dict[str, Any]]] = {}
+    for table, column, data_type, nullable, extra in rows:
+        columns = tables.setdefault(str(table), [])
+        if 'GENERATED' in (extra or '').upper():
+            continue
+        columns.append({
+            'name': column,
+            'kind': column_kind(str(data_type)),
+            'nullable': nullable == 'YES',
+        })
+    return tables
+
+
+def select_expression(column: Dict[str, Any]) -> str:
+    """
+    Return the expression to select ``column`` with so that ``mysql --batch
+    --raw`` prints it the way ``LOAD DATA`` reads it.
+
+    ``mysql --batch`` prints both ``NULL`` and the string ``'NULL'`` as
+    ``NULL``, so we escape text ourselves, with ``NULL`` as ``\\N``.  Numbers and
+    times cannot be the string ``'NULL'``, so we leave them alone and turn
+    ``NULL`` back into ``NULL`` as we load them: see :py:func:`load_columns`.
+    """
+    name = quote_identifier(column['name'])
+    if column['kind'] == 'plain':
+        return name
+    if column['kind'] == 'bit':
+        return '{} + 0'.format(name)
+    return (
+        "IFNULL(REPLACE(REPLACE(REPLACE(REPLACE({}, '\\\\', '\\\\\\\\'), '\\t', '\\\\t'), '\\n', '\\\\n'), "
+        "CHAR(0), '\\\\0'), '\\\\N')"
+    ).format(name)
+
+
+def render_tsv_select(table: str, columns: Sequence[Dict[str, Any]]) -> str:
+    """
+    Render the SQL that selects every row of ``table`` as tab separated values
+    for ``LOAD DATA``.
+    """
+    return '{}SELECT {} FROM {};'.format(
+        SESSION_SQL,
+        ', '.join(select_expression(column) for column in columns),
+        quote_identifier(table)
+    )
+
+
+def load_columns(columns: Sequence[Dict[str, Any]]) -> str:
+    """
+    Render the column list and ``SET`` clause of the ``LOAD DATA`` statement
+    that loads a file written with :py:func:`render_tsv_select`.
+    """
+    names: List[str] = []
+    assignments: List[str] = []
+    for i, column in enumerate(columns):
+        if column['kind'] == 'text' or (column['kind'] == 'plain' and not column['nullable']):
+            names.append(column['name'])
+            continue
+        variable = '@c{}'.format(i)
+        names.append(variable)
+        value = "NULLIF({}, 'NULL')".format(variable)
+        if column['kind'] == 'bit':
+            value = 'CAST({} AS UNSIGNED)'.format(value)
+        assignments.append('{} = {}'.format(quote_identifier(column['name']), value))
+    sql = column_list(names)
+    if assignments:
+        sql += ' SET {}'.format(', '.join(assignments))
+    return sql
+
+
+def table_filename(table: str, taken: Set[str]) -> str:
+    """
+    Return a name for the data file of ``table`` that is safe on any
+    filesystem and not in ``taken`` (compared case-insensitively), and add it
+    to ``taken``.
+    """
+    base = re.sub(r'[^\w.-]', '_', table) or 'table'
+    filename = '{}.tsv.gz'.format(base)
+    i = 1
+    while filename.lower() in taken:
+        filename = '{}-{}.tsv.gz'.format(base, i)
+        i += 1
+    taken.add(filename.lower())
+    return filename
@@ -0,0 +1,66 @@
+import re
+from typing import Any, Dict, List, Sequence
+
+
+#: A table named after ``FROM``, ``JOIN``, ``UPDATE`` or ``INTO`` in a digest, optionally with its schema
+DIGEST_TABLE_RE = re.compile(
+    r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(?:`(?:[^`]|``)+`\s*\.\s*|\w+\.)?(?:`(?P<quoted>(?:[^`]|``)+)`|(?P<bare>\w+))',
+    re.IGNORECASE
+)
+
+
+def digest_tables(query: str) -> List[str]:
+    """
+    Return the tables that the normalized statement ``query`` from
+    ``performance_schema`` reads or writes, in the order they appear.
+    """
+    tables: List[str] = []
+    for match in DIGEST_TABLE_RE.finditer(query):
+        table = match.group('quoted').replace('``', '`') if match.group('quoted') else match.group('bare')
+        if table not in tables and table.upper() not in ('SELECT', 'DUAL'):
+            tables.append(table)
+    return tables
+
+
+def hot_tables(snapshot: Dict[str, Any]) -> List[str]:
+    """
+    Rank the tables in a saved ``stats`` or ``digests`` snapshot (see
+    :py:mod:`deployfish_mysql.snapshots`), hottest first.
+
+    A ``digests`` snapshot ranks tables by the rows examined by the statements
+    that use them, which is the best guide to what was in the old server's
+    buffer pool.  A ``stats`` snapshot only knows sizes, so it ranks the
+    biggest tables first.
+
+    Returns:
+        A list of table names.
+    """
+    scores: Dict[str, int] = {}
+    if snapshot['kind'] == 'digests':
+        for row in snapshot['rows']:
+            for table in digest_tables(row['query']):
+                scores[table] = scores.get(table, 0) + max(row['rows_examined'], row['calls'])
+    else:
+        for row in snapshot['rows']:
+            scores[row['table']] = row['total_length']
+    return sorted(scores, key=lambda table: (-scores[table], table))
+
+
+def balance(tables: Sequence[Dict[str, Any]], workers: int) -> List[List[str]]:
+    """
+    Share ``tables`` (dicts with keys ``table`` and ``total_length``, as from
+    :py:meth:`deployfish_mysql.models.mysql.MySQLDatabaseManager.stats`)
+    between ``workers`` so that each gets about the same number of bytes to
+    work through: biggest first, each to the least loaded worker.
+
+    Returns:
+        A list of up to ``workers`` lists of table names.
+    """
+    buckets: List[List[str]] = [[] for _ in range(max(workers, 1))]
+    loads = [0] * len(buckets)
+    for table in sorted(tables, key=lambda t: -t['total_length']):
+        i = loads.index(min(loads))
+        buckets[i].append(table['table'])
+        # Even an empty table costs a round trip
+        loads[i] += table['total_length'] + 1
+    return [bucket for bucket in buckets if bucket]
@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+def lock_chains(waits: Sequence[Tuple[str, str]]) -> List[List[str]]:
+    """
+    Turn ``(waiting thread id, blocking thread id)`` pairs into blocking
+    chains, each of which starts at a root blocker (a thread that blocks others
+    but is not itself waiting) and ends at a thread nobody is waiting on.
+
+    Threads that block each other in a cycle have no root blocker; InnoDB
+    will kill one of them as a deadlock victim soon enough, so we report the
+    cycle starting at its lowest thread id.
+
+    Args:
+        waits: the lock waits
+
+    Returns:
+        A list of chains, each a list of thread ids, root blocker first.
+    """
+    waiters: Dict[str, List[str]] = OrderedDict()
+    waiting = set()
+    for waiter, blocker in waits:
+        waiters.setdefault(blocker, [])
+        if waiter not in waiters[blocker]:
+            waiters[blocker].append(waiter)
+        waiting.add(waiter)
+    roots = [blocker for blocker in waiters if blocker not in waiting]
+    if not roots and waiters:
+        roots = [min(waiters, key=lambda thread: int(thread) if thread.isdigit() else 0)]
+    chains: List[List[str]] = []
+
+    def walk(chain: List[str]) -> None:
+        children = [thread for thread in waiters.get(chain[-1], []) if thread not in chain]
+        if not children:
+            chains.append(chain)
+        for child in children:
+            walk(chain + [child])
+
+    for root in roots:
+        walk([root])
+    return chains
+
+
+class WatchSummary:
+    """
+    Collect the samples taken by
+    :py:meth:`deployfish_mysql.models.mysql.MySQLDatabaseManager.watch` and
+    summarize them over the whole watch window.
+
+    Each sample is a list of tagged rows:
+
+    * ``P``: ``(id, user, host, db, command, time, state, info)`` from the
+      processlist
+    * ``L``: ``(waiting id, blocking id, table, seconds waited)`` for each lock wait
+    * ``X``: ``(id, seconds open, state, rows locked, rows modified, query)``
+      for each transaction open longer than the threshold
+    """
+
+    def __init__(self) -> None:
+        self.samples: int = 0
+        #: (user, host) to the connection count in each sample
+        self.connections: Dict[Tuple[str, str], List[int]] = {}
+        #: thread id of a blocker to what we know about it
+        self.blockers: Dict[str, Dict[str, Any]] = {}
+        #: thread id to what we know about its long transaction
+        self.transactions: Dict[str, Dict[str, Any]] = {}
+        #: chain, rendered as a string, to the number of samples we saw it in
+        self.chains: Dict[str, int] = {}
+
+    def add(self, rows: Sequence[Sequence[Optional[str]]]) -> Dict[str, Any]:
+        """
+        Add one sample.
+
+        Returns:
+            A dict describing just this sample, with keys ``connections``,
+            ``running``, ``waits``, ``long_transactions`` and ``chains``.
+        """
+        self.samples += 1
+        threads: Dict[str, Dict[str, Any]] = {}
+        counts: Dict[Tuple[str, str], int] = {}
+        waits = []
+        long_transactions = 0
+        for kind, *values in rows:
+            if kind == 'P':
+                thread_id, user, host, db, command, seconds, state, info = values
+                threads[thread_id] = {  # type: ignore
+                    'user': user or '',
+                    'host': host or '',
+                    'db': db or '',
+                    'command': command,
+                    'time': int(seconds or 0),
+                    'state': state or '',
+                    'info': info or '',
+                }
+                key = (user or '', host or '')
+                counts[key] = counts.get(key, 0) + 1
+            elif kind == 'L':
+                waiter, blocker, table, seconds = values
+                waits.append((waiter, blocker, table or '', int(seconds or 0)))
+            elif kind == 'X':
+                long_transactions += 1
+                thread_id, seconds, state, locked, modified, query = values
+                thread = threads.get(thread_id, {})  # type: ignore
+                transaction = self.transactions.setdefault(thread_id, {'id': thread_id})  # type: ignore
+                transaction.update({
+                    'user': thread.get('user', ''),
+                    'host': thread.get('host', ''),
+                    'age': max(int(seconds or 0), transaction.get('age', 0)),
+                    'state': state,
+                    'rows_locked': int(locked or 0),
+                    'rows_modified': int(modified or 0),
+                    'query': query or thread.get('info', '') or transaction.get('query', ''),
+                })
+        for key in set(self.connections) | set(counts):
+            self.connections.setdefault(key, [0] * (self.samples - 1)).append(counts.get(key, 0))
+        chains = lock_chains([(waiter, blocker) for waiter, blocker, _, _ in waits])
+        for chain in chains:
+            rendered = ' <- '.join(chain)
+            self.chains[rendered] = self.chains.get(rendered, 0) + 1
+        waiters_of: Dict[str, List[Tuple[str, str, int]]] = {}
+        for waiter, blocker, table, seconds in waits:
+            waiters_of.setdefault(blocker, []).append((waiter, table, seconds))
+        for blocker, blocked in waiters_of.items():
+            thread = threads.get(blocker, {})
+            entry = self.blockers.setdefault(blocker, {
+                'id': blocker,
+                'samples': 0,
+                'waiters': 0,
+                'max_wait': 0,
+                'tables': '',
+            })
+            entry['samples'] += 1
+            entry['waiters'] = max(entry['waiters'], len(blocked))
+            entry['max_wait'] = max([entry['max_wait']] + [seconds for _, _, seconds in blocked])
+            entry['tables'] = ','.join(sorted(
+                set(filter(None, entry['tables'].split(','))) | {table for _, table, _ in blocked if table}
+            ))
+            for key in ('user', 'host', 'command', 'state', 'info'):
+                if thread.get(key) or key not in entry:
+                    entry[key] = thread.get(key, '')
+        return {
+            'connections': len(threads),
+            'running': len([thread for thread in threads.values() if thread['command'] not in ('Sleep', 'Daemon')]),
+            'waits': len(waits),
+            'long_transactions': long_transactions,
+            'chains': [' <- '.join(chain) for chain in chains],
+        }
+
+    def report(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Summarize all the samples we have seen.
+
+        Returns:
+            A dict with these keys, each a list of dicts suitable for a table
+            renderer:
+
+            * ``connections``: average and peak connections per user and client
+              host, busiest first
+            * ``blockers``: threads that blocked others, worst first
+            * ``chains``: the blocking chains we saw, most frequent first
+            * ``long_transactions``: transactions open longer than the
+              threshold, oldest first
+        """
+        connections = []
+        for (user, host), counts in self.connections.items():
+            counts = counts + [0] * (self.samples - len(counts))
+            connections.append({
+                'user': user,
+                'host': host,
+                'average': round(sum(counts) / max(self.samples, 1), 1),
+                'max': max(counts),
+            })
+        connections.sort(key=lambda r: (-r['average'], -r['max'], r['user'], r['host']))
+        blockers = sorted(
+            self.blockers.values(),
+            key=lambda r: (-r['samples'], -r['waiters'], -r['max_wait'])
+        )
+        chains = [
+            {'chain': chain, 'samples': count}
+            for chain, count in sorted(self.chains.items(), key=lambda item: (-item[1], item[0]))
+        ]
+        transactions = sorted(self.transactions.values(), key=lambda r: -r['age'])
+        return {
+            'connections': connections,
+            'blockers': blockers,
+            'chains': chains,
+            'long_transactions': transactions,
+        }
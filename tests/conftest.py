@@ -0,0 +1,135 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+import types
+
+import pytest
+
+from deployfish_mysql.models.mysql import MySQLDatabase
+from deployfish_mysql.sql import escape_tsv
+
+
+#: A stand-in for ``/usr/bin/mysql``: it prints the warning the real client prints
+#: when given a password on the command line, then either saves its stdin (for
+#: ``LOAD DATA LOCAL INFILE '/dev/stdin'``) and prints a row count, or prints
+#: the output of the first response in ``$FAKE_MYSQL_RESPONSES`` that matches
+#: the SQL it was given (see :py:meth:`LocalCluster.respond`), or the rows in
+#: ``$FAKE_MYSQL_ROWS``.  It appends the SQL it runs to ``$FAKE_MYSQL_LOG``.
+FAKE_MYSQL = '''#!{python}
+import json
+import os
+import sys
+
+sys.stderr.write('mysql: [Warning] Using a password on the command line interface can be insecure.\\n')
+sys.stderr.flush()
+if '--local-infile=1' in sys.argv:
+    data = sys.stdin.buffer.read()
+    with open(os.environ['FAKE_MYSQL_LOADED'], 'wb') as fd:
+        fd.write(data)
+    print(data.count(b'\\n'))
+    sys.exit(0)
+sql = [arg[len('--execute='):] for arg in sys.argv if arg.startswith('--execute=')]
+sql = sql[0] if sql else sys.stdin.read()
+with open(os.environ['FAKE_MYSQL_LOG'], 'a') as fd:
+    fd.write(sql + '\\0')
+if os.path.exists(os.environ['FAKE_MYSQL_RESPONSES']):
+    with open(os.environ['FAKE_MYSQL_RESPONSES']) as fd:
+        responses = json.load(fd)
+    for pattern, output in responses:
+        if pattern in sql:
+            if output.startswith('ERROR'):
+                sys.stderr.write(output)
+                sys.exit(1)
+            sys.stdout.write(output)
+            sys.exit(0)
+with open(os.environ['FAKE_MYSQL_ROWS'], 'rb') as fd:
+    sys.stdout.buffer.write(fd.read())
+'''
+
+
+class LocalCluster:
+    """
+    A cluster whose ``ssh_noninteractive`` runs the command in a local shell,
+    with ``/usr/bin/mysql`` replaced by ``mysql``, and with stderr sent
+    wherever stdout goes, as deployfish does.
+    """
+
+    def __init__(self, mysql: str, responses: str = None, log: str = None) -> None:
+        self.mysql = mysql
+        self.responses = responses
+        self.log = log
+        self.name = 'local'
+        self.commands = []
+
+    def respond(self, pattern: str, rows) -> None:
+        """
+        Make the fake ``mysql`` print ``rows`` (a list of lists, printed as
+        ``mysql --batch`` would, or a string printed as it is) for any SQL containing
+        ``pattern``.  A string starting with ``ERROR`` makes it fail instead.
+        """
+        if not isinstance(rows, str):
+            rows = ''.join(
+                '\t'.join('NULL' if value is None else escape_tsv(str(value)) for value in row) + '\n' for row in rows
+            )
+        responses = []
+        if os.path.exists(self.responses):
+            with open(self.responses, encoding='utf-8') as fd:
+                responses = json.load(fd)
+        responses.append([pattern, rows])
+        with open(self.responses, 'w', encoding='utf-8') as fd:
+            json.dump(responses, fd)
+
+    @property
+    def sql(self):
+        """
+        The SQL of each ``mysql`` command run so far, in order.
+        """
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log, encoding='utf-8') as fd:
+            return fd.read().split('\0')[:-1]
+
+    def ssh_noninteractive(self, command, verbose=False, output=None, input_data=None, ssh_target=None):
+        command = command.replace('/usr/bin/mysql ', '{} '.format(self.mysql))
+        self.commands.append(command)
+        text = isinstance(input_data, str)
+        p = subprocess.run(
+            ['/bin/bash', '-c', command],
+            input=input_data.encode('utf-8') if text else None,
+            stdin=None if text else input_data if input_data is not None else subprocess.DEVNULL,
+            stdout=output if output is not None else subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            check=False
+        )
+        return p.returncode == 0, p.stdout.decode('utf-8', errors='replace') if output is None else ''
+
+
+def make_database(cluster=None, **data) -> MySQLDatabase:
+    """
+    Make a ``MySQLDatabase`` from a ``mysql:`` entry, with its service (and so
+    its cluster) already filled in.
+    """
+    entry = {'name': 'test', 'service': 'svc', 'host': 'db.example.com', 'db': 'app', 'user': 'app', 'pass': 'secret'}
+    entry.update(data)
+    obj = MySQLDatabase.new(entry, 'deployfish')
+    obj.cache['service'] = types.SimpleNamespace(name=entry['service'], cluster=cluster)
+    return obj
+
+
+@pytest.fixture
+def database():
+    return make_database
+
+
+@pytest.fixture
+def local_cluster(tmp_path, monkeypatch):
+    mysql = tmp_path / 'mysql'
+    mysql.write_text(FAKE_MYSQL.format(python=sys.executable))
+    mysql.chmod(mysql.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv('FAKE_MYSQL_ROWS', str(tmp_path / 'rows.tsv'))
+    monkeypatch.setenv('FAKE_MYSQL_LOADED', str(tmp_path / 'loaded.tsv'))
+    monkeypatch.setenv('FAKE_MYSQL_RESPONSES', str(tmp_path / 'responses.json'))
+    monkeypatch.setenv('FAKE_MYSQL_LOG', str(tmp_path / 'sql.log'))
+    return LocalCluster(str(mysql), responses=str(tmp_path / 'responses.json'), log=str(tmp_path / 'sql.log'))
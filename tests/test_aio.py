@@ -0,0 +1,145 @@
+import asyncio
+import io
+import os
+import time
+
+import pytest
+
+from deployfish_mysql.aio import AsyncMySQLDatabaseManager, ssh_noninteractive
+
+
+class LocalProvider:
+
+    def __init__(self, instance, verbose=False):
+        self.instance = instance
+
+    def ssh_command(self, command):
+        return command
+
+
+class StubCluster:
+    """
+    A cluster whose ssh provider runs commands in a local shell.
+    """
+
+    class OperationFailed(Exception):
+        pass
+
+    class NoSSHTargetAvailable(Exception):
+        pass
+
+    providers = {'local': LocalProvider}
+    ssh_proxy_type = 'local'
+
+    def __init__(self, name='local'):
+        self.ssh_target = type('Instance', (), {'name': name})()
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    # ssh_noninteractive runs a login shell; keep the user's profile out of the output
+    monkeypatch.setenv('HOME', str(tmp_path))
+
+
+def run(command, **kwargs):
+    return asyncio.run(ssh_noninteractive(StubCluster(), command, **kwargs))
+
+
+def wait_for(path):
+    for _ in range(100):
+        if os.path.exists(path) and open(path).read().strip():
+            return int(open(path).read())
+        time.sleep(0.05)
+    raise AssertionError('the command never started')
+
+
+def assert_killed(pid):
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+def test_output():
+    success, output = run('echo out; echo err >&2; exit 3')
+    assert success is False
+    assert output.endswith('out\nerr\n')
+
+
+@pytest.mark.parametrize('input_data', [
+    'text\nmore\n',
+    b'text\nmore\n',
+    [b'text\n', b'more\n'],
+])
+def test_feed_plain_data(input_data):
+    assert run('cat', input_data=input_data) == (True, 'text\nmore\n')
+
+
+def test_feed_files(tmp_path):
+    data = tmp_path / 'data'
+    data.write_bytes(b'x' * 3000000)
+    with open(data, 'rb') as fd:
+        success, output = run('wc -c', input_data=fd)
+    assert (success, output.split()[-1]) == (True, '3000000')
+    with open(data, encoding='utf-8') as fd:
+        success, output = run('wc -c', input_data=fd)
+    assert (success, output.split()[-1]) == (True, '3000000')
+
+
+def test_feed_async_iterable():
+    async def blocks():
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield b'block %d\n' % i
+
+    assert run('cat', input_data=blocks()) == (True, 'block 0\nblock 1\nblock 2\n')
+
+
+def test_output_to_file():
+    fd = io.BytesIO()
+    assert run('cat', input_data=b'data', output=fd) == (True, '')
+    assert fd.getvalue().endswith(b'data')
+
+
+def test_timeout_kills_the_command(tmp_path):
+    pidfile = str(tmp_path / 'pid')
+    started = time.time()
+    with pytest.raises(StubCluster.OperationFailed) as e:
+        run('echo $$ > {}; exec sleep 30'.format(pidfile), timeout=1)
+    assert 'Timed out after 1s' in str(e.value)
+    assert time.time() - started < 10
+    assert_killed(wait_for(pidfile))
+
+
+def test_cancel_kills_the_command(tmp_path):
+    pidfile = str(tmp_path / 'pid')
+
+    async def main():
+        task = asyncio.ensure_future(
+            ssh_noninteractive(StubCluster(), 'echo $$ > {}; exec sleep 30'.format(pidfile))
+        )
+        pid = await asyncio.get_running_loop().run_in_executor(None, wait_for, pidfile)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return pid
+
+    assert_killed(asyncio.run(main()))
+
+
+def test_bulk_returns_exceptions_in_place():
+    manager = AsyncMySQLDatabaseManager()
+
+    async def times_ten(obj):
+        if obj == 2:
+            raise ValueError('bad')
+        if obj == 4:
+            await asyncio.sleep(30)
+        return obj * 10
+
+    manager.times_ten = times_ten
+    try:
+        results = asyncio.run(manager.bulk('times_ten', [1, 2, 3, 4], concurrency=2, timeout=1))
+    finally:
+        manager.close()
+    assert results[0] == 10 and results[2] == 30
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[3], asyncio.TimeoutError)
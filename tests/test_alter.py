@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+
+STATE = {
+    'table': 't',
+    'alter': 'ADD COLUMN `c` int',
+    'shadow': '_t_new',
+    'key': 'id',
+    'columns': ['id', 'note'],
+    'copied': 0,
+    'chunks': 0,
+}
+
+
+def metadata(dependents=()):
+    return [['K', 'id'], ['C', 'id', 'int'], ['C', 'note', 'text'], ['C', 'gone', 'int']] + list(dependents)
+
+
+def respond(cluster, dependents=(), key_range=(1, 2500)):
+    cluster.respond("table_name = '_t_new' AND index_name", [['K', 'id'], ['C', 'id', 'int'], ['C', 'note', 'text']])
+    cluster.respond("index_name = 'PRIMARY'", metadata(dependents))
+    cluster.respond('SELECT MIN(', [key_range])
+    cluster.respond("Threads_running", [['Threads_running', '1']])
+    cluster.respond('INSERT LOW_PRIORITY', [['1000']])
+    cluster.respond('', '')
+
+
+def test_render_sql_for_alter_triggers(database):
+    sql = database().render_sql_for_alter_triggers(STATE)
+    assert sql.startswith('DELIMITER ;;\n')
+    assert (
+        'CREATE TRIGGER `t_osc_ins` AFTER INSERT ON `t` FOR EACH ROW '
+        'REPLACE INTO `_t_new` (`id`, `note`) VALUES (NEW.`id`, NEW.`note`);;\n'
+    ) in sql
+    assert (
+        'CREATE TRIGGER `t_osc_upd` AFTER UPDATE ON `t` FOR EACH ROW BEGIN '
+        'DELETE IGNORE FROM `_t_new` WHERE `id` = OLD.`id`; REPLACE INTO `_t_new`'
+    ) in sql
+    assert (
+        'CREATE TRIGGER `t_osc_del` AFTER DELETE ON `t` FOR EACH ROW '
+        'DELETE IGNORE FROM `_t_new` WHERE `id` = OLD.`id`;;\n'
+    ) in sql
+    assert sql.endswith('DELIMITER ;\n')
+
+
+def test_render_sql_for_alter_copy(database):
+    assert database().render_sql_for_alter_copy(STATE, 1, 1001) == (
+        'INSERT LOW_PRIORITY IGNORE INTO `app`.`_t_new` (`id`, `note`) SELECT `id`, `note` FROM `app`.`t` '
+        'FORCE INDEX (PRIMARY) WHERE `id` >= 1 AND `id` < 1001 LOCK IN SHARE MODE;SELECT ROW_COUNT();'
+    )
+
+
+def test_render_sql_for_alter_swap(database):
+    sql = database().render_sql_for_alter_swap(STATE)
+    assert sql.startswith('RENAME TABLE `t` TO `_t_old`, `_t_new` TO `t`;\n')
+    assert 'DROP TRIGGER IF EXISTS `t_osc_ins`;\n' in sql
+    assert sql.endswith('DROP TABLE `_t_old`;\n')
+    assert 'DROP TABLE' not in database().render_sql_for_alter_swap(STATE, keep_old=True)
+
+
+@pytest.mark.parametrize('dependent, message', [
+    (['F', 'fk_user', 'fk_user -> users'], 'foreign keys (fk_user -> users)'),
+    (['R', 'fk_t', 'app.child.fk_t'], 'foreign keys in other tables that reference it (app.child.fk_t)'),
+    (['T', 'audit_t', 'audit_t'], 'triggers (audit_t)'),
+])
+def test_refuses_tables_with_foreign_keys_or_triggers(tmp_path, local_cluster, database, dependent, message):
+    respond(local_cluster, dependents=[dependent])
+    obj = database(cluster=local_cluster)
+    with pytest.raises(obj.OperationFailed) as e:
+        obj.online_alter('t', alter='ADD COLUMN `c` int', state_file=str(tmp_path / 'state.json'))
+    assert message in str(e.value)
+    # We refused before creating anything
+    assert len(local_cluster.sql) == 1
+    assert not os.path.exists(tmp_path / 'state.json')
+
+
+def test_pause_and_resume(tmp_path, local_cluster, database):
+    respond(local_cluster)
+    obj = database(cluster=local_cluster)
+    state_file = str(tmp_path / 'state.json')
+
+    def pause(message):
+        if 'copied' in message:
+            open(state_file + '.pause', 'w').close()
+
+    with pytest.raises(obj.OperationFailed) as e:
+        obj.online_alter('t', alter='ALTER TABLE t ADD COLUMN `c` int;', chunk_size=1000, state_file=state_file,
+                         callback=pause)
+    assert 'Paused' in str(e.value)
+    with open(state_file, encoding='utf-8') as fd:
+        state = json.load(fd)
+    assert (state['alter'], state['columns'], state['next'], state['copied']) == (
+        'ADD COLUMN `c` int', ['id', 'note'], 1001, 1000
+    )
+    assert any('CREATE TABLE `_t_new` LIKE `t`;\nALTER TABLE `_t_new` ADD COLUMN `c` int;' in sql
+               for sql in local_cluster.sql)
+    assert not any('RENAME TABLE' in sql for sql in local_cluster.sql)
+
+    os.remove(state_file + '.pause')
+    result = obj.online_alter('t', resume=True, chunk_size=1000, state_file=state_file)
+    assert (result['rows'], result['chunks']) == (3000, 3)
+    copies = [sql for sql in local_cluster.sql if 'INSERT LOW_PRIORITY' in sql]
+    assert ['`id` >= 1 AND `id` < 1001', '`id` >= 1001 AND `id` < 2001', '`id` >= 2001 AND `id` < 3001'] == [
+        sql[sql.index('`id` >='):sql.index(' LOCK')] for sql in copies
+    ]
+    assert local_cluster.sql[-1].startswith('RENAME TABLE `t` TO `_t_old`, `_t_new` TO `t`;')
+    assert not os.path.exists(state_file)
+
+
+def test_resume_without_state_file(tmp_path, local_cluster, database):
+    obj = database(cluster=local_cluster)
+    with pytest.raises(obj.OperationFailed) as e:
+        obj.online_alter('t', resume=True, state_file=str(tmp_path / 'missing.json'))
+    assert 'there is no state file' in str(e.value)
@@ -0,0 +1,79 @@
+from deployfish_mysql.audit import AUDIT_MARKER, SCHEMA_PRIVILEGES, audit_entries, parse_audit_output, password_digest
+
+
+def audit_rows(users, schemas, databases, global_privileges=(), tables=(), fingerprint='abc'):
+    rows = [[AUDIT_MARKER, 'fingerprint', fingerprint], [AUDIT_MARKER, 'users']]
+    rows.extend(users)
+    rows.append([AUDIT_MARKER, 'global'])
+    rows.extend(global_privileges)
+    rows.append([AUDIT_MARKER, 'schemas'])
+    rows.extend(schemas)
+    rows.append([AUDIT_MARKER, 'tables'])
+    rows.extend(tables)
+    rows.append([AUDIT_MARKER, 'databases'])
+    rows.extend(databases)
+    return rows
+
+
+def grants(account, db, privileges=SCHEMA_PRIVILEGES):
+    return [[account, db, privilege, 'NO'] for privilege in sorted(privileges)]
+
+
+def test_parse_audit_output():
+    rows = audit_rows(
+        users=[['app', '%', None, password_digest('secret')]],
+        global_privileges=[["'app'@'%'", 'USAGE', 'NO'], ["'admin'@'%'", 'SELECT', 'YES']],
+        schemas=[["'app'@'%'", 'my\\_app', 'SELECT', 'NO'], ["'app'@'%'", 'my\\_app', 'INSERT', 'YES']],
+        tables=[["'app'@'%'", 'other', 't', 'SELECT', 'NO']],
+        databases=[['my_app', 'UTF8MB3', 'utf8mb3_unicode_ci']],
+    )
+    fingerprint, snapshot = parse_audit_output(rows)
+    assert fingerprint == 'abc'
+    assert snapshot == {
+        'users': {"'app'@'%'": {'plugin': 'mysql_native_password', 'password': password_digest('secret')}},
+        'global': {"'admin'@'%'": ['GRANT OPTION', 'SELECT']},
+        'schemas': {"'app'@'%'": {'my_app': ['GRANT OPTION', 'INSERT', 'SELECT']}},
+        'tables': {"'app'@'%'": {'other.t': ['SELECT']}},
+        'databases': {'my_app': {'character_set': 'utf8', 'collation': 'utf8_unicode_ci'}},
+    }
+
+
+def test_parse_audit_output_without_snapshot():
+    assert parse_audit_output([[AUDIT_MARKER, 'fingerprint', 'abc']]) == ('abc', None)
+
+
+def test_audit_entries_clean(database):
+    objs = [database(), database(name='other', db='other')]
+    rows = audit_rows(
+        users=[['app', '%', 'mysql_native_password', password_digest('secret')]],
+        schemas=grants("'app'@'%'", 'app') + grants("'app'@'%'", 'other'),
+        databases=[['app', 'utf8', 'utf8_unicode_ci'], ['other', 'utf8', 'utf8_unicode_ci']],
+    )
+    assert audit_entries(parse_audit_output(rows)[1], objs) == []
+
+
+def test_audit_entries_problems(database):
+    rows = audit_rows(
+        users=[['app', '%', 'mysql_native_password', password_digest('wrong')], ['app', 'localhost', None, None]],
+        global_privileges=[["'app'@'%'", 'PROCESS', 'NO']],
+        schemas=grants("'app'@'%'", 'app', SCHEMA_PRIVILEGES - {'DROP'}) + grants("'app'@'%'", 'scratch', ['SELECT']),
+        databases=[['app', 'latin1', 'latin1_swedish_ci']],
+    )
+    problems = [entry['problem'] for entry in audit_entries(parse_audit_output(rows)[1], [database()])]
+    assert problems == [
+        'database character set is latin1, not utf8',
+        'database collation is latin1_swedish_ci, not utf8_unicode_ci',
+        "the user also has the accounts 'app'@'localhost', which may match first",
+        'password does not match deployfish.yml',
+        'missing privileges on app: DROP',
+        'global privileges: PROCESS',
+        'privileges on other databases: scratch',
+    ]
+
+
+def test_audit_entries_missing_database_and_account(database):
+    rows = audit_rows(users=[['root', 'localhost', None, None]], schemas=[], databases=[])
+    assert [entry['problem'] for entry in audit_entries(parse_audit_output(rows)[1], [database()])] == [
+        'database "app" does not exist',
+        "account 'app'@'%' does not exist",
+    ]
@@ -0,0 +1,65 @@
+import datetime
+import gzip
+import io
+
+import pytest
+
+from deployfish_mysql.binlog import compress_segment, copy_segment, event_time
+
+
+EVENTS = (
+    b"mysqlbinlog: [Warning] Using a password on the command line interface can be insecure.\n"
+    b"# at 4\n"
+    b"#261019 12:00:01 server id 1  end_log_pos 120 CRC32 0x0 \tQuery\tthread_id=5\n"
+    b"BEGIN\n/*!*/;\n"
+    b"INSERT INTO `t` VALUES ('a\r\nb','c\rd')\n/*!*/;\n"
+    b"# at 200\n"
+    b"#261019 12:05:00 server id 1  end_log_pos 300 CRC32 0x0 \tQuery\tthread_id=5\n"
+    b"INSERT INTO `t` VALUES ('later')\n/*!*/;\n"
+)
+
+
+def compress(tmp_path) -> str:
+    raw = tmp_path / 'raw.sql'
+    raw.write_bytes(EVENTS)
+    segment = str(tmp_path / 'segment.binlog.sql.gz')
+    assert compress_segment(str(raw), segment) == 2
+    return segment
+
+
+def test_segments_keep_carriage_returns(tmp_path):
+    segment = compress(tmp_path)
+    with gzip.open(segment) as fd:
+        assert fd.read() == EVENTS.split(b'\n', 1)[1]
+    fd = io.BytesIO()
+    assert copy_segment(segment, fd) is False
+    assert b"('a\r\nb','c\rd')" in fd.getvalue()
+    assert fd.getvalue() == EVENTS.split(b'\n', 1)[1]
+
+
+def test_copy_segment_stops_before_until(tmp_path):
+    segment = compress(tmp_path)
+    fd = io.BytesIO()
+    assert copy_segment(segment, fd, until=datetime.datetime(2026, 10, 19, 12, 1)) is True
+    assert b"('a\r\nb','c\rd')" in fd.getvalue()
+    assert b'later' not in fd.getvalue()
+    assert b'# at 200' not in fd.getvalue()
+    assert fd.getvalue().endswith(b'ROLLBACK /*!*/;\nDELIMITER ;\n')
+
+
+def test_event_time():
+    assert event_time(b'#261019  9:05:00 server id 1  end_log_pos 300\n') == datetime.datetime(2026, 10, 19, 9, 5)
+    assert event_time(b'# at 200\n') is None
+
+
+@pytest.mark.parametrize('version, statement', [
+    ('5.7.44-log', 'SHOW MASTER STATUS;'),
+    ('8.0.35', 'SHOW MASTER STATUS;'),
+    ('8.4.3', 'SHOW BINARY LOG STATUS;'),
+])
+def test_binlog_status(local_cluster, database, version, statement):
+    local_cluster.respond(statement, [['mysql-bin-changelog.000042', '1234', '', '', '']])
+    obj = database(cluster=local_cluster)
+    obj.cache['server_version'] = version
+    assert obj.objects.binlog_status(obj) == ('mysql-bin-changelog.000042', 1234)
+    assert local_cluster.sql == [statement]
@@ -0,0 +1,48 @@
+import hashlib
+import io
+
+from deployfish_mysql.checksums import TrailerReceiver, receive_with_trailer
+
+
+def trailer(data: bytes) -> bytes:
+    return b'\n-- deployfish-sha256: ' + hashlib.sha256(data).hexdigest().encode('ascii') + b'\n'
+
+
+def test_trailer_is_stripped_however_the_data_is_split():
+    data = b''.join(b'row %d\n' % i for i in range(1000))
+    sent = data + trailer(data)
+    for size in (1, 10, 89, 90, 4096, len(sent)):
+        destination = io.BytesIO()
+        receiver = TrailerReceiver(destination)
+        for i in range(0, len(sent), size):
+            receiver.write(sent[i:i + size])
+        sha256, remote, written = receiver.finish()
+        assert destination.getvalue() == data
+        assert sha256 == remote == hashlib.sha256(data).hexdigest()
+        assert written == len(data)
+
+
+def test_empty_data_with_trailer():
+    destination = io.BytesIO()
+    sha256, remote, written = receive_with_trailer(io.BytesIO(trailer(b'')), destination)
+    assert destination.getvalue() == b''
+    assert sha256 == remote
+    assert written == 0
+
+
+def test_missing_trailer_passes_everything_through():
+    data = b'no trailer here\n-- deployfish-sha256: not hex\n'
+    destination = io.BytesIO()
+    sha256, remote, written = receive_with_trailer(io.BytesIO(data), destination)
+    assert destination.getvalue() == data
+    assert remote is None
+    assert sha256 == hashlib.sha256(data).hexdigest()
+    assert written == len(data)
+
+
+def test_corrupted_data_does_not_match_remote():
+    data = b'some rows\n'
+    destination = io.BytesIO()
+    sha256, remote, _ = receive_with_trailer(io.BytesIO(b'some rowz\n' + trailer(data)), destination)
+    assert remote == hashlib.sha256(data).hexdigest()
+    assert sha256 != remote
@@ -0,0 +1,76 @@
+from deployfish_mysql.coalesce import InsertCoalescer, split_statements
+
+
+SCRIPT = (
+    b"-- a comment; with a semicolon\n"
+    b"CREATE TABLE `t` (`id` int, `note` text);\n"
+    b"INSERT INTO `t` VALUES (1,'a;b');\n"
+    b"INSERT INTO `t` VALUES (2,'it''s');\n"
+    b"/*!40000 ALTER TABLE `t` ENABLE KEYS */;\n"
+    b"DELIMITER ;;\n"
+    b"CREATE TRIGGER `tr` BEFORE INSERT ON `t` FOR EACH ROW BEGIN SET NEW.id = 1; END ;;\n"
+    b"DELIMITER ;\n"
+    b"INSERT INTO `t` VALUES (3,\"x\\\";\");\n"
+)
+
+
+def blocks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_split_statements_keeps_everything():
+    statements = list(split_statements([SCRIPT]))
+    assert b''.join(statements) == SCRIPT
+    assert [statement.strip().split(b'\n')[-1][:20] for statement in statements] == [
+        b'CREATE TABLE `t` (`i',
+        b'INSERT INTO `t` VALU',
+        b'INSERT INTO `t` VALU',
+        b'/*!40000 ALTER TABLE',
+        b'DELIMITER ;;',
+        b'CREATE TRIGGER `tr` ',
+        b'DELIMITER ;',
+        b'INSERT INTO `t` VALU',
+        b'',
+    ]
+
+
+def test_split_statements_does_not_depend_on_block_boundaries():
+    expected = list(split_statements([SCRIPT]))
+    for size in (1, 2, 3, 7, 64):
+        assert list(split_statements(blocks(SCRIPT, size))) == expected
+
+
+def test_coalescer_merges_runs_of_inserts():
+    coalescer = InsertCoalescer()
+    output = b''.join(coalescer([SCRIPT]))
+    assert b"INSERT INTO `t` VALUES (1,'a;b'),(2,'it''s');" in output
+    assert b'CREATE TRIGGER `tr` BEFORE INSERT ON `t` FOR EACH ROW BEGIN SET NEW.id = 1; END ;;' in output
+    assert coalescer.inserts == 2
+    assert coalescer.merged == 1
+
+
+def test_coalescer_does_not_merge_across_tables_or_statements():
+    script = (
+        b"INSERT INTO `a` VALUES (1);\n"
+        b"INSERT INTO `b` VALUES (1);\n"
+        b"INSERT INTO `b` VALUES (2);\n"
+        b"DELETE FROM `b`;\n"
+        b"INSERT INTO `b` VALUES (3);\n"
+    )
+    coalescer = InsertCoalescer()
+    assert b''.join(coalescer(blocks(script, 5))) == (
+        b"INSERT INTO `a` VALUES (1);"
+        b"\nINSERT INTO `b` VALUES (1),(2);"
+        b"\nDELETE FROM `b`;"
+        b"\nINSERT INTO `b` VALUES (3);\n"
+    )
+    assert coalescer.statements == 5
+
+
+def test_coalescer_respects_max_statement_size():
+    script = b''.join(b"INSERT INTO `t` VALUES (%d);\n" % i for i in range(10))
+    coalescer = InsertCoalescer(max_statement_size=60)
+    statements = [statement for statement in split_statements(coalescer([script])) if statement.strip()]
+    assert all(len(statement) <= 60 for statement in statements)
+    assert len(statements) > 1
+    assert b''.join(statements).count(b'(') == 10
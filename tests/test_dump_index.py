@@ -0,0 +1,62 @@
+from deployfish_mysql.dump_index import build_dump_index, read_sections
+
+
+HEADER = (
+    b'-- MySQL dump 10.13\n'
+    b'/*!40101 SET @OLD_SQL_MODE=@@SQL_MODE */;\n'
+)
+ORDERS = (
+    b'\n--\n-- Table structure for table `orders`\n--\n\n'
+    b'CREATE TABLE `orders` (`id` int);\n'
+    b'\n--\n-- Dumping data for table `orders`\n--\n\n'
+    b'INSERT INTO `orders` VALUES (1),(2);\n'
+)
+ODD = (
+    b'\n--\n-- Table structure for table `odd``name`\n--\n\n'
+    b'CREATE TABLE `odd``name` (`id` int);\n'
+)
+FOOTER = (
+    b'/*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;\n'
+    b'/*!40101 SET SQL_MODE=@OLD_SQL_MODE */;\n'
+    b'-- Dump completed\n'
+)
+
+
+def write(tmp_path, data: bytes) -> str:
+    filename = tmp_path / 'dump.sql'
+    filename.write_bytes(data)
+    return str(filename)
+
+
+def test_sections(tmp_path):
+    data = HEADER + ORDERS + ODD + FOOTER
+    filename = write(tmp_path, data)
+    sections = build_dump_index(filename)
+    assert [(section['section'], section.get('table')) for section in sections] == [
+        ('header', None), ('table', 'orders'), ('table', 'odd`name'), ('footer', None),
+    ]
+    header, orders, odd, footer = sections
+    assert data[header['start']:header['end']] == HEADER + b'\n'
+    assert data[orders['start']:orders['end']] == ORDERS[1:] + b'\n'
+    assert data[orders['data_start']:orders['end']].startswith(b'--\n-- Dumping data for table `orders`')
+    assert odd['data_start'] is None
+    assert data[footer['start']:footer['end']] == FOOTER
+    assert b''.join(read_sections(filename, sections)) == data
+
+
+def test_stderr_before_the_header_is_skipped(tmp_path):
+    warning = b'mysqldump: [Warning] Using a password on the command line interface can be insecure.\n'
+    filename = write(tmp_path, warning + HEADER + ORDERS + FOOTER)
+    header = build_dump_index(filename)[0]
+    assert header['start'] == len(warning)
+
+
+def test_truncated_dump_has_an_empty_footer(tmp_path):
+    data = HEADER + ORDERS
+    sections = build_dump_index(write(tmp_path, data))
+    assert sections[-1] == {'section': 'footer', 'start': len(data), 'end': len(data)}
+    assert sections[-2]['end'] == len(data)
+
+
+def test_empty_dump(tmp_path):
+    assert build_dump_index(write(tmp_path, b'')) == []
@@ -0,0 +1,29 @@
+import types
+
+
+def test_import_counts_rows(tmp_path, local_cluster, database):
+    data = tmp_path / 'people.csv'
+    data.write_text('ann,30\nbob,40\ncat,50\n')
+    obj = database(cluster=local_cluster)
+    rows, _ = obj.import_file('people', str(data))
+    assert rows == 3
+    assert (tmp_path / 'loaded.tsv').read_bytes() == data.read_bytes()
+
+
+def test_import_batches(tmp_path, local_cluster, database):
+    data = tmp_path / 'people.tsv'
+    data.write_text('ann\t30\nbob\t40\ncat\t50\n')
+    obj = database(cluster=local_cluster)
+    rows, _ = obj.import_file('people', str(data), batch_size=2)
+    assert rows == 3
+    assert len(local_cluster.commands) == 2
+
+
+def test_import_without_a_row_count(tmp_path, database):
+    data = tmp_path / 'people.csv'
+    data.write_text('ann,30\n')
+    warning = 'mysql: [Warning] Using a password on the command line interface can be insecure.\n'
+    cluster = types.SimpleNamespace(ssh_noninteractive=lambda command, **kwargs: (True, warning))
+    obj = database(cluster=cluster)
+    assert obj.import_file('people', str(data)) == (None, warning)
+    assert obj.import_file('people', str(data), batch_size=1) == (None, warning)
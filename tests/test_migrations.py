@@ -0,0 +1,81 @@
+import pytest
+
+from deployfish_mysql.migrations import MIGRATED_MARKER, migration_files, natural_key, terminate
+
+
+def test_natural_key():
+    names = ['10_orders.sql', '2_users.sql', '1_init.SQL', '02_Accounts.sql']
+    assert sorted(names, key=natural_key) == ['1_init.SQL', '02_Accounts.sql', '2_users.sql', '10_orders.sql']
+
+
+def test_migration_files(tmp_path):
+    for name in ('10_b.sql', '9_a.sql', 'notes.txt'):
+        (tmp_path / name).write_text('SELECT 1;')
+    (tmp_path / '11_dir.sql').mkdir()
+    assert [row['filename'] for row in migration_files(str(tmp_path))] == ['9_a.sql', '10_b.sql']
+
+
+@pytest.mark.parametrize('script, expected', [
+    (b'CREATE TABLE t (id int);\n', b'CREATE TABLE t (id int);\n\n'),
+    (b'CREATE TABLE t (id int)', b'CREATE TABLE t (id int)\n;\n'),
+    (b'SELECT 1;\n-- done\n', b'SELECT 1;\n-- done\n\n'),
+    (b'SELECT 1;\nSELECT 2 /* no delimiter */', b'SELECT 1;\nSELECT 2 /* no delimiter */\n;\n'),
+    (
+        b'DELIMITER ;;\nCREATE PROCEDURE p() BEGIN SELECT 1; END',
+        b'DELIMITER ;;\nCREATE PROCEDURE p() BEGIN SELECT 1; END\n;;\nDELIMITER ;\n'
+    ),
+    (
+        b'DELIMITER $$\nCREATE PROCEDURE p() BEGIN SELECT 1; END$$\nDELIMITER ;\n',
+        b'DELIMITER $$\nCREATE PROCEDURE p() BEGIN SELECT 1; END$$\nDELIMITER ;\n\n'
+    ),
+])
+def test_terminate(script, expected):
+    assert b''.join(terminate([script])) == expected
+    # The split into blocks does not matter
+    assert b''.join(terminate([script[i:i + 3] for i in range(0, len(script), 3)])) == expected
+
+
+def migrations(tmp_path, cluster, output):
+    directory = tmp_path / 'migrations'
+    directory.mkdir()
+    (directory / '1_users.sql').write_text('CREATE TABLE users (id int);')
+    (directory / '2_orders.sql').write_text('CREATE TABLE orders (id int);')
+    cluster.respond('@deployfish_migration_start', output)
+    cluster.respond('', '')
+    return str(directory)
+
+
+def test_migrate(tmp_path, local_cluster, database):
+    output = ''.join('{}\t{}\t0.5\n'.format(MIGRATED_MARKER, name) for name in ('1_users.sql', '2_orders.sql'))
+    directory = migrations(tmp_path, local_cluster, output)
+    obj = database(cluster=local_cluster)
+    results = obj.migrate(directory)
+    assert [(row['filename'], row['status'], row['seconds']) for row in results] == [
+        ('1_users.sql', 'applied', 0.5), ('2_orders.sql', 'applied', 0.5)
+    ]
+    script = local_cluster.sql[-1]
+    assert script.index('CREATE TABLE users (id int);') < script.index('CREATE TABLE orders (id int);')
+
+
+def test_migrate_failure(tmp_path, local_cluster, database):
+    output = "ERROR 1050 (42S01) at line 9: Table 'orders' already exists\n{}\t1_users.sql\t0.5\n".format(
+        MIGRATED_MARKER
+    )
+    directory = migrations(tmp_path, local_cluster, output)
+    obj = database(cluster=local_cluster)
+    with pytest.raises(obj.OperationFailed) as e:
+        obj.migrate(directory)
+    assert 'Migration "2_orders.sql" failed' in str(e.value)
+    assert 'after applying 1 of 2 migrations' in str(e.value)
+
+
+def test_migrate_failure_after_the_last_migration(tmp_path, local_cluster, database):
+    output = 'ERROR 2013 (HY000): Lost connection to MySQL server during query\n' + ''.join(
+        '{}\t{}\t0.5\n'.format(MIGRATED_MARKER, name) for name in ('1_users.sql', '2_orders.sql')
+    )
+    directory = migrations(tmp_path, local_cluster, output)
+    obj = database(cluster=local_cluster)
+    with pytest.raises(obj.OperationFailed) as e:
+        obj.migrate(directory)
+    assert 'Applied all 2 migrations' in str(e.value)
+    assert 'Lost connection' in str(e.value)
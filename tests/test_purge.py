@@ -0,0 +1,89 @@
+import gzip
+
+import pytest
+
+
+WHERE = "created < '2020-01-01'"
+
+
+def respond(cluster, key_type='bigint', batches=()):
+    """
+    Answer the purge's queries: each of ``batches`` is a (SQL fragment, rows)
+    pair, most specific first.
+    """
+    for fragment, rows in batches:
+        cluster.respond(fragment, rows)
+    cluster.respond("index_name = 'PRIMARY'", [['K', 'id'], ['C', 'id', key_type], ['C', 'note', 'text']])
+    cluster.respond('Threads_running', [['Threads_running', '1']])
+
+
+def test_purge_condition(database):
+    obj = database()
+    assert obj._purge_condition(WHERE, 'id', None) == "({})".format(WHERE)
+    assert obj._purge_condition(WHERE, 'id', 9007199254740993) == "`id` > 9007199254740993 AND ({})".format(WHERE)
+    assert obj._purge_condition(WHERE, 'code', "o'k") == "`code` > 'o\\'k' AND ({})".format(WHERE)
+
+
+def test_render_sql_for_purge_batch(database):
+    assert database().render_sql_for_purge_batch('t', WHERE, 'id', 1000, 500) == (
+        "SET @upper := (SELECT MAX(`id`) FROM (SELECT `id` FROM `app`.`t` WHERE `id` > 1000 AND ({where}) "
+        "ORDER BY `id` LIMIT 500) AS batch);"
+        "DELETE FROM `app`.`t` WHERE `id` > 1000 AND ({where}) AND `id` <= @upper;"
+        "SELECT @upper, ROW_COUNT();"
+    ).format(where=WHERE)
+
+
+def test_purge_integer_keys(local_cluster, database):
+    respond(local_cluster, batches=[
+        ('`id` > 9007199254740993 AND', [[None, '0']]),
+        ('SET @upper', [['9007199254740993', '1000']]),
+    ])
+    obj = database(cluster=local_cluster)
+    result = obj.objects.purge(obj, 't', WHERE, sleep=0)
+    assert (result['rows'], result['batches'], result['archive']) == (1000, 1, None)
+    batches = [sql for sql in local_cluster.sql if 'SET @upper' in sql]
+    assert len(batches) == 2
+    assert '`id` >' not in batches[0]
+    # Not quoted, so MySQL compares it exactly rather than as a double
+    assert '`id` > 9007199254740993 AND' in batches[1]
+
+
+def test_purge_string_keys(local_cluster, database):
+    respond(local_cluster, key_type='varchar', batches=[
+        ("`id` > 'b' AND", [[None, '0']]),
+        ('`id` > ', [['b', '3']]),
+        ('SET @upper', [['a', '5']]),
+    ])
+    obj = database(cluster=local_cluster)
+    result = obj.objects.purge(obj, 't', WHERE, sleep=0)
+    assert (result['rows'], result['batches']) == (8, 2)
+    assert "`id` > 'a' AND" in [sql for sql in local_cluster.sql if 'SET @upper' in sql][1]
+
+
+def test_purge_archive(tmp_path, local_cluster, database):
+    respond(local_cluster, batches=[
+        ('`id` > 2 AND', ''),
+        ('SELECT `id`, t.*', [['1', '1', 'tab\there'], ['2', '2', None]]),
+        ('DELETE FROM `app`.`t` WHERE `id` IN (1,2)', [['2']]),
+    ])
+    obj = database(cluster=local_cluster)
+    result = obj.objects.purge(obj, 't', WHERE, sleep=0, archive_dir=str(tmp_path))
+    assert (result['rows'], result['batches']) == (2, 1)
+    assert result['archive'].startswith(str(tmp_path / 'app.t-'))
+    with gzip.open(result['archive'], 'rt', encoding='utf-8') as fd:
+        assert fd.read() == 'id\tnote\n1\ttab\\there\n2\t\\N\n'
+
+
+def test_purge_dry_run(local_cluster, database):
+    local_cluster.respond('SELECT COUNT(*)', [['42']])
+    obj = database(cluster=local_cluster)
+    assert obj.objects.purge(obj, 't', WHERE, dry_run=True)['rows'] == 42
+    assert local_cluster.sql == ["SELECT COUNT(*) FROM `app`.`t` WHERE ({});".format(WHERE)]
+
+
+def test_purge_needs_a_single_column_key(local_cluster, database):
+    local_cluster.respond("index_name = 'PRIMARY'", [['K', 'a'], ['K', 'b']])
+    obj = database(cluster=local_cluster)
+    with pytest.raises(obj.OperationFailed) as e:
+        obj.objects.purge(obj, 't', WHERE)
+    assert 'single column primary key, but has a, b' in str(e.value)
@@ -0,0 +1,37 @@
+import pytest
+
+from deployfish_mysql.sql import version_tuple
+
+
+def test_version_tuple():
+    assert version_tuple('8.0.35') == (8, 0, 35)
+    assert version_tuple('5.7.44-log') == (5, 7, 44)
+    assert version_tuple('unknown') == ()
+
+
+@pytest.mark.parametrize('version, statement', [
+    ('5.7.44-log', 'SHOW SLAVE STATUS;'),
+    ('8.0.21', 'SHOW SLAVE STATUS;'),
+    ('8.0.22', 'SHOW REPLICA STATUS;'),
+    ('8.4.3', 'SHOW REPLICA STATUS;'),
+])
+def test_render_for_replica_status(database, version, statement):
+    assert statement in database().render_for_replica_status(version)
+
+
+@pytest.mark.parametrize('version, statement, column', [
+    ('5.7.44-log', 'SHOW SLAVE STATUS', 'Seconds_Behind_Master'),
+    ('8.4.3', 'SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+])
+def test_replica_lag(local_cluster, database, version, statement, column):
+    local_cluster.respond(statement, [['Replica_IO_State', column], ['Waiting for source', '7']])
+    obj = database(cluster=local_cluster)
+    obj.cache['server_version'] = version
+    assert obj.objects.replica_lag(obj) == 7
+
+
+def test_replica_lag_when_not_replicating(local_cluster, database):
+    local_cluster.respond('STATUS', '')
+    obj = database(cluster=local_cluster)
+    obj.cache['server_version'] = '8.4.3'
+    assert obj.objects.replica_lag(obj) is None
@@ -0,0 +1,143 @@
+import pytest
+
+from deployfish_mysql.scheduler import BackupJob, BackupScheduler, parse_interval
+
+
+class Clock:
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Executor:
+    """
+    Collects the jobs the scheduler starts, so that the test decides when
+    each one finishes.
+    """
+
+    def __init__(self) -> None:
+        self.submitted = []
+
+    def submit(self, fn, job):
+        self.submitted.append((fn, job))
+
+    def names(self):
+        return [job.name for _, job in self.submitted]
+
+    def finish(self, name):
+        for i, (fn, job) in enumerate(self.submitted):
+            if job.name == name:
+                del self.submitted[i]
+                fn(job)
+                return
+        raise AssertionError('{} is not running'.format(name))
+
+
+def job(name, every=3600, **kwargs):
+    return BackupJob(name, lambda: {'bytes': 10, 'location': name}, every, **kwargs)
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_parse_interval():
+    assert parse_interval(90) == 90.0
+    assert parse_interval('30m') == 1800.0
+    assert parse_interval(' 1.5h ') == 5400.0
+    assert parse_interval('1w') == 604800.0
+    for value in ('0', '-1', 'soon', True):
+        with pytest.raises(ValueError):
+            parse_interval(value)
+
+
+def test_host_budget(clock):
+    executor = Executor()
+    scheduler = BackupScheduler(
+        [job('a', host='db1'), job('b', host='db1'), job('c', host='db2')],
+        max_jobs=3, max_per_host=1, clock=clock
+    )
+    assert scheduler.run_pending(executor) == 0
+    assert executor.names() == ['a', 'c']
+    executor.finish('a')
+    scheduler.run_pending(executor)
+    assert executor.names() == ['c', 'b']
+
+
+def test_bastion_and_overall_budgets(clock):
+    executor = Executor()
+    jobs = [job(name, host=name, bastion='bastion1') for name in 'abc'] + [job('d', host='d', bastion='bastion2')]
+    scheduler = BackupScheduler(jobs, max_jobs=3, max_per_host=1, max_per_bastion=2, clock=clock)
+    scheduler.run_pending(executor)
+    assert executor.names() == ['a', 'b', 'd']
+    executor.finish('d')
+    scheduler.run_pending(executor)
+    # 'c' fits the overall budget now, but not its bastion's
+    assert executor.names() == ['a', 'b']
+    executor.finish('a')
+    scheduler.run_pending(executor)
+    assert executor.names() == ['b', 'c']
+
+
+def test_priority_then_most_overdue_first(clock):
+    executor = Executor()
+    jobs = [job('low'), job('high', priority=5), job('late', every=60)]
+    scheduler = BackupScheduler(jobs, max_jobs=1, clock=clock)
+    scheduler.run_pending(executor)
+    assert executor.names() == ['high']
+    clock.now += 120
+    executor.finish('high')
+    scheduler.run_pending(executor)
+    assert executor.names() == ['low']
+
+
+def test_reschedules_from_the_start_of_the_last_run(clock):
+    def backup():
+        clock.now += 100
+        return {'bytes': 10, 'location': 'a'}
+
+    executor = Executor()
+    scheduler = BackupScheduler([BackupJob('a', backup, 600)], clock=clock)
+    scheduler.run_pending(executor)
+    executor.finish('a')
+    metrics = scheduler.jobs[0].metrics
+    assert (metrics['status'], metrics['last_success'], metrics['last_duration']) == ('ok', 1000.0, 100.0)
+    assert scheduler.run_pending(executor) == 500.0
+    assert executor.names() == []
+    clock.now += 500
+    scheduler.run_pending(executor)
+    assert executor.names() == ['a']
+
+
+def test_retries_back_off_then_give_up(clock):
+    def fail():
+        raise RuntimeError('ssh failed')
+
+    executor = Executor()
+    scheduler = BackupScheduler([BackupJob('a', fail, 3600, retries=2, retry_delay=10)], clock=clock)
+    delays = []
+    for _ in range(3):
+        scheduler.run_pending(executor)
+        executor.finish('a')
+        delays.append(scheduler.jobs[0].due - clock.now)
+        clock.now = scheduler.jobs[0].due
+    metrics = scheduler.jobs[0].metrics
+    assert delays == [10, 20, 3600]
+    assert metrics['status'] == 'failed'
+    assert metrics['failures'] == 3
+    assert metrics['last_error'] == 'ssh failed'
+
+
+def test_restart_waits_for_the_next_run(tmp_path, clock):
+    metrics_file = str(tmp_path / 'metrics.json')
+    executor = Executor()
+    scheduler = BackupScheduler([job('a', every=600), job('b', every=600)], metrics_file=metrics_file, clock=clock)
+    scheduler.run_pending(executor)
+    executor.finish('a')
+    clock.now += 60
+    restarted = BackupScheduler([job('a', every=600), job('b', every=600)], metrics_file=metrics_file, clock=clock)
+    assert [j.due for j in restarted.jobs] == [1600.0, 1060.0]
@@ -0,0 +1,27 @@
+from deployfish_mysql.schema import build_columns, column_definition
+
+
+def column(column_type, default, extra='', nullable='NO'):
+    return build_columns([['t', 'c', '1', column_type, nullable, default, extra, None, '', None]])['t'][0]
+
+
+def test_string_defaults_are_quoted():
+    assert column_definition(column('varchar(10)', "it's")) == "`c` varchar(10) NOT NULL DEFAULT 'it\\'s'"
+    assert column_definition(column('int', '0')) == "`c` int NOT NULL DEFAULT '0'"
+
+
+def test_literal_and_expression_defaults_are_not_quoted():
+    assert column_definition(column('bit(1)', "b'0'")) == "`c` bit(1) NOT NULL DEFAULT b'0'"
+    assert column_definition(column('datetime(3)', 'CURRENT_TIMESTAMP(3)', 'DEFAULT_GENERATED')) == (
+        '`c` datetime(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)'
+    )
+    assert column_definition(column('timestamp', 'CURRENT_TIMESTAMP', 'on update CURRENT_TIMESTAMP')) == (
+        '`c` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP on update CURRENT_TIMESTAMP'
+    )
+    assert column_definition(column('json', "json_array()", 'DEFAULT_GENERATED')) == (
+        '`c` json NOT NULL DEFAULT (json_array())'
+    )
+
+
+def test_bit_like_strings_on_other_types_are_quoted():
+    assert column_definition(column('varchar(10)', "b'0'")) == "`c` varchar(10) NOT NULL DEFAULT 'b\\'0\\''"
@@ -0,0 +1,104 @@
+import datetime
+import io
+import json
+import os
+import threading
+
+from deployfish_mysql.sinks import DumpStoreSink
+from deployfish_mysql.store import TEMP_PREFIX, DumpStore, chunk_stream
+
+
+def dump(rows: int, seed: int = 0) -> bytes:
+    return b''.join(
+        b"INSERT INTO `t` VALUES (%d,'row %d of %d');\n" % (i, i * 7 + seed, rows) for i in range(rows)
+    )
+
+
+def chunk_files(store: DumpStore) -> int:
+    return sum(len(os.listdir(os.path.join(store.chunks_path, d))) for d in os.listdir(store.chunks_path))
+
+
+def backdate(manifest: str, days: int) -> None:
+    with open(manifest, encoding='utf-8') as fd:
+        data = json.load(fd)
+    taken = datetime.datetime.fromisoformat(data['timestamp']) - datetime.timedelta(days=days)
+    data['timestamp'] = taken.isoformat()
+    with open(manifest, 'w', encoding='utf-8') as fd:
+        json.dump(data, fd)
+
+
+def test_chunk_stream_cuts_at_separators_within_limits():
+    data = dump(20000)
+    chunks = list(chunk_stream(io.BytesIO(data), min_size=1024, average_size=4096, max_size=16384))
+    assert b''.join(chunks) == data
+    assert len(chunks) > 1
+    for chunk in chunks[:-1]:
+        assert 1024 <= len(chunk) <= 16384
+        assert chunk.endswith(b'\n')
+
+
+def test_chunk_stream_resynchronizes_after_a_change():
+    before = list(chunk_stream(io.BytesIO(dump(20000)), min_size=1024, average_size=4096))
+    changed = b"INSERT INTO `t` VALUES (-1,'new');\n" + dump(20000)
+    after = list(chunk_stream(io.BytesIO(changed), min_size=1024, average_size=4096))
+    assert len(set(before) & set(after)) >= len(before) - 2
+
+
+def test_add_deduplicates_chunks(tmp_path, database):
+    store = DumpStore(str(tmp_path))
+    first = store.add(io.BytesIO(dump(5000)), database())
+    assert first['new_chunks'] == first['chunks']
+    second = store.add(io.BytesIO(dump(5000)), database())
+    assert second['new_chunks'] == 0
+    assert second['manifest'] != first['manifest']
+    assert chunk_files(store) == first['chunks']
+    assert [b''.join(store.stream(manifest)) for manifest in store.manifests()] == [dump(5000)] * 2
+
+
+def test_prune_removes_old_manifests_and_their_chunks(tmp_path, database):
+    store = DumpStore(str(tmp_path))
+    old = store.add(io.BytesIO(dump(5000, seed=1)), database())
+    new = store.add(io.BytesIO(dump(5000, seed=2)), database())
+    other = store.add(io.BytesIO(dump(5000, seed=3)), database(name='other'))
+    for result in (old, other):
+        backdate(result['manifest'], 10)
+    assert store.prune(7, dry_run=True)['manifests'] == 1
+    assert os.path.exists(old['manifest'])
+    removed = store.prune(7)
+    assert removed['manifests'] == 1
+    assert removed['chunks'] > 0
+    # The newest manifest for each connection is kept, however old
+    kept = [manifest['filename'] for manifest in store.manifests()]
+    assert sorted(kept) == sorted([new['manifest'], other['manifest']])
+    # and none of their chunks were removed
+    for manifest in store.manifests():
+        assert b''.join(store.stream(manifest)).startswith(b'INSERT INTO')
+
+
+def test_prune_skips_temporary_chunk_files(tmp_path, database):
+    store = DumpStore(str(tmp_path))
+    store.add(io.BytesIO(dump(5000)), database())
+    directory = os.path.join(store.chunks_path, os.listdir(store.chunks_path)[0])
+    temporary = os.path.join(directory, TEMP_PREFIX + 'abc')
+    with open(temporary, 'wb') as fd:
+        fd.write(b'partial')
+    assert store.prune(0)['chunks'] == 0
+    assert os.path.exists(temporary)
+
+
+def test_prune_waits_for_dumps_being_added(tmp_path, database):
+    store = DumpStore(str(tmp_path))
+    obj = database()
+    sink = DumpStoreSink(store, obj)
+    sink.write(dump(5000))
+    sink.pipe.flush()
+    result = {}
+    pruner = threading.Thread(target=lambda: result.update(store.prune(0)))
+    pruner.start()
+    pruner.join(0.5)
+    # The sink still holds its lock, so the prune cannot have removed its chunks
+    assert pruner.is_alive()
+    sink.commit()
+    pruner.join()
+    assert result['chunks'] == 0
+    assert b''.join(store.stream(store.manifests()[0])) == dump(5000)
@@ -0,0 +1,75 @@
+import gzip
+
+from deployfish_mysql.checksums import read_blocks
+from deployfish_mysql.sql import parse_batch_output
+from deployfish_mysql.tsv import build_tsv_columns, load_columns, select_expression, table_filename
+
+
+COLUMNS = build_tsv_columns([
+    ['t', 'id', 'bigint', 'NO', 'auto_increment'],
+    ['t', 'note', 'text', 'YES', ''],
+    ['t', 'flags', 'bit', 'YES', ''],
+    ['t', 'seen', 'datetime', 'YES', ''],
+    ['t', 'total', 'int', 'NO', 'VIRTUAL GENERATED'],
+])['t']
+
+
+def test_build_tsv_columns_skips_generated_columns():
+    assert [column['name'] for column in COLUMNS] == ['id', 'note', 'flags', 'seen']
+    assert [column['kind'] for column in COLUMNS] == ['plain', 'text', 'bit', 'plain']
+    assert [column['nullable'] for column in COLUMNS] == [False, True, True, True]
+
+
+def test_select_expression():
+    assert select_expression(COLUMNS[0]) == '`id`'
+    assert select_expression(COLUMNS[2]) == '`flags` + 0'
+    text = select_expression(COLUMNS[1])
+    assert text.startswith('IFNULL(REPLACE(')
+    assert text.endswith("'\\\\N')")
+    assert "'\\\\', '\\\\\\\\'" in text
+
+
+def test_load_columns():
+    assert load_columns(COLUMNS) == (
+        " (`id`,`note`,@c2,@c3)"
+        " SET `flags` = CAST(NULLIF(@c2, 'NULL') AS UNSIGNED), `seen` = NULLIF(@c3, 'NULL')"
+    )
+
+
+def test_load_columns_without_assignments():
+    assert load_columns(COLUMNS[:2]) == ' (`id`,`note`)'
+
+
+def test_table_filename():
+    taken = set()
+    assert table_filename('orders', taken) == 'orders.tsv.gz'
+    assert table_filename('Orders', taken) == 'Orders-1.tsv.gz'
+    assert table_filename('a/b c', taken) == 'a_b_c.tsv.gz'
+
+
+def test_dump_and_load_round_trip(tmp_path, local_cluster, database):
+    rows = b'1\tone\\ttab\t1\t2024-01-01 00:00:00\n2\t\\N\tNULL\tNULL\n3\tline\\nbreak\t0\t2024-01-02 00:00:00\n'
+    (tmp_path / 'rows.tsv').write_bytes(rows)
+    obj = database(cluster=local_cluster)
+    dumped = str(tmp_path / 't.tsv.gz')
+
+    sha256, size = obj.objects._dump_tsv_file(obj, dumped, obj.render_for_tsv_dump('t', COLUMNS))
+    assert size > 0
+    with gzip.open(dumped) as fd:
+        assert fd.read() == rows
+
+    success, output = obj.objects._stream_to_remote(obj, obj.render_for_tsv_load('t', COLUMNS), read_blocks(dumped))
+    assert success, output
+    assert parse_batch_output(output) == [['3']]
+    assert (tmp_path / 'loaded.tsv').read_bytes() == rows
+
+
+def test_dump_failure_shows_mysql_errors(tmp_path, local_cluster, database):
+    obj = database(cluster=local_cluster)
+    # No rows file, so the fake mysql fails
+    try:
+        obj.objects._dump_tsv_file(obj, str(tmp_path / 't.tsv.gz'), obj.render_for_tsv_dump('t', COLUMNS))
+    except obj.OperationFailed as e:
+        assert 'No such file or directory' in str(e)
+    else:
+        raise AssertionError('the dump did not fail')
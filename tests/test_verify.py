@@ -0,0 +1,92 @@
+import zlib
+
+import pytest
+
+
+class FakeServers:
+    """
+    Stands in for ``checksum_metadata`` and ``checksum_chunks``: each database
+    name has tables of ``{key: value}`` rows.
+    """
+
+    def __init__(self, tables, metadata):
+        self.tables = tables
+        self.metadata = metadata
+        self.calls = []
+
+    def checksum_metadata(self, obj, ssh_target=None, verbose=False):
+        return self.metadata[obj.name]
+
+    def checksum_chunks(self, obj, table, columns, key=None, chunk_size=None, ranges=None, ssh_target=None,
+                        verbose=False):
+        self.calls.append((obj.name, chunk_size, ranges))
+        chunks = {}
+        for value, row in self.tables[obj.name][table].items():
+            if ranges is not None and not any(start <= value < end for start, end in ranges):
+                continue
+            chunk = value // chunk_size if chunk_size else 0
+            count, checksum = chunks.get(chunk, (0, 0))
+            chunks[chunk] = (count + 1, checksum ^ zlib.crc32(repr((value, row)).encode('utf-8')))
+        return chunks
+
+
+@pytest.fixture
+def servers(monkeypatch, database):
+    def make(tables, metadata):
+        fake = FakeServers(tables, metadata)
+        manager = database().objects
+        monkeypatch.setattr(manager, 'checksum_metadata', fake.checksum_metadata)
+        monkeypatch.setattr(manager, 'checksum_chunks', fake.checksum_chunks)
+        return fake
+    return make
+
+
+def table(key='id', columns=('id', 'note')):
+    return {'columns': list(columns), 'key': key}
+
+
+def test_refines_mismatched_chunks(servers, database):
+    rows = {i: 'row {}'.format(i) for i in range(10000)}
+    changed = {**rows, 4321: 'changed'}
+    fake = servers({'test': {'t': rows}, 'other': {'t': changed}}, {'test': {'t': table()}, 'other': {'t': table()}})
+    obj, other = database(), database(name='other')
+    [result] = obj.objects.verify(obj, other, chunk_size=1000, min_chunk_size=10)
+    assert (result['verdict'], result['rows'], result['other_rows']) == ('differs', 10000, 10000)
+    assert result['ranges'] == [(4320, 4330)]
+    # Each mismatched range is split by 10 until it is min_chunk_size
+    assert sorted(set((size, tuple(ranges or ())) for _, size, ranges in fake.calls)) == [
+        (10, ((4300, 4400),)), (100, ((4000, 5000),)), (1000, ())
+    ]
+
+
+def test_refinement_stops_at_min_chunk_size(servers, database):
+    rows = {i: 'row {}'.format(i) for i in range(1000)}
+    changed = {**rows, 5: 'changed', 905: 'changed'}
+    servers({'test': {'t': rows}, 'other': {'t': changed}}, {'test': {'t': table()}, 'other': {'t': table()}})
+    obj, other = database(), database(name='other')
+    [result] = obj.objects.verify(obj, other, chunk_size=1000, min_chunk_size=250)
+    assert result['ranges'] == [(0, 250), (750, 1000)]
+
+
+def test_verdicts(servers, database):
+    rows = {i: i for i in range(10)}
+    metadata = {
+        'test': {'same': table(), 'gone': table(), 'cols': table(), 'nokey': table(key=None)},
+        'other': {'same': table(), 'cols': table(columns=('id',)), 'nokey': table(key=None), 'extra': table()},
+    }
+    servers(
+        {
+            'test': {'same': rows, 'nokey': rows},
+            'other': {'same': rows, 'nokey': {**rows, 3: 'x'}},
+        },
+        metadata
+    )
+    obj, other = database(), database(name='other')
+    results = {result['table']: result for result in obj.objects.verify(obj, other)}
+    assert sorted(results) == ['cols', 'gone', 'nokey', 'same']
+    assert (results['same']['verdict'], results['same']['rows']) == ('match', 10)
+    assert (results['gone']['verdict'], results['gone']['message']) == ('missing', 'not in other')
+    assert (results['cols']['verdict'], results['cols']['message']) == ('error', 'columns differ')
+    assert (results['nokey']['verdict'], results['nokey']['ranges']) == ('differs', [])
+    [result] = obj.objects.verify(obj, other, tables=['extra'])
+    assert (result['verdict'], result['message']) == ('missing', 'not in test')